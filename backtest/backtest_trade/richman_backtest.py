@@ -1,16 +1,29 @@
 import sys
-from typing import Tuple
+from typing import Optional, Tuple
 
 import pandas as pd
 import numpy as np
 
 sys.path.append(".")
 from backtest.backtest_trade.backtest import backtest
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
 
 
-def richman_backtest(ohlcv_df: pd.DataFrame, buy_df: pd.DataFrame, sell_df: pd.DataFrame) -> pd.DataFrame:
-    buy_executed, buy_price = trade_executed(ohlcv_df, buy_df, side="buy")
-    sell_executed, sell_price = trade_executed(ohlcv_df, sell_df, side="sell")
+def richman_backtest(ohlcv_df: pd.DataFrame, buy_df: pd.DataFrame, sell_df: pd.DataFrame, spec: Optional[SymbolSpec] = None) -> pd.DataFrame:
+    """Backtest of the predictions.
+
+    Args:
+        ohlcv_df (pd.DataFrame): ohlcv dataframe
+        buy_df (pd.DataFrame): buy predictions matched to the bars
+        sell_df (pd.DataFrame): sell predictions matched to the bars
+        spec (Optional[SymbolSpec]): If given, prices are compared and passed to the kernel in ticks of the symbol. Defaults to None (float prices).
+
+    Returns:
+        pd.DataFrame: result
+    """
+    buy_executed, buy_price = trade_executed(ohlcv_df, buy_df, side="buy", spec=spec)
+    sell_executed, sell_price = trade_executed(ohlcv_df, sell_df, side="sell", spec=spec)
+    close = ohlcv_df["close"].to_numpy() if spec is None else spec.ticks_array(ohlcv_df["close"].to_numpy())
     predict_buy_entry = (buy_df["is_entry"] == True).to_numpy()  # noqa: E712
     predict_sell_entry = (sell_df["is_entry"] == True).to_numpy()  # noqa: E712
     # If you use two different model for buy and sell, you have to custom priority_buy_entry.
@@ -18,7 +31,7 @@ def richman_backtest(ohlcv_df: pd.DataFrame, buy_df: pd.DataFrame, sell_df: pd.D
     prioty_buy_entry = predict_buy_entry
 
     cumulative_return, possition, buy_entry_prices, sell_entry_prices, buy_exit_prices, sell_exit_prices = backtest(
-        close=ohlcv_df["close"].to_numpy(),
+        close=close,
         predict_buy_entry=predict_buy_entry,
         predict_sell_entry=predict_sell_entry,
         priority_buy_entry=prioty_buy_entry,
@@ -27,6 +40,9 @@ def richman_backtest(ohlcv_df: pd.DataFrame, buy_df: pd.DataFrame, sell_df: pd.D
         buy_price=buy_price,
         sell_price=sell_price,
     )
+    if spec is not None:
+        buy_entry_prices, sell_entry_prices = spec.prices_array(buy_entry_prices), spec.prices_array(sell_entry_prices)
+        buy_exit_prices, sell_exit_prices = spec.prices_array(buy_exit_prices), spec.prices_array(sell_exit_prices)
 
     result_df = pd.DataFrame(
         {
@@ -44,13 +60,21 @@ def richman_backtest(ohlcv_df: pd.DataFrame, buy_df: pd.DataFrame, sell_df: pd.D
     return result_df
 
 
-def trade_executed(ohlcv_df: pd.DataFrame, target_df: pd.DataFrame, side: str) -> Tuple[np.ndarray, np.ndarray]:
+def _to_ticks(prices: pd.Series, spec: SymbolSpec) -> Tuple[np.ndarray, np.ndarray]:
+    """Ticks of prices (0 for nan) and mask of not nan prices."""
+    prices = prices.to_numpy(dtype=np.float64)
+    is_valid = ~np.isnan(prices)
+    return spec.ticks_array(np.where(is_valid, prices, 0.0)), is_valid
+
+
+def trade_executed(ohlcv_df: pd.DataFrame, target_df: pd.DataFrame, side: str, spec: Optional[SymbolSpec] = None) -> Tuple[np.ndarray, np.ndarray]:
     """Trade Executed and entry price
 
     Args:
         ohlcv_df (pd.DataFrame): ohlcv dataframe
         target_df (pd.DataFrame): buy_df or sell_df
         side (str): `buy` or `sell`
+        spec (Optional[SymbolSpec]): If given, compare prices in ticks and return prices in ticks. Defaults to None.
 
     Raises:
         ValueError: raises if side is wrong.
@@ -62,6 +86,14 @@ def trade_executed(ohlcv_df: pd.DataFrame, target_df: pd.DataFrame, side: str) -
         raise ValueError("side should be buy or sell")
 
     merged_df = ohlcv_df.merge(target_df["price"], how="left", left_index=True, right_index=True)
+    if spec is not None:
+        price_ticks, has_price = _to_ticks(merged_df["price"], spec)
+        bound_ticks, has_bound = _to_ticks(merged_df["low" if side.upper() == "BUY" else "high"].shift(-1), spec)
+        if side.upper() == "BUY":
+            return has_price & has_bound & (price_ticks >= bound_ticks), price_ticks
+        else:
+            return has_price & has_bound & (price_ticks <= bound_ticks), price_ticks
+
     if side.upper() == "BUY":
         executed = merged_df["price"] >= merged_df["low"].shift(-1)
         return executed.to_numpy(), merged_df["price"].to_numpy()
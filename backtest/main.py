@@ -6,7 +6,8 @@ import sqlalchemy.orm  # noqa: F401
 
 sys.path.append(".")
 from gmo_hft_bot.db.database import initialize_database
-from gmo_hft_bot.db import crud
+from gmo_hft_bot.db import crud, schemas
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
 from backtest.visualize.ohlcv import ohlcv_plot
 from backtest.utils.utils import get_ohlcv_df, get_predict_df, match_timestamp_for_ohlcv
 from backtest.backtest_trade.richman_backtest import richman_backtest
@@ -15,27 +16,28 @@ from backtest.visualize.backtest_visualize import cum_return_plot, position_chan
 
 def main():
     symbol = "BTC_JPY"
+    time_span = 5
     _, SessionLocal = initialize_database(uri="sqlite:///example.db")
 
     with SessionLocal() as db:
-        ohlcv_data = crud.get_ohlcv_with_symbol(db=db, symbol=symbol)
-        predict_data = crud.get_predict_items(db=db, symbol=symbol)
+        ohlcv_data = crud.get_ohlcv_with_symbol(db=db, symbol=symbol, timeframe=schemas.timeframe_label(time_span))
+        predict_data = crud.get_predictions_in_range(db=db, symbol=symbol, start_timestamp=0, end_timestamp=2**62)
 
     # fig, axes = plt.subplots(2, 1, figsize=(16, 8))
     # axes = axes.flatten()
 
-    time_span = 5
     ohlcv_df = get_ohlcv_df(ohlcv_data, time_span=time_span)
     buy_df, sell_df = get_predict_df(predict_data)
     timestamped_buy_df = match_timestamp_for_ohlcv(ohlcv_df, buy_df, time_span)
     timestamped_sell_df = match_timestamp_for_ohlcv(ohlcv_df, sell_df, time_span)
-    result_online = richman_backtest(ohlcv_df, buy_df=timestamped_buy_df, sell_df=timestamped_sell_df)
+    spec = get_symbol_spec(symbol)
+    result_online = richman_backtest(ohlcv_df, buy_df=timestamped_buy_df, sell_df=timestamped_sell_df, spec=spec)
 
     # local data backtest
     pips = 500
     timestamped_buy_df["price"] = ohlcv_df.loc[:, "close"] - pips
     timestamped_sell_df["price"] = ohlcv_df.loc[:, "close"] + pips
-    result_local = richman_backtest(ohlcv_df, buy_df=timestamped_buy_df, sell_df=timestamped_sell_df)
+    result_local = richman_backtest(ohlcv_df, buy_df=timestamped_buy_df, sell_df=timestamped_sell_df, spec=spec)
 
     _, ax = plt.subplots(4, 2, figsize=(16, 16))
     ax = ax.flatten()
@@ -1,19 +1,23 @@
 import sys
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 
 sys.path.append(".")
-from gmo_hft_bot.db import models
+from gmo_hft_bot.db import models, schemas
+from gmo_hft_bot.utils.decision_journal import decode_book_features
+from gmo_hft_bot.utils.orderbook_kernels import BOOK_FEATURE_NAMES
 
 
-def get_ohlcv_df(ohlcv_data: List[models.OHLCV], time_span: int) -> pd.DataFrame:
+def get_ohlcv_df(ohlcv_data: List[models.OHLCV], time_span: Optional[int] = None, timestamp_unit: str = "s") -> pd.DataFrame:
     """Get ohlcv data as pd.Dataframe
 
     Args:
         ohlcv_data (_type_): return of query.
-        time_span (int): seconds.
+        time_span (Optional[int]): seconds. None for information bars.
+        timestamp_unit (str): Unit of timestamp. "ms" for information bars (e.g. tick bars). Defaults to "s".
 
     Returns:
         pd.DataFrame: pandas dataframe with the columns timestamp, open, high, low, close, volume
@@ -28,51 +32,46 @@ def get_ohlcv_df(ohlcv_data: List[models.OHLCV], time_span: int) -> pd.DataFrame
         data["timestamp"].append(item.timestamp)
 
     df = pd.DataFrame(data)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s", utc=True)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit=timestamp_unit, utc=True)
     df["timestamp"] += timedelta(hours=9)
     df = df.set_index("timestamp")
     df = df.sort_index()
     return df
 
 
-def get_predict_df(predict_data: List[models.PREDICT]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def get_predict_df(predict_data: Union[np.ndarray, pd.DataFrame], strategy_id: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """Get Predict Dataframe
 
     Args:
-        predict_data (List[models.PREDICT]): predict data
+        predict_data (Union[np.ndarray, pd.DataFrame]): decision journal from `crud.get_predictions_in_range`.
+        strategy_id (Optional[str]): Use only the decisions of this strategy. Defaults to None (all strategies).
 
     Returns:
-        Tuple[pd.DataFrame, pd.DataFrame]: buy_df, sell_df with columns timestamp, side, price, size, predict_value, symbol
+        Tuple[pd.DataFrame, pd.DataFrame]: buy_df, sell_df of the decisions indexed by timestamp, with columns
+            strategy_id, price, size, predict_value, is_entry, bar_timestamp, features (bytes, see `decode_features`),
+            freshness (schemas.FRESHNESS_* flags of skipped or downsized orders) and the board features of the live kernels
+            (BOOK_FEATURE_NAMES of utils/orderbook_kernels.py: depth_imbalance and weighted_mid in ticks, nan if not journaled)
     """
-    data = {"timestamp": [], "side": [], "price": [], "size": [], "predict_value": [], "symbol": [], "is_entry": []}
-    for item in predict_data:
-        data["timestamp"].append(item.timestamp)
-        data["side"].append(item.side)
-        data["price"].append(item.price)
-        data["size"].append(item.size)
-        data["predict_value"].append(item.predict_value)
-        data["symbol"].append(item.symbol)
-        data["is_entry"].append(item.is_entry)
-
-    df = pd.DataFrame(data)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
-    df["timestamp"] += timedelta(hours=9)
-    df = df.sort_index()
-
-    buy_df = df.loc[df["side"] == "BUY"]
-    sell_df = df.loc[df["side"] == "SELL"]
-    buy_df = buy_df.set_index("timestamp")
-    sell_df = sell_df.set_index("timestamp")
+    df = predict_data if isinstance(predict_data, pd.DataFrame) else pd.DataFrame.from_records(predict_data)
+    df = df.loc[df["kind"] == schemas.PREDICT_KIND_DECISION]
+    if strategy_id is not None:
+        df = df.loc[df["strategy_id"] == strategy_id]
+    df = df.assign(timestamp=pd.to_datetime(df["timestamp"], unit="ms", utc=True) + timedelta(hours=9)).drop(columns=["kind"])
+    book_features = np.array([decode_book_features(features) for features in df["features"]], dtype=np.float64).reshape(-1, len(BOOK_FEATURE_NAMES))
+    df = df.assign(**{name: book_features[:, i] for i, name in enumerate(BOOK_FEATURE_NAMES)})
+
+    buy_df = df.loc[df["side"] == schemas.PREDICT_SIDE_BUY].drop(columns=["side"]).set_index("timestamp")
+    sell_df = df.loc[df["side"] == schemas.PREDICT_SIDE_SELL].drop(columns=["side"]).set_index("timestamp")
     return buy_df, sell_df
 
 
-def match_timestamp_for_ohlcv(ohlcv_df: pd.DataFrame, target_df: pd.DataFrame, time_span: int) -> pd.DataFrame:
+def match_timestamp_for_ohlcv(ohlcv_df: pd.DataFrame, target_df: pd.DataFrame, time_span: Optional[int]) -> pd.DataFrame:
     """Match timestamp for ohlcv dataframe
 
     Args:
         ohlcv_df (pd.DataFrame): ohlcv dataframe
         target_df (pd.DataFrame): buy_df or sell_df
-        time_span (int): Time span. seconds.
+        time_span (Optional[int]): Time span. seconds. If None (information bars), a bar lasts until the next bar opens.
 
     Returns:
         matched_timstamp_dataframe (pd.Dataframe):
@@ -81,7 +80,13 @@ def match_timestamp_for_ohlcv(ohlcv_df: pd.DataFrame, target_df: pd.DataFrame, t
     column_names = target_df.columns.values.tolist()
     matched_timestamp_df = pd.DataFrame({"timestamp": ohlcv_df.index})
     for idx, timestamp in enumerate(ohlcv_df.index):
-        target_row = target_df.loc[(target_df.index >= timestamp) & (target_df.index < pd.Timedelta(time_span, unit="s") + timestamp)]
+        if time_span is not None:
+            end_timestamp = pd.Timedelta(time_span, unit="s") + timestamp
+        elif idx + 1 < len(ohlcv_df.index):
+            end_timestamp = ohlcv_df.index[idx + 1]
+        else:
+            end_timestamp = pd.Timestamp.max.tz_localize("UTC")
+        target_row = target_df.loc[(target_df.index >= timestamp) & (target_df.index < end_timestamp)]
         if len(target_row) > 0:
             target_row = target_row.iloc[0, :]
             matched_timestamp_df.loc[idx, column_names] = target_row
@@ -0,0 +1,457 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import platform
+import statistics
+import traceback
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import sqlalchemy.orm  # noqa: F401
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models, schemas
+from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.threads.manage_orderbook_queue import OrderbookQueueManager
+from gmo_hft_bot.threads.manage_tick_queue import TickQueueManager
+from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
+from gmo_hft_bot.utils.bar_builder import DEFAULT_TIMEFRAMES, MultiTimeframeBarBuilder
+from gmo_hft_bot.utils import orderbook_kernels
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
+from gmo_hft_bot.utils.db_writer import DbWriter
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from gmo_hft_bot.utils.gc_control import measure_allocations
+
+# Table sizes of gmo_hft_bot/main.py
+MAX_ORDERBOOK_TABLE_ROWS = 1000
+MAX_TICK_TABLE_ROWS = 1000
+MAX_OHLCV_TABLE_ROWS = 100000
+BOARD_LEVELS = 50
+SYMBOL = "BTC_JPY"
+TIME_SPAN = 5
+
+RESULTS_DIR = "./benchmarks/results"
+# A case is flagged when it is this much slower than the baseline.
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+# ... or when it triggers this much more young collections (and at least one more per 1000 items).
+MIN_GC_COLLECTIONS_INCREASE = 1.0
+
+
+class BenchmarkCase(NamedTuple):
+    name: str
+    # Build the state the case runs against and return the function to time.
+    setup: Callable[[], Callable[[], None]]
+    number: int
+    # Work items per call, e.g. messages drained by one run of a queue consumer.
+    items_per_call: int = 1
+
+
+def _isoformat(unix_time: float) -> str:
+    return datetime.fromtimestamp(unix_time, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _orderbook_message(unix_time: float, mid_price: float) -> Dict:
+    return {
+        "channel": "orderbooks",
+        "asks": [{"price": str(mid_price + 500 + i * 1000), "size": "0.1"} for i in range(BOARD_LEVELS)],
+        "bids": [{"price": str(mid_price - 500 - i * 1000), "size": "0.1"} for i in range(BOARD_LEVELS)],
+        "symbol": SYMBOL,
+        "timestamp": _isoformat(unix_time),
+    }
+
+
+def _tick_message(unix_time: float, price: float) -> Dict:
+    return {"channel": "trades", "price": str(price), "side": "BUY", "size": "0.01", "timestamp": _isoformat(unix_time), "symbol": SYMBOL}
+
+
+def _populated_session(boards: int = MAX_ORDERBOOK_TABLE_ROWS, ticks: int = MAX_TICK_TABLE_ROWS, ohlcv: int = MAX_OHLCV_TABLE_ROWS):
+    """In-memory database filled up to the table limits, like the bot after it has run for a while."""
+    database_engine, SessionLocal = initialize_database(uri=None)
+    models.Base.metadata.create_all(database_engine)
+    rng = random.Random(0)
+    now = time.time()
+    # Rows are in ticks and lots like crud.insert_board_items and crud.insert_tick_item store them.
+    spec = get_symbol_spec(SYMBOL)
+
+    with SessionLocal() as db:
+        board_rows = []
+        for i in range(boards):
+            timestamp = int((now - boards + i) * 1000)
+            for level in range(BOARD_LEVELS):
+                board_rows.append(
+                    {
+                        "id": f"s{i}-{level}",
+                        "timestamp": timestamp,
+                        "price": spec.to_ticks(str(5000500 + level * 1000)),
+                        "size": spec.to_lots("0.1"),
+                        "side": "SELL",
+                        "symbol": SYMBOL,
+                    }
+                )
+                board_rows.append(
+                    {
+                        "id": f"b{i}-{level}",
+                        "timestamp": timestamp,
+                        "price": spec.to_ticks(str(4999500 - level * 1000)),
+                        "size": spec.to_lots("0.1"),
+                        "side": "BUY",
+                        "symbol": SYMBOL,
+                    }
+                )
+        db.bulk_insert_mappings(models.Board, board_rows)
+
+        # Ticks of the last few bars so that create_ohlcv_from_ticks has work to do.
+        tick_rows = [
+            {
+                "id": f"t{i}",
+                "timestamp": int((now - 3 * TIME_SPAN * (1 - i / ticks)) * 1000),
+                "price": spec.to_ticks(str(5000000 + rng.randint(-5, 5) * 1000)),
+                "size": spec.to_lots("0.01"),
+                "symbol": SYMBOL,
+            }
+            for i in range(ticks)
+        ]
+        db.bulk_insert_mappings(models.Tick, tick_rows)
+
+        last_bar_timestamp = int(now // TIME_SPAN - 1) * TIME_SPAN
+        ohlcv_rows = [
+            {
+                "timestamp": last_bar_timestamp - i * TIME_SPAN,
+                "open": 5000000,
+                "high": 5001000,
+                "low": 4999000,
+                "close": 5000000 + rng.choice([-1000, 1000]),
+                "volume": 1.0,
+                "symbol": SYMBOL,
+                "timeframe": schemas.timeframe_label(TIME_SPAN),
+            }
+            for i in range(ohlcv)
+        ]
+        db.bulk_insert_mappings(models.OHLCV, ohlcv_rows)
+        db.commit()
+
+    return SessionLocal
+
+
+def _session_case(func: Callable[[sqlalchemy.orm.Session], None]) -> Callable[[], Callable[[], None]]:
+    def setup():
+        SessionLocal = _populated_session()
+        db = SessionLocal()
+        return lambda: func(db)
+
+    return setup
+
+
+def _insert_board_items_setup():
+    SessionLocal = _populated_session()
+    db = SessionLocal()
+    counter = iter(range(10**9))
+    return lambda: crud.insert_board_items(
+        db=db, insert_items=_orderbook_message(time.time() + next(counter), 5000000), max_board_counts=MAX_ORDERBOOK_TABLE_ROWS
+    )
+
+
+def _insert_tick_item_setup():
+    SessionLocal = _populated_session()
+    db = SessionLocal()
+    return lambda: crud.insert_tick_item(db=db, insert_item=_tick_message(time.time(), 5000000), max_rows=MAX_TICK_TABLE_ROWS)
+
+
+class _DrainingOrderbookQueueManager(OrderbookQueueManager):
+    """Stop once the queue is drained."""
+
+    def __init__(self, queue_and_trade_manager: QueueAndTradeManager):
+        self.queue_and_trade_manager = queue_and_trade_manager
+
+    @property
+    def RUNNING(self):
+        return self.queue_and_trade_manager.get_orderbook_queue_size() > 0
+
+
+class _DrainingTickQueueManager(TickQueueManager):
+    """Stop once the queue is drained."""
+
+    def __init__(self, queue_and_trade_manager: QueueAndTradeManager):
+        self.queue_and_trade_manager = queue_and_trade_manager
+
+    @property
+    def RUNNING(self):
+        return self.queue_and_trade_manager.get_ticks_queue_size() > 0
+
+
+def _book_arrays() -> orderbook_kernels.BookArrays:
+    rng = random.Random(0)
+    return orderbook_kernels.BookArrays(
+        # Ticks of 1 JPY and lots of 0.01 BTC, like orderbook_kernels.board_arrays.
+        bid_prices=np.array([4999500 - level * 1000 for level in range(BOARD_LEVELS)], dtype=np.int64),
+        bid_sizes=np.array([rng.randint(1, 100) for _ in range(BOARD_LEVELS)], dtype=np.int64),
+        ask_prices=np.array([5000500 + level * 1000 for level in range(BOARD_LEVELS)], dtype=np.int64),
+        ask_sizes=np.array([rng.randint(1, 100) for _ in range(BOARD_LEVELS)], dtype=np.int64),
+    )
+
+
+def _kernel_case(func: Callable[[orderbook_kernels.BookArrays], None]) -> Callable[[], Callable[[], None]]:
+    def setup():
+        # Exclude compile time.
+        orderbook_kernels.warmup_kernels()
+        book = _book_arrays()
+        return lambda: func(book)
+
+    return setup
+
+
+QUEUE_BATCH_SIZE = 100
+
+
+def _orderbook_queue_setup(with_db_writer: bool = False):
+    """Time on the event loop. With `with_db_writer`, boards go to LiveMarketState and are written in the DbWriter thread."""
+    SessionLocal = _populated_session()
+    queue_and_trade_manager = QueueAndTradeManager(api_key="dummy_key", api_secret="dummy_secret")
+    logger = logging.getLogger("BenchmarkLogger")
+    messages = [_orderbook_message(time.time() + i, 5000000) for i in range(QUEUE_BATCH_SIZE)]
+    db_writer, market_state = None, None
+    if with_db_writer:
+        db_writer = DbWriter(SessionLocal=SessionLocal, logger=logger)
+        db_writer.start()
+        market_state = LiveMarketState(symbol=SYMBOL, bar_builder=MultiTimeframeBarBuilder(symbol=SYMBOL))
+
+    def run():
+        for message in messages:
+            queue_and_trade_manager.add_orderbook_queue(message)
+        manager = _DrainingOrderbookQueueManager(queue_and_trade_manager)
+        asyncio.run(
+            manager.run(
+                max_orderbook_table_rows=MAX_ORDERBOOK_TABLE_ROWS,
+                logger=logger,
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+                db_writer=db_writer,
+                market_state=market_state,
+            )
+        )
+
+    return run
+
+
+def _tick_queue_setup(with_bar_builder: bool = False):
+    SessionLocal = _populated_session()
+    queue_and_trade_manager = QueueAndTradeManager(api_key="dummy_key", api_secret="dummy_secret")
+    logger = logging.getLogger("BenchmarkLogger")
+    bar_builder = MultiTimeframeBarBuilder(symbol=SYMBOL, timeframes=[*DEFAULT_TIMEFRAMES, TIME_SPAN]) if with_bar_builder else None
+
+    def run():
+        now = time.time()
+        for i in range(QUEUE_BATCH_SIZE):
+            queue_and_trade_manager.add_ticks_queue(_tick_message(now + i / QUEUE_BATCH_SIZE, 5000000))
+        manager = _DrainingTickQueueManager(queue_and_trade_manager)
+        asyncio.run(
+            manager.run(
+                symbol=SYMBOL,
+                time_span=TIME_SPAN,
+                max_tick_table_rows=MAX_TICK_TABLE_ROWS,
+                max_ohlcv_table_rows=MAX_OHLCV_TABLE_ROWS,
+                logger=logger,
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+                bar_builder=bar_builder,
+            )
+        )
+
+    return run
+
+
+BENCHMARK_CASES = [
+    BenchmarkCase("insert_board_items", _insert_board_items_setup, number=50),
+    BenchmarkCase("get_current_board", _session_case(lambda db: crud.get_current_board(db=db, symbol=SYMBOL)), number=100),
+    BenchmarkCase("insert_tick_item", _insert_tick_item_setup, number=200),
+    BenchmarkCase(
+        "create_ohlcv_from_ticks",
+        _session_case(lambda db: crud.create_ohlcv_from_ticks(db=db, symbol=SYMBOL, time_span=TIME_SPAN, max_rows=MAX_OHLCV_TABLE_ROWS)),
+        number=100,
+    ),
+    BenchmarkCase(
+        "get_ohlcv_with_symbol_as_df",
+        _session_case(
+            lambda db: crud.get_ohlcv_with_symbol(db=db, symbol=SYMBOL, limit=5, ascending=False, as_df=True, timeframe=schemas.timeframe_label(TIME_SPAN))
+        ),
+        number=200,
+    ),
+    BenchmarkCase(
+        "get_ticks_in_range", _session_case(lambda db: crud.get_ticks_in_range(db=db, symbol=SYMBOL, start_timestamp=0, end_timestamp=2**62)), number=100
+    ),
+    BenchmarkCase(
+        "get_boards_in_range", _session_case(lambda db: crud.get_boards_in_range(db=db, symbol=SYMBOL, start_timestamp=0, end_timestamp=2**62)), number=5
+    ),
+    BenchmarkCase("get_prediction_info", _session_case(lambda db: crud.get_prediction_info(db=db, symbol=SYMBOL)), number=100),
+    BenchmarkCase(
+        "board_arrays",
+        _session_case(lambda db: orderbook_kernels.board_arrays(*crud.get_current_board(db=db, symbol=SYMBOL))),
+        number=100,
+    ),
+    BenchmarkCase("kernel_cumulative_depth", _kernel_case(lambda book: orderbook_kernels.cumulative_depth(book.bid_sizes)), number=10000),
+    BenchmarkCase("kernel_depth_imbalance", _kernel_case(lambda book: orderbook_kernels.depth_imbalance(book.bid_sizes, book.ask_sizes, 10)), number=10000),
+    BenchmarkCase("kernel_weighted_mid", _kernel_case(lambda book: orderbook_kernels.weighted_mid(*book)), number=10000),
+    BenchmarkCase("kernel_vwap_to_size", _kernel_case(lambda book: orderbook_kernels.vwap_to_size(book.ask_prices, book.ask_sizes, 500)), number=10000),
+    BenchmarkCase("kernel_book_slope", _kernel_case(lambda book: orderbook_kernels.book_slope(book.bid_prices, book.bid_sizes, 20)), number=10000),
+    BenchmarkCase("orderbook_queue_manager", _orderbook_queue_setup, number=3, items_per_call=QUEUE_BATCH_SIZE),
+    BenchmarkCase("orderbook_queue_manager_db_writer", lambda: _orderbook_queue_setup(with_db_writer=True), number=3, items_per_call=QUEUE_BATCH_SIZE),
+    BenchmarkCase("tick_queue_manager", _tick_queue_setup, number=3, items_per_call=QUEUE_BATCH_SIZE),
+    BenchmarkCase("tick_queue_manager_multi_timeframe", lambda: _tick_queue_setup(with_bar_builder=True), number=3, items_per_call=QUEUE_BATCH_SIZE),
+]
+
+
+def run_case(case: BenchmarkCase, repeat: int = 5) -> Dict:
+    """Time `case.number` calls `repeat` times.
+
+    Args:
+        case (BenchmarkCase): Benchmark case.
+        repeat (int, optional): Number of rounds. Defaults to 5.
+
+    Returns:
+        Dict: Result. `us_per_item` is the median over rounds. Allocations are measured in extra calls after the rounds:
+            `gc_collections_per_1k_items` (young collections triggered with the default thresholds), `retained_blocks_per_item`
+            and `peak_kb_per_call`. `error` is set instead if the case failed.
+    """
+    try:
+        func = case.setup()
+        # Warm up caches (e.g. compiled statements of sqlalchemy).
+        func()
+        rounds = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            for _ in range(case.number):
+                func()
+            rounds.append((time.perf_counter() - start_time) / (case.number * case.items_per_call) * 1e6)
+        allocations = measure_allocations(func, calls=case.number)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+
+    median = statistics.median(rounds)
+    return {
+        "us_per_item": median,
+        "min_us_per_item": min(rounds),
+        "items_per_second": 1e6 / median,
+        "calls": case.number * repeat,
+        "gc_collections_per_1k_items": allocations.gc_collections[0] / case.items_per_call * 1000,
+        "retained_blocks_per_item": allocations.retained_blocks / case.items_per_call,
+        "peak_kb_per_call": allocations.peak_bytes / 1024,
+    }
+
+
+def run_suite(cases: List[BenchmarkCase] = BENCHMARK_CASES, repeat: int = 5, names: Optional[List[str]] = None) -> Dict:
+    results = {}
+    for case in cases:
+        if names is not None and case.name not in names:
+            continue
+        results[case.name] = run_case(case, repeat=repeat)
+
+    return {
+        "meta": {"created_at": _isoformat(time.time()), "python": platform.python_version(), "machine": platform.machine(), "node": platform.node()},
+        "results": results,
+    }
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> List[Dict]:
+    """Compare timings of report with baseline.
+
+    Args:
+        report (Dict): Output of `run_suite`.
+        baseline (Dict): Output of `run_suite` saved as the baseline.
+        threshold (float, optional): Relative slowdown to flag. Defaults to DEFAULT_REGRESSION_THRESHOLD.
+
+    Returns:
+        List[Dict]: Comparison of each case, e.g. {"name": "get_current_board", "ratio": 1.3, "status": "regression"}.
+            `status` is one of "ok", "regression", "allocation_regression", "improvement", "error" and "new".
+            "allocation_regression" is a case which is not slower but triggers more young collections.
+    """
+    comparisons = []
+    for name, result in report["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if "error" in result:
+            comparisons.append({"name": name, "ratio": None, "status": "error"})
+        elif baseline_result is None or "error" in baseline_result:
+            comparisons.append({"name": name, "ratio": None, "status": "new"})
+        else:
+            ratio = result["us_per_item"] / baseline_result["us_per_item"]
+            if ratio > 1 + threshold:
+                status = "regression"
+            elif ratio < 1 / (1 + threshold):
+                status = "improvement"
+            else:
+                status = "ok"
+
+            collections = result.get("gc_collections_per_1k_items")
+            baseline_collections = baseline_result.get("gc_collections_per_1k_items")
+            if (
+                status != "regression"
+                and collections is not None
+                and baseline_collections is not None
+                and collections > baseline_collections * (1 + threshold)
+                and collections - baseline_collections >= MIN_GC_COLLECTIONS_INCREASE
+            ):
+                status = "allocation_regression"
+            comparisons.append({"name": name, "ratio": ratio, "status": status})
+
+    return comparisons
+
+
+def format_report(report: Dict, comparisons: Optional[List[Dict]] = None) -> str:
+    statuses = {comparison["name"]: comparison for comparison in comparisons or []}
+    lines = [f"{'case':<34} {'us/item':>12} {'items/s':>12} {'gc/1k items':>12} {'peak KB':>10} {'vs baseline':>12}  status"]
+    for name, result in report["results"].items():
+        comparison = statuses.get(name, {})
+        ratio = comparison.get("ratio")
+        ratio_text = f"{ratio:.2f}x" if ratio is not None else "-"
+        if "error" in result:
+            lines.append(f"{name:<34} {'-':>12} {'-':>12} {'-':>12} {'-':>10} {ratio_text:>12}  error: {result['error']}")
+        else:
+            collections = result.get("gc_collections_per_1k_items")
+            collections_text = f"{collections:.1f}" if collections is not None else "-"
+            peak_text = f"{result['peak_kb_per_call']:.1f}" if "peak_kb_per_call" in result else "-"
+            lines.append(
+                f"{name:<34} {result['us_per_item']:>12.1f} {result['items_per_second']:>12.1f} {collections_text:>12} {peak_text:>10} {ratio_text:>12}"
+                f"  {comparison.get('status', '')}"
+            )
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Benchmark crud hot functions and queue consumers.")
+    arg_parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "latest.json"))
+    arg_parser.add_argument("--baseline", default=os.path.join(RESULTS_DIR, "baseline.json"))
+    arg_parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baseline.")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--case", action="append", dest="names", help="Run only this case. Can be repeated.")
+    args = arg_parser.parse_args()
+
+    report = run_suite(repeat=args.repeat, names=args.names)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(format_report(report))
+        print(f"Saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    comparisons = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            comparisons = compare_with_baseline(report, json.load(f), threshold=args.threshold)
+    print(format_report(report, comparisons))
+
+    regressions = [comparison["name"] for comparison in comparisons or [] if comparison["status"] in ("regression", "allocation_regression")]
+    if len(regressions) > 0:
+        print(f"Regression: {', '.join(regressions)}")
+        sys.exit(1)
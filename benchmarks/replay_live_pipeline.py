@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import ctypes
+import sqlite3
+import logging
+import tempfile
+import multiprocessing
+from typing import Dict, List, Optional
+
+sys.path.append(".")
+from gmo_hft_bot.processes import queue_and_trade_task, websocket_process
+from gmo_hft_bot.utils.feed_replay_server import FeedReplayServer, feed_replay_server_process
+from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT, LOGGING_QUEUE_MAXSIZE, listener_process
+from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
+
+CHANNELS = ["trades", "orderbooks"]
+
+
+def bench_listener_configurer():
+    file_handler = logging.FileHandler("./log/replay_bench.log", "a")
+    file_handler.setFormatter(logging.Formatter(LOGGER_FORMAT))
+    logging.getLogger().addHandler(file_handler)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _latest_tick_timestamp(database_path: str) -> Optional[int]:
+    try:
+        with sqlite3.connect(database_path, timeout=1.0) as conn:
+            return conn.execute("SELECT max(timestamp) FROM tick").fetchone()[0]
+    except sqlite3.Error:
+        # Table is not created yet or is locked by the writer.
+        return None
+
+
+def run_replay_benchmark(
+    feed_path: str,
+    speed: float = 1.0,
+    duration: Optional[float] = None,
+    port: int = 8011,
+    symbol: str = "BTC_JPY",
+    time_span: int = 5,
+    sample_interval: float = 0.5,
+    logging_level: int = logging.WARNING,
+) -> Dict:
+    """Run the live stack (`websocket_process` and `queue_and_trade_task`) against a replayed feed.
+
+    Throughput is counted from the frames which left the replay server minus the frames still waiting in the queues.
+    Queue lag is the age of the newest tick in the database (timestamps are rewritten to the send time by the server)
+    while ticks are waiting in the queue, and its distance from the last sent trades frame otherwise.
+
+    Args:
+        feed_path (str): File path of feed (see utils/feed_recorder.py).
+        speed (float, optional): Replay speed. 1.0 is real time, 0 is max speed. Defaults to 1.0.
+        duration (Optional[float], optional): Benchmark time (seconds). Defaults to the replay time of the feed.
+        port (int, optional): Port of replay server. Defaults to 8011.
+        symbol (str, optional): Name of symbol. Defaults to "BTC_JPY".
+        time_span (int, optional): Time span of bars (seconds). Defaults to 5.
+        sample_interval (float, optional): Interval of sampling queue sizes and lag (seconds). Defaults to 0.5.
+        logging_level (int, optional): Logging level of the bot processes. Defaults to logging.WARNING.
+
+    Returns:
+        Dict: Report.
+    """
+    if duration is None:
+        feed_duration = FeedReplayServer(feed_path).duration
+        duration = feed_duration / speed if speed > 0 else feed_duration
+
+    sent_counters = {channel: multiprocessing.RawValue(ctypes.c_longlong, 0) for channel in CHANNELS}
+    last_sent_times = {channel: multiprocessing.RawValue(ctypes.c_double, 0.0) for channel in CHANNELS}
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    database_path = os.path.join(tmp_dir.name, "bench.db")
+
+    queue_and_trade_manager = QueueAndTradeManager(api_key="dummy_key", api_secret="dummy_secret")
+    # The replay server answers the dummy orders of Trader.
+    queue_and_trade_manager.http_request_private_baseurl = f"http://127.0.0.1:{port}/private"
+    logging_queue = multiprocessing.Queue(LOGGING_QUEUE_MAXSIZE)
+
+    processes = [
+        multiprocessing.Process(
+            target=feed_replay_server_process,
+            kwargs={"path": feed_path, "port": port, "speed": speed, "sent_counters": sent_counters, "last_sent_times": last_sent_times},
+        ),
+        multiprocessing.Process(target=listener_process, kwargs={"queue": logging_queue, "configurer": bench_listener_configurer}),
+    ]
+    for process in processes:
+        process.start()
+    # Wait to open replay server.
+    time.sleep(1.0)
+
+    bot_processes = [
+        multiprocessing.Process(
+            target=queue_and_trade_task,
+            kwargs={
+                "symbol": symbol,
+                "time_span": time_span,
+                "max_orderbook_table_rows": 1000,
+                "max_tick_table_rows": 1000,
+                "max_ohlcv_table_rows": 100000,
+                "queue_and_trade_manager": queue_and_trade_manager,
+                "logging_level": logging_level,
+                "logging_queue": logging_queue,
+                "database_uri": f"sqlite:///{database_path}",
+            },
+        ),
+        multiprocessing.Process(
+            target=websocket_process,
+            kwargs={
+                "symbol": symbol,
+                "queue_and_trade_manager": queue_and_trade_manager,
+                "logging_level": logging_level,
+                "logging_queue": logging_queue,
+                "ws_url": f"ws://127.0.0.1:{port}/",
+            },
+        ),
+    ]
+    for process in bot_processes:
+        process.start()
+
+    queue_sizes: Dict[str, List[int]] = {channel: [] for channel in CHANNELS}
+    lags: List[float] = []
+    start_time = time.monotonic()
+    try:
+        while time.monotonic() - start_time < duration:
+            time.sleep(sample_interval)
+            ticks_queue_size = queue_and_trade_manager.get_ticks_queue_size()
+            queue_sizes["trades"].append(ticks_queue_size)
+            queue_sizes["orderbooks"].append(queue_and_trade_manager.get_orderbook_queue_size())
+            latest_tick_timestamp = _latest_tick_timestamp(database_path)
+            if latest_tick_timestamp is not None and last_sent_times["trades"].value > 0:
+                # With a backlog the newest stored tick is being processed now, otherwise the pipeline has caught up with the feed.
+                caught_up_time = time.time() if ticks_queue_size > 0 else last_sent_times["trades"].value
+                lags.append(max(0.0, caught_up_time - latest_tick_timestamp / 1000))
+
+            if not all(process.is_alive() for process in bot_processes):
+                raise RuntimeError("A bot process has stopped. See ./log/replay_bench.log")
+
+        elapsed = time.monotonic() - start_time
+        final_queue_sizes = {
+            "trades": queue_and_trade_manager.get_ticks_queue_size(),
+            "orderbooks": queue_and_trade_manager.get_orderbook_queue_size(),
+        }
+    finally:
+        for process in bot_processes + processes:
+            process.terminate()
+            process.join()
+        tmp_dir.cleanup()
+
+    report = {"feed": feed_path, "speed": speed, "elapsed_seconds": elapsed, "channels": {}}
+    for channel in CHANNELS:
+        sent = sent_counters[channel].value
+        report["channels"][channel] = {
+            "sent": sent,
+            "consumed_per_second": (sent - final_queue_sizes[channel]) / elapsed,
+            "queue_size_max": max(queue_sizes[channel], default=0),
+            "queue_size_final": final_queue_sizes[channel],
+        }
+    report["tick_lag_seconds"] = {"p50": _percentile(lags, 0.5), "p99": _percentile(lags, 0.99), "max": max(lags, default=None)}
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from benchmarks.synthetic_feed import write_synthetic_feed
+
+    arg_parser = argparse.ArgumentParser(description="Replay a recorded feed into the live bot and report throughput and queue lag.")
+    arg_parser.add_argument("path", nargs="?", help="File path of feed. If omitted, a synthetic feed is used.")
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="Replay speed. 1.0 is real time, 0 is max speed.")
+    arg_parser.add_argument("--duration", type=float, default=None, help="Benchmark time (seconds).")
+    arg_parser.add_argument("--port", type=int, default=8011)
+    arg_parser.add_argument("--output", default=None, help="Write the report as json.")
+    args = arg_parser.parse_args()
+
+    feed_path = args.path
+    if feed_path is None:
+        feed_path = os.path.join(tempfile.mkdtemp(), "synthetic_feed.bin")
+        write_synthetic_feed(feed_path, duration=30.0)
+
+    report = run_replay_benchmark(feed_path=feed_path, speed=args.speed, duration=args.duration, port=args.port)
+    print(json.dumps(report, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,95 @@
+import sys
+import json
+import random
+from decimal import Decimal
+from datetime import datetime, timezone
+
+sys.path.append(".")
+from gmo_hft_bot.utils.feed_recorder import FeedRecorder
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
+
+
+def _isoformat(unix_time_ns: int) -> str:
+    return datetime.fromtimestamp(unix_time_ns / 1e9, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def write_synthetic_feed(
+    path: str,
+    symbol: str = "BTC_JPY",
+    duration: float = 60.0,
+    trades_per_second: float = 20.0,
+    orderbooks_per_second: float = 10.0,
+    levels: int = 50,
+    seed: int = 0,
+) -> int:
+    """Write a random-walk feed in the recorder format, for machines which have neither network nor a recording.
+
+    Args:
+        path (str): File path of feed.
+        symbol (str, optional): Name of symbol. Defaults to "BTC_JPY".
+        duration (float, optional): Length of feed (seconds). Defaults to 60.0.
+        trades_per_second (float, optional): Mean rate of trades frames. Defaults to 20.0.
+        orderbooks_per_second (float, optional): Mean rate of orderbooks frames. Defaults to 10.0.
+        levels (int, optional): Price levels of each side of orderbooks. Defaults to 50.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        int: Number of frames.
+    """
+    rng = random.Random(seed)
+    # Sizes on the grid of the symbol, as the exchange sends them: up to 0.1 for trades and 1.0 for the levels of boards.
+    spec = get_symbol_spec(symbol)
+    max_trade_lots = max(1, int(Decimal("0.1") / spec.size_step))
+    max_level_lots = max(1, int(Decimal("1.0") / spec.size_step))
+    start_time_ns = 1648000000 * 10**9
+    end_time_ns = start_time_ns + int(duration * 1e9)
+    next_trade_ns = start_time_ns + int(rng.expovariate(trades_per_second) * 1e9)
+    next_orderbook_ns = start_time_ns + int(rng.expovariate(orderbooks_per_second) * 1e9)
+    mid_price = 5000000
+
+    with FeedRecorder(path) as recorder:
+        while min(next_trade_ns, next_orderbook_ns) < end_time_ns:
+            mid_price += rng.choice([-1000, 0, 1000])
+            if next_trade_ns <= next_orderbook_ns:
+                side = rng.choice(["BUY", "SELL"])
+                message = {
+                    "channel": "trades",
+                    "price": str(mid_price + (500 if side == "BUY" else -500)),
+                    "side": side,
+                    "size": spec.format_size(rng.randint(1, max_trade_lots)),
+                    "timestamp": _isoformat(next_trade_ns),
+                    "symbol": symbol,
+                }
+                recorder.write(json.dumps(message), recv_time_ns=next_trade_ns)
+                next_trade_ns += int(rng.expovariate(trades_per_second) * 1e9)
+            else:
+                message = {
+                    "channel": "orderbooks",
+                    "asks": [{"price": str(mid_price + 500 + i * 1000), "size": spec.format_size(rng.randint(1, max_level_lots))} for i in range(levels)],
+                    "bids": [{"price": str(mid_price - 500 - i * 1000), "size": spec.format_size(rng.randint(1, max_level_lots))} for i in range(levels)],
+                    "symbol": symbol,
+                    "timestamp": _isoformat(next_orderbook_ns),
+                }
+                recorder.write(json.dumps(message), recv_time_ns=next_orderbook_ns)
+                next_orderbook_ns += int(rng.expovariate(orderbooks_per_second) * 1e9)
+
+        return recorder.record_count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Write a synthetic feed in the recorder format.")
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--duration", type=float, default=60.0)
+    arg_parser.add_argument("--trades-per-second", type=float, default=20.0)
+    arg_parser.add_argument("--orderbooks-per-second", type=float, default=10.0)
+    args = arg_parser.parse_args()
+
+    count = write_synthetic_feed(
+        args.path,
+        duration=args.duration,
+        trades_per_second=args.trades_per_second,
+        orderbooks_per_second=args.orderbooks_per_second,
+    )
+    print(f"Wrote {count} frames to {args.path}")
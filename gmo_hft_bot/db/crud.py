@@ -1,13 +1,17 @@
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import or_, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine.row import Row
 import uuid
 import time
-from dateutil import parser
+import numpy as np
 import pandas as pd
 
-from gmo_hft_bot.db import schemas, models
+from gmo_hft_bot.db import records, schemas, models
+from gmo_hft_bot.utils.fixed_point import SymbolSpec, get_symbol_spec
+from gmo_hft_bot.utils.freshness import FreshnessConfig, gate_decision, incomplete_bars
+from gmo_hft_bot.utils.orderbook_kernels import BookArrays, board_arrays, book_features
 
 
 # Board methods
@@ -45,7 +49,7 @@ def get_whole_board(db: Session) -> List[schemas.Board]:
 
 
 def get_current_board(db: Session, symbol: str, side: Optional[str] = None) -> Union[List[Row], Tuple[List[Row]]]:
-    """[Get current board. return with ascending order of price.]
+    """[Get current board. return with ascending order of price. Prices are in ticks and sizes in lots.]
 
     Args:
         db (Session): [Session of sqlalchemy.]
@@ -110,12 +114,12 @@ def get_oldest_board(db: Session, symbol: str, side: Optional[str] = None) -> Un
         return db.execute(stat, {"symbol": symbol, "side": "BUY"}).all(), db.execute(stat, {"symbol": symbol, "side": "SELL"}).all()
 
 
-def insert_board_items(db: Session, insert_items: Dict, max_board_counts: int = 1000) -> None:
+def insert_board_items(db: Session, insert_items: Union[Dict, records.Board], max_board_counts: int = 1000) -> None:
     """[Insert Board items.]
 
     Args:
         db (Session): [Session of sqlalchemy]
-        insert_items (Dict): [board items]
+        insert_items (Union[Dict, records.Board]): [board items] Converted board (see records.board_from_message) or the message
             e.g. {
                     "channel":"orderbooks",
                     "asks": [
@@ -131,48 +135,20 @@ def insert_board_items(db: Session, insert_items: Dict, max_board_counts: int =
                 }
         max_board_counts (int): Max board counts (group by timestamp)
     """
+    if not isinstance(insert_items, records.Board):
+        insert_items = records.board_from_message(insert_items, get_symbol_spec(insert_items["symbol"]))
     board_items = []
-    # ask items
-    insert_asks_items = insert_items["asks"]
-    insert_bids_item = insert_items["bids"]
-    timestamp = parser.parse(insert_items["timestamp"]).timestamp() * 1000
-    timestamp = int(timestamp)
-    symbol = insert_items["symbol"]
+    timestamp = insert_items.timestamp
+    symbol = insert_items.symbol
 
     count_boards = _count_boards(db)
     if count_boards > max_board_counts:
         oldest_board = get_oldest_board(db=db, symbol=symbol, side="BUY")
         delete_board(db=db, timestamp=oldest_board[0].timestamp)
 
-    if len(insert_asks_items) > 0:
-        for item in insert_asks_items:
-            id = uuid.uuid4().hex
-            side = "SELL"
-            board_items.append(
-                models.Board(
-                    id=id,
-                    timestamp=timestamp,
-                    price=float(item["price"]),
-                    size=float(item["size"]),
-                    side=side,
-                    symbol=symbol,
-                )
-            )
-
-    if len(insert_bids_item) > 0:
-        for item in insert_bids_item:
-            id = uuid.uuid4().hex
-            side = "BUY"
-            board_items.append(
-                models.Board(
-                    id=id,
-                    timestamp=timestamp,
-                    price=float(item["price"]),
-                    size=float(item["size"]),
-                    side=side,
-                    symbol=symbol,
-                )
-            )
+    for side, levels in (("SELL", insert_items.asks), ("BUY", insert_items.bids)):
+        for level in levels:
+            board_items.append(models.Board(id=uuid.uuid4().hex, timestamp=timestamp, price=level.price, size=level.size, side=side, symbol=symbol))
 
     db.add_all(board_items)
     db.commit()
@@ -240,21 +216,25 @@ def _count_ticks(db: Session) -> int:
     return db.query(models.Tick).count()
 
 
-def get_ticks(db: Session, is_newer: bool, limit: int = 1) -> List[schemas.Tick]:
+def get_ticks(db: Session, is_newer: bool, limit: int = 1, symbol: Optional[str] = None) -> List[schemas.Tick]:
     """Get older or newer tick data.
 
     Args:
         db (Session): Session of sqlalchemy
         is_newer (bool): If True, get newer data.
         limit (int, optional): the number of ticks to get. Defaults to 1 (oldest ticks).
+        symbol (Optional[str], optional): Name of symbol. Defaults to None (all symbols).
 
     Returns:
         List[schemas.Tick]: list of older ticks
     """
+    query = db.query(models.Tick)
+    if symbol is not None:
+        query = query.filter(models.Tick.symbol == symbol)
     if is_newer:
-        return db.query(models.Tick).order_by(models.Tick.timestamp.desc()).limit(limit).all()
+        return query.order_by(models.Tick.timestamp.desc()).limit(limit).all()
     else:
-        return db.query(models.Tick).order_by(models.Tick.timestamp).limit(limit).all()
+        return query.order_by(models.Tick.timestamp).limit(limit).all()
 
 
 def delete_tick_items(db: Session, delete_items: List[schemas.Tick]) -> None:
@@ -270,12 +250,12 @@ def delete_tick_items(db: Session, delete_items: List[schemas.Tick]) -> None:
     db.commit()
 
 
-def insert_tick_item(db: Session, insert_item: Dict, max_rows: int = 1000) -> None:
+def insert_tick_item(db: Session, insert_item: Union[Dict, records.Tick], max_rows: int = 1000) -> None:
     """Insert tick item
 
     Args:
         db (Session): Session of sqlalchemy
-        insert_item (Dict): Response of GMO websocket (subscribe tick).
+        insert_item (Union[Dict, records.Tick]): Converted tick (see records.tick_from_message) or response of GMO websocket (subscribe tick).
             e.g. {
                     "channel":"trades",
                     "price": "750760",
@@ -294,52 +274,221 @@ def insert_tick_item(db: Session, insert_item: Dict, max_rows: int = 1000) -> No
         delete_tick_items(db=db, delete_items=delete_items)
 
     # insert new tick data
-    id = uuid.uuid4().hex
-    timestamp = parser.parse(insert_item["timestamp"]).timestamp() * 1000
-    timestamp = int(timestamp)
-    symbol = insert_item["symbol"]
-    tick_items = [
-        models.Tick(
-            id=id,
-            timestamp=timestamp,
-            price=float(insert_item["price"]),
-            size=float(insert_item["size"]),
-            symbol=symbol,
-        )
-    ]
+    if not isinstance(insert_item, records.Tick):
+        insert_item = records.tick_from_message(insert_item, get_symbol_spec(insert_item["symbol"]))
+    tick_items = [models.Tick(id=uuid.uuid4().hex, timestamp=insert_item.timestamp, price=insert_item.price, size=insert_item.size, symbol=insert_item.symbol)]
     db.add_all(tick_items)
     db.commit()
 
 
+def insert_tick_items(db: Session, insert_items: Sequence[Union[Dict, records.Tick]], max_rows: int = 1000) -> None:
+    """Insert ticks in one commit (e.g. trades backfilled from the REST API), unlike `insert_tick_item` per tick.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        insert_items (Sequence[Union[Dict, records.Tick]]): Converted ticks or responses of GMO (see `insert_tick_item`).
+        max_rows (int, optional): Number of max rows. The oldest ticks are deleted first. Defaults to 1000.
+    """
+    if len(insert_items) == 0:
+        return
+    ticks = [item if isinstance(item, records.Tick) else records.tick_from_message(item, get_symbol_spec(item["symbol"])) for item in insert_items]
+    delete_items_count = _count_ticks(db) + len(ticks) - max_rows
+    if delete_items_count > 0:
+        delete_items = get_ticks(db=db, is_newer=False, limit=delete_items_count)
+        for item in delete_items:
+            db.query(models.Tick).filter(models.Tick.id == item.id).delete()
+
+    db.add_all([models.Tick(id=uuid.uuid4().hex, timestamp=tick.timestamp, price=tick.price, size=tick.size, symbol=tick.symbol) for tick in ticks])
+    db.commit()
+
+
+# Range queries
+# Rows of range queries. Timestamps are Unix timestamp (ms), prices are in ticks and sizes are in lots.
+TICK_DTYPE = np.dtype([("timestamp", np.int64), ("price", np.int64), ("size", np.int64)])
+BOARD_DTYPE = np.dtype([("timestamp", np.int64), ("side", "U4"), ("price", np.int64), ("size", np.int64)])
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def _iter_chunks(db: Session, stat, params: Dict, dtype: np.dtype, chunk_size: int) -> Iterator[np.ndarray]:
+    result = db.execute(stat, params)
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if len(rows) == 0:
+                return
+            yield np.array([tuple(row) for row in rows], dtype=dtype)
+    finally:
+        result.close()
+
+
+def _concat_chunks(chunks: Iterator[np.ndarray], dtype: np.dtype, as_df: bool) -> Union[np.ndarray, pd.DataFrame]:
+    chunks = list(chunks)
+    items = np.concatenate(chunks) if len(chunks) > 0 else np.empty(0, dtype=dtype)
+    return pd.DataFrame.from_records(items) if as_df else items
+
+
+def iter_ticks_in_range(db: Session, symbol: str, start_timestamp: int, end_timestamp: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """Stream ticks of `start_timestamp <= timestamp < end_timestamp` in chunks, without ORM objects.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        start_timestamp (int): Unix timestamp (ms), inclusive.
+        end_timestamp (int): Unix timestamp (ms), exclusive.
+        chunk_size (int, optional): Max rows of a chunk. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Yields:
+        Iterator[np.ndarray]: Structured arrays of TICK_DTYPE in ascending order of timestamp.
+    """
+    stat = text(
+        """
+        select timestamp, price, size from tick
+        where tick.symbol = :symbol and tick.timestamp >= :start_timestamp and tick.timestamp < :end_timestamp
+        order by timestamp
+        """
+    )
+    params = {"symbol": symbol, "start_timestamp": start_timestamp, "end_timestamp": end_timestamp}
+    return _iter_chunks(db, stat, params, TICK_DTYPE, chunk_size)
+
+
+def get_ticks_in_range(db: Session, symbol: str, start_timestamp: int, end_timestamp: int, as_df: bool = False) -> Union[np.ndarray, pd.DataFrame]:
+    """Get ticks of `start_timestamp <= timestamp < end_timestamp` (ms) as a structured array of TICK_DTYPE or a dataframe.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        start_timestamp (int): Unix timestamp (ms), inclusive.
+        end_timestamp (int): Unix timestamp (ms), exclusive.
+        as_df (bool, optional): Get data as dataframe. Defaults to False.
+
+    Returns:
+        Union[np.ndarray, pd.DataFrame]: ticks
+    """
+    return _concat_chunks(iter_ticks_in_range(db, symbol, start_timestamp, end_timestamp), TICK_DTYPE, as_df)
+
+
+def iter_boards_in_range(db: Session, symbol: str, start_timestamp: int, end_timestamp: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """Stream board snapshots of `start_timestamp <= timestamp < end_timestamp` in chunks, without ORM objects.
+    Rows are ordered by timestamp, side and price, so that a snapshot is consecutive rows (it can span two chunks).
+
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        start_timestamp (int): Unix timestamp (ms), inclusive.
+        end_timestamp (int): Unix timestamp (ms), exclusive.
+        chunk_size (int, optional): Max rows of a chunk. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Yields:
+        Iterator[np.ndarray]: Structured arrays of BOARD_DTYPE.
+    """
+    stat = text(
+        """
+        select timestamp, side, price, size from board
+        where board.symbol = :symbol and board.timestamp >= :start_timestamp and board.timestamp < :end_timestamp
+        order by timestamp, side, price
+        """
+    )
+    params = {"symbol": symbol, "start_timestamp": start_timestamp, "end_timestamp": end_timestamp}
+    return _iter_chunks(db, stat, params, BOARD_DTYPE, chunk_size)
+
+
+def get_boards_in_range(db: Session, symbol: str, start_timestamp: int, end_timestamp: int, as_df: bool = False) -> Union[np.ndarray, pd.DataFrame]:
+    """Get board snapshots of `start_timestamp <= timestamp < end_timestamp` (ms) as a structured array of BOARD_DTYPE or a dataframe.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        start_timestamp (int): Unix timestamp (ms), inclusive.
+        end_timestamp (int): Unix timestamp (ms), exclusive.
+        as_df (bool, optional): Get data as dataframe. Defaults to False.
+
+    Returns:
+        Union[np.ndarray, pd.DataFrame]: board rows
+    """
+    return _concat_chunks(iter_boards_in_range(db, symbol, start_timestamp, end_timestamp), BOARD_DTYPE, as_df)
+
+
 # OHLCV methods
-def _count_ohlcv(db: Session) -> int:
+def _filter_ohlcv(query, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+    if symbol is not None:
+        query = query.filter(models.OHLCV.symbol == symbol)
+    if timeframe is not None:
+        query = query.filter(models.OHLCV.timeframe == timeframe)
+    return query
+
+
+def _count_ohlcv(db: Session, symbol: Optional[str] = None, timeframe: Optional[str] = None) -> int:
     """Count ohlcv rows
 
     Args:
         db (Session): Session of sqlalchemy
+        symbol (Optional[str], optional): Count only the bars of this symbol. Defaults to None.
+        timeframe (Optional[str], optional): Count only the bars of this timeframe. Defaults to None.
 
     Returns:
         (int): counts of ohlcv table rows
     """
-    return db.query(models.OHLCV).count()
+    return _filter_ohlcv(db.query(models.OHLCV), symbol=symbol, timeframe=timeframe).count()
 
 
-def _check_if_ohclv_stored(db: Session, timestamp: int) -> bool:
+def _check_if_ohclv_stored(db: Session, timestamp: int, symbol: Optional[str] = None, timeframe: Optional[str] = None) -> bool:
     """Check if the data has stored in ohlcv table
 
     Args:
         db (Session): Session of sqlalchemy
         timestamp (int): timestamp (id)
+        symbol (Optional[str], optional): Name of symbol. Defaults to None (any symbol).
+        timeframe (Optional[str], optional): Label of timeframe. Defaults to None (any timeframe).
 
     Returns:
         bool: Return true if exists.
     """
-    count_item = db.query(models.OHLCV).filter(models.OHLCV.timestamp == timestamp).count()
-    return True if count_item == 1 else False
+    count_item = _filter_ohlcv(db.query(models.OHLCV), symbol=symbol, timeframe=timeframe).filter(models.OHLCV.timestamp == timestamp).count()
+    return count_item > 0
+
+
+def _select_ohlcv(
+    db: Session,
+    symbol: Optional[str],
+    timeframe: Optional[str],
+    limit: Optional[int],
+    ascending: bool,
+    as_df: bool,
+) -> Union[List[schemas.OHLCV], pd.DataFrame]:
+    if limit is not None and limit < 1:
+        raise ValueError("`limit` should be more than 1.")
+
+    if as_df is True:
+        conditions, params = [], {}
+        if symbol is not None:
+            conditions.append("ohlcv.symbol = :symbol")
+            params["symbol"] = symbol
+        if timeframe is not None:
+            conditions.append("ohlcv.timeframe = :timeframe")
+            params["timeframe"] = timeframe
+        stat = "select * from ohlcv"
+        if len(conditions) > 0:
+            stat += " where " + " and ".join(conditions)
+        stat += " order by timestamp" if ascending else " order by timestamp desc"
+        if limit is not None:
+            stat += " limit :limit"
+            params["limit"] = limit
+        return pd.read_sql(text(stat), db.bind, params=params)
+
+    query = _filter_ohlcv(db.query(models.OHLCV), symbol=symbol, timeframe=timeframe)
+    query = query.order_by(models.OHLCV.timestamp if ascending else models.OHLCV.timestamp.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
 def get_ohlcv_with_symbol(
-    db: Session, symbol: Optional[str] = None, limit: Optional[int] = None, ascending: bool = True, as_df: bool = False
+    db: Session,
+    symbol: Optional[str] = None,
+    limit: Optional[int] = None,
+    ascending: bool = True,
+    as_df: bool = False,
+    timeframe: Optional[str] = None,
 ) -> List[schemas.OHLCV]:
     """get all ohlcv of a symbol
 
@@ -348,42 +497,16 @@ def get_ohlcv_with_symbol(
         symbol (str): Name of symbol
         limit (Optional[int], optional): limit. Defaults to None.
         ascending (bool, optional): Ascending order of timestamp. Defaults to True.
+        as_df (bool, optional): Get data as dataframe.
+        timeframe (Optional[str], optional): Label of timeframe (e.g. "5s"). Defaults to None (all timeframes).
 
     Returns:
         List[schemas.OHLCV]: list of ohlcv
     """
-    if limit is not None and limit < 1:
-        raise ValueError("`limit` should be more than 1.")
-
-    if ascending:
-        if limit is None:
-            if as_df is True:
-                stat = text("select * from ohlcv where ohlcv.symbol = :symbol order by timestamp")
-                return pd.read_sql(stat, db.bind, params={"symbol": symbol})
-            else:
-                return db.query(models.OHLCV).filter(models.OHLCV.symbol == symbol).order_by(models.OHLCV.timestamp).all()
-        else:
-            if as_df is True:
-                stat = text("select * from ohlcv where ohlcv.symbol = :symbol order by timestamp limit :limit")
-                return pd.read_sql(stat, db.bind, params={"symbol": symbol, "limit": limit})
-            else:
-                return db.query(models.OHLCV).filter(models.OHLCV.symbol == symbol).order_by(models.OHLCV.timestamp).limit(limit).all()
-    else:
-        if limit is None:
-            if as_df is True:
-                stat = text("select * from ohlcv where ohlcv.symbol = :symbol order by timestamp desc")
-                return pd.read_sql(stat, db.bind, params={"symbol": symbol})
-            else:
-                return db.query(models.OHLCV).filter(models.OHLCV.symbol == symbol).order_by(models.OHLCV.timestamp.desc()).all()
-        else:
-            if as_df is True:
-                stat = text("select * from ohlcv where ohlcv.symbol = :symbol order by timestamp desc limit :limit")
-                return pd.read_sql(stat, db.bind, params={"symbol": symbol, "limit": limit})
-            else:
-                return db.query(models.OHLCV).filter(models.OHLCV.symbol == symbol).order_by(models.OHLCV.timestamp.desc()).limit(limit).all()
+    return _select_ohlcv(db=db, symbol=symbol, timeframe=timeframe, limit=limit, ascending=ascending, as_df=as_df)
 
 
-def get_ohlcv(db: Session, limit: Optional[int] = None, ascending: bool = True, as_df: bool = False) -> List[schemas.OHLCV]:
+def get_ohlcv(db: Session, limit: Optional[int] = None, ascending: bool = True, as_df: bool = False, timeframe: Optional[str] = None) -> List[schemas.OHLCV]:
     """get all ohlcv
 
     Args:
@@ -391,86 +514,161 @@ def get_ohlcv(db: Session, limit: Optional[int] = None, ascending: bool = True,
         limit (Optional[int], optional): limit. Defaults to None.
         ascending (bool, optional): ascending order. Defaults to True.
         as_df (bool, optional): Get data as dataframe (timestamp is index column).
+        timeframe (Optional[str], optional): Label of timeframe (e.g. "5s"). Defaults to None (all timeframes).
 
     Returns:
         List[schemas.OHLCV]: Session of sqlalchemy
     """
-    if limit is not None and limit < 1:
-        raise ValueError("`limit` should be more than 1.")
+    return _select_ohlcv(db=db, symbol=None, timeframe=timeframe, limit=limit, ascending=ascending, as_df=as_df)
 
-    if ascending:
-        if limit is None:
-            if as_df is True:
-                return pd.read_sql("select * from ohlcv order by timestamp", db.bind)
-            else:
-                return db.query(models.OHLCV).order_by(models.OHLCV.timestamp).all()
-        else:
-            if as_df is True:
-                stat = text("select * from ohlcv order by timestamp limit :limit")
-                return pd.read_sql(stat, db.bind, params={"limit": limit})
-            else:
-                return db.query(models.OHLCV).order_by(models.OHLCV.timestamp).limit(limit).all()
-    else:
-        if limit is None:
-            if as_df is True:
-                return pd.read_sql("select * from ohlcv order by timestamp desc", db.bind)
-            else:
-                return db.query(models.OHLCV).order_by(models.OHLCV.timestamp.desc()).all()
-        else:
-            if as_df is True:
-                stat = text("select * from ohlcv order by timestamp desc limit :limit")
-                return pd.read_sql(stat, db.bind, params={"limit": limit})
-            else:
-                return db.query(models.OHLCV).order_by(models.OHLCV.timestamp.desc()).limit(limit).all()
+
+def _ohlcv_mapping(item: Union[records.Bar, schemas.OHLCVBase]) -> Dict:
+    # Pydantic models are accepted from callers outside the hot paths.
+    return item._asdict() if isinstance(item, records.Bar) else item.dict()
 
 
-def insert_ohlcv_items(db: Session, insert_items: List[schemas.OHLCVCreate], max_rows: int = 100) -> None:
+def insert_ohlcv_items(db: Session, insert_items: List[Union[records.Bar, schemas.OHLCVCreate]], max_rows: int = 100) -> None:
     """Insert ohlcv items
 
     Args:
         db (Session): Session of sqlalchemy
-        insert_items (List[Union[Dict, schemas.OHLCV]]): List of ohlcv items.
+        insert_items (List[Union[records.Bar, schemas.OHLCVCreate]]): List of ohlcv items.
+        max_rows (int): Number of max rows of each symbol and timeframe. Default is 100.
     """
-    # Delete older rows
-    count_ohlcv = _count_ohlcv(db=db)
-    if count_ohlcv + len(insert_items) - 1 > max_rows:
-        query_limit = count_ohlcv + len(insert_items) - max_rows + 1
-        delete_items = get_ohlcv(db=db, limit=query_limit, ascending=True)
-        delete_ohlcv_items(db=db, delete_items=delete_items)
+    # Delete older rows of each series
+    insert_counts: Dict[Tuple[str, str], int] = {}
+    for item in insert_items:
+        insert_counts[(item.symbol, item.timeframe)] = insert_counts.get((item.symbol, item.timeframe), 0) + 1
+
+    for (symbol, timeframe), insert_count in insert_counts.items():
+        count_ohlcv = _count_ohlcv(db=db, symbol=symbol, timeframe=timeframe)
+        if count_ohlcv + insert_count - 1 > max_rows:
+            query_limit = count_ohlcv + insert_count - max_rows + 1
+            delete_items = get_ohlcv_with_symbol(db=db, symbol=symbol, timeframe=timeframe, limit=query_limit, ascending=True)
+            delete_ohlcv_items(db=db, delete_items=delete_items)
 
     ohlcv_items = []
     for item in insert_items:
-        item = models.OHLCV(**item.dict())
+        item = models.OHLCV(**_ohlcv_mapping(item))
         ohlcv_items.append(item)
 
     db.add_all(ohlcv_items)
     db.commit()
 
 
-def update_ohlcv_items(db: Session, update_items: List[schemas.OHLCV]) -> None:
+def update_ohlcv_items(db: Session, update_items: List[Union[records.Bar, schemas.OHLCV]]) -> None:
     """Update ohlcv items
 
     Args:
         db (Session): Session of sqlalchemy
-        update_items (List[schemas.OHLCV]): update ohlcv items.
+        update_items (List[Union[records.Bar, schemas.OHLCV]]): update ohlcv items.
     """
     for item in update_items:
-        db.query(models.OHLCV).filter(models.OHLCV.timestamp == item.timestamp).update(item.dict())
+        db.query(models.OHLCV).filter(
+            models.OHLCV.symbol == item.symbol, models.OHLCV.timeframe == item.timeframe, models.OHLCV.timestamp == item.timestamp
+        ).update(_ohlcv_mapping(item))
+
+    db.commit()
+
+
+# Columns of a bar which ticks change.
+OHLCV_VALUE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+def _upsert_ohlcv_statement():
+    stat = sqlite_insert(models.OHLCV.__table__)
+    table = models.OHLCV.__table__
+    return stat.on_conflict_do_update(
+        index_elements=["symbol", "timeframe", "timestamp"],
+        set_={column: stat.excluded[column] for column in OHLCV_VALUE_COLUMNS},
+        # Stored bars which have not changed are not written again.
+        where=or_(*(table.c[column] != stat.excluded[column] for column in OHLCV_VALUE_COLUMNS)),
+    )
+
+
+_UPSERT_OHLCV = _upsert_ohlcv_statement()
+
+
+def _newest_ohlcv_timestamps(db: Session, series: List[Tuple[str, str]]) -> List[Optional[int]]:
+    """Timestamp of the newest bar of each (symbol, timeframe), in one query of primary key seeks. None for an empty series."""
+    columns = ", ".join(f"(select max(timestamp) from ohlcv where symbol = :symbol{i} and timeframe = :timeframe{i})" for i in range(len(series)))
+    params = {}
+    for i, (symbol, timeframe) in enumerate(series):
+        params[f"symbol{i}"], params[f"timeframe{i}"] = symbol, timeframe
+    return list(db.execute(text(f"select {columns}"), params).one())
+
 
+def _trim_ohlcv(db: Session, symbol: str, timeframe: str, max_rows: int) -> None:
+    """Delete bars older than the newest `max_rows` bars of the series."""
+    db.execute(
+        text(
+            """
+            delete from ohlcv where ohlcv.symbol = :symbol and ohlcv.timeframe = :timeframe and ohlcv.timestamp <= (
+                select timestamp from ohlcv where ohlcv.symbol = :symbol and ohlcv.timeframe = :timeframe
+                order by timestamp desc limit 1 offset :max_rows
+            )
+            """
+        ),
+        {"symbol": symbol, "timeframe": timeframe, "max_rows": max_rows},
+    )
+
+
+def upsert_ohlcv_items(db: Session, items: List[Union[records.Bar, schemas.OHLCVCreate]], max_rows: int = 100) -> None:
+    """Insert new bars and update stored bars (e.g. the open bar which has been updated by new ticks) in one
+    `INSERT ... ON CONFLICT (symbol, timeframe, timestamp) DO UPDATE`. Stored bars which have not changed are not written.
+
+    Series are trimmed to `max_rows` bars only when a bar newer than the stored ones is added, so a flush which
+    updates the open bar costs a lookup of the newest bars and the upsert.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        items (List[Union[records.Bar, schemas.OHLCVCreate]]): ohlcv items.
+        max_rows (int): Number of max rows of each symbol and timeframe. Default is 100.
+    """
+    if len(items) == 0:
+        return
+
+    rows = [_ohlcv_mapping(item) for item in items]
+    newest_timestamps: Dict[Tuple[str, str], int] = {}
+    for row in rows:
+        key = (row["symbol"], row["timeframe"])
+        newest_timestamps[key] = max(newest_timestamps.get(key, row["timestamp"]), row["timestamp"])
+    series = list(newest_timestamps.keys())
+    stored_timestamps = _newest_ohlcv_timestamps(db, series)
+
+    db.execute(_UPSERT_OHLCV, rows)
+    for (symbol, timeframe), stored_timestamp in zip(series, stored_timestamps):
+        if stored_timestamp is None or newest_timestamps[(symbol, timeframe)] > stored_timestamp:
+            _trim_ohlcv(db, symbol=symbol, timeframe=timeframe, max_rows=max_rows)
     db.commit()
 
 
 def delete_ohlcv_items(db: Session, delete_items: List[Union[Dict, schemas.OHLCV]]) -> None:
+    """Delete ohlcv items. Items without `symbol` or `timeframe` delete the bars of all symbols or timeframes at the timestamp.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        delete_items (List[Union[Dict, schemas.OHLCV]]): delete ohlcv items.
+    """
     for item in delete_items:
         if isinstance(item, Dict):
-            db.query(models.OHLCV).filter(models.OHLCV.timestamp == item["timestamp"]).delete()
+            query = _filter_ohlcv(db.query(models.OHLCV), symbol=item.get("symbol"), timeframe=item.get("timeframe"))
+            query.filter(models.OHLCV.timestamp == item["timestamp"]).delete()
         else:
-            db.query(models.OHLCV).filter(models.OHLCV.timestamp == item.timestamp).delete()
+            query = _filter_ohlcv(db.query(models.OHLCV), symbol=item.symbol, timeframe=item.timeframe)
+            query.filter(models.OHLCV.timestamp == item.timestamp).delete()
 
     db.commit()
 
 
-def create_ohlcv_from_ticks(db: Session, symbol: str, time_span: int, max_rows: int = 100) -> None:
+def create_ohlcv_from_ticks(
+    db: Session,
+    symbol: str,
+    time_span: int,
+    max_rows: int = 100,
+    min_unix_timestamp: Optional[int] = None,
+    timeframe: Optional[str] = None,
+) -> None:
     """Create OHLCV (5 seconds) from tick data.
 
     Args:
@@ -478,6 +676,9 @@ def create_ohlcv_from_ticks(db: Session, symbol: str, time_span: int, max_rows:
         symbol (str): Name of pair
         timespan (int): Timespan to create timebar.
         max_rows (int): Number of max rows of ohlcv table. Default is 100.
+        min_unix_timestamp (Optional[int]): Aggregate ticks newer than this unix timestamp (ms).
+            Default is None (from the open time of the previous bar). Used to backfill a gap.
+        timeframe (Optional[str]): Label of bars. Default is None (`schemas.timeframe_label(time_span)`).
     """
     stat = text(
         """
@@ -505,82 +706,250 @@ def create_ohlcv_from_ticks(db: Session, symbol: str, time_span: int, max_rows:
         order by open_time desc
         """
     )
-    # [TODO]: filter ticks by timestamp
-    min_unix_timestamp = (time.time() // time_span - 1) * time_span * 1000
+    if min_unix_timestamp is None:
+        min_unix_timestamp = (time.time() // time_span - 1) * time_span * 1000
+    if timeframe is None:
+        timeframe = schemas.timeframe_label(time_span)
+    spec = get_symbol_spec(symbol)
 
     ohlcv_items = db.execute(stat, {"symbol": symbol, "time_span": time_span, "min_unix_timestamp": min_unix_timestamp}).all()
-    ohlcv_insert_items = []
-    ohlcv_update_items = []
-    timestamps = []
-
-    for item in ohlcv_items:
-        ohlcv_model = schemas.OHLCVCreate(open=item[0], high=item[1], low=item[2], close=item[3], volume=item[4], timestamp=item[5] * time_span, symbol=symbol)
-        if _check_if_ohclv_stored(db, timestamp=ohlcv_model.timestamp) is True:
-            ohlcv_update_items.append(ohlcv_model)
-            timestamps.append(ohlcv_model.timestamp)
-        else:
-            ohlcv_insert_items.append(ohlcv_model)
-            timestamps.append(ohlcv_model.timestamp)
+    bars = [
+        records.Bar(
+            open=spec.to_price(item[0]),
+            high=spec.to_price(item[1]),
+            low=spec.to_price(item[2]),
+            close=spec.to_price(item[3]),
+            volume=spec.to_size(item[4]),
+            timestamp=item[5] * time_span,
+            symbol=symbol,
+            timeframe=timeframe,
+        )
+        for item in ohlcv_items
+    ]
 
-    # Check if no trade when before step.
+    # Check if no trade when before step: carry the close of the previous bar, unless the bar is stored.
     check_timestamp = int(min_unix_timestamp // 1000)
-    if (
-        check_timestamp not in timestamps
-        and _check_if_ohclv_stored(db, timestamp=check_timestamp) is False
-        and _check_if_ohclv_stored(db, timestamp=check_timestamp - time_span) is True
-    ):
-        ohlcv_item = db.execute(text("select * from ohlcv where ohlcv.timestamp = :timestamp"), {"timestamp": check_timestamp - time_span}).all()
-        close = ohlcv_item[0].close
-        ohlcv_insert_items.append(schemas.OHLCVCreate(timestamp=check_timestamp, open=close, low=close, high=close, close=close, volume=0.0, symbol=symbol))
-
-    insert_ohlcv_items(db=db, insert_items=ohlcv_insert_items, max_rows=max_rows)
-    update_ohlcv_items(db=db, update_items=ohlcv_update_items)
+    carried = 0
+    if all(bar.timestamp != check_timestamp for bar in bars):
+        carried = db.execute(
+            text(
+                """
+                insert into ohlcv (timestamp, open, high, low, close, volume, symbol, timeframe)
+                select :timestamp, close, close, close, close, 0.0, symbol, timeframe from ohlcv
+                where ohlcv.symbol = :symbol and ohlcv.timeframe = :timeframe and ohlcv.timestamp = :previous_timestamp
+                on conflict (symbol, timeframe, timestamp) do nothing
+                """
+            ),
+            {"symbol": symbol, "timeframe": timeframe, "timestamp": check_timestamp, "previous_timestamp": check_timestamp - time_span},
+        ).rowcount
+
+    if len(bars) > 0:
+        upsert_ohlcv_items(db=db, items=bars, max_rows=max_rows)
+        return
+    if carried > 0:
+        _trim_ohlcv(db, symbol=symbol, timeframe=timeframe, max_rows=max_rows)
+    db.commit()
 
 
 # PREDICT methods
-def insert_predict_items(db: Session, insert_items: List[Dict]):
-    predict_items = []
-    for item in insert_items:
-        item["id"] = uuid.uuid4().hex
-        item["timestamp"] = round(time.time() * 1000)
-        predict_items.append(models.PREDICT(**item))
+def insert_predict_items(db: Session, insert_items: List[Dict]) -> None:
+    """Append rows to the decision journal in one executemany, without ORM objects.
 
-    db.add_all(predict_items)
+    Args:
+        db (Session): Session of sqlalchemy
+        insert_items (List[Dict]): Rows with the columns of models.PREDICT except `id` (e.g. from DecisionJournal).
+            `timestamp` defaults to now.
+    """
+    if len(insert_items) == 0:
+        return
+    now = round(time.time() * 1000)
+    rows = [item if "timestamp" in item else {**item, "timestamp": now} for item in insert_items]
+    db.execute(models.PREDICT.__table__.insert(), rows)
     db.commit()
 
 
-def get_predict_items(db: Session, symbol: str):
+def get_predict_items(db: Session, symbol: str) -> List[models.PREDICT]:
     return db.query(models.PREDICT).filter(models.PREDICT.symbol == symbol).order_by(models.PREDICT.timestamp).all()
 
 
+# Rows of `iter_predictions_in_range`. bar_timestamp is 0 for rows without it and features are bytes of float64 (or None).
+PREDICT_DTYPE = np.dtype(
+    [
+        ("timestamp", np.int64),
+        ("strategy_id", "U32"),
+        ("kind", np.int8),
+        ("side", np.int8),
+        ("price", np.float64),
+        ("size", np.float64),
+        ("predict_value", np.float64),
+        ("is_entry", np.bool_),
+        ("bar_timestamp", np.int64),
+        ("features", object),
+        ("freshness", np.int16),
+    ]
+)
+
+
+def iter_predictions_in_range(db: Session, symbol: str, start_timestamp: int, end_timestamp: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """Stream the decision journal of `start_timestamp <= timestamp < end_timestamp` in chunks, without ORM objects.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        start_timestamp (int): Unix timestamp (ms), inclusive.
+        end_timestamp (int): Unix timestamp (ms), exclusive.
+        chunk_size (int, optional): Max rows of a chunk. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Yields:
+        Iterator[np.ndarray]: Structured arrays of PREDICT_DTYPE in the order of the decisions.
+    """
+    stat = text(
+        """
+        select timestamp, strategy_id, kind, side, price, size, predict_value, is_entry, coalesce(bar_timestamp, 0), features, coalesce(freshness, 0)
+        from predict
+        where predict.symbol = :symbol and predict.timestamp >= :start_timestamp and predict.timestamp < :end_timestamp
+        order by timestamp, id
+        """
+    )
+    params = {"symbol": symbol, "start_timestamp": start_timestamp, "end_timestamp": end_timestamp}
+    return _iter_chunks(db, stat, params, PREDICT_DTYPE, chunk_size)
+
+
+def get_predictions_in_range(db: Session, symbol: str, start_timestamp: int, end_timestamp: int, as_df: bool = False) -> Union[np.ndarray, pd.DataFrame]:
+    """Get the decision journal of `start_timestamp <= timestamp < end_timestamp` (ms) as a structured array of PREDICT_DTYPE or a dataframe.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        start_timestamp (int): Unix timestamp (ms), inclusive.
+        end_timestamp (int): Unix timestamp (ms), exclusive.
+        as_df (bool, optional): Get data as dataframe. Defaults to False.
+
+    Returns:
+        Union[np.ndarray, pd.DataFrame]: rows of the journal
+    """
+    return _concat_chunks(iter_predictions_in_range(db, symbol, start_timestamp, end_timestamp), PREDICT_DTYPE, as_df)
+
+
 # Predict calculation
-def get_prediction_info(db: Session, symbol: str) -> schemas.PreidictInfo:
-    # Do predict calculation.
+# Number of bars used by `get_prediction`.
+PREDICTION_BARS = 5
+
+
+def get_prediction_info(
+    db: Session,
+    symbol: str,
+    prefetched_ohlcv_df: Optional[pd.DataFrame] = None,
+    bar_close_timestamp: Optional[int] = None,
+    timeframe: Optional[str] = None,
+    freshness_config: Optional[FreshnessConfig] = None,
+    last_tick_timestamp: Optional[int] = None,
+    now: Optional[float] = None,
+) -> records.Decision:
+    """Do predict calculation.
 
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        prefetched_ohlcv_df (Optional[pd.DataFrame]): Newest `PREDICTION_BARS` bars read just before the bar closed.
+            If given, only the bars which can have changed since then are read. Defaults to None.
+        bar_close_timestamp (Optional[int]): Unix timestamp (s) when the bar closed. Bars opened at or after it are not used.
+            Defaults to None (use the newest bars).
+        timeframe (Optional[str]): Label of timeframe of the bars (e.g. "5s"). Defaults to None (all timeframes).
+        freshness_config (Optional[FreshnessConfig]): Skip or downsize the orders if the board, the ticks or the bars are stale
+            (see utils/freshness.py). The age of the board is that of the board rows read here. Defaults to None (no check).
+        last_tick_timestamp (Optional[int]): Unix timestamp (ms) of the newest tick (e.g. BarScheduler.latest_tick_timestamp).
+            Defaults to None (unknown).
+        now (Optional[float]): Unix time (s) of the decision, which the ages of the inputs are measured at. Defaults to None
+            (time.time()).
+
+    Returns:
+        records.Decision: Prediction.
+    """
     # Get Best bid & best ask
     buy_board_items, sell_board_items = get_current_board(db=db, symbol=symbol)
 
     # Get ohlcv
-    ohlcv_df = get_ohlcv_with_symbol(db=db, limit=5, as_df=True, ascending=False, symbol=symbol)
-    ohlcv_df = ohlcv_df.sort_values("timestamp")
+    if prefetched_ohlcv_df is None:
+        ohlcv_df = get_ohlcv_with_symbol(db=db, limit=PREDICTION_BARS + 1, as_df=True, ascending=False, symbol=symbol, timeframe=timeframe)
+    else:
+        # Only the closing bar and the bar opened after the prefetch can have changed.
+        updated_items = get_ohlcv_with_symbol(db=db, limit=2, ascending=False, symbol=symbol, timeframe=timeframe)
+        updated_df = pd.DataFrame(
+            [[item.timestamp, item.open, item.high, item.low, item.close, item.volume, item.symbol] for item in updated_items],
+            columns=["timestamp", "open", "high", "low", "close", "volume", "symbol"],
+        )
+        ohlcv_df = pd.concat([prefetched_ohlcv_df, updated_df]).drop_duplicates("timestamp", keep="last")
 
+    if bar_close_timestamp is not None:
+        ohlcv_df = ohlcv_df.loc[ohlcv_df["timestamp"] < bar_close_timestamp]
+    ohlcv_df = ohlcv_df.sort_values("timestamp").iloc[-PREDICTION_BARS:].reset_index(drop=True)
+
+    features = prediction_features(ohlcv_df, book=board_arrays(buy_board_items, sell_board_items))
     prediction = get_prediction(ohlcv_df)
 
-    if len(buy_board_items) > 0 and len(sell_board_items) > 0 and prediction is not None:
-        best_bid, best_ask = buy_board_items[-1], sell_board_items[0]
+    best_bid_price = buy_board_items[-1].price if len(buy_board_items) > 0 else None
+    best_ask_price = sell_board_items[0].price if len(sell_board_items) > 0 else None
+    decision = build_prediction_info(
+        prediction=prediction, best_bid_price=best_bid_price, best_ask_price=best_ask_price, spec=get_symbol_spec(symbol), features=features
+    )
+    if freshness_config is None:
+        return decision
+
+    # The older side of the board.
+    board_timestamps = [items[0].timestamp for items in (buy_board_items, sell_board_items) if len(items) > 0]
+    incomplete = incomplete_bars(
+        ohlcv_df["timestamp"].tolist(),
+        ohlcv_df["volume"].tolist(),
+        bars=PREDICTION_BARS,
+        time_span=None if timeframe is None else schemas.timeframe_span(timeframe),
+        bar_close_timestamp=bar_close_timestamp,
+    )
+    return gate_decision(
+        decision,
+        freshness_config,
+        board_timestamp=min(board_timestamps) if len(board_timestamps) == 2 else None,
+        last_tick_timestamp=last_tick_timestamp,
+        incomplete=incomplete,
+        now=now,
+    )
+
+
+def build_prediction_info(
+    prediction: Optional[Dict],
+    best_bid_price: Optional[int],
+    best_ask_price: Optional[int],
+    spec: SymbolSpec,
+    features: Optional[List[float]] = None,
+) -> records.Decision:
+    """Order prices and sizes of a prediction.
+
+    Args:
+        prediction (Optional[Dict]): Result of `get_prediction`.
+        best_bid_price (Optional[int]): Best bid (ticks). None if there is no bid.
+        best_ask_price (Optional[int]): Best ask (ticks). None if there is no ask.
+        spec (SymbolSpec): Units of the prices.
+        features (Optional[List[float]]): Result of `prediction_features`, kept in the decision journal. Defaults to None.
+
+    Returns:
+        records.Decision: Prediction. No entry if either side of the board or the prediction is missing.
+    """
+    if best_bid_price is not None and best_ask_price is not None and prediction is not None:
         # spread = best_ask.price - best_bid.price
-        return schemas.PreidictInfo(
+        # Quote one tick inside the best prices.
+        return records.Decision(
             is_buy_entry=prediction["is_buy_entry"],
             is_sell_entry=prediction["is_sell_entry"],
-            buy_price=best_bid.price + 1,
-            sell_price=best_ask.price - 1,
+            buy_price=spec.to_price(best_bid_price + 1),
+            sell_price=spec.to_price(best_ask_price - 1),
             buy_size=0.01,
             sell_size=0.01,
-            buy_predict_value=prediction["buy_predict_value"],
-            sell_predict_value=prediction["sell_predict_value"],
+            buy_predict_value=float(prediction["buy_predict_value"]),
+            sell_predict_value=float(prediction["sell_predict_value"]),
+            features=features,
         )
     else:
-        return schemas.PreidictInfo(
+        return records.Decision(
             is_buy_entry=False,
             is_sell_entry=False,
             buy_price=0.0,
@@ -589,9 +958,25 @@ def get_prediction_info(db: Session, symbol: str) -> schemas.PreidictInfo:
             sell_size=0.0,
             buy_predict_value=0.0,
             sell_predict_value=0.0,
+            features=features,
         )
 
 
+# Columns of the bars which `get_prediction` reads.
+PREDICTION_FEATURE_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+def prediction_features(ohlcv_df: pd.DataFrame, book: Optional[BookArrays] = None) -> List[float]:
+    """Snapshot of the inputs of `get_prediction`: PREDICTION_FEATURE_COLUMNS of each bar, oldest bar first, flattened.
+
+    With `book`, the BOOK_FEATURE_NAMES of the board (see utils/orderbook_kernels.py) follow the bar features.
+    """
+    features = ohlcv_df[PREDICTION_FEATURE_COLUMNS].to_numpy(dtype=np.float64).ravel().tolist()
+    if book is not None:
+        features.extend(book_features(book))
+    return features
+
+
 # Ryotaro trade
 def get_prediction(ohlcv_df: pd.DataFrame) -> Optional[Dict]:
     # ===================
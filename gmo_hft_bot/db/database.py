@@ -1,4 +1,6 @@
-from typing import Optional, Tuple
+import contextlib
+import threading
+from typing import Callable, Iterator, Optional, Tuple
 
 import sqlalchemy
 
@@ -13,7 +15,8 @@ def initialize_database(uri: Optional[str] = None) -> Tuple[sqlalchemy.engine.En
         Tuple[sqlalchemy.engine.Engine, sqlalchemy.orm.Session]: Engine and Session.
     """
     if uri is None:
-        engine = sqlalchemy.create_engine("sqlite:///:memory:")
+        # One connection shared by all threads (e.g. utils/db_writer.DbWriter), otherwise each thread has its own empty database.
+        engine = sqlalchemy.create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=sqlalchemy.pool.StaticPool)
     else:
         engine = sqlalchemy.create_engine(uri)
 
@@ -22,4 +25,28 @@ def initialize_database(uri: Optional[str] = None) -> Tuple[sqlalchemy.engine.En
     return engine, SessionLocal
 
 
+class SerializedSessionLocal:
+    """Session factory whose sessions are used by one thread at a time.
+
+    The in-memory database of `initialize_database` is one connection shared by all threads, so a commit or rollback in
+    one thread ends the transaction of another. Every user of such an engine (e.g. the threads of utils/db_writer.DbWriter
+    and the event loop) takes its sessions from one SerializedSessionLocal. Sessions can be nested in one thread.
+    """
+
+    def __init__(self, SessionLocal: Callable[[], sqlalchemy.orm.Session], lock: Optional[threading.RLock] = None):
+        """
+        Args:
+            SessionLocal (Callable[[], sqlalchemy.orm.Session]): Session factory of sqlalchemy.
+            lock (Optional[threading.RLock], optional): Held from the creation to the close of a session. Defaults to None
+                (a new lock).
+        """
+        self.SessionLocal = SessionLocal
+        self.lock = lock or threading.RLock()
+
+    @contextlib.contextmanager
+    def __call__(self) -> Iterator[sqlalchemy.orm.Session]:
+        with self.lock, self.SessionLocal() as db:
+            yield db
+
+
 Base = sqlalchemy.orm.declarative_base()
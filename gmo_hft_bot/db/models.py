@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, Boolean
+from sqlalchemy import Column, Integer, Float, String, Boolean, Index, LargeBinary, PrimaryKeyConstraint, SmallInteger
 
 from gmo_hft_bot.db.database import Base
 
@@ -7,51 +7,80 @@ from gmo_hft_bot.db.database import Base
 
 class Board(Base):
     __tablename__ = "board"
+    # Indexes follow the access paths of crud (see tests/db/test_query_plans.py).
+    __table_args__ = (
+        # The newest and oldest board of a side (crud.get_current_board, crud.get_oldest_board).
+        Index("ix_board_symbol_side_timestamp", "symbol", "side", "timestamp"),
+        # Range scans of a symbol (crud.iter_boards_in_range).
+        Index("ix_board_symbol_timestamp", "symbol", "timestamp"),
+    )
 
     # Generate id using uuid
     id = Column(String(128), primary_key=True)
     # Unix timestamp (ms) should be int converted from isoformat string
     timestamp = Column(Integer, index=True)
-    price = Column(Float, index=True)
-    size = Column(Float)
-    side = Column(String(10), index=True)
-    symbol = Column(String(10), index=True)
+    # Price in ticks and size in lots of the symbol (see utils/fixed_point.py).
+    price = Column(Integer)
+    size = Column(Integer)
+    side = Column(String(10))
+    symbol = Column(String(10))
 
 
 class Tick(Base):
     __tablename__ = "tick"
+    # Range scans of a symbol (crud.iter_ticks_in_range) and the window query of crud.create_ohlcv_from_ticks.
+    __table_args__ = (Index("ix_tick_symbol_timestamp", "symbol", "timestamp"),)
 
     # generate id using uuid
     id = Column(String(128), primary_key=True)
     # Unix timestamp (ms) should be int converted from isoformat string
     timestamp = Column(Integer, index=True)
-    price = Column(Float, index=True)
-    size = Column(Float)
-    symbol = Column(String(10), index=True)
+    # Price in ticks and size in lots of the symbol (see utils/fixed_point.py).
+    price = Column(Integer)
+    size = Column(Integer)
+    symbol = Column(String(10))
 
 
 class OHLCV(Base):
     __tablename__ = "ohlcv"
+    # Bars of several symbols and timeframes share the table. The primary key serves the queries of a symbol.
+    __table_args__ = (PrimaryKeyConstraint("symbol", "timeframe", "timestamp"),)
 
-    # Unix timestamp (s).
-    timestamp = Column(Integer, primary_key=True, index=True)
+    # Unix timestamp (s) of the open time. Unix timestamp (ms) for information bars (see utils/bar_builder.py).
+    timestamp = Column(Integer, index=True)
     open = Column(Float)
     high = Column(Float)
     low = Column(Float)
     close = Column(Float)
     volume = Column(Float)
-    symbol = Column(String(10), index=True)
+    symbol = Column(String(10))
+    # Label of time span (e.g. "5s", "1m") or information bar (e.g. "tick100"). See schemas.timeframe_label.
+    timeframe = Column(String(32))
 
 
 class PREDICT(Base):
+    """Decision journal. Rows are appended in batches (crud.insert_predict_items) and read in bulk (crud.iter_predictions_in_range)."""
+
     __tablename__ = "predict"
-    # generate id using uuid
-    id = Column(String(128), primary_key=True)
-    # Unix timestamp (s).
-    timestamp = Column(Integer, index=True)
-    side = Column(String(10))
+    __table_args__ = (Index("ix_predict_symbol_timestamp", "symbol", "timestamp"),)
+
+    # rowid, in the order of the decisions.
+    id = Column(Integer, primary_key=True)
+    # Unix timestamp (ms) of the decision.
+    timestamp = Column(Integer)
+    symbol = Column(String(10))
+    strategy_id = Column(String(32))
+    # schemas.PREDICT_KIND_*
+    kind = Column(SmallInteger)
+    # schemas.PREDICT_SIDE_BUY or schemas.PREDICT_SIDE_SELL
+    side = Column(SmallInteger)
     price = Column(Float)
     size = Column(Float)
     predict_value = Column(Float)
-    symbol = Column(String(10), index=True)
     is_entry = Column(Boolean)
+    # Unix timestamp (s) of the bar close which the decision is made at. NULL for the other kinds.
+    bar_timestamp = Column(Integer, nullable=True)
+    # float64 array of the features used (see crud.prediction_features). NULL if unknown.
+    features = Column(LargeBinary, nullable=True)
+    # schemas.FRESHNESS_* flags: why the orders of the decision were skipped or downsized. 0 for fresh inputs.
+    freshness = Column(SmallInteger, default=0)
@@ -0,0 +1,100 @@
+"""Records of the hot paths.
+
+Websocket messages are validated and converted to ticks and lots once, when they are taken from the queues, and
+the consumers, bar builders and crud pass these records around. They are NamedTuples: building one costs a tuple,
+while a pydantic model validates every field again. The pydantic models of `schemas` are kept for the boundaries
+(responses of the exchange, rows read with the ORM).
+"""
+
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+
+
+class Tick(NamedTuple):
+    # Unix timestamp (ms).
+    timestamp: int
+    # Ticks and lots (see utils/fixed_point.py).
+    price: int
+    size: int
+    side: str
+    symbol: str
+
+
+class BookLevel(NamedTuple):
+    # Ticks and lots.
+    price: int
+    size: int
+
+
+class Board(NamedTuple):
+    # Unix timestamp (ms).
+    timestamp: int
+    symbol: str
+    # In the order of the message.
+    bids: Tuple[BookLevel, ...]
+    asks: Tuple[BookLevel, ...]
+
+
+class Bar(NamedTuple):
+    """Row of the ohlcv table. Same fields as `schemas.OHLCVCreate`."""
+
+    # Unix timestamp (s) of the open.
+    timestamp: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    symbol: str
+    timeframe: str
+
+
+class Decision(NamedTuple):
+    """Prediction at a bar close. Same fields as `schemas.PreidictInfo`."""
+
+    is_buy_entry: bool
+    is_sell_entry: bool
+    buy_price: float
+    sell_price: float
+    buy_size: float
+    sell_size: float
+    buy_predict_value: float
+    sell_predict_value: float
+    # Inputs of the prediction (see crud.prediction_features). None if unknown.
+    features: Optional[List[float]] = None
+    # schemas.FRESHNESS_* flags (see utils/freshness.py).
+    freshness: int = 0
+
+
+# Raised by `tick_from_message` and `board_from_message` for a malformed message, or a price or size off the grid of the spec.
+# The queue consumers drop such messages instead of restarting.
+INVALID_MESSAGE_ERRORS = (KeyError, TypeError, ValueError, ArithmeticError)
+
+
+def parse_unix_timestamp(timestamp: str) -> int:
+    """Unix timestamp (ms) of isoformat string of GMO (e.g. 2018-03-30T12:34:56.789Z)."""
+    return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def tick_from_message(message: Dict, spec: SymbolSpec) -> Tick:
+    """Tick of a trades message of GMO websocket (the format of `crud.insert_tick_item`)."""
+    return Tick(
+        timestamp=parse_unix_timestamp(message["timestamp"]),
+        price=spec.to_ticks(message["price"]),
+        size=spec.to_lots(message["size"]),
+        side=message["side"],
+        symbol=message["symbol"],
+    )
+
+
+def board_from_message(message: Dict, spec: SymbolSpec) -> Board:
+    """Board of an orderbooks message of GMO websocket (the format of `crud.insert_board_items`)."""
+    to_ticks, to_lots = spec.to_ticks, spec.to_lots
+    return Board(
+        timestamp=parse_unix_timestamp(message["timestamp"]),
+        symbol=message["symbol"],
+        bids=tuple(BookLevel(to_ticks(item["price"]), to_lots(item["size"])) for item in message["bids"]),
+        asks=tuple(BookLevel(to_ticks(item["price"]), to_lots(item["size"])) for item in message["asks"]),
+    )
@@ -1,13 +1,61 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 sides = ["BUY", "SELL"]
 
+# Typed columns of the predict table (decision journal, see utils/decision_journal.py).
+# side
+PREDICT_SIDE_BUY = 1
+PREDICT_SIDE_SELL = -1
+# kind: a decision at a bar close, or the best price after the order price (local online backtest).
+PREDICT_KIND_DECISION = 0
+PREDICT_KIND_TRACK_BEST = 1
+# freshness: flags of the stale inputs of a decision (see utils/freshness.py). 0 if they are fresh.
+FRESHNESS_OK = 0
+# Orders are skipped: no board or an old board, no recent tick, too many missing bars, or lagging feeds (utils/feed_lag.py).
+FRESHNESS_STALE_BOOK = 1
+FRESHNESS_STALE_TICKS = 2
+FRESHNESS_INCOMPLETE_BARS = 4
+FRESHNESS_FEED_LAG = 8
+# Orders are downsized: an aging board, or a few missing bars.
+FRESHNESS_AGING_BOOK = 16
+FRESHNESS_PARTIAL_BARS = 32
+FRESHNESS_SKIP_FLAGS = FRESHNESS_STALE_BOOK | FRESHNESS_STALE_TICKS | FRESHNESS_INCOMPLETE_BARS | FRESHNESS_FEED_LAG
+FRESHNESS_DOWNSIZE_FLAGS = FRESHNESS_AGING_BOOK | FRESHNESS_PARTIAL_BARS
+FRESHNESS_NAMES = {
+    FRESHNESS_STALE_BOOK: "stale_book",
+    FRESHNESS_STALE_TICKS: "stale_ticks",
+    FRESHNESS_INCOMPLETE_BARS: "incomplete_bars",
+    FRESHNESS_FEED_LAG: "feed_lag",
+    FRESHNESS_AGING_BOOK: "aging_book",
+    FRESHNESS_PARTIAL_BARS: "partial_bars",
+}
+
+
+def timeframe_label(time_span: int) -> str:
+    """Label of bars of `time_span` seconds, e.g. 5 -> "5s", 60 -> "1m", 3600 -> "1h"."""
+    if time_span % 3600 == 0:
+        return f"{time_span // 3600}h"
+    if time_span % 60 == 0:
+        return f"{time_span // 60}m"
+    return f"{time_span}s"
+
+
+def timeframe_span(label: str) -> Optional[int]:
+    """Time span (seconds) of a label of `timeframe_label`, e.g. "1m" -> 60. None for the labels of information bars."""
+    unit = {"s": 1, "m": 60, "h": 3600}.get(label[-1:])
+    if unit is None or not label[:-1].isdigit():
+        return None
+    return int(label[:-1]) * unit
+
 
 class BoardBase(BaseModel):
     id: str
     timestamp: int
-    price: float
-    size: float
+    # Ticks and lots (see utils/fixed_point.py).
+    price: int
+    size: int
     side: str
     symbol: str
 
@@ -26,8 +74,9 @@ class Board(BoardBase):
 class TickBase(BaseModel):
     id: str
     timestamp: int
-    price: float
-    size: float
+    # Ticks and lots (see utils/fixed_point.py).
+    price: int
+    size: int
     symbol: str
 
 
@@ -50,6 +99,7 @@ class OHLCVBase(BaseModel):
     close: float
     volume: float
     symbol: str
+    timeframe: str
 
 
 class OHLCVCreate(OHLCVBase):
@@ -64,14 +114,22 @@ class OHLCV(OHLCVBase):
 
 
 class PREDICT(BaseModel):
-    id: str
+    id: int
     timestamp: int
-    side: str
+    symbol: str
+    strategy_id: str
+    kind: int
+    side: int
     price: float
     size: float
     predict_value: float
-    symbol: str
     is_entry: bool
+    bar_timestamp: Optional[int]
+    features: Optional[bytes]
+    freshness: int = FRESHNESS_OK
+
+    class Config:
+        orm_mode = True
 
 
 class PreidictInfo(BaseModel):
@@ -83,3 +141,7 @@ class PreidictInfo(BaseModel):
     sell_size: float
     buy_predict_value: float
     sell_predict_value: float
+    # Inputs of the prediction (see crud.prediction_features). None if unknown.
+    features: Optional[List[float]] = None
+    # FRESHNESS_* flags.
+    freshness: int = FRESHNESS_OK
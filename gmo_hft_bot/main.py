@@ -1,6 +1,7 @@
+import asyncio
 import logging
-import multiprocessing
 import os
+import signal
 import sys
 import traceback
 
@@ -10,10 +11,17 @@ from dotenv import load_dotenv
 import sqlalchemy.orm  # noqa: F401
 
 sys.path.append(".")
-from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT
-from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
+from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT, LOGGING_QUEUE_MAXSIZE, listener_configurer, listener_process
+from gmo_hft_bot.utils.process_supervisor import COMMAND_TOGGLE_PROFILER, ProcessLaunchConfig, ProcessSupervisor, parse_cpu_list
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
-from gmo_hft_bot.processes import get_logging_process, websocket_process, get_manage_queue_and_trade_process
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
+from gmo_hft_bot.utils.gmo_public_rest_client import GmoPublicRestClient
+from gmo_hft_bot.utils.event_loop import LOOP_AUTO, LoopConfig
+from gmo_hft_bot.utils.gc_control import GcConfig
+from gmo_hft_bot.utils.freshness import FreshnessConfig
+from gmo_hft_bot.utils.private_api_scheduler import RateLimitConfig
+from gmo_hft_bot.utils.shared_market_state import SharedMarketStateConfig, unlink_shared_market_state
+from gmo_hft_bot.processes import websocket_process, queue_and_trade_task
 
 # Load .env file
 load_dotenv()
@@ -23,53 +31,126 @@ logger = logging.getLogger("rootLogger")
 
 def main():
     logging_level = logging.DEBUG
-    logging_queue = multiprocessing.Manager().Queue(-1)
+    # The supervisor restarts only the process which failed. forkserver starts the bot processes from a clean server
+    # process instead of copying this one. PROCESS_START_METHOD=fork|forkserver|spawn to change it.
+    supervisor = ProcessSupervisor(logger=logger, start_method=os.environ.get("PROCESS_START_METHOD", "forkserver"))
+    # Queues and locks shared with the processes are created with the start method of the supervisor.
+    logging_queue = supervisor.context.Queue(LOGGING_QUEUE_MAXSIZE)
     logging.basicConfig(level=logging_level, format=LOGGER_FORMAT)
 
     database_uri = "sqlite:///example.db"
-
-    queue_and_trade_manager = QueueAndTradeManager(api_key=os.environ["EXCHANGE_API_KEY"], api_secret=os.environ["EXCHANGE_API_SECRET"])
+    # Bars and the last board are checkpointed here and restored on restart.
+    snapshot_path = "./market_state.npz"
+    # `kill -USR2 <pid>` toggles the sampling profiler of the process (of all bot processes for the main process).
+    profile_output_dir = "./log/profiles"
+    # EVENT_LOOP=uvloop|asyncio|auto selects the event loop of the bot processes (uvloop needs `pip install uvloop`).
+    # The loop lag is sent with the heartbeats. Steps of coroutines longer than 50 ms are logged on the asyncio loop, and
+    # on uvloop only with EVENT_LOOP_DEBUG=1, whose debug mode costs the speedup of uvloop.
+    loop_config = LoopConfig(
+        loop=os.environ.get("EVENT_LOOP", LOOP_AUTO),
+        executor_workers=4,
+        slow_callback_duration=0.05,
+        debug=os.environ.get("EVENT_LOOP_DEBUG") == "1",
+    )
+    # WEBSOCKET_CPUS and TRADE_CPUS (e.g. "2" or "2-3") pin the processes to cores, to avoid jitter from core migration
+    # on a shared box. The logging process runs at a lower priority. Objects created at startup are frozen out of the GC.
+    websocket_launch_config = ProcessLaunchConfig(cpu_affinity=parse_cpu_list(os.environ.get("WEBSOCKET_CPUS")), gc_freeze=True)
+    trade_launch_config = ProcessLaunchConfig(cpu_affinity=parse_cpu_list(os.environ.get("TRADE_CPUS")), gc_freeze=True)
+    logging_launch_config = ProcessLaunchConfig(nice=10)
+    # After startup, the queue and trade process raises the GC thresholds and collects right after each decision.
+    gc_config = GcConfig()
+
+    # The queues are bounded. When the consumers fall behind, old boards are dropped, and the websocket waits instead of
+    # dropping ticks. Trading pauses while the dequeued messages are older than MAX_FEED_LAG seconds.
+    queue_and_trade_manager = QueueAndTradeManager(
+        api_key=os.environ["EXCHANGE_API_KEY"],
+        api_secret=os.environ["EXCHANGE_API_SECRET"],
+        orderbook_queue_maxsize=int(os.environ.get("ORDERBOOK_QUEUE_MAXSIZE", "100")),
+        ticks_queue_maxsize=int(os.environ.get("TICKS_QUEUE_MAXSIZE", "100000")),
+        context=supervisor.context,
+    )
+    max_feed_lag = float(os.environ.get("MAX_FEED_LAG", "1.0"))
+    # Orders are skipped on a board older than 2 s, no tick for a minute or gaps in the bars, and halved on an aging board.
+    freshness_config = FreshnessConfig()
+    # Private requests are kept under PRIVATE_API_RATE requests per second (the limit of the account tier), cancels first.
+    private_api_rate = float(os.environ.get("PRIVATE_API_RATE", "6"))
+    rate_limit_config = RateLimitConfig(rate=private_api_rate, burst=max(int(private_api_rate), 1))
+    # Top 10 levels, last trade and 100 bars in /dev/shm, for monitors and other strategies on the host
+    # (`SharedMarketStateReader(symbol).read()`).
+    shared_market_state_config = SharedMarketStateConfig(levels=10, bars=100)
     symbol = "BTC_JPY"
     time_span = 5
     max_orderbook_table_rows = 1000
     max_tick_table_rows = 1000
     max_ohlcv_table_rows = 100000
+    # The websocket process fans out the feed to local subscribers on MARKET_DATA_SOCKET, so that other strategies and
+    # the recorder (`python gmo_hft_bot/utils/market_data_service.py`) need no subscription to GMO. Empty to disable.
+    market_data_socket = os.environ.get("MARKET_DATA_SOCKET", f"/tmp/gmo_hft_bot_{symbol}.sock") or None
 
-    logging_process = get_logging_process(logging_queue=logging_queue, queue_and_trade_manager=queue_and_trade_manager)
-    queue_and_trade_process = get_manage_queue_and_trade_process(
-        symbol=symbol,
-        time_span=time_span,
-        max_orderbook_table_rows=max_orderbook_table_rows,
-        max_tick_table_rows=max_tick_table_rows,
-        max_ohlcv_table_rows=max_ohlcv_table_rows,
-        queue_and_trade_manager=queue_and_trade_manager,
-        logging_level=logging_level,
-        logging_queue=logging_queue,
-        database_uri=database_uri,
-    )
-
+    # Prices and sizes are stored in ticks and lots of the symbol.
     try:
-        logging_process.start()
-        queue_and_trade_process.start()
-
-        websocket_process(symbol=symbol, queue_and_trade_manager=queue_and_trade_manager, logging_level=logging_level)
-
-        logging_process.join()
-        queue_and_trade_process.join()
-    except ConnectionFailedError:
-        logging_process.terminate()
-        queue_and_trade_process.terminate()
+        symbol_spec = asyncio.run(GmoPublicRestClient().get_symbol_specs())[symbol]
+    except Exception as e:
+        symbol_spec = get_symbol_spec(symbol)
+        logger.warning(f"Failed to get symbol spec. Use {symbol_spec}: {e}")
 
-        logger.warning("Rerun bot")
+    supervisor.add_process(
+        "logging", target=listener_process, kwargs={"queue": logging_queue, "configurer": listener_configurer}, launch_config=logging_launch_config
+    )
+    supervisor.add_process(
+        "websocket",
+        target=websocket_process,
+        kwargs={
+            "symbol": symbol,
+            "queue_and_trade_manager": queue_and_trade_manager,
+            "logging_level": logging_level,
+            "logging_queue": logging_queue,
+            "profile_output_dir": profile_output_dir,
+            "loop_config": loop_config,
+            "market_data_socket": market_data_socket,
+        },
+        launch_config=websocket_launch_config,
+    )
+    supervisor.add_process(
+        "queue_and_trade",
+        target=queue_and_trade_task,
+        kwargs={
+            "symbol": symbol,
+            "time_span": time_span,
+            "max_orderbook_table_rows": max_orderbook_table_rows,
+            "max_tick_table_rows": max_tick_table_rows,
+            "max_ohlcv_table_rows": max_ohlcv_table_rows,
+            "queue_and_trade_manager": queue_and_trade_manager,
+            "logging_level": logging_level,
+            "logging_queue": logging_queue,
+            # Avoid AttributeError: Can't pickle local object 'create_engine.<locals>.connect'
+            "SessionLocal": None,
+            "database_uri": database_uri,
+            "snapshot_path": snapshot_path,
+            "profile_output_dir": profile_output_dir,
+            "symbol_spec": symbol_spec,
+            "loop_config": loop_config,
+            "gc_config": gc_config,
+            "max_feed_lag": max_feed_lag,
+            "freshness_config": freshness_config,
+            "rate_limit_config": rate_limit_config,
+            "shared_market_state_config": shared_market_state_config,
+        },
+        health_flag=queue_and_trade_manager.subprocesses_alive,
+        launch_config=trade_launch_config,
+    )
 
-        main()
+    signal.signal(signal.SIGUSR2, lambda *_: supervisor.broadcast_command(COMMAND_TOGGLE_PROFILER))
 
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        logger.info("Stop bot")
     except Exception as e:
         logger.error(traceback.format_exc())
         logger.error(e)
-
-        logging_process.terminate()
-        queue_and_trade_process.terminate()
+    finally:
+        unlink_shared_market_state(symbol)
 
 
 if __name__ == "__main__":
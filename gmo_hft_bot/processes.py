@@ -1,7 +1,7 @@
-import asyncio
 import logging
-from typing import Tuple, Optional
+from typing import Sequence, Tuple, Optional
 import multiprocessing
+from multiprocessing.connection import Connection
 import sys
 
 from dotenv import load_dotenv
@@ -9,9 +9,26 @@ import sqlalchemy
 
 sys.path.append(".")
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
-from gmo_hft_bot.threads.websocket_threads import run_multiple_websockets
+from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
+from gmo_hft_bot.threads.websocket_threads import PUBLIC_WS_URL, run_multiple_websockets
 from gmo_hft_bot.threads.queue_and_trade_threads import run_manage_queue_and_trading
-from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT, listener_configurer, listener_process, worker_configurer
+from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT, worker_configurer
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
+from gmo_hft_bot.utils.sampling_profiler import attach_profiler
+from gmo_hft_bot.threads.connect_orderbook_ws import ConnectOrderbookWs
+from gmo_hft_bot.threads.connect_tick_ws import ConnectTickWs
+from gmo_hft_bot.threads.manage_orderbook_queue import OrderbookQueueManager
+from gmo_hft_bot.threads.manage_tick_queue import TickQueueManager
+from gmo_hft_bot.threads.trade import Trader
+from gmo_hft_bot.utils.market_state_snapshot import MarketStateCheckpointer
+from gmo_hft_bot.utils.bar_scheduler import CLOSE_ON_CLOCK
+from gmo_hft_bot.utils.bar_builder import DEFAULT_TIMEFRAMES
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+from gmo_hft_bot.utils.event_loop import LoopConfig, run_with_loop
+from gmo_hft_bot.utils.gc_control import GcConfig
+from gmo_hft_bot.utils.freshness import FreshnessConfig
+from gmo_hft_bot.utils.private_api_scheduler import RateLimitConfig
+from gmo_hft_bot.utils.shared_market_state import SharedMarketStateConfig
 
 # Load .env file
 load_dotenv()
@@ -22,14 +39,25 @@ def websocket_process(
     queue_and_trade_manager: QueueAndTradeManager,
     logging_level: Tuple[str, int],
     logging_queue: Optional[multiprocessing.Queue] = None,
+    heartbeat_conn: Optional[Connection] = None,
+    ws_url: str = PUBLIC_WS_URL,
+    profile_output_dir: Optional[str] = None,
+    loop_config: Optional[LoopConfig] = None,
+    market_data_socket: Optional[str] = None,
 ):
-    """Main process
+    """Websocket process
 
     Args:
         symbol (str): Name of symbol
         queue_and_trade_manager (QueueAndTradeManager): gmo websockets
         logging_level (Tuple[str, int]): Logging level
         logging_queue (multiprocessing.Queue): Logging queue for multiprocessing. Default is None
+        heartbeat_conn (Optional[Connection]): Pipe to ProcessSupervisor. Default is None
+        ws_url (str): Url of public websocket. Set a replay server (utils/feed_replay_server.py) to run offline.
+        profile_output_dir (Optional[str]): Output directory of the sampling profiler toggled by SIGUSR2. Default is None (disabled)
+        loop_config (Optional[LoopConfig]): Event loop implementation and tuning (see utils/event_loop.py). Default is None (asyncio.run)
+        market_data_socket (Optional[str]): Unix domain socket of the market data service, which fans out the frames to local
+            subscribers (see utils/market_data_service.py). Default is None (no service)
     """
     if logging_queue is None:
         logger = logging.getLogger("WebsocketThredsLogger")
@@ -47,19 +75,26 @@ def websocket_process(
         if logging_level is not None:
             logger.setLevel(logging_level)
 
-    asyncio.run(run_multiple_websockets(symbol=symbol, logger=logger, queue_and_trade_manager=queue_and_trade_manager))
-
-
-def get_logging_process(logging_queue: multiprocessing.Queue, queue_and_trade_manager: QueueAndTradeManager) -> multiprocessing.Process:
-    logging_process = multiprocessing.Process(
-        target=listener_process,
-        args=(
-            logging_queue,
-            listener_configurer,
-            queue_and_trade_manager,
-        ),
-    )
-    return logging_process
+    heartbeat = Heartbeat(heartbeat_conn, name="websocket") if heartbeat_conn is not None else None
+    attach_profiler(profile_output_dir, name="websocket", tag_classes=[ConnectOrderbookWs, ConnectTickWs, Heartbeat], logger=logger, heartbeat=heartbeat)
+    try:
+        run_with_loop(
+            run_multiple_websockets(
+                symbol=symbol,
+                logger=logger,
+                queue_and_trade_manager=queue_and_trade_manager,
+                heartbeat=heartbeat,
+                ws_url=ws_url,
+                market_data_socket=market_data_socket,
+            ),
+            logger=logger,
+            config=loop_config,
+            heartbeat=heartbeat,
+        )
+    except ConnectionFailedError:
+        if heartbeat is not None:
+            heartbeat.fail("ConnectionFailedError in websocket process")
+        raise
 
 
 def queue_and_trade_task(
@@ -73,66 +108,95 @@ def queue_and_trade_task(
     logging_queue: multiprocessing.Queue,
     SessionLocal: Optional[sqlalchemy.orm.Session] = None,
     database_uri: Optional[str] = None,
+    snapshot_path: Optional[str] = None,
+    heartbeat_conn: Optional[Connection] = None,
+    profile_output_dir: Optional[str] = None,
+    bar_close_on: str = CLOSE_ON_CLOCK,
+    timeframes: Sequence[int] = DEFAULT_TIMEFRAMES,
+    information_bars: Sequence[Tuple[str, float]] = (),
+    symbol_spec: Optional[SymbolSpec] = None,
+    loop_config: Optional[LoopConfig] = None,
+    gc_config: Optional[GcConfig] = None,
+    max_feed_lag: Optional[float] = None,
+    freshness_config: Optional[FreshnessConfig] = None,
+    rate_limit_config: Optional[RateLimitConfig] = None,
+    shared_market_state_config: Optional[SharedMarketStateConfig] = None,
 ):
-    logger = logging.getLogger("QueueAndTradeLogger")
-    worker_configurer(logging_queue, logger.getEffectiveLevel())
-    logger.setLevel(logging_level)
-    asyncio.run(
-        run_manage_queue_and_trading(
-            symbol=symbol,
-            time_span=time_span,
-            max_orderbook_table_rows=max_orderbook_table_rows,
-            max_tick_table_rows=max_tick_table_rows,
-            max_ohlcv_table_rows=max_ohlcv_table_rows,
-            logger=logger,
-            queue_and_trade_manager=queue_and_trade_manager,
-            SessionLocal=SessionLocal,
-            database_uri=database_uri,
-        )
-    )
-
-
-def get_manage_queue_and_trade_process(
-    symbol: str,
-    time_span: int,
-    max_orderbook_table_rows: int,
-    max_tick_table_rows: int,
-    max_ohlcv_table_rows: int,
-    queue_and_trade_manager: QueueAndTradeManager,
-    logging_level: Tuple[str, int],
-    logging_queue: multiprocessing.Queue,
-    database_uri: str,
-) -> multiprocessing.Process:
-    """Sub processes. Logging process and manage_queue_and_trade process.
+    """Queue and trade process.
 
     Args:
         symbol (str): Name of symbol.
         time_span (int): Time span (seconds).
         max_orderbook_table_rows (int): Number of max orderbook table rows.
         max_tick_table_rows (int): Number of max tick table rows.
-        max_ohlcv_table_rows (int): Number of max ohlcv table rows.
+        max_ohlcv_table_rows (int): Number of max ohlcv table rows of each timeframe.
         queue_and_trade_manager (QueueAndTradeManager): Manage queue class.
         logging_level (Tuple[str, int]): Logging level.
         logging_queue (multiprocessing.Queue): Queue of multiprocessing.
-
-    Return:
-        (logging_process, queue_and_trade_process)
+        SessionLocal (Optional[sqlalchemy.orm.Session]): Session of sqlalchemy. Use None in multiprocessing
+            to avoid AttributeError: Can't pickle local object 'create_engine.<locals>.connect'.
+        database_uri (Optional[str]): Database uri. Needed if SessionLocal is None.
+        snapshot_path (Optional[str]): File path of market state snapshot. If None, start without warm start.
+        heartbeat_conn (Optional[Connection]): Pipe to ProcessSupervisor. Default is None
+        profile_output_dir (Optional[str]): Output directory of the sampling profiler toggled by SIGUSR2. Default is None (disabled)
+        bar_close_on (str): When Trader regards a bar as closed, CLOSE_ON_CLOCK or CLOSE_ON_TICKS (see utils/bar_scheduler.py).
+            Default is CLOSE_ON_CLOCK
+        timeframes (Sequence[int]): Time spans (seconds) of bars stored in ohlcv table in addition to `time_span`. Default is DEFAULT_TIMEFRAMES
+        information_bars (Sequence[Tuple[str, float]]): (bar type, threshold) of information bars stored in ohlcv table,
+            e.g. [(BAR_TYPE_VOLUME, 1.0)] (see utils/bar_builder.py). Default is ()
+        symbol_spec (Optional[SymbolSpec]): Tick size and size step of the symbol. Default is None (see utils/fixed_point.py)
+        loop_config (Optional[LoopConfig]): Event loop implementation and tuning (see utils/event_loop.py). Default is None (asyncio.run)
+        gc_config (Optional[GcConfig]): GC settings after startup (see utils/gc_control.py). Default is None (default GC)
+        max_feed_lag (Optional[float]): Pause trading while queued messages lag more than this (seconds, see utils/feed_lag.py).
+            Default is None (never pause)
+        freshness_config (Optional[FreshnessConfig]): Skip or downsize orders on stale inputs (see utils/freshness.py). Default is None (no check)
+        rate_limit_config (Optional[RateLimitConfig]): Token bucket of the private API (see utils/private_api_scheduler.py).
+            Default is None (RateLimitConfig())
+        shared_market_state_config (Optional[SharedMarketStateConfig]): Publish the board, last trade and bars to shared memory
+            (see utils/shared_market_state.py). Default is None (not published)
     """
-
-    queue_and_trade_process = multiprocessing.Process(
-        target=queue_and_trade_task,
-        args=(
-            symbol,
-            time_span,
-            max_orderbook_table_rows,
-            max_tick_table_rows,
-            max_ohlcv_table_rows,
-            queue_and_trade_manager,
-            logging_level,
-            logging_queue,
-            None,  # Avoid AttributeError: Can't pickle local object 'create_engine.<locals>.connect'
-            database_uri,
-        ),
+    logger = logging.getLogger("QueueAndTradeLogger")
+    worker_configurer(logging_queue, logger.getEffectiveLevel())
+    logger.setLevel(logging_level)
+    heartbeat = Heartbeat(heartbeat_conn, name="queue_and_trade") if heartbeat_conn is not None else None
+    attach_profiler(
+        profile_output_dir,
+        name="queue_and_trade",
+        tag_classes=[TickQueueManager, OrderbookQueueManager, Trader, MarketStateCheckpointer, Heartbeat],
+        logger=logger,
+        heartbeat=heartbeat,
     )
-
-    return queue_and_trade_process
+    try:
+        run_with_loop(
+            run_manage_queue_and_trading(
+                symbol=symbol,
+                time_span=time_span,
+                max_orderbook_table_rows=max_orderbook_table_rows,
+                max_tick_table_rows=max_tick_table_rows,
+                max_ohlcv_table_rows=max_ohlcv_table_rows,
+                logger=logger,
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+                database_uri=database_uri,
+                heartbeat=heartbeat,
+                snapshot_path=snapshot_path,
+                bar_close_on=bar_close_on,
+                timeframes=timeframes,
+                information_bars=information_bars,
+                symbol_spec=symbol_spec,
+                gc_config=gc_config,
+                max_feed_lag=max_feed_lag,
+                freshness_config=freshness_config,
+                rate_limit_config=rate_limit_config,
+                shared_market_state_config=shared_market_state_config,
+            ),
+            logger=logger,
+            config=loop_config,
+            heartbeat=heartbeat,
+        )
+    except ConnectionFailedError:
+        # Tell the websocket loops directly instead of waiting for the supervisor to notice.
+        queue_and_trade_manager.update_subprocesses_alive_status(False)
+        if heartbeat is not None:
+            heartbeat.fail("ConnectionFailedError in queue and trade process")
+        raise
@@ -4,17 +4,27 @@ import json
 import logging
 import time
 import traceback
+from typing import Optional
 
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 from gmo_hft_bot.utils.gmo_websocket_subscriber import GmoWebsocketSubscriber
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
+from gmo_hft_bot.utils.feed_lag import FEED_ORDERBOOKS
+from gmo_hft_bot.utils.market_data_service import MarketDataService
 
 
 class ConnectOrderbookWs:
     RUNNING = True
     gmo_websocket_subscriber = GmoWebsocketSubscriber()
 
-    async def run(self, ws_url: str, symbol: str, logger: logging.Logger, queue_and_trade_manager: QueueAndTradeManager):
+    async def run(
+        self,
+        ws_url: str,
+        symbol: str,
+        logger: logging.Logger,
+        queue_and_trade_manager: QueueAndTradeManager,
+        market_data_service: Optional[MarketDataService] = None,
+    ):
         async with websockets.connect(ws_url, logger=logger, ping_timeout=1.0) as ws:
             ws.logger.info("Start orderbook")
             # Subscribe board topic
@@ -22,30 +32,38 @@ class ConnectOrderbookWs:
             await asyncio.wait_for(ws.send(subscribe_message), timeout=1.0)
             ws.logger.info("Orderbook subscribed!")
 
+            # Hoisted out of the loop. The queue size is an IPC call, so only ask for it when it is logged.
+            is_debug = ws.logger.isEnabledFor(logging.DEBUG)
             while self.RUNNING:
-                ws.logger.debug("Running Orderbook websockets")
-                ws.logger.debug(f"Orderbook Queue count: {queue_and_trade_manager.get_orderbook_queue_size()}")
+                if is_debug:
+                    ws.logger.debug("Orderbook Queue count: %d", queue_and_trade_manager.get_orderbook_queue_size())
                 try:
                     if queue_and_trade_manager.is_subprocesses_alive() is True:
                         # Get data
-                        res = await ws.recv()
-                        res = json.loads(res)
+                        frame = await ws.recv()
+                        res = json.loads(frame)
                         if "error" in list(res.keys()):
                             if "Invalid request parameter" in res["error"]:
                                 raise ValueError(f"Invalid request parameter sybol={symbol}")
                             else:
-                                ws.logger.error(f"Error response: {res}. Try to subscribe again")
+                                ws.logger.error("Error response: %s. Try to subscribe again", res)
                                 # Try to connect again
                                 time.sleep(0.5)
                                 await asyncio.wait_for(ws.send(subscribe_message), timeout=1.0)
                         else:
-                            queue_and_trade_manager.add_orderbook_queue(res)
+                            # Before the queue, which can wait for the consumer.
+                            if market_data_service is not None:
+                                market_data_service.publish(FEED_ORDERBOOKS, frame)
+                            await queue_and_trade_manager.add_orderbook_queue_async(res)
 
                         await asyncio.sleep(0.1)
                     else:
-                        msg = "subprocesses are dead."
-                        ws.logger.error(msg)
-                        raise Exception(msg)
+                        # The supervisor is restarting the queue/trade process.
+                        # Keep the subscription and drop frames until it is healthy again. The subscribers of the
+                        # market data service still get them.
+                        frame = await ws.recv()
+                        if market_data_service is not None and "error" not in json.loads(frame):
+                            market_data_service.publish(FEED_ORDERBOOKS, frame)
                 except websockets.exceptions.ConnectionClosed:
                     ws.logger.error("Public websocket connection has been closed.")
                     await asyncio.sleep(0.0)
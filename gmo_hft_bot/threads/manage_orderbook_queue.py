@@ -2,37 +2,82 @@ import sys
 import asyncio
 import logging
 import traceback
+from typing import Optional
 
 import sqlalchemy
 
 sys.path.append(".")
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
-from gmo_hft_bot.db import crud
+from gmo_hft_bot.db import crud, records
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
+from gmo_hft_bot.utils.db_writer import DbWriter, DirectWriter
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
+from gmo_hft_bot.utils.feed_lag import FEED_ORDERBOOKS, FeedLagMonitor
+from gmo_hft_bot.utils.shared_market_state import SharedMarketStateWriter
 
 
 class OrderbookQueueManager:
     RUNNING = True
 
+    def __init__(self) -> None:
+        # Malformed or off-grid orderbooks messages, which are dropped.
+        self.invalid_messages = 0
+
     async def run(
         self,
         max_orderbook_table_rows: int,
         logger: logging.Logger,
         queue_and_trade_manager: QueueAndTradeManager,
         SessionLocal: sqlalchemy.orm.Session,
+        db_writer: Optional[DbWriter] = None,
+        market_state: Optional[LiveMarketState] = None,
+        feed_monitor: Optional[FeedLagMonitor] = None,
+        shared_state: Optional[SharedMarketStateWriter] = None,
     ):
+        """Store queued boards.
+
+        Args:
+            max_orderbook_table_rows (int): Number of max boards of board table.
+            logger (logging.Logger): logger
+            queue_and_trade_manager (QueueAndTradeManager): Queue manager.
+            SessionLocal (sqlalchemy.orm.Session): Session factory of sqlalchemy.
+            db_writer (Optional[DbWriter]): Writer of the boards. Defaults to None (write at once with `SessionLocal`).
+            market_state (Optional[LiveMarketState]): Updated with each board before it is written. Defaults to None.
+            feed_monitor (Optional[FeedLagMonitor]): Told the lag of each dequeued board and the overflows (dropped boards) of
+                the board queue. Defaults to None.
+            shared_state (Optional[SharedMarketStateWriter]): Publish the top levels of the board of `market_state` to the
+                other processes, once per batch of boards. Defaults to None.
+
+        Malformed messages and messages off the grid of the symbol spec are counted in `invalid_messages` and dropped.
+        """
+        is_debug = logger.isEnabledFor(logging.DEBUG)
+        writer = db_writer or DirectWriter(SessionLocal)
         while self.RUNNING:
             try:
-                with SessionLocal() as db:
-                    # Save orderbook queue
-                    qsize = queue_and_trade_manager.get_orderbook_queue_size()
-                    if qsize > 0:
-                        logger.debug(f"Orderbook queue count: {qsize}")
-                        for _ in range(qsize):
-                            item = queue_and_trade_manager.get_orderbook_queue_item()
-
-                            logger.debug("Add orderbook queue item to DB")
-                            crud.insert_board_items(db=db, insert_items=item, max_board_counts=max_orderbook_table_rows)
+                # Save orderbook queue
+                qsize = queue_and_trade_manager.get_orderbook_queue_size()
+                if qsize > 0:
+                    if is_debug:
+                        logger.debug("Orderbook queue count: %d", qsize)
+                    for _ in range(qsize):
+                        item = queue_and_trade_manager.get_orderbook_queue_item()
+                        try:
+                            # Converted once, for the market state and the writer.
+                            board = records.board_from_message(item, get_symbol_spec(item["symbol"]))
+                        except records.INVALID_MESSAGE_ERRORS as e:
+                            self.invalid_messages += 1
+                            logger.warning("Drop invalid orderbooks message (%d in total): %r", self.invalid_messages, e)
+                            continue
+                        if feed_monitor is not None:
+                            feed_monitor.observe(FEED_ORDERBOOKS, board.timestamp)
+                        if market_state is not None:
+                            market_state.update_board(board)
+                        writer.submit(crud.insert_board_items, insert_items=board, max_board_counts=max_orderbook_table_rows)
+                    if feed_monitor is not None:
+                        feed_monitor.report_overflows(FEED_ORDERBOOKS, queue_and_trade_manager.get_orderbook_queue_overflows())
+                    if shared_state is not None and market_state is not None and market_state.board_timestamp is not None:
+                        shared_state.publish_book(market_state.book, market_state.board_timestamp)
 
                 await asyncio.sleep(0.0)
             except asyncio.TimeoutError:
@@ -1,19 +1,31 @@
 import sys
+import time
 import asyncio
 import logging
 import traceback
+from typing import Optional, Sequence
 
 import sqlalchemy
 
 sys.path.append(".")
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
-from gmo_hft_bot.db import crud
+from gmo_hft_bot.db import crud, records
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
+from gmo_hft_bot.utils.bar_scheduler import BarScheduler
+from gmo_hft_bot.utils.bar_builder import InformationBarBuilder, MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
+from gmo_hft_bot.utils.db_writer import DbWriter, DirectWriter
+from gmo_hft_bot.utils.feed_lag import FEED_TRADES, FeedLagMonitor
+from gmo_hft_bot.utils.shared_market_state import SharedMarketStateWriter
 
 
 class TickQueueManager:
     RUNNING = True
 
+    def __init__(self) -> None:
+        # Malformed or off-grid trades messages, which are dropped.
+        self.invalid_messages = 0
+
     async def run(
         self,
         symbol: str,
@@ -23,22 +35,86 @@ class TickQueueManager:
         logger: logging.Logger,
         queue_and_trade_manager: QueueAndTradeManager,
         SessionLocal: sqlalchemy.orm.Session,
+        bar_scheduler: Optional[BarScheduler] = None,
+        bar_builder: Optional[MultiTimeframeBarBuilder] = None,
+        information_bar_builders: Sequence[InformationBarBuilder] = (),
+        db_writer: Optional[DbWriter] = None,
+        feed_monitor: Optional[FeedLagMonitor] = None,
+        shared_state: Optional[SharedMarketStateWriter] = None,
     ):
+        """Store queued ticks and update bars.
+
+        Args:
+            symbol (str): Name of symbol
+            time_span (int): Time span of bars (seconds). Used if `bar_builder` is None.
+            max_tick_table_rows (int): Number of max rows of tick table.
+            max_ohlcv_table_rows (int): Number of max rows of each timeframe of ohlcv table.
+            logger (logging.Logger): logger
+            queue_and_trade_manager (QueueAndTradeManager): Queue manager.
+            SessionLocal (sqlalchemy.orm.Session): Session factory of sqlalchemy.
+            bar_scheduler (Optional[BarScheduler]): Told when bars are up to date until a tick. Defaults to None.
+            bar_builder (Optional[MultiTimeframeBarBuilder]): Build bars of its timeframes in memory from the queued ticks.
+                Defaults to None (aggregate the bars of `time_span` from the tick table).
+            information_bar_builders (Sequence[InformationBarBuilder]): Build tick, volume, dollar or tick imbalance bars
+                from the queued ticks. Defaults to ().
+            db_writer (Optional[DbWriter]): Writer of the ticks and bars. Defaults to None (write at once with `SessionLocal`).
+            feed_monitor (Optional[FeedLagMonitor]): Told the lag of each dequeued tick and the overflows of the tick queue.
+                Defaults to None.
+            shared_state (Optional[SharedMarketStateWriter]): Publish the last trade and the bars of `bar_builder` to the other
+                processes, once per batch of ticks. Defaults to None.
+
+        Malformed messages and messages off the grid of the symbol spec are counted in `invalid_messages` and dropped.
+        """
+        is_debug = logger.isEnabledFor(logging.DEBUG)
+        spec = get_symbol_spec(symbol)
+        writer = db_writer or DirectWriter(SessionLocal)
         while self.RUNNING:
             try:
-                with SessionLocal() as db:
-                    # Save ticks queue
-                    qsize = queue_and_trade_manager.get_ticks_queue_size()
-                    if qsize > 0:
-                        logger.debug(f"Tick queue count: {qsize}")
-                        for _ in range(qsize):
-                            item = queue_and_trade_manager.get_ticks_queue_item()
-
-                            logger.debug("Add tick queue item to DB")
-                            crud.insert_tick_item(db=db, insert_item=item, max_rows=max_tick_table_rows)
-
-                    # Create ohlcv
-                    crud.create_ohlcv_from_ticks(db=db, symbol=symbol, time_span=time_span, max_rows=max_ohlcv_table_rows)
+                # Save ticks queue
+                qsize = queue_and_trade_manager.get_ticks_queue_size()
+                tick = None
+                if qsize > 0:
+                    if is_debug:
+                        logger.debug("Tick queue count: %d", qsize)
+                    for _ in range(qsize):
+                        message = queue_and_trade_manager.get_ticks_queue_item()
+                        try:
+                            # Converted once, for the writer and the bar builders.
+                            tick = records.tick_from_message(message, spec)
+                        except records.INVALID_MESSAGE_ERRORS as e:
+                            self.invalid_messages += 1
+                            logger.warning("Drop invalid trades message (%d in total): %r %s", self.invalid_messages, e, message)
+                            continue
+                        if feed_monitor is not None:
+                            feed_monitor.observe(FEED_TRADES, tick.timestamp)
+                        writer.submit(crud.insert_tick_item, insert_item=tick, max_rows=max_tick_table_rows)
+                        if bar_builder is not None:
+                            bar_builder.add_tick(tick.timestamp, tick.price, tick.size)
+                        for information_bar_builder in information_bar_builders:
+                            information_bar_builder.add_tick(tick.timestamp, tick.price, tick.size, is_buy=tick.side == "BUY")
+                    if feed_monitor is not None:
+                        feed_monitor.report_overflows(FEED_TRADES, queue_and_trade_manager.get_ticks_queue_overflows())
+                    if shared_state is not None and tick is not None:
+                        shared_state.publish_trade(tick)
+
+                # Create ohlcv
+                ohlcv_items = []
+                if bar_builder is None:
+                    # Runs after the queued ticks are inserted, since the writer keeps the order of jobs.
+                    writer.submit(crud.create_ohlcv_from_ticks, symbol=symbol, time_span=time_span, max_rows=max_ohlcv_table_rows)
+                else:
+                    bar_builder.close_until(time.time())
+                    ohlcv_items += bar_builder.drain_updates()
+                for information_bar_builder in information_bar_builders:
+                    ohlcv_items += information_bar_builder.drain_updates()
+                if len(ohlcv_items) > 0:
+                    writer.submit(crud.upsert_ohlcv_items, items=ohlcv_items, max_rows=max_ohlcv_table_rows)
+                    if shared_state is not None:
+                        shared_state.publish_bars(ohlcv_items)
+
+                if bar_scheduler is not None and tick is not None:
+                    # Bars are up to date until the newest tick. A tick of the next bar closes the current bar.
+                    bar_scheduler.on_tick(tick.timestamp)
                 await asyncio.sleep(0.0)
             except asyncio.TimeoutError:
                 logger.debug("Trade thread has ended with asyncio.TimeoutError")
@@ -3,7 +3,7 @@ import sys
 import asyncio
 import logging
 import multiprocessing
-from typing import Optional, Tuple
+from typing import Optional, Sequence, Tuple
 import traceback
 
 from dotenv import load_dotenv
@@ -14,10 +14,29 @@ from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 from gmo_hft_bot.threads.manage_orderbook_queue import OrderbookQueueManager
 from gmo_hft_bot.threads.manage_tick_queue import TickQueueManager
 from gmo_hft_bot.threads.trade import Trader
-from gmo_hft_bot.db import models
-from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.db import models, schemas
+from gmo_hft_bot.db.database import SerializedSessionLocal, initialize_database
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
 from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT, worker_configurer
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
+from gmo_hft_bot.utils.bar_scheduler import CLOSE_ON_CLOCK, BarScheduler
+from gmo_hft_bot.utils.bar_builder import DEFAULT_TIMEFRAMES, InformationBarBuilder, MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.fixed_point import SymbolSpec, register_symbol_spec
+from gmo_hft_bot.utils.db_writer import BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, DbWriter
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from gmo_hft_bot.utils.orderbook_kernels import warmup_kernels
+from gmo_hft_bot.utils.feed_lag import FeedLagMonitor
+from gmo_hft_bot.utils.freshness import FreshnessConfig
+from gmo_hft_bot.utils.private_api_scheduler import PrivateApiScheduler, RateLimitConfig
+from gmo_hft_bot.utils.shared_market_state import SharedMarketStateConfig, SharedMarketStateWriter
+from gmo_hft_bot.utils.gc_control import GcConfig, GcPauseMonitor, IdleCollector, enter_steady_state, leave_steady_state
+from gmo_hft_bot.utils.market_state_snapshot import (
+    MarketStateCheckpointer,
+    save_market_state_snapshot,
+    seed_live_market_state,
+    take_market_state_snapshot,
+    warm_start,
+)
 
 
 async def run_manage_queue_and_trading(
@@ -30,55 +49,118 @@ async def run_manage_queue_and_trading(
     queue_and_trade_manager: QueueAndTradeManager,
     SessionLocal: Optional[sqlalchemy.orm.Session] = None,
     database_uri: Optional[str] = None,
+    heartbeat: Optional[Heartbeat] = None,
+    snapshot_path: Optional[str] = None,
+    checkpoint_interval: float = 10.0,
+    bar_close_on: str = CLOSE_ON_CLOCK,
+    timeframes: Sequence[int] = DEFAULT_TIMEFRAMES,
+    information_bars: Sequence[Tuple[str, float]] = (),
+    symbol_spec: Optional[SymbolSpec] = None,
+    db_writer_maxsize: int = 0,
+    db_writer_backpressure: str = BACKPRESSURE_BLOCK,
+    board_writer_maxsize: int = 1000,
+    gc_config: Optional[GcConfig] = None,
+    max_feed_lag: Optional[float] = None,
+    freshness_config: Optional[FreshnessConfig] = None,
+    rate_limit_config: Optional[RateLimitConfig] = None,
+    shared_market_state_config: Optional[SharedMarketStateConfig] = None,
 ):
     if SessionLocal is None and database_uri is None:
         logger.error("database_uri is needed if SessionLocal is None.")
+    if symbol_spec is not None:
+        # Before the builders and crud look it up.
+        register_symbol_spec(symbol_spec)
 
     orderbook_queue_manager = OrderbookQueueManager()
     tick_queue_manager = TickQueueManager()
     trader = Trader()
+    # Shared by TickQueueManager (which tells the newest stored tick) and Trader (which waits for bars to close).
+    bar_scheduler = BarScheduler(time_span=time_span, close_on=bar_close_on)
+    # Bars of all timeframes are built from the tick stream. The trading timeframe is always included.
+    bar_builder = MultiTimeframeBarBuilder(symbol=symbol, timeframes=[*timeframes, time_span])
+    information_bar_builders = [InformationBarBuilder(symbol=symbol, bar_type=bar_type, threshold=threshold) for bar_type, threshold in information_bars]
+    # Decisions read the board and bars from memory, and all writes go through the writer thread.
+    market_state = LiveMarketState(symbol=symbol, bar_builder=bar_builder)
+    # Trading pauses while the queued messages are older than `max_feed_lag`.
+    feed_monitor = FeedLagMonitor(max_lag=max_feed_lag, heartbeat=heartbeat, logger=logger) if max_feed_lag is not None else None
+    # Private requests of Trader are rate limited, cancels first.
+    api_scheduler = PrivateApiScheduler(
+        base_url=queue_and_trade_manager.http_request_private_baseurl,
+        sign=queue_and_trade_manager.http_headers,
+        config=rate_limit_config or RateLimitConfig(),
+        heartbeat=heartbeat,
+        logger=logger,
+    )
+    # Board, last trade and bars in shared memory, for the other processes of the host (see utils/shared_market_state.py).
+    shared_state = None
+    if shared_market_state_config is not None:
+        shared_state = SharedMarketStateWriter(symbol=symbol, timeframe=schemas.timeframe_label(time_span), config=shared_market_state_config)
 
-    if SessionLocal is None:
-        # Run in multiprocessing.Process
-
+    # Run in multiprocessing.Process if SessionLocal is None
+    is_subprocess = SessionLocal is None
+    if is_subprocess:
         # Avoid AttributeError: Can't pickle local object 'create_engine.<locals>.connect'
         database_engine, SessionLocal = initialize_database(uri=database_uri)
-        try:
-            # Initialize sqlite3 in-memory database
-            models.Base.metadata.create_all(database_engine)
-
-            await asyncio.gather(
-                tick_queue_manager.run(
-                    symbol=symbol,
-                    time_span=time_span,
-                    max_tick_table_rows=max_tick_table_rows,
-                    max_ohlcv_table_rows=max_ohlcv_table_rows,
-                    logger=logger,
-                    queue_and_trade_manager=queue_and_trade_manager,
-                    SessionLocal=SessionLocal,
-                ),
-                orderbook_queue_manager.run(
-                    max_orderbook_table_rows=max_orderbook_table_rows,
-                    logger=logger,
-                    queue_and_trade_manager=queue_and_trade_manager,
-                    SessionLocal=SessionLocal,
-                ),
-                trader.run(
-                    symbol=symbol,
-                    trade_time_span=time_span,
-                    logger=logger,
-                    queue_and_trade_manager=queue_and_trade_manager,
-                    SessionLocal=SessionLocal,
-                ),
+        # Initialize sqlite3 in-memory database
+        models.Base.metadata.create_all(database_engine)
+
+    # The in-memory database is one connection, shared by the writer threads and this event loop. Their sessions take turns.
+    SessionLocal = SerializedSessionLocal(SessionLocal)
+
+    # Ticks, bars, the decision journal and the checkpoints are never dropped (the queue is unbounded by default). Boards
+    # have their own writer, which drops the oldest boards if it falls behind, since a board supersedes the older ones.
+    db_writer = DbWriter(SessionLocal=SessionLocal, maxsize=db_writer_maxsize, backpressure=db_writer_backpressure, logger=logger)
+    board_writer = DbWriter(SessionLocal=SessionLocal, maxsize=board_writer_maxsize, backpressure=BACKPRESSURE_DROP_OLDEST, logger=logger)
+    db_writer.start()
+    board_writer.start()
+
+    background_coroutines = []
+    if heartbeat is not None:
+        background_coroutines.append(heartbeat.run())
+    if snapshot_path is not None:
+        checkpointer = MarketStateCheckpointer()
+        background_coroutines.append(
+            checkpointer.run(
+                snapshot_path=snapshot_path,
+                symbol=symbol,
+                time_span=time_span,
+                logger=logger,
+                SessionLocal=SessionLocal,
+                checkpoint_interval=checkpoint_interval,
+                db_writer=db_writer,
             )
-        except ConnectionFailedError:
-            # Clear in-memory DB
-            models.Base.metadata.drop_all(database_engine)
+        )
+
+    gc_monitor, idle_collector, previous_gc_thresholds = None, None, None
+    try:
+        # Compile (or load) the kernels of the board features before the first decision.
+        warmup_kernels()
+        if snapshot_path is not None:
+            await warm_start(
+                snapshot_path=snapshot_path,
+                symbol=symbol,
+                time_span=time_span,
+                max_orderbook_table_rows=max_orderbook_table_rows,
+                max_tick_table_rows=max_tick_table_rows,
+                max_ohlcv_table_rows=max_ohlcv_table_rows,
+                logger=logger,
+                SessionLocal=SessionLocal,
+                timeframes=bar_builder.timeframes,
+            )
+        # Decisions read only the market state: start it with the bars and the board restored and backfilled by the warm
+        # start, so that they do not wait for `crud.PREDICTION_BARS` new bars.
+        with SessionLocal() as db:
+            seeded_bars = seed_live_market_state(db=db, market_state=market_state, time_span=time_span)
+        if seeded_bars > 0:
+            logger.info("Loaded %d bars into the market state", seeded_bars)
+
+        if gc_config is not None:
+            # Startup is over. Young collections run after decisions instead of at random messages.
+            previous_gc_thresholds = enter_steady_state(gc_config, logger=logger)
+            gc_monitor = GcPauseMonitor()
+            gc_monitor.install()
+            idle_collector = IdleCollector(gc_config, monitor=gc_monitor, heartbeat=heartbeat, logger=logger)
 
-            # Raise ConnectionFailedError again so that restart from main process.
-            logger.error(traceback.format_exc())
-            raise ConnectionFailedError
-    else:
         await asyncio.gather(
             tick_queue_manager.run(
                 symbol=symbol,
@@ -88,12 +170,22 @@ async def run_manage_queue_and_trading(
                 logger=logger,
                 queue_and_trade_manager=queue_and_trade_manager,
                 SessionLocal=SessionLocal,
+                bar_scheduler=bar_scheduler,
+                bar_builder=bar_builder,
+                information_bar_builders=information_bar_builders,
+                db_writer=db_writer,
+                feed_monitor=feed_monitor,
+                shared_state=shared_state,
             ),
             orderbook_queue_manager.run(
                 max_orderbook_table_rows=max_orderbook_table_rows,
                 logger=logger,
                 queue_and_trade_manager=queue_and_trade_manager,
                 SessionLocal=SessionLocal,
+                db_writer=board_writer,
+                market_state=market_state,
+                feed_monitor=feed_monitor,
+                shared_state=shared_state,
             ),
             trader.run(
                 symbol=symbol,
@@ -101,8 +193,47 @@ async def run_manage_queue_and_trading(
                 logger=logger,
                 queue_and_trade_manager=queue_and_trade_manager,
                 SessionLocal=SessionLocal,
+                bar_scheduler=bar_scheduler,
+                db_writer=db_writer,
+                market_state=market_state,
+                idle_collector=idle_collector,
+                feed_monitor=feed_monitor,
+                freshness_config=freshness_config,
+                api_scheduler=api_scheduler,
             ),
+            *background_coroutines,
         )
+    except ConnectionFailedError:
+        if is_subprocess:
+            # Raise ConnectionFailedError again so that restart from main process.
+            logger.error(traceback.format_exc())
+        raise
+    finally:
+        # Whatever stopped the tasks, write the queued jobs before the snapshot and the cleanup.
+        db_writer.stop()
+        board_writer.stop()
+        logger.info("DbWriter stats: %s, boards: %s", db_writer.stats(), board_writer.stats())
+        if is_subprocess:
+            if snapshot_path is not None:
+                # Keep the latest state for the next start.
+                with SessionLocal() as db:
+                    save_market_state_snapshot(snapshot_path, take_market_state_snapshot(db=db, symbol=symbol, time_span=time_span))
+
+            # Clear in-memory DB
+            models.Base.metadata.drop_all(database_engine)
+        if shared_state is not None:
+            # The segment is kept for the readers, and reused after a restart.
+            shared_state.close()
+        if gc_monitor is not None:
+            gc_monitor.uninstall()
+            logger.info(
+                "GC collections: %d (%d unscheduled, max pause %.2f ms)",
+                gc_monitor.collections,
+                gc_monitor.unscheduled_collections,
+                gc_monitor.max_unscheduled_pause * 1000,
+            )
+        if previous_gc_thresholds is not None:
+            leave_steady_state(previous_gc_thresholds)
 
 
 def main(
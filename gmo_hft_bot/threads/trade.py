@@ -1,21 +1,90 @@
 import sys
 import asyncio
 import logging
-import time
+import functools
 import aiohttp
 import traceback
+from typing import Dict, Optional, Tuple
 
 import sqlalchemy
 
 sys.path.append(".")
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
-from gmo_hft_bot.db import crud
-from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
+from gmo_hft_bot.db import crud, schemas
+from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError, RequestSupersededError
+from gmo_hft_bot.utils.bar_scheduler import BarScheduler
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
+from gmo_hft_bot.utils.db_writer import DbWriter, DirectWriter
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from gmo_hft_bot.utils.decision_journal import DEFAULT_STRATEGY_ID, DecisionJournal
+from gmo_hft_bot.utils.gc_control import IdleCollector
+from gmo_hft_bot.utils.feed_lag import FeedLagMonitor
+from gmo_hft_bot.utils.freshness import FreshnessConfig, describe_freshness, skip_orders
+from gmo_hft_bot.utils.private_api_scheduler import PRIORITY_ORDER, PrivateApiScheduler
+
+# [Note]: Dummy order. Orders are not sent yet, and the account margin is requested instead.
+DUMMY_ORDER_ENDPOINT = "/v1/account/margin"
 
 
 class Trader:
     RUNNING = True
 
+    def _check_execution(
+        self,
+        journal: DecisionJournal,
+        symbol: str,
+        best_bid_price: Optional[int],
+        best_ask_price: Optional[int],
+        before_buy_order_price: Optional[float],
+        before_sell_order_price: Optional[float],
+    ) -> Tuple:
+        """[Note]: Only local online backtest. Track best prices (ticks) after the order prices."""
+        if best_bid_price is not None and best_ask_price is not None and before_buy_order_price is not None:
+            spec = get_symbol_spec(symbol)
+            update_best_bid_price = spec.to_price(best_bid_price)
+            update_best_ask_price = spec.to_price(best_ask_price)
+            # Buffered, and written with the next decision.
+            if update_best_bid_price > before_buy_order_price:
+                journal.record(kind=schemas.PREDICT_KIND_TRACK_BEST, side=schemas.PREDICT_SIDE_BUY, price=update_best_bid_price, size=0.0)
+                before_buy_order_price = update_best_bid_price
+
+            if update_best_ask_price < before_sell_order_price:
+                journal.record(kind=schemas.PREDICT_KIND_TRACK_BEST, side=schemas.PREDICT_SIDE_SELL, price=update_best_ask_price, size=0.0)
+                before_sell_order_price = update_best_ask_price
+
+        return before_buy_order_price, before_sell_order_price
+
+    def _best_prices(self, symbol: str, SessionLocal: sqlalchemy.orm.Session, market_state: Optional[LiveMarketState]) -> Tuple[Optional[int], Optional[int]]:
+        """(best bid, best ask) in ticks from `market_state`, or from the board table if it is None."""
+        if market_state is not None:
+            return market_state.best_prices()
+        with SessionLocal() as db:
+            buy_board_items, sell_board_items = crud.get_current_board(db=db, symbol=symbol)
+        best_bid_price = buy_board_items[-1].price if len(buy_board_items) > 0 else None
+        best_ask_price = sell_board_items[0].price if len(sell_board_items) > 0 else None
+        return best_bid_price, best_ask_price
+
+    def _log_order_result(self, future: asyncio.Future, side: str, logger: logging.Logger) -> None:
+        """Done callback of an order. Retrieves the exception, so that a failed order is logged once."""
+        if future.cancelled():
+            return
+        e = future.exception()
+        if isinstance(e, RequestSupersededError):
+            logger.info(e)
+        elif e is not None:
+            logger.error("%s order failed: %r", side, e)
+
+    def _send_order(self, api_scheduler: PrivateApiScheduler, side: str, logger: logging.Logger) -> asyncio.Future:
+        """Queue an order without waiting for its response. An order of the same side, queued by the next decision while this
+        one still waits for a token, replaces it (see `coalesce_key` of PrivateApiScheduler.submit).
+
+        Returns:
+            asyncio.Future: Response of the order. The result is logged by `_log_order_result`.
+        """
+        future = api_scheduler.submit("GET", DUMMY_ORDER_ENDPOINT, priority=PRIORITY_ORDER, coalesce_key=f"order:{side}")
+        future.add_done_callback(functools.partial(self._log_order_result, side=side, logger=logger))
+        return future
+
     async def run(
         self,
         symbol: str,
@@ -23,6 +92,15 @@ class Trader:
         logger: logging.Logger,
         queue_and_trade_manager: QueueAndTradeManager,
         SessionLocal: sqlalchemy.orm.Session,
+        bar_scheduler: Optional[BarScheduler] = None,
+        execution_check_interval: float = 0.5,
+        db_writer: Optional[DbWriter] = None,
+        market_state: Optional[LiveMarketState] = None,
+        strategy_id: str = DEFAULT_STRATEGY_ID,
+        idle_collector: Optional[IdleCollector] = None,
+        feed_monitor: Optional[FeedLagMonitor] = None,
+        freshness_config: Optional[FreshnessConfig] = None,
+        api_scheduler: Optional[PrivateApiScheduler] = None,
     ):
         """Trade threads
 
@@ -32,111 +110,130 @@ class Trader:
             logger (logging.Logger): logger
             queue_and_trade_manager (QueueAndTradeManager): Quene and trade manager
             SessionLocal (sqlalchemy.orm.Session): Session of sqlalchemy
+            bar_scheduler (Optional[BarScheduler]): Scheduler of decisions. Defaults to a wall-clock aligned scheduler of `trade_time_span`.
+            execution_check_interval (float): Interval of execution checks between decisions (seconds). Defaults to 0.5.
+            db_writer (Optional[DbWriter]): Writer of the predictions. Defaults to None (write at once with `SessionLocal`).
+            market_state (Optional[LiveMarketState]): Board and bars in memory. Decisions read only them if given, which is needed
+                when the boards and bars are written by a DbWriter. Defaults to None (read the database).
+            strategy_id (str): Id of the strategy in the decision journal. Defaults to DEFAULT_STRATEGY_ID.
+            idle_collector (Optional[IdleCollector]): Collect garbage right after each decision. Defaults to None.
+            feed_monitor (Optional[FeedLagMonitor]): No orders are sent while it pauses trading because the feeds lag.
+                The decisions are still journaled. Defaults to None.
+            freshness_config (Optional[FreshnessConfig]): Skip or downsize orders on a stale board, ticks or bars (see
+                utils/freshness.py). The reasons are journaled with the decision. Defaults to None (no check).
+            api_scheduler (Optional[PrivateApiScheduler]): Rate limiter of the private requests (see utils/private_api_scheduler.py).
+                Orders are queued without waiting for their responses. Defaults to None (RateLimitConfig() with the keys of
+                `queue_and_trade_manager`).
 
         Raises:
             ConnectionFailedError: Raise if threads stopped.
         """
-        before_timestamp_per_span = None
+        if bar_scheduler is None:
+            bar_scheduler = BarScheduler(time_span=trade_time_span)
+        journal = DecisionJournal(symbol=symbol, writer=db_writer or DirectWriter(SessionLocal), strategy_id=strategy_id)
 
         # [Note]: Only local online backtest
         before_buy_order_price = None
         before_sell_order_price = None
-        while self.RUNNING:
+
+        timeframe = schemas.timeframe_label(trade_time_span)
+        if api_scheduler is None:
+            api_scheduler = PrivateApiScheduler(base_url=queue_and_trade_manager.http_request_private_baseurl, sign=queue_and_trade_manager.http_headers)
+        # Reuse one session so that orders go over a warm keep-alive connection.
+        async with aiohttp.ClientSession() as session:
+            # All private requests go through the scheduler, which keeps them under the rate limit of the account.
+            api_scheduler_task = asyncio.create_task(api_scheduler.run(session))
+            # Orders are not awaited by the decisions, which would keep them from being replaced while they are queued.
+            pending_orders: Dict[str, asyncio.Future] = {}
             try:
-                current_timestamp_per_span = time.time() // trade_time_span
-                if before_timestamp_per_span is not None and current_timestamp_per_span > before_timestamp_per_span:
-
-                    with SessionLocal() as db:
-                        predict_info = crud.get_prediction_info(db=db, symbol=symbol)
-
-                    if predict_info.is_buy_entry is True:
-                        # Buy
-                        logger.info("Buy order.")
-                        # Dummy order
-                        request_url, headers = queue_and_trade_manager.test_http_private_request_args()
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(request_url, headers=headers) as response:
-                                _ = await response.json()
-
-                    if predict_info.is_sell_entry is True:
-                        # Sell
-                        logger.info("Sell order")
-                        # Dummy order
-                        request_url, headers = queue_and_trade_manager.test_http_private_request_args()
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(request_url, headers=headers) as response:
-                                _ = await response.json()
-
-                    with SessionLocal() as db:
-                        buy_predict_item = {
-                            "side": "BUY",
-                            "size": predict_info.buy_size,
-                            "price": predict_info.buy_price,
-                            "predict_value": predict_info.buy_predict_value,
-                            "symbol": symbol,
-                            "is_entry": predict_info.is_buy_entry,
-                        }
-                        sell_predict_item = {
-                            "side": "SELL",
-                            "size": predict_info.sell_size,
-                            "price": predict_info.sell_price,
-                            "predict_value": predict_info.sell_predict_value,
-                            "symbol": symbol,
-                            "is_entry": predict_info.is_sell_entry,
-                        }
-                        crud.insert_predict_items(db=db, insert_items=[buy_predict_item, sell_predict_item])
+                while self.RUNNING:
+                    try:
+                        boundary = bar_scheduler.next_boundary()
+                        precompute_reached = False
+                        while not precompute_reached:
+                            # Execution check
+                            best_bid_price, best_ask_price = self._best_prices(symbol=symbol, SessionLocal=SessionLocal, market_state=market_state)
+                            before_buy_order_price, before_sell_order_price = self._check_execution(
+                                journal=journal,
+                                symbol=symbol,
+                                best_bid_price=best_bid_price,
+                                best_ask_price=best_ask_price,
+                                before_buy_order_price=before_buy_order_price,
+                                before_sell_order_price=before_sell_order_price,
+                            )
+                            precompute_reached = await bar_scheduler.wait_until_precompute(boundary, timeout=execution_check_interval)
+
+                        # Precompute everything which does not depend on the closing bar.
+                        if market_state is None:
+                            with SessionLocal() as db:
+                                prefetched_ohlcv_df = crud.get_ohlcv_with_symbol(
+                                    db=db, symbol=symbol, limit=crud.PREDICTION_BARS, ascending=False, as_df=True, timeframe=timeframe
+                                )
+                        await bar_scheduler.wait_for_close(boundary)
+
+                        if market_state is None:
+                            with SessionLocal() as db:
+                                predict_info = crud.get_prediction_info(
+                                    db=db,
+                                    symbol=symbol,
+                                    prefetched_ohlcv_df=prefetched_ohlcv_df,
+                                    bar_close_timestamp=int(boundary),
+                                    timeframe=timeframe,
+                                    freshness_config=freshness_config,
+                                    last_tick_timestamp=bar_scheduler.latest_tick_timestamp,
+                                )
+                        else:
+                            predict_info = market_state.get_prediction_info(
+                                time_span=trade_time_span,
+                                bar_close_timestamp=int(boundary),
+                                freshness_config=freshness_config,
+                                last_tick_timestamp=bar_scheduler.latest_tick_timestamp,
+                            )
+
+                        # The boards and bars are stale while the feeds lag. No orders are better than orders on them.
+                        if feed_monitor is not None and feed_monitor.trading_paused:
+                            logger.warning("Feed lag %s", feed_monitor.last_lags)
+                            predict_info = skip_orders(predict_info, schemas.FRESHNESS_FEED_LAG)
+                        if predict_info.freshness & schemas.FRESHNESS_SKIP_FLAGS:
+                            logger.warning("Skip orders of the bar %d: %s", int(boundary), describe_freshness(predict_info.freshness))
+                        elif predict_info.freshness != schemas.FRESHNESS_OK:
+                            logger.info("Downsize orders of the bar %d: %s", int(boundary), describe_freshness(predict_info.freshness))
+
+                        if predict_info.is_buy_entry is True:
+                            # Buy
+                            logger.info("Buy order.")
+                            pending_orders["BUY"] = self._send_order(api_scheduler, side="BUY", logger=logger)
+
+                        if predict_info.is_sell_entry is True:
+                            # Sell
+                            logger.info("Sell order")
+                            pending_orders["SELL"] = self._send_order(api_scheduler, side="SELL", logger=logger)
+
+                        # One batch per bar, with the tracked best prices since the last decision.
+                        journal.record_decision(predict_info, bar_timestamp=int(boundary))
+                        journal.flush()
 
                         # [Note]: Only local online backtest
                         before_buy_order_price = predict_info.buy_price
                         before_sell_order_price = predict_info.sell_price
-                else:
-                    # Execution check
-                    with SessionLocal() as db:
-                        buy_board_items, sell_board_items = crud.get_current_board(db=db, symbol=symbol)
-
-                    if len(buy_board_items) > 0 and len(sell_board_items) > 0 and before_buy_order_price is not None:
-                        update_best_bid, update_best_ask = buy_board_items[-1], sell_board_items[0]
-                        update_best_bid_price = update_best_bid.price
-                        update_best_ask_price = update_best_ask.price
-                        update_predict_items = []
-                        if update_best_bid_price > before_buy_order_price:
-                            update_buy_item = {
-                                "side": "TrackBestBuy",
-                                "size": 0,
-                                "price": update_best_bid_price,
-                                "predict_value": 0,
-                                "symbol": symbol,
-                                "is_entry": False,
-                            }
-                            update_predict_items.append(update_buy_item)
-                            before_buy_order_price = update_best_bid_price
-
-                        if update_best_ask_price < before_sell_order_price:
-                            update_sell_item = {
-                                "side": "TrackBestSell",
-                                "size": 0,
-                                "price": update_best_ask_price,
-                                "predict_value": 0,
-                                "symbol": symbol,
-                                "is_entry": False,
-                            }
-                            update_predict_items.append(update_sell_item)
-                            before_sell_order_price = update_best_ask_price
-
-                        if len(update_predict_items) > 0:
-                            with SessionLocal() as db:
-                                crud.insert_predict_items(db=db, insert_items=update_predict_items)
-
-                    await asyncio.sleep(0.5)
-
-                before_timestamp_per_span = current_timestamp_per_span
-
-                await asyncio.sleep(0.0)
-            except asyncio.TimeoutError:
-                logger.debug("Trade thread has ended with asyncio.TimeoutError")
-                raise ConnectionFailedError
 
-            except Exception as e:
-                logger.error(traceback.format_exc())
-                logger.error(e)
-                raise ConnectionFailedError
+                        # The next decision is a bar away.
+                        if idle_collector is not None:
+                            idle_collector.collect()
+
+                        await asyncio.sleep(0.0)
+                    except asyncio.TimeoutError:
+                        logger.debug("Trade thread has ended with asyncio.TimeoutError")
+                        raise ConnectionFailedError
+
+                    except Exception as e:
+                        logger.error(traceback.format_exc())
+                        logger.error(e)
+                        raise ConnectionFailedError
+            finally:
+                api_scheduler_task.cancel()
+                # Queued orders are not sent anymore.
+                for future in pending_orders.values():
+                    future.cancel()
+                # Rows of the last execution checks.
+                journal.flush()
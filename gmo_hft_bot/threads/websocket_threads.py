@@ -10,16 +10,38 @@ sys.path.append(".")
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
 from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT, worker_configurer
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
 from gmo_hft_bot.threads.connect_orderbook_ws import ConnectOrderbookWs
 from gmo_hft_bot.threads.connect_tick_ws import ConnectTickWs
+from gmo_hft_bot.utils.market_data_service import MarketDataService
 
+PUBLIC_WS_URL = "wss://api.coin.z.com/ws/public/v1"
 
-async def run_multiple_websockets(symbol: str, logger: logging.Logger, queue_and_trade_manager: QueueAndTradeManager):
+
+async def run_multiple_websockets(
+    symbol: str,
+    logger: logging.Logger,
+    queue_and_trade_manager: QueueAndTradeManager,
+    heartbeat: Optional[Heartbeat] = None,
+    ws_url: str = PUBLIC_WS_URL,
+    market_data_socket: Optional[str] = None,
+):
     connect_orderbook_ws = ConnectOrderbookWs()
     connect_tick_ws = ConnectTickWs()
+    background_coroutines = [heartbeat.run()] if heartbeat is not None else []
+    # The frames are also fanned out to local subscribers (see utils/market_data_service.py).
+    market_data_service = None
+    if market_data_socket is not None:
+        market_data_service = MarketDataService(socket_path=market_data_socket, heartbeat=heartbeat, logger=logger)
+        background_coroutines.append(market_data_service.serve())
     await asyncio.gather(
-        connect_orderbook_ws.run(ws_url="wss://api.coin.z.com/ws/public/v1", symbol=symbol, logger=logger, queue_and_trade_manager=queue_and_trade_manager),
-        connect_tick_ws.run(ws_url="wss://api.coin.z.com/ws/public/v1", symbol=symbol, logger=logger, queue_and_trade_manager=queue_and_trade_manager),
+        connect_orderbook_ws.run(
+            ws_url=ws_url, symbol=symbol, logger=logger, queue_and_trade_manager=queue_and_trade_manager, market_data_service=market_data_service
+        ),
+        connect_tick_ws.run(
+            ws_url=ws_url, symbol=symbol, logger=logger, queue_and_trade_manager=queue_and_trade_manager, market_data_service=market_data_service
+        ),
+        *background_coroutines,
     )
 
 
@@ -0,0 +1,438 @@
+import sys
+from collections import deque
+from decimal import Decimal
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+sys.path.append(".")
+from gmo_hft_bot.db import records, schemas
+from gmo_hft_bot.utils.fixed_point import SymbolSpec, get_symbol_spec
+
+# 1 second, 5 seconds, 1 minute and 5 minutes.
+DEFAULT_TIMEFRAMES = (1, 5, 60, 300)
+
+
+class _Bar:
+    """Bar in ticks and lots."""
+
+    __slots__ = ("timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, timestamp: int, open: int, high: int, low: int, close: int, volume: int):
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def merge(self, other: "_Bar") -> None:
+        """Fold `other`, which is newer than self, into self."""
+        if other.high > self.high:
+            self.high = other.high
+        if other.low < self.low:
+            self.low = other.low
+        self.close = other.close
+        self.volume += other.volume
+
+    def copy(self, timestamp: int) -> "_Bar":
+        return _Bar(timestamp, self.open, self.high, self.low, self.close, self.volume)
+
+
+class MultiTimeframeBarBuilder:
+    """Build OHLCV bars of several timeframes at once from one tick stream, in memory.
+
+    Ticks only update the bar of the smallest timeframe (base bar). When a base bar closes it is folded into
+    the open bar of each higher timeframe, so a higher timeframe costs O(1) per base bar and ticks are never
+    scanned again. Bars are aligned to the wall clock (`timestamp // time_span`) like `crud.create_ohlcv_from_ticks`,
+    and timeframes without trades get flat bars (volume 0 at the last close) when they close.
+    Bars are built in ticks and lots and `drain_updates` returns the bars which have changed since the last call
+    in prices and sizes, to be upserted to the ohlcv table.
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        timeframes: Sequence[int] = DEFAULT_TIMEFRAMES,
+        max_fill_bars: int = 1000,
+        spec: Optional[SymbolSpec] = None,
+        history: int = 100,
+    ):
+        """
+        Args:
+            symbol (str): Name of symbol.
+            timeframes (Sequence[int], optional): Time spans of bars (seconds). Each should be a multiple of the smallest one.
+                Defaults to DEFAULT_TIMEFRAMES.
+            max_fill_bars (int, optional): Max flat bars of a timeframe filled after a gap. Defaults to 1000.
+            spec (Optional[SymbolSpec], optional): Units of prices and sizes. Defaults to None (`get_symbol_spec(symbol)`).
+            history (int, optional): Number of closed bars of each timeframe kept for `recent_bars`. Defaults to 100.
+        """
+        self.timeframes = sorted(set(timeframes))
+        if len(self.timeframes) == 0 or self.timeframes[0] < 1:
+            raise ValueError(f"Invalid timeframes={timeframes}")
+        self.base_span = self.timeframes[0]
+        self.higher_spans = self.timeframes[1:]
+        for span in self.higher_spans:
+            if span % self.base_span != 0:
+                raise ValueError(f"Timeframe {span} is not a multiple of the smallest timeframe {self.base_span}")
+
+        self.symbol = symbol
+        self.spec = get_symbol_spec(symbol) if spec is None else spec
+        self.max_fill_bars = max_fill_bars
+        self.labels = {span: schemas.timeframe_label(span) for span in self.timeframes}
+        # Open bar of each timeframe. Bars of higher timeframes hold the closed base bars of the period.
+        self._bars: Dict[int, Optional[_Bar]] = {span: None for span in self.timeframes}
+        # Open time (s) of the bar after the last closed bar of each timeframe.
+        self._next_timestamps: Dict[int, Optional[int]] = {span: None for span in self.timeframes}
+        self._last_close: Optional[int] = None
+        self._closed: List[Tuple[int, _Bar]] = []
+        self._history: Dict[int, Deque[_Bar]] = {span: deque(maxlen=history) for span in self.timeframes}
+        self._is_updated = False
+        # Ticks older than the open base bar, which are ignored.
+        self.late_ticks = 0
+
+    def add_tick(self, unix_timestamp: int, price: int, size: int) -> bool:
+        """Update bars with a tick.
+
+        Args:
+            unix_timestamp (int): Unix timestamp (ms) of the tick.
+            price (int): Price in ticks.
+            size (int): Size in lots.
+
+        Returns:
+            bool: False if the tick is older than the open base bar and ignored.
+        """
+        bar_timestamp = unix_timestamp // (1000 * self.base_span) * self.base_span
+        bar = self._bars[self.base_span]
+        if bar is not None and bar_timestamp == bar.timestamp:
+            if price > bar.high:
+                bar.high = price
+            elif price < bar.low:
+                bar.low = price
+            bar.close = price
+            bar.volume += size
+        elif bar is None or bar_timestamp > bar.timestamp:
+            self._close_until(bar_timestamp)
+            self._bars[self.base_span] = _Bar(bar_timestamp, price, price, price, price, size)
+        else:
+            self.late_ticks += 1
+            return False
+
+        self._is_updated = True
+        return True
+
+    def close_until(self, unix_time: float) -> None:
+        """Close the bars which end at or before `unix_time`, e.g. when no trade has come after the boundary.
+
+        Args:
+            unix_time (float): Unix time (s).
+        """
+        bar_timestamp = int(unix_time // self.base_span) * self.base_span
+        bar = self._bars[self.base_span]
+        if bar is None or bar_timestamp > bar.timestamp:
+            self._close_until(bar_timestamp)
+
+    def _close_until(self, bar_timestamp: int) -> None:
+        """Close the bars opened before `bar_timestamp` (open time of a base bar)."""
+        bar = self._bars[self.base_span]
+        if bar is not None:
+            self._close_bar(self.base_span, bar)
+            for span in self.higher_spans:
+                period = bar.timestamp // span * span
+                higher_bar = self._bars[span]
+                if higher_bar is not None and higher_bar.timestamp < period:
+                    self._close_bar(span, higher_bar)
+                    higher_bar = None
+                if higher_bar is None:
+                    self._fill(span, period)
+                    self._bars[span] = bar.copy(period)
+                else:
+                    higher_bar.merge(bar)
+
+        self._fill(self.base_span, bar_timestamp)
+        for span in self.higher_spans:
+            period = bar_timestamp // span * span
+            higher_bar = self._bars[span]
+            if higher_bar is not None and higher_bar.timestamp < period:
+                self._close_bar(span, higher_bar)
+            self._fill(span, period)
+
+    def _close_bar(self, span: int, bar: _Bar) -> None:
+        self._closed.append((span, bar))
+        self._history[span].append(bar)
+        self._bars[span] = None
+        self._next_timestamps[span] = bar.timestamp + span
+        self._last_close = bar.close
+
+    def _fill(self, span: int, until_timestamp: int) -> None:
+        """Add flat bars of `span` from the last closed bar until `until_timestamp` (exclusive)."""
+        start_timestamp = self._next_timestamps[span]
+        if start_timestamp is None or self._last_close is None or start_timestamp >= until_timestamp:
+            return
+        start_timestamp = max(start_timestamp, until_timestamp - self.max_fill_bars * span)
+        close = self._last_close
+        for timestamp in range(start_timestamp, until_timestamp, span):
+            bar = _Bar(timestamp, close, close, close, close, 0)
+            self._closed.append((span, bar))
+            self._history[span].append(bar)
+        self._next_timestamps[span] = until_timestamp
+
+    def seed_history(self, bars: Sequence[records.Bar]) -> int:
+        """Load closed bars (e.g. restored and backfilled after a restart) before the bars built from ticks.
+
+        Bars of unknown timeframes, and bars which are not older than the bars built from ticks, are ignored. A timeframe
+        without ticks yet continues from its newest seeded bar, so that the gap until the first tick gets flat bars.
+
+        Args:
+            bars (Sequence[records.Bar]): ohlcv items in prices and sizes.
+
+        Returns:
+            int: Number of loaded bars.
+        """
+        loaded = 0
+        for span, label in self.labels.items():
+            history = self._history[span]
+            open_bar = self._bars[span]
+            first_timestamps = [bar.timestamp for bar in (history[0] if len(history) > 0 else None, open_bar) if bar is not None]
+            limit = min(first_timestamps) if len(first_timestamps) > 0 else None
+            seeded = [
+                _Bar(
+                    bar.timestamp,
+                    int(self.spec.ticks_array(bar.open)),
+                    int(self.spec.ticks_array(bar.high)),
+                    int(self.spec.ticks_array(bar.low)),
+                    int(self.spec.ticks_array(bar.close)),
+                    int(self.spec.lots_array(bar.volume)),
+                )
+                for bar in sorted(bars, key=lambda bar: bar.timestamp)
+                if bar.timeframe == label and (limit is None or bar.timestamp < limit)
+            ]
+            if len(seeded) == 0:
+                continue
+            self._history[span] = deque(seeded + list(history), maxlen=history.maxlen)
+            if self._next_timestamps[span] is None:
+                self._next_timestamps[span] = seeded[-1].timestamp + span
+            if self._last_close is None:
+                self._last_close = seeded[-1].close
+            loaded += len(seeded)
+        return loaded
+
+    def current_bar(self, span: int) -> Optional[_Bar]:
+        """Open bar of `span` including the open base bar."""
+        base_bar = self._bars[self.base_span]
+        if span == self.base_span:
+            return base_bar
+        # The bar of a higher timeframe is always of the period of the open base bar (older ones are closed when it opens).
+        bar = self._bars[span]
+        if base_bar is None:
+            return bar
+        if bar is None:
+            return base_bar.copy(base_bar.timestamp // span * span)
+        bar = bar.copy(bar.timestamp)
+        bar.merge(base_bar)
+        return bar
+
+    def recent_bars(self, span: int, limit: int) -> List[records.Bar]:
+        """Newest `limit` closed bars of `span` (at most `history`), oldest first.
+
+        Call `close_until` first to include the bars which have just ended without a tick of the next bar.
+        """
+        history = self._history[span]
+        return [self._to_record(span, history[i]) for i in range(max(len(history) - limit, 0), len(history))]
+
+    def _to_record(self, span: int, bar: _Bar) -> records.Bar:
+        return _bar_to_record(self.spec, bar, self.symbol, self.labels[span])
+
+    def drain_updates(self) -> List[records.Bar]:
+        """Bars which have closed or changed since the last call, oldest first in each timeframe.
+
+        Returns:
+            List[records.Bar]: ohlcv items.
+        """
+        items = [self._to_record(span, bar) for span, bar in self._closed]
+        self._closed = []
+        if self._is_updated:
+            for span in self.timeframes:
+                bar = self.current_bar(span)
+                if bar is not None:
+                    items.append(self._to_record(span, bar))
+            self._is_updated = False
+        return items
+
+
+def _bar_to_record(spec: SymbolSpec, bar: _Bar, symbol: str, timeframe: str) -> records.Bar:
+    return records.Bar(
+        timestamp=bar.timestamp,
+        open=spec.to_price(bar.open),
+        high=spec.to_price(bar.high),
+        low=spec.to_price(bar.low),
+        close=spec.to_price(bar.close),
+        volume=spec.to_size(bar.volume),
+        symbol=symbol,
+        timeframe=timeframe,
+    )
+
+
+# Information-driven bars, which close on the activity instead of the clock.
+# A bar of `threshold` ticks.
+BAR_TYPE_TICK = "tick"
+# A bar of `threshold` traded size (not lots).
+BAR_TYPE_VOLUME = "volume"
+# A bar of `threshold` traded notional (JPY).
+BAR_TYPE_DOLLAR = "dollar"
+# Tick imbalance bar. `threshold` is the initial expected number of ticks of a bar.
+BAR_TYPE_TICK_IMBALANCE = "tib"
+INFORMATION_BAR_TYPES = (BAR_TYPE_TICK, BAR_TYPE_VOLUME, BAR_TYPE_DOLLAR, BAR_TYPE_TICK_IMBALANCE)
+
+
+def information_bar_label(bar_type: str, threshold: float) -> str:
+    """Label of information bars stored in the timeframe column of ohlcv table, e.g. ("tick", 100) -> "tick100"."""
+    threshold = float(threshold)
+    return f"{bar_type}{int(threshold) if threshold.is_integer() else threshold}"
+
+
+class InformationBarBuilder:
+    """Build tick, volume, dollar or tick imbalance bars from the tick stream with O(1) work per tick.
+
+    A bar closes with the tick which makes its size (number of ticks, traded size or notional) reach `threshold`,
+    so a large trade is not split over bars. A tick imbalance bar closes when |sum of signed ticks| reaches
+    E[ticks of a bar] * max(|E[sign]|, min_imbalance), where both expectations are exponentially weighted moving
+    averages (E[ticks of a bar] is bounded by `threshold` / `max_ratio` and `threshold` * `max_ratio` so that it can not
+    collapse or explode). The sign of a tick is its taker side, or the tick rule if the side is unknown.
+
+    Bars are stored with the time bars in ohlcv table with the label of `information_bar_label` as timeframe. As several
+    bars can open in the same second, their timestamp is the Unix timestamp (ms) of the first tick (increased by 1 ms on collision).
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        bar_type: str,
+        threshold: float,
+        ewma_alpha: float = 0.1,
+        min_imbalance: float = 0.1,
+        max_ratio: float = 10.0,
+        spec: Optional[SymbolSpec] = None,
+    ):
+        """
+        Args:
+            symbol (str): Name of symbol.
+            bar_type (str): One of INFORMATION_BAR_TYPES.
+            threshold (float): Size of bars. Initial expected number of ticks of a bar for BAR_TYPE_TICK_IMBALANCE.
+            ewma_alpha (float, optional): Weight of the newest bar in E[ticks of a bar] of tick imbalance bars. Defaults to 0.1.
+            min_imbalance (float, optional): Lower bound of |E[sign]| of tick imbalance bars. Defaults to 0.1.
+            max_ratio (float, optional): Bound of E[ticks of a bar] of tick imbalance bars relative to `threshold`. Defaults to 10.0.
+            spec (Optional[SymbolSpec], optional): Units of prices and sizes. Defaults to None (`get_symbol_spec(symbol)`).
+        """
+        if bar_type not in INFORMATION_BAR_TYPES:
+            raise ValueError(f"Invalid bar_type={bar_type}")
+        if threshold <= 0:
+            raise ValueError(f"Invalid threshold={threshold}")
+
+        self.symbol = symbol
+        self.spec = get_symbol_spec(symbol) if spec is None else spec
+        self.bar_type = bar_type
+        self.threshold = threshold
+        # `threshold` in the units of ticks, i.e. lots for volume bars and ticks * lots for dollar bars.
+        if bar_type == BAR_TYPE_VOLUME:
+            self._unit_threshold = float(Decimal(str(threshold)) / self.spec.size_step)
+        elif bar_type == BAR_TYPE_DOLLAR:
+            self._unit_threshold = float(Decimal(str(threshold)) / (self.spec.tick_size * self.spec.size_step))
+        else:
+            self._unit_threshold = float(threshold)
+        self.label = information_bar_label(bar_type, threshold)
+        self.ewma_alpha = ewma_alpha
+        self.min_imbalance = min_imbalance
+        self.min_expected_ticks = threshold / max_ratio
+        self.max_expected_ticks = threshold * max_ratio
+
+        self._bar: Optional[_Bar] = None
+        self._progress = 0
+        self._ticks = 0
+        self._last_timestamp: Optional[int] = None
+        self._closed: List[_Bar] = []
+        self._is_updated = False
+        # State of tick imbalance bars.
+        self.expected_ticks = float(threshold)
+        self.mean_sign = 0.0
+        self._sign_alpha = 1.0 / threshold
+        self._last_price: Optional[int] = None
+        self._last_sign = 1
+
+    def expected_imbalance(self) -> float:
+        """|Sum of signed ticks| which closes the open tick imbalance bar."""
+        return self.expected_ticks * max(abs(self.mean_sign), self.min_imbalance)
+
+    def add_tick(self, unix_timestamp: int, price: int, size: int, is_buy: Optional[bool] = None) -> bool:
+        """Update bars with a tick.
+
+        Args:
+            unix_timestamp (int): Unix timestamp (ms) of the tick.
+            price (int): Price in ticks.
+            size (int): Size in lots.
+            is_buy (Optional[bool], optional): Taker side is buy. Used by tick imbalance bars. Defaults to None (tick rule).
+
+        Returns:
+            bool: True if the tick has closed a bar.
+        """
+        bar = self._bar
+        if bar is None:
+            if self._last_timestamp is not None and unix_timestamp <= self._last_timestamp:
+                unix_timestamp = self._last_timestamp + 1
+            self._last_timestamp = unix_timestamp
+            bar = self._bar = _Bar(unix_timestamp, price, price, price, price, size)
+        else:
+            if price > bar.high:
+                bar.high = price
+            elif price < bar.low:
+                bar.low = price
+            bar.close = price
+            bar.volume += size
+        self._ticks += 1
+        self._is_updated = True
+
+        if self.bar_type == BAR_TYPE_TICK:
+            self._progress += 1
+            is_closed = self._progress >= self._unit_threshold
+        elif self.bar_type == BAR_TYPE_VOLUME:
+            self._progress += size
+            is_closed = self._progress >= self._unit_threshold
+        elif self.bar_type == BAR_TYPE_DOLLAR:
+            self._progress += price * size
+            is_closed = self._progress >= self._unit_threshold
+        else:
+            if is_buy is not None:
+                sign = 1 if is_buy else -1
+            elif self._last_price is None or price == self._last_price:
+                sign = self._last_sign
+            else:
+                sign = 1 if price > self._last_price else -1
+            self._last_price = price
+            self._last_sign = sign
+            self.mean_sign += self._sign_alpha * (sign - self.mean_sign)
+            self._progress += sign
+            is_closed = abs(self._progress) >= self.expected_imbalance()
+            if is_closed:
+                expected_ticks = self.expected_ticks + self.ewma_alpha * (self._ticks - self.expected_ticks)
+                self.expected_ticks = min(max(expected_ticks, self.min_expected_ticks), self.max_expected_ticks)
+
+        if is_closed:
+            self._closed.append(bar)
+            self._bar = None
+            self._progress = 0
+            self._ticks = 0
+        return is_closed
+
+    def _to_record(self, bar: _Bar) -> records.Bar:
+        return _bar_to_record(self.spec, bar, self.symbol, self.label)
+
+    def drain_updates(self) -> List[records.Bar]:
+        """Bars which have closed or changed since the last call, oldest first.
+
+        Returns:
+            List[records.Bar]: ohlcv items.
+        """
+        items = [self._to_record(bar) for bar in self._closed]
+        self._closed = []
+        if self._is_updated and self._bar is not None:
+            items.append(self._to_record(self._bar))
+        self._is_updated = False
+        return items
@@ -0,0 +1,119 @@
+import time
+import asyncio
+from typing import Optional
+
+# Close bars at the wall-clock boundary.
+CLOSE_ON_CLOCK = "clock"
+# Close bars when the first tick of the next bar has been stored (or `tick_grace` seconds after the boundary).
+CLOSE_ON_TICKS = "ticks"
+
+
+class BarScheduler:
+    """Wake the trader when the streaming bar of `time_span` closes.
+
+    Bars are aligned to the wall clock (`timestamp // time_span`), the same as `crud.create_ohlcv_from_ticks`.
+    `wait_until_precompute` returns `precompute_lead` seconds before the boundary so that the work which does
+    not depend on the closing bar can be done in advance, and `wait_for_close` returns when the bar closes:
+    at the boundary with CLOSE_ON_CLOCK, or when TickQueueManager has stored a tick of the next bar with
+    CLOSE_ON_TICKS, so that the closing bar is complete in the database.
+    """
+
+    def __init__(
+        self,
+        time_span: int,
+        close_on: str = CLOSE_ON_CLOCK,
+        precompute_lead: float = 0.05,
+        tick_grace: float = 0.2,
+        spin_threshold: float = 0.001,
+    ):
+        """
+        Args:
+            time_span (int): Time span of bars (seconds).
+            close_on (str, optional): CLOSE_ON_CLOCK or CLOSE_ON_TICKS. Defaults to CLOSE_ON_CLOCK.
+            precompute_lead (float, optional): Seconds before the boundary to start precomputing. Defaults to 0.05.
+            tick_grace (float, optional): Max seconds to wait for a tick after the boundary with CLOSE_ON_TICKS. Defaults to 0.2.
+            spin_threshold (float, optional): The last part of a sleep (seconds) is spent yielding to the event loop instead of
+                in a timer, because timers fire up to one select() late. Defaults to 0.001.
+        """
+        if close_on not in (CLOSE_ON_CLOCK, CLOSE_ON_TICKS):
+            raise ValueError(f"Invalid close_on={close_on}")
+
+        self.time_span = time_span
+        self.close_on = close_on
+        self.precompute_lead = precompute_lead
+        self.tick_grace = tick_grace
+        self.spin_threshold = spin_threshold
+        # Unix timestamp (ms) of the newest stored tick.
+        self.latest_tick_timestamp = 0
+        self._tick_event: Optional[asyncio.Event] = None
+        self._waiting_boundary: Optional[float] = None
+
+    def next_boundary(self, now: Optional[float] = None) -> float:
+        """Unix time (s) when the current bar closes."""
+        if now is None:
+            now = time.time()
+        return (now // self.time_span + 1) * self.time_span
+
+    def on_tick(self, unix_timestamp: int) -> None:
+        """Tell that ticks up to `unix_timestamp` (ms) are stored and bars are updated.
+
+        Args:
+            unix_timestamp (int): Unix timestamp (ms) of the newest stored tick.
+        """
+        if unix_timestamp <= self.latest_tick_timestamp:
+            return
+        self.latest_tick_timestamp = unix_timestamp
+        if self._tick_event is not None and self._waiting_boundary is not None and unix_timestamp >= self._waiting_boundary * 1000:
+            self._tick_event.set()
+
+    async def sleep_until(self, unix_time: float) -> None:
+        """Sleep until the wall clock reaches `unix_time` (s)."""
+        delay = unix_time - time.time()
+        if delay > self.spin_threshold:
+            await asyncio.sleep(delay - self.spin_threshold)
+        while time.time() < unix_time:
+            await asyncio.sleep(0.0)
+
+    async def wait_until_precompute(self, boundary: float, timeout: Optional[float] = None) -> bool:
+        """Sleep until `precompute_lead` seconds before `boundary`, or for at most `timeout` seconds.
+
+        Args:
+            boundary (float): Unix time (s) of the boundary.
+            timeout (Optional[float], optional): Max seconds to sleep, so that the caller can do periodic work
+                (e.g. execution checks) until the precompute time. Defaults to None (no limit).
+
+        Returns:
+            bool: True if the precompute time is reached.
+        """
+        precompute_time = boundary - self.precompute_lead
+        if timeout is not None and time.time() + timeout < precompute_time:
+            await self.sleep_until(time.time() + timeout)
+            return False
+        await self.sleep_until(precompute_time)
+        return True
+
+    async def wait_for_close(self, boundary: float) -> float:
+        """Wait until the bar closing at `boundary` is closed.
+
+        Args:
+            boundary (float): Unix time (s) of the boundary.
+
+        Returns:
+            float: Unix time (s) when the bar is regarded as closed.
+        """
+        if self.close_on == CLOSE_ON_CLOCK:
+            await self.sleep_until(boundary)
+            return time.time()
+
+        if self.latest_tick_timestamp < boundary * 1000:
+            self._tick_event = asyncio.Event()
+            self._waiting_boundary = boundary
+            try:
+                await asyncio.wait_for(self._tick_event.wait(), timeout=max(0.0, boundary + self.tick_grace - time.time()))
+            except asyncio.TimeoutError:
+                # No trade in the next bar yet.
+                pass
+            finally:
+                self._tick_event = None
+                self._waiting_boundary = None
+        return time.time()
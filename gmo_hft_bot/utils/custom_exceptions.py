@@ -1,2 +1,10 @@
 class ConnectionFailedError(Exception):
     pass
+
+
+class RequestSupersededError(Exception):
+    """A queued private request is replaced by a newer one with the same coalesce key (see utils/private_api_scheduler.py)."""
+
+
+class SharedStateReadError(Exception):
+    """The shared market state cannot be read consistently (see utils/shared_market_state.py)."""
@@ -0,0 +1,226 @@
+import logging
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+import sqlalchemy.orm
+
+# What `DbWriter.submit` does when the queue is full.
+# Wait for a free slot. The caller (e.g. the event loop) is blocked meanwhile.
+BACKPRESSURE_BLOCK = "block"
+# Drop the oldest queued job, e.g. a board which is superseded by the new one anyway.
+BACKPRESSURE_DROP_OLDEST = "drop_oldest"
+# Drop the new job.
+BACKPRESSURE_DROP_NEWEST = "drop_newest"
+BACKPRESSURE_POLICIES = (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_DROP_NEWEST)
+
+# (func, kwargs) of a job. None stops the writer thread.
+_Job = Optional[Tuple[Callable[..., Any], dict]]
+
+
+class DbWriterStats(NamedTuple):
+    submitted: int
+    written: int
+    dropped: int
+    failed: int
+    # Number of batches written, each in one session.
+    flushes: int
+    queue_size: int
+    # High-water mark of the queue.
+    max_queue_size: int
+    # Duration (seconds) of the last and the slowest batch.
+    last_flush_seconds: float
+    max_flush_seconds: float
+
+
+class DirectWriter:
+    """Run jobs at once in the calling thread. Same interface as DbWriter for tests, benchmarks and scripts."""
+
+    def __init__(self, SessionLocal: sqlalchemy.orm.Session):
+        self.SessionLocal = SessionLocal
+
+    def submit(self, func: Callable[..., Any], **kwargs) -> bool:
+        with self.SessionLocal() as db:
+            func(db=db, **kwargs)
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return True
+
+
+class DbWriter:
+    """Write to database in a dedicated thread, so that coroutines on the event loop never wait on SQLite.
+
+    A job is a crud function (or any function which takes `db`), called as `func(db=db, **kwargs)` in the writer thread.
+    Jobs run in the order of `submit`. The thread takes all queued jobs (up to `max_batch`) at once and runs them in one
+    session. The queue is bounded by `maxsize` and `backpressure` (one of BACKPRESSURE_POLICIES) decides what happens when
+    it is full. A failed job is logged and counted, and does not stop the writer.
+
+    Jobs with different loss tolerances go to different writers (e.g. boards, which supersede each other, to a
+    BACKPRESSURE_DROP_OLDEST writer and ticks to a writer which never drops). Writers of the in-memory database share a
+    SessionLocal of db/database.SerializedSessionLocal.
+    """
+
+    def __init__(
+        self,
+        SessionLocal: sqlalchemy.orm.Session,
+        maxsize: int = 10000,
+        backpressure: str = BACKPRESSURE_DROP_OLDEST,
+        max_batch: int = 1000,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """
+        Args:
+            SessionLocal (sqlalchemy.orm.Session): Session factory of sqlalchemy. The engine should allow use from another thread.
+            maxsize (int, optional): Max number of queued jobs. 0 for unbounded (no job is ever dropped). Defaults to 10000.
+            backpressure (str, optional): Policy when the queue is full. Defaults to BACKPRESSURE_DROP_OLDEST.
+            max_batch (int, optional): Max number of jobs in one session. Defaults to 1000.
+            logger (Optional[logging.Logger], optional): logger. Defaults to None (logger of this module).
+        """
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Invalid backpressure={backpressure}")
+
+        self.SessionLocal = SessionLocal
+        self.backpressure = backpressure
+        self.max_batch = max_batch
+        self.logger = logger or logging.getLogger(__name__)
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self._submitted = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+        self._max_queue_size = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="DbWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Write the queued jobs and stop the thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, func: Callable[..., Any], **kwargs) -> bool:
+        """Queue a job.
+
+        Args:
+            func (Callable[..., Any]): Function called as `func(db=db, **kwargs)`.
+
+        Returns:
+            bool: False if the job is dropped by the backpressure policy.
+        """
+        job = (func, kwargs)
+        self._submitted += 1
+        if self.backpressure == BACKPRESSURE_BLOCK:
+            self._queue.put(job)
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(job)
+                    break
+                except queue.Full:
+                    if self.backpressure == BACKPRESSURE_DROP_NEWEST:
+                        self._drop()
+                        return False
+                    try:
+                        self._queue.get_nowait()
+                        self._queue.task_done()
+                        self._drop()
+                    except queue.Empty:
+                        # The writer has taken the jobs meanwhile.
+                        pass
+
+        queue_size = self._queue.qsize()
+        if queue_size > self._max_queue_size:
+            self._max_queue_size = queue_size
+        return True
+
+    def _drop(self) -> None:
+        with self._lock:
+            self._dropped += 1
+            dropped = self._dropped
+        if dropped == 1 or dropped % 1000 == 0:
+            self.logger.warning("DbWriter queue is full. %d jobs have been dropped (%s)", dropped, self.backpressure)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the queued jobs are written.
+
+        Args:
+            timeout (Optional[float], optional): Seconds. Defaults to None (wait forever).
+
+        Returns:
+            bool: False if timed out.
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks > 0:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def stats(self) -> DbWriterStats:
+        with self._lock:
+            return DbWriterStats(
+                submitted=self._submitted,
+                written=self._written,
+                dropped=self._dropped,
+                failed=self._failed,
+                flushes=self._flushes,
+                queue_size=self._queue.qsize(),
+                max_queue_size=self._max_queue_size,
+                last_flush_seconds=self._last_flush_seconds,
+                max_flush_seconds=self._max_flush_seconds,
+            )
+
+    def _run(self) -> None:
+        is_running = True
+        while is_running:
+            jobs: List[_Job] = [self._queue.get()]
+            while len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            start = time.perf_counter()
+            written = failed = 0
+            with self.SessionLocal() as db:
+                for job in jobs:
+                    if job is None:
+                        is_running = False
+                        continue
+                    func, kwargs = job
+                    try:
+                        func(db=db, **kwargs)
+                        written += 1
+                    except Exception:
+                        failed += 1
+                        db.rollback()
+                        self.logger.error("DbWriter job %s failed\n%s", getattr(func, "__name__", func), traceback.format_exc())
+            duration = time.perf_counter() - start
+
+            with self._lock:
+                self._written += written
+                self._failed += failed
+                self._flushes += 1
+                self._last_flush_seconds = duration
+                self._max_flush_seconds = max(self._max_flush_seconds, duration)
+            for _ in jobs:
+                self._queue.task_done()
@@ -0,0 +1,134 @@
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, records, schemas
+from gmo_hft_bot.utils.db_writer import DbWriter
+from gmo_hft_bot.utils.orderbook_kernels import BOOK_FEATURE_NAMES
+
+# Strategy of crud.get_prediction.
+DEFAULT_STRATEGY_ID = "up_candle_count"
+
+
+class DecisionJournal:
+    """Buffer decisions of a strategy and write them to the predict table in batches.
+
+    Rows are plain dicts of the typed columns of models.PREDICT, so the writer inserts a batch with one executemany.
+    The feature snapshot of a decision is kept as float64 bytes, so that a backtest can replay the same inputs
+    (see backtest.utils.utils.get_predict_df).
+    """
+
+    def __init__(self, symbol: str, writer: DbWriter, strategy_id: str = DEFAULT_STRATEGY_ID, max_buffer: int = 1000):
+        """
+        Args:
+            symbol (str): Name of symbol.
+            writer (DbWriter): Writer of the batches (or DirectWriter).
+            strategy_id (str, optional): Id of the strategy. Defaults to DEFAULT_STRATEGY_ID.
+            max_buffer (int, optional): Rows buffered before a flush. Defaults to 1000.
+        """
+        self.symbol = symbol
+        self.writer = writer
+        self.strategy_id = strategy_id
+        self.max_buffer = max_buffer
+        self._rows: List[Dict] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def record(
+        self,
+        kind: int,
+        side: int,
+        price: float,
+        size: float,
+        predict_value: float = 0.0,
+        is_entry: bool = False,
+        bar_timestamp: Optional[int] = None,
+        features: Optional[Sequence[float]] = None,
+        timestamp: Optional[int] = None,
+    ) -> None:
+        """Buffer a row. Flush if `max_buffer` rows are buffered.
+
+        Args:
+            kind (int): schemas.PREDICT_KIND_*.
+            side (int): schemas.PREDICT_SIDE_BUY or schemas.PREDICT_SIDE_SELL.
+            price (float): Price.
+            size (float): Size.
+            predict_value (float, optional): Value of the prediction. Defaults to 0.0.
+            is_entry (bool, optional): Whether an order is sent. Defaults to False.
+            bar_timestamp (Optional[int], optional): Unix timestamp (s) of the bar close. Defaults to None.
+            features (Optional[Sequence[float]], optional): Inputs of the prediction. Defaults to None.
+            timestamp (Optional[int], optional): Unix timestamp (ms). Defaults to None (now).
+        """
+        self._rows.append(
+            {
+                "timestamp": round(time.time() * 1000) if timestamp is None else timestamp,
+                "symbol": self.symbol,
+                "strategy_id": self.strategy_id,
+                "kind": kind,
+                "side": side,
+                "price": price,
+                "size": size,
+                "predict_value": predict_value,
+                "is_entry": is_entry,
+                "bar_timestamp": bar_timestamp,
+                "features": None if features is None else np.asarray(features, dtype=np.float64).tobytes(),
+                "freshness": schemas.FRESHNESS_OK,
+            }
+        )
+        if len(self._rows) >= self.max_buffer:
+            self.flush()
+
+    def record_decision(self, predict_info: records.Decision, bar_timestamp: Optional[int] = None) -> None:
+        """Buffer the buy and the sell row of a decision, which share the timestamp and the features."""
+        timestamp = round(time.time() * 1000)
+        features = None if predict_info.features is None else np.asarray(predict_info.features, dtype=np.float64).tobytes()
+        for side, price, size, predict_value, is_entry in [
+            (schemas.PREDICT_SIDE_BUY, predict_info.buy_price, predict_info.buy_size, predict_info.buy_predict_value, predict_info.is_buy_entry),
+            (schemas.PREDICT_SIDE_SELL, predict_info.sell_price, predict_info.sell_size, predict_info.sell_predict_value, predict_info.is_sell_entry),
+        ]:
+            self._rows.append(
+                {
+                    "timestamp": timestamp,
+                    "symbol": self.symbol,
+                    "strategy_id": self.strategy_id,
+                    "kind": schemas.PREDICT_KIND_DECISION,
+                    "side": side,
+                    "price": price,
+                    "size": size,
+                    "predict_value": predict_value,
+                    "is_entry": is_entry,
+                    "bar_timestamp": bar_timestamp,
+                    "features": features,
+                    "freshness": predict_info.freshness,
+                }
+            )
+        if len(self._rows) >= self.max_buffer:
+            self.flush()
+
+    def flush(self) -> None:
+        """Submit the buffered rows to the writer as one job."""
+        if len(self._rows) == 0:
+            return
+        rows, self._rows = self._rows, []
+        self.writer.submit(crud.insert_predict_items, insert_items=rows)
+
+
+def decode_features(features: Optional[bytes]) -> Optional[np.ndarray]:
+    """float64 array of the `features` column."""
+    if features is None:
+        return None
+    return np.frombuffer(features, dtype=np.float64)
+
+
+def decode_book_features(features: Optional[bytes]) -> np.ndarray:
+    """BOOK_FEATURE_NAMES of the `features` column (see crud.prediction_features). nan if they were not journaled."""
+    values = decode_features(features)
+    book_feature_count = len(BOOK_FEATURE_NAMES)
+    if values is None or values.size % len(crud.PREDICTION_FEATURE_COLUMNS) != book_feature_count:
+        return np.full(book_feature_count, np.nan)
+    start = values.size - book_feature_count
+    return values[start:]
@@ -0,0 +1,220 @@
+import sys
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, NamedTuple, Optional
+
+sys.path.append(".")
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
+
+# Event loop implementations of `run_with_loop`.
+LOOP_ASYNCIO = "asyncio"
+# uvloop (libuv) if it is installed (`pip install uvloop`, not on Windows). Falls back to asyncio.
+LOOP_UVLOOP = "uvloop"
+# uvloop if it is installed, otherwise asyncio, without a warning.
+LOOP_AUTO = "auto"
+LOOP_IMPLEMENTATIONS = (LOOP_ASYNCIO, LOOP_UVLOOP, LOOP_AUTO)
+
+# Heartbeat metrics of LoopLagMonitor (milliseconds).
+METRIC_LOOP_LAG_MS = "loop_lag_ms"
+METRIC_MAX_LOOP_LAG_MS = "max_loop_lag_ms"
+
+
+class LoopConfig(NamedTuple):
+    """Event loop settings of a process. Picklable, so that it can be passed to multiprocessing targets."""
+
+    # One of LOOP_IMPLEMENTATIONS.
+    loop: str = LOOP_AUTO
+    # Threads of the default executor (`loop.run_in_executor(None, ...)`). None for the default of asyncio.
+    executor_workers: Optional[int] = None
+    # Log callbacks (steps of coroutines) which block the loop longer than this (seconds). None to disable.
+    # Not on uvloop unless `debug` is True (see `configure_loop`). LoopLagMonitor still reports blocking there.
+    slow_callback_duration: Optional[float] = 0.1
+    # Debug mode of the loop, which tracks the origin of every handle and coroutine. Slow, for diagnosis only.
+    debug: bool = False
+    # Interval (seconds) of LoopLagMonitor. None to disable.
+    lag_interval: Optional[float] = 1.0
+    # Log loop lag longer than this (seconds).
+    lag_warning: float = 0.1
+
+
+def new_event_loop(implementation: str = LOOP_AUTO, logger: Optional[logging.Logger] = None) -> asyncio.AbstractEventLoop:
+    """Create an event loop of `implementation` (one of LOOP_IMPLEMENTATIONS).
+
+    Raises:
+        ValueError: If `implementation` is unknown.
+    """
+    if implementation not in LOOP_IMPLEMENTATIONS:
+        raise ValueError(f"Invalid event loop {implementation}. It should be in {LOOP_IMPLEMENTATIONS}")
+
+    if implementation != LOOP_ASYNCIO:
+        try:
+            import uvloop
+
+            return uvloop.new_event_loop()
+        except ImportError:
+            if implementation == LOOP_UVLOOP and logger is not None:
+                logger.warning("uvloop is not installed. Use the asyncio event loop.")
+    return asyncio.new_event_loop()
+
+
+def is_uvloop(loop: asyncio.AbstractEventLoop) -> bool:
+    return type(loop).__module__.startswith("uvloop")
+
+
+def _callback_name(handle: asyncio.Handle) -> str:
+    """Name of the coroutine whose step is `handle`, or of the callback."""
+    callback = getattr(handle, "_callback", None)
+    # Task steps and wakeups are bound to the task.
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return getattr(coro, "__qualname__", repr(coro))
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+class SlowCallbackLogger:
+    """Log callbacks of asyncio event loops which run longer than `threshold` with the name of the coroutine.
+
+    It times `asyncio.Handle._run`, which costs two clock reads per callback, instead of the debug mode of asyncio
+    (which also tracks the origin of every coroutine). uvloop does not run `asyncio.Handle`, so slow callbacks of uvloop
+    loops are only logged in debug mode (`LoopConfig.debug`), by the `asyncio` logger.
+    """
+
+    def __init__(self, threshold: float, logger: logging.Logger):
+        self.threshold = threshold
+        self.logger = logger
+        self.slow_callbacks = 0
+        self._original_run: Optional[Callable] = None
+
+    def install(self) -> None:
+        if self._original_run is not None:
+            return
+        original_run = asyncio.Handle._run
+        threshold, log = self.threshold, self._log
+
+        def _run(handle):
+            start = time.perf_counter()
+            original_run(handle)
+            duration = time.perf_counter() - start
+            if duration > threshold:
+                log(handle, duration)
+
+        self._original_run = original_run
+        asyncio.Handle._run = _run
+
+    def uninstall(self) -> None:
+        if self._original_run is None:
+            return
+        asyncio.Handle._run = self._original_run
+        self._original_run = None
+
+    def _log(self, handle: asyncio.Handle, duration: float) -> None:
+        self.slow_callbacks += 1
+        self.logger.warning("Slow callback %s blocked the event loop for %.1f ms", _callback_name(handle), duration * 1000)
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes a sleeping coroutine. Lag is the time other callbacks held the loop.
+
+    The newest and the max lag are published as heartbeat metrics (METRIC_LOOP_LAG_MS, METRIC_MAX_LOOP_LAG_MS).
+    """
+
+    RUNNING = True
+
+    def __init__(self, interval: float = 1.0, warning_threshold: float = 0.1):
+        self.interval = interval
+        self.warning_threshold = warning_threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self, logger: logging.Logger, heartbeat: Optional[Heartbeat] = None):
+        loop = asyncio.get_running_loop()
+        while self.RUNNING:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.warning_threshold:
+                logger.warning("Event loop lag %.1f ms", lag * 1000)
+            if heartbeat is not None:
+                heartbeat.set_metric(METRIC_LOOP_LAG_MS, lag * 1000)
+                heartbeat.set_metric(METRIC_MAX_LOOP_LAG_MS, self.max_lag * 1000)
+
+
+def configure_loop(loop: asyncio.AbstractEventLoop, config: LoopConfig, logger: logging.Logger) -> Optional[SlowCallbackLogger]:
+    """Apply the executor size, the debug mode and the slow callback detection of `config` to `loop`.
+
+    uvloop has no cheap hook for slow callbacks, and its debug mode would cost the speedup it is chosen for, so slow
+    callbacks of uvloop loops are logged only if `config.debug` is True. LoopLagMonitor still measures blocking.
+    In debug mode, slow callbacks are logged by the `asyncio` logger instead of a SlowCallbackLogger.
+
+    Returns:
+        Optional[SlowCallbackLogger]: Installed logger of slow callbacks, to be uninstalled when the loop is closed.
+    """
+    if config.executor_workers is not None:
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=config.executor_workers, thread_name_prefix="loop-executor"))
+
+    if config.debug:
+        loop.set_debug(True)
+        if config.slow_callback_duration is not None:
+            loop.slow_callback_duration = config.slow_callback_duration
+    if config.slow_callback_duration is None or config.debug or is_uvloop(loop):
+        # The debug mode logs slow callbacks by itself.
+        return None
+    slow_callback_logger = SlowCallbackLogger(threshold=config.slow_callback_duration, logger=logger)
+    slow_callback_logger.install()
+    return slow_callback_logger
+
+
+def _cancel_all_tasks(loop: asyncio.AbstractEventLoop) -> None:
+    # Same as the cleanup of asyncio.run.
+    tasks = asyncio.all_tasks(loop)
+    if len(tasks) == 0:
+        return
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            loop.call_exception_handler({"message": "unhandled exception during run_with_loop() shutdown", "exception": task.exception(), "task": task})
+
+
+def run_with_loop(main: Coroutine, logger: logging.Logger, config: Optional[LoopConfig] = None, heartbeat: Optional[Heartbeat] = None) -> Any:
+    """`asyncio.run` with the event loop of `config`.
+
+    Args:
+        main (Coroutine): Coroutine to run.
+        logger (logging.Logger): logger
+        config (Optional[LoopConfig], optional): Loop settings. Defaults to None (asyncio.run).
+        heartbeat (Optional[Heartbeat], optional): Heartbeat which publishes the loop lag. Defaults to None.
+
+    Returns:
+        Any: Result of `main`.
+    """
+    if config is None:
+        return asyncio.run(main)
+
+    loop = new_event_loop(config.loop, logger=logger)
+    slow_callback_logger = None
+    try:
+        asyncio.set_event_loop(loop)
+        slow_callback_logger = configure_loop(loop, config, logger)
+        logger.info("Run on %s event loop", "uvloop" if is_uvloop(loop) else "asyncio")
+        if config.lag_interval is not None:
+            monitor = LoopLagMonitor(interval=config.lag_interval, warning_threshold=config.lag_warning)
+            loop.create_task(monitor.run(logger=logger, heartbeat=heartbeat))
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            _cancel_all_tasks(loop)
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            if hasattr(loop, "shutdown_default_executor"):
+                loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            if slow_callback_logger is not None:
+                slow_callback_logger.uninstall()
+            asyncio.set_event_loop(None)
+            loop.close()
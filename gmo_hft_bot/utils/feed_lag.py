@@ -0,0 +1,112 @@
+import sys
+import time
+import logging
+from typing import Dict, Optional
+
+sys.path.append(".")
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
+
+# Feeds of the websocket queues.
+FEED_TRADES = "trades"
+FEED_ORDERBOOKS = "orderbooks"
+FEEDS = (FEED_TRADES, FEED_ORDERBOOKS)
+
+# Heartbeat metrics of FeedLagMonitor, per feed (e.g. "trades_lag_ms").
+METRIC_FEED_LAG_MS = "{feed}_lag_ms"
+METRIC_FEED_QUEUE_OVERFLOWS = "{feed}_queue_overflows"
+METRIC_TRADING_PAUSED = "trading_paused"
+
+
+class FeedLagMonitor:
+    """Lag of the feeds: now minus the exchange timestamp of a message, when it is taken from its queue.
+
+    The queue consumers call `observe` for each message. Trading is paused while the lag of the newest message of
+    a feed is above `max_lag`, and resumes when the lag of all feeds is back to `resume_lag`, so that it does not
+    flap around the threshold. Trading on stale boards is worse than not trading.
+
+    The lag of a feed which has delivered no message for `lag_expiry` seconds is not counted: its queue is empty, since
+    a consumer behind the feed takes messages all the time. Otherwise the last trade of a quiet market would keep trading
+    paused while fresh boards come.
+    """
+
+    def __init__(
+        self,
+        max_lag: float = 1.0,
+        resume_lag: Optional[float] = None,
+        lag_expiry: Optional[float] = None,
+        heartbeat: Optional[Heartbeat] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """
+        Args:
+            max_lag (float, optional): Pause trading above this lag (seconds). Defaults to 1.0.
+            resume_lag (Optional[float], optional): Resume trading at or below this lag (seconds). Defaults to None (half of `max_lag`).
+            lag_expiry (Optional[float], optional): Ignore the lag of a feed without messages for this long (seconds).
+                Defaults to None (`max_lag`).
+            heartbeat (Optional[Heartbeat], optional): Heartbeat which publishes the lag. Defaults to None.
+            logger (Optional[logging.Logger], optional): Logger of the pauses and overflows. Defaults to None.
+        """
+        self.max_lag = max_lag
+        self.resume_lag = max_lag / 2 if resume_lag is None else resume_lag
+        self.lag_expiry = max_lag if lag_expiry is None else lag_expiry
+        self.heartbeat = heartbeat
+        self.logger = logger
+        # Lag (seconds) of the newest message of each feed.
+        self.last_lags: Dict[str, float] = {}
+        # Unix time (s) when the newest message of each feed was taken from its queue.
+        self.observed_at: Dict[str, float] = {}
+        self.max_lags: Dict[str, float] = {}
+        self.overflows: Dict[str, int] = {}
+        self.pauses = 0
+        self.trading_paused = False
+
+    def observe(self, feed: str, timestamp: int, now: Optional[float] = None) -> float:
+        """Record the lag of a message taken from the queue of `feed`.
+
+        Args:
+            feed (str): One of FEEDS.
+            timestamp (int): Exchange timestamp of the message (unix ms).
+            now (Optional[float], optional): Unix time (s) of the dequeue. Defaults to None (time.time()).
+
+        Returns:
+            float: Lag (seconds).
+        """
+        if now is None:
+            now = time.time()
+        lag = now - timestamp / 1000
+        self.last_lags[feed] = lag
+        self.observed_at[feed] = now
+        if lag > self.max_lags.get(feed, 0.0):
+            self.max_lags[feed] = lag
+
+        if not self.trading_paused:
+            if lag > self.max_lag:
+                self.trading_paused = True
+                self.pauses += 1
+                if self.logger is not None:
+                    self.logger.warning("Pause trading: %s lag %.0f ms is above %.0f ms", feed, lag * 1000, self.max_lag * 1000)
+        elif all(last_lag <= self.resume_lag or now - self.observed_at[other] > self.lag_expiry for other, last_lag in self.last_lags.items()):
+            self.trading_paused = False
+            if self.logger is not None:
+                self.logger.warning("Resume trading: feed lag is back to %.0f ms", lag * 1000)
+
+        if self.heartbeat is not None:
+            self.heartbeat.set_metric(METRIC_FEED_LAG_MS.format(feed=feed), lag * 1000)
+            self.heartbeat.set_metric(METRIC_TRADING_PAUSED, float(self.trading_paused))
+        return lag
+
+    def report_overflows(self, feed: str, overflows: int) -> None:
+        """Alert when the queue of `feed` has been full since the last report.
+
+        Args:
+            feed (str): One of FEEDS.
+            overflows (int): Times the queue was full so far (e.g. `QueueAndTradeManager.get_ticks_queue_overflows()`).
+        """
+        new_overflows = overflows - self.overflows.get(feed, 0)
+        if new_overflows <= 0:
+            return
+        self.overflows[feed] = overflows
+        if self.logger is not None:
+            self.logger.warning("%s queue was full %d times (%d in total). The consumer is behind the feed.", feed, new_overflows, overflows)
+        if self.heartbeat is not None:
+            self.heartbeat.set_metric(METRIC_FEED_QUEUE_OVERFLOWS.format(feed=feed), overflows)
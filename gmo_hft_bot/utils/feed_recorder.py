@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import struct
+import asyncio
+import logging
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+import websockets
+
+sys.path.append(".")
+from gmo_hft_bot.utils.gmo_websocket_subscriber import GmoWebsocketSubscriber
+from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT
+
+# File format of recorded feeds:
+#   FEED_FILE_MAGIC, then records of FEED_RECORD_HEADER (receive time in ns since epoch, frame length) + raw frame bytes.
+# Records are only appended, so a file cut by a crash is still readable up to the last complete record.
+FEED_FILE_MAGIC = b"GMOFEED1"
+FEED_RECORD_HEADER = struct.Struct("<qI")
+
+
+class FeedRecorder:
+    """Append raw websocket frames with their receive timestamps to a feed file."""
+
+    def __init__(self, path: str):
+        is_new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file: BinaryIO = open(path, "ab")
+        if is_new_file:
+            self.file.write(FEED_FILE_MAGIC)
+        self.record_count = 0
+
+    def write(self, frame: Union[str, bytes], recv_time_ns: Optional[int] = None) -> None:
+        """Append a frame.
+
+        Args:
+            frame (Union[str, bytes]): Raw frame received from websocket.
+            recv_time_ns (Optional[int], optional): Receive time (ns since epoch). Defaults to now.
+        """
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        if recv_time_ns is None:
+            recv_time_ns = time.time_ns()
+        self.file.write(FEED_RECORD_HEADER.pack(recv_time_ns, len(frame)))
+        self.file.write(frame)
+        self.record_count += 1
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_feed_records(path: str) -> Iterator[Tuple[int, bytes]]:
+    """Read frames written by `FeedRecorder`.
+
+    Args:
+        path (str): File path of feed.
+
+    Raises:
+        ValueError: Raise if the file is not a feed file.
+
+    Yields:
+        Iterator[Tuple[int, bytes]]: Receive time (ns since epoch) and raw frame.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(FEED_FILE_MAGIC)) != FEED_FILE_MAGIC:
+            raise ValueError(f"{path} is not a feed file.")
+
+        while True:
+            header = f.read(FEED_RECORD_HEADER.size)
+            if len(header) < FEED_RECORD_HEADER.size:
+                return
+            recv_time_ns, length = FEED_RECORD_HEADER.unpack(header)
+            frame = f.read(length)
+            if len(frame) < length:
+                # Truncated by a crash while recording.
+                return
+            yield recv_time_ns, frame
+
+
+async def record_public_feed(ws_url: str, symbol: str, path: str, duration: float, logger: logging.Logger) -> int:
+    """Record `orderbooks` and `trades` frames of public websocket.
+
+    Args:
+        ws_url (str): Url of public websocket.
+        symbol (str): Name of symbol
+        path (str): File path of feed. Frames are appended if it exists.
+        duration (float): Recording time (seconds).
+        logger (logging.Logger): logger
+
+    Returns:
+        int: Number of recorded frames.
+    """
+    gmo_websocket_subscriber = GmoWebsocketSubscriber()
+    with FeedRecorder(path) as recorder:
+        async with websockets.connect(ws_url, logger=logger) as ws:
+            await ws.send(gmo_websocket_subscriber.subscribe_orderbooks_msg(symbol=symbol))
+            # Public websocket accepts one subscribe request per second.
+            await asyncio.sleep(1.0)
+            await ws.send(gmo_websocket_subscriber.subscribe_trades_msg(symbol=symbol))
+
+            end_time = time.monotonic() + duration
+            last_flush_time = time.monotonic()
+            while time.monotonic() < end_time:
+                try:
+                    frame = await asyncio.wait_for(ws.recv(), timeout=end_time - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+                recorder.write(frame)
+
+                if time.monotonic() - last_flush_time > 1.0:
+                    recorder.flush()
+                    last_flush_time = time.monotonic()
+                    logger.info("Recorded %d frames", recorder.record_count)
+
+        return recorder.record_count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Record orderbooks and trades frames of GMO public websocket.")
+    arg_parser.add_argument("path", help="File path of feed.")
+    arg_parser.add_argument("--symbol", default="BTC_JPY")
+    arg_parser.add_argument("--duration", type=float, default=600.0, help="Recording time (seconds).")
+    arg_parser.add_argument("--ws-url", default="wss://api.coin.z.com/ws/public/v1")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOGGER_FORMAT)
+    logger = logging.getLogger("FeedRecorderLogger")
+    count = asyncio.run(record_public_feed(ws_url=args.ws_url, symbol=args.symbol, path=args.path, duration=args.duration, logger=logger))
+    logger.info("Recorded %d frames to %s", count, args.path)
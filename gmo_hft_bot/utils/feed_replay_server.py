@@ -0,0 +1,167 @@
+import sys
+import time
+import json
+import asyncio
+import logging
+from http import HTTPStatus
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import websockets
+
+sys.path.append(".")
+from gmo_hft_bot.utils.feed_recorder import read_feed_records
+from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT
+
+# Answer for private REST requests (e.g. the dummy order of Trader) so that the whole bot runs without network.
+DUMMY_PRIVATE_API_RESPONSE = json.dumps({"status": 0, "data": {}, "responsetime": "2018-03-30T12:34:56.789Z"}).encode("utf-8")
+
+
+class FeedReplayServer:
+    """Websocket server which serves frames recorded by `FeedRecorder` like GMO public websocket.
+
+    Each connection gets the frames of the channel it subscribes to (`orderbooks` or `trades`) with the
+    recorded pacing divided by `speed`. `speed=0` sends as fast as the client reads. With `rewrite_timestamps`,
+    the `timestamp` of each frame is replaced with the send time, so the bot sees the replay as a live feed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        speed: float = 1.0,
+        rewrite_timestamps: bool = True,
+        loop: bool = False,
+        sent_counters: Optional[Dict[str, Any]] = None,
+        last_sent_times: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            path (str): File path of feed.
+            speed (float, optional): Replay speed. 1.0 is real time, 0 is max speed. Defaults to 1.0.
+            rewrite_timestamps (bool, optional): Replace `timestamp` with the send time. Defaults to True.
+            loop (bool, optional): Replay again from the beginning when frames run out. Defaults to False.
+            sent_counters (Optional[Dict[str, Any]], optional): Shared integers (have `value` attribute, e.g. `multiprocessing.RawValue`)
+                counting the sent frames per channel. Defaults to None.
+            last_sent_times (Optional[Dict[str, Any]], optional): Shared floats set to the unix time (s) when the last frame
+                of each channel was sent. Defaults to None.
+        """
+        self.speed = speed
+        self.rewrite_timestamps = rewrite_timestamps
+        self.loop = loop
+        self.sent_counters = sent_counters or {}
+        self.last_sent_times = last_sent_times or {}
+        self.frames: Dict[str, List[Tuple[float, Dict]]] = {}
+        self.duration = 0.0
+
+        first_recv_time_ns = None
+        for recv_time_ns, frame in read_feed_records(path):
+            message = json.loads(frame)
+            channel = message.get("channel")
+            if channel is None:
+                continue
+            if first_recv_time_ns is None:
+                first_recv_time_ns = recv_time_ns
+            # Channels share the clock so that their relative timing is kept.
+            offset = (recv_time_ns - first_recv_time_ns) / 1e9
+            self.frames.setdefault(channel, []).append((offset, message))
+            self.duration = offset
+
+    def frame_count(self, channel: str) -> int:
+        return len(self.frames.get(channel, []))
+
+    async def process_request(self, path: str, request_headers: Any) -> Optional[Tuple[HTTPStatus, List[Tuple[str, str]], bytes]]:
+        if path.startswith("/private"):
+            return HTTPStatus.OK, [("Content-Type", "application/json")], DUMMY_PRIVATE_API_RESPONSE
+        return None
+
+    async def handler(self, websocket):
+        subscribe_message = json.loads(await websocket.recv())
+        channel = subscribe_message.get("channel")
+        frames = self.frames.get(channel, [])
+        sent_counter = self.sent_counters.get(channel)
+        last_sent_time = self.last_sent_times.get(channel)
+        if len(frames) == 0:
+            await websocket.send(json.dumps({"error": "ERR-5010 Invalid request parameter."}))
+            return
+
+        start_time = time.monotonic()
+        while True:
+            for i, (offset, message) in enumerate(frames):
+                if self.speed > 0:
+                    wait_time = start_time + offset / self.speed - time.monotonic()
+                    if wait_time > 0:
+                        await asyncio.sleep(wait_time)
+                elif i % 100 == 0:
+                    # Let the loop answer pings while sending at max speed.
+                    await asyncio.sleep(0)
+
+                sent_at = time.time()
+                if self.rewrite_timestamps:
+                    message = {
+                        **message,
+                        "timestamp": datetime.fromtimestamp(sent_at, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+                    }
+                await websocket.send(json.dumps(message))
+                if sent_counter is not None:
+                    sent_counter.value += 1
+                if last_sent_time is not None:
+                    last_sent_time.value = sent_at
+
+            if not self.loop:
+                break
+            start_time += self.duration / self.speed if self.speed > 0 else 0.0
+
+        # Keep the connection open. Closing it looks like a connection failure to the bot.
+        await websocket.wait_closed()
+
+    async def serve(self, host: str = "", port: int = 8001):
+        async with websockets.serve(self.handler, host, port, process_request=self.process_request):
+            await asyncio.Future()
+
+
+def feed_replay_server_process(
+    path: str,
+    host: str = "",
+    port: int = 8001,
+    speed: float = 1.0,
+    rewrite_timestamps: bool = True,
+    loop: bool = False,
+    sent_counters: Optional[Dict[str, Any]] = None,
+    last_sent_times: Optional[Dict[str, Any]] = None,
+):
+    """Target of multiprocessing.Process to run `FeedReplayServer`.
+
+    Args:
+        path (str): File path of feed.
+        host (str, optional): Host. Defaults to "".
+        port (int, optional): Port. Defaults to 8001.
+        speed (float, optional): Replay speed. 1.0 is real time, 0 is max speed. Defaults to 1.0.
+        rewrite_timestamps (bool, optional): Replace `timestamp` with the send time. Defaults to True.
+        loop (bool, optional): Replay again from the beginning when frames run out. Defaults to False.
+        sent_counters (Optional[Dict[str, Any]], optional): Shared integers counting the sent frames per channel. Defaults to None.
+        last_sent_times (Optional[Dict[str, Any]], optional): Shared floats of the send time of the last frame per channel. Defaults to None.
+    """
+    server = FeedReplayServer(
+        path=path,
+        speed=speed,
+        rewrite_timestamps=rewrite_timestamps,
+        loop=loop,
+        sent_counters=sent_counters,
+        last_sent_times=last_sent_times,
+    )
+    asyncio.run(server.serve(host=host, port=port))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Replay a recorded feed as GMO public websocket.")
+    arg_parser.add_argument("path", help="File path of feed.")
+    arg_parser.add_argument("--port", type=int, default=8001)
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="Replay speed. 1.0 is real time, 0 is max speed.")
+    arg_parser.add_argument("--keep-timestamps", action="store_true", help="Send the recorded timestamps as they are.")
+    arg_parser.add_argument("--loop", action="store_true")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOGGER_FORMAT)
+    feed_replay_server_process(path=args.path, port=args.port, speed=args.speed, rewrite_timestamps=not args.keep_timestamps, loop=args.loop)
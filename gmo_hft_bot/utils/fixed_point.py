@@ -0,0 +1,78 @@
+from decimal import Decimal
+from typing import Dict, NamedTuple, Union
+
+import numpy as np
+
+# Prices and sizes are integers from the websocket messages on: price in ticks (multiples of `tickSize`) and size in lots
+# (multiples of `sizeStep`) of the symbol. Strings of the exchange are parsed with Decimal, so no float rounding gets in,
+# and prices are converted back to float only at the edges (ohlcv table, orders, predict table).
+
+
+class SymbolSpec(NamedTuple):
+    """Price and size units of a symbol (`tickSize` and `sizeStep` of GET /public/v1/symbols)."""
+
+    symbol: str
+    tick_size: Decimal
+    size_step: Decimal
+
+    def to_ticks(self, price: Union[str, Decimal]) -> int:
+        """Price (e.g. "455659") in ticks. Raise ValueError if it is not a multiple of `tick_size`."""
+        ticks, remainder = divmod(Decimal(price), self.tick_size)
+        if remainder != 0:
+            raise ValueError(f"Price {price} is not a multiple of tick size {self.tick_size} of {self.symbol}")
+        return int(ticks)
+
+    def to_lots(self, size: Union[str, Decimal]) -> int:
+        """Size (e.g. "0.01") in lots. Raise ValueError if it is not a multiple of `size_step`."""
+        lots, remainder = divmod(Decimal(size), self.size_step)
+        if remainder != 0:
+            raise ValueError(f"Size {size} is not a multiple of size step {self.size_step} of {self.symbol}")
+        return int(lots)
+
+    def to_price(self, ticks: int) -> float:
+        return float(int(ticks) * self.tick_size)
+
+    def to_size(self, lots: int) -> float:
+        return float(int(lots) * self.size_step)
+
+    def format_price(self, ticks: int) -> str:
+        """Price string in the format of the exchange (e.g. for orders)."""
+        return str(int(ticks) * self.tick_size)
+
+    def format_size(self, lots: int) -> str:
+        return str(int(lots) * self.size_step)
+
+    def ticks_array(self, prices: np.ndarray) -> np.ndarray:
+        """Prices (float) in ticks, rounded to the nearest tick. nan is not allowed."""
+        return np.rint(np.asarray(prices, dtype=np.float64) / float(self.tick_size)).astype(np.int64)
+
+    def prices_array(self, ticks: np.ndarray) -> np.ndarray:
+        return np.asarray(ticks, dtype=np.float64) * float(self.tick_size)
+
+    def lots_array(self, sizes: np.ndarray) -> np.ndarray:
+        """Sizes (float) in lots, rounded to the nearest lot."""
+        return np.rint(np.asarray(sizes, dtype=np.float64) / float(self.size_step)).astype(np.int64)
+
+
+# Used for symbols which are not registered.
+DEFAULT_TICK_SIZE = Decimal("1")
+DEFAULT_SIZE_STEP = Decimal("0.0001")
+
+# Specs known without asking the exchange. `GmoPublicRestClient.get_symbol_specs` gets the current ones.
+_SYMBOL_SPECS: Dict[str, SymbolSpec] = {
+    "BTC": SymbolSpec("BTC", Decimal("1"), Decimal("0.0001")),
+    "BTC_JPY": SymbolSpec("BTC_JPY", Decimal("1"), Decimal("0.01")),
+}
+
+
+def register_symbol_spec(spec: SymbolSpec) -> None:
+    """Use `spec` for its symbol in this process (e.g. the spec from the exchange)."""
+    _SYMBOL_SPECS[spec.symbol] = spec
+
+
+def get_symbol_spec(symbol: str) -> SymbolSpec:
+    """Spec of a symbol. DEFAULT_TICK_SIZE and DEFAULT_SIZE_STEP if it is not registered."""
+    spec = _SYMBOL_SPECS.get(symbol)
+    if spec is None:
+        return SymbolSpec(symbol, DEFAULT_TICK_SIZE, DEFAULT_SIZE_STEP)
+    return spec
@@ -0,0 +1,144 @@
+"""Freshness of the inputs of a decision.
+
+The ages come from metadata which the decision path has at hand: the timestamp of the board (in memory, or of the
+board rows already read), the newest tick told to the BarScheduler, and the bars of the prediction. No query is added.
+A decision on stale inputs is skipped or downsized, and the reasons are kept in the decision journal as
+`schemas.FRESHNESS_*` flags.
+"""
+
+import sys
+import time
+from typing import List, NamedTuple, Optional, Sequence, Union
+
+sys.path.append(".")
+from gmo_hft_bot.db import records, schemas
+
+
+class FreshnessConfig(NamedTuple):
+    """Freshness thresholds of decisions. Picklable, so that it can be passed to multiprocessing targets."""
+
+    # Skip orders if the board is older than this (seconds).
+    max_book_age: float = 2.0
+    # Downsize orders if the board is older than this (seconds). None to disable.
+    downsize_book_age: Optional[float] = 0.5
+    # Skip orders if the newest tick is older than this (seconds). Trades are sparse in quiet markets. None to disable.
+    max_tick_age: Optional[float] = 60.0
+    # Skip orders if more bars of the prediction than this are missing or without trades (flat bars filled after a gap).
+    max_incomplete_bars: int = 2
+    # Downsize orders if more bars than this are incomplete. None to disable.
+    downsize_incomplete_bars: Optional[int] = 0
+    # Factor of the sizes of downsized orders.
+    downsize_factor: float = 0.5
+
+
+class InputAges(NamedTuple):
+    # Seconds since the board. None if there is no board.
+    book_age: Optional[float]
+    # Seconds since the newest tick. None if no tick has come.
+    tick_age: Optional[float]
+    # Bars of the prediction which are missing or without trades.
+    incomplete_bars: int
+
+
+def age(unix_timestamp: Optional[int], now: float) -> Optional[float]:
+    """Seconds from `unix_timestamp` (ms) to `now` (s). None for a missing (None or 0) timestamp."""
+    if not unix_timestamp:
+        return None
+    return now - unix_timestamp / 1000
+
+
+def incomplete_bars(
+    timestamps: Sequence[int],
+    volumes: Sequence[float],
+    bars: int,
+    time_span: Optional[int] = None,
+    bar_close_timestamp: Optional[int] = None,
+) -> int:
+    """Number of the `bars` bars before `bar_close_timestamp` which are missing or have no volume.
+
+    Args:
+        timestamps (Sequence[int]): Open times (s) of the bars of the prediction.
+        volumes (Sequence[float]): Volumes of the bars.
+        bars (int): Bars the prediction uses (crud.PREDICTION_BARS).
+        time_span (Optional[int], optional): Time span of the bars (seconds). Defaults to None (information bars, whose
+            open times are not known in advance. Only missing bars at the start and bars without volume are counted).
+        bar_close_timestamp (Optional[int], optional): Unix timestamp (s) when the bar closed. Defaults to None (after the newest bar).
+
+    Returns:
+        int: Incomplete bars.
+    """
+    if time_span is None or len(timestamps) == 0:
+        return max(bars - len(timestamps), 0) + sum(1 for volume in volumes if volume <= 0)
+
+    if bar_close_timestamp is None:
+        bar_close_timestamp = int(max(timestamps)) + time_span
+    first_timestamp = bar_close_timestamp - bars * time_span
+    traded = {int(timestamp) for timestamp, volume in zip(timestamps, volumes) if volume > 0 and first_timestamp <= timestamp < bar_close_timestamp}
+    return bars - len(traded)
+
+
+def check_freshness(ages: InputAges, config: FreshnessConfig) -> int:
+    """`schemas.FRESHNESS_*` flags of the inputs. 0 if they are fresh."""
+    flags = schemas.FRESHNESS_OK
+    if ages.book_age is None or ages.book_age > config.max_book_age:
+        flags |= schemas.FRESHNESS_STALE_BOOK
+    elif config.downsize_book_age is not None and ages.book_age > config.downsize_book_age:
+        flags |= schemas.FRESHNESS_AGING_BOOK
+
+    if config.max_tick_age is not None and (ages.tick_age is None or ages.tick_age > config.max_tick_age):
+        flags |= schemas.FRESHNESS_STALE_TICKS
+
+    if ages.incomplete_bars > config.max_incomplete_bars:
+        flags |= schemas.FRESHNESS_INCOMPLETE_BARS
+    elif config.downsize_incomplete_bars is not None and ages.incomplete_bars > config.downsize_incomplete_bars:
+        flags |= schemas.FRESHNESS_PARTIAL_BARS
+    return flags
+
+
+def apply_freshness(decision: records.Decision, flags: int, config: FreshnessConfig) -> records.Decision:
+    """Skip or downsize the orders of `decision` by the freshness `flags`, and keep the flags in the decision."""
+    flags |= decision.freshness
+    if flags & schemas.FRESHNESS_SKIP_FLAGS:
+        return decision._replace(is_buy_entry=False, is_sell_entry=False, freshness=flags)
+    if flags & schemas.FRESHNESS_DOWNSIZE_FLAGS:
+        return decision._replace(buy_size=decision.buy_size * config.downsize_factor, sell_size=decision.sell_size * config.downsize_factor, freshness=flags)
+    return decision._replace(freshness=flags)
+
+
+def gate_decision(
+    decision: records.Decision,
+    config: FreshnessConfig,
+    board_timestamp: Optional[int],
+    last_tick_timestamp: Optional[int],
+    incomplete: int,
+    now: Optional[float] = None,
+) -> records.Decision:
+    """Skip or downsize the orders of `decision` whose inputs are stale.
+
+    Args:
+        decision (records.Decision): Decision.
+        config (FreshnessConfig): Thresholds.
+        board_timestamp (Optional[int]): Unix timestamp (ms) of the board. None if there is no board.
+        last_tick_timestamp (Optional[int]): Unix timestamp (ms) of the newest tick. None (or 0) if unknown.
+        incomplete (int): Result of `incomplete_bars`.
+        now (Optional[float], optional): Unix time (s) of the decision. Defaults to None (time.time()).
+
+    Returns:
+        records.Decision: Decision with the `freshness` flags.
+    """
+    if now is None:
+        now = time.time()
+    ages = InputAges(book_age=age(board_timestamp, now), tick_age=age(last_tick_timestamp, now), incomplete_bars=incomplete)
+    return apply_freshness(decision, check_freshness(ages, config), config)
+
+
+def describe_freshness(flags: int) -> List[str]:
+    """Names of the `schemas.FRESHNESS_*` flags, for logs."""
+    return [name for flag, name in schemas.FRESHNESS_NAMES.items() if flags & flag]
+
+
+def skip_orders(decision: Union[records.Decision, schemas.PreidictInfo], flag: int) -> records.Decision:
+    """Decision without orders, with `flag` added to its freshness flags (e.g. FRESHNESS_FEED_LAG)."""
+    if not isinstance(decision, records.Decision):
+        decision = records.Decision(**decision.dict())
+    return decision._replace(is_buy_entry=False, is_sell_entry=False, freshness=decision.freshness | flag)
@@ -0,0 +1,201 @@
+import gc
+import sys
+import time
+import logging
+import tracemalloc
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+sys.path.append(".")
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
+
+# Heartbeat metrics of IdleCollector.
+METRIC_GC_IDLE_PAUSE_MS = "gc_idle_pause_ms"
+METRIC_GC_MAX_PAUSE_MS = "gc_max_pause_ms"
+METRIC_GC_UNSCHEDULED_COLLECTIONS = "gc_unscheduled_collections"
+
+
+class GcConfig(NamedTuple):
+    """Garbage collector settings of the steady state. Picklable, so that it can be passed to multiprocessing targets."""
+
+    # Move the objects created at startup (modules, engine, caches, restored bars) to the permanent generation.
+    freeze: bool = True
+    # Thresholds of gc.set_threshold. The default (700, 10, 10) collects young objects every few messages.
+    # None to keep the thresholds.
+    thresholds: Optional[Tuple[int, int, int]] = (50000, 20, 100)
+    # Generation collected by IdleCollector after each decision. None to disable.
+    idle_generation: Optional[int] = 1
+    # Collect all generations instead every this many decisions. None to leave them to the thresholds.
+    full_collect_every: Optional[int] = 720
+
+
+def enter_steady_state(config: GcConfig, logger: Optional[logging.Logger] = None) -> Tuple[int, int, int]:
+    """Apply `config` after startup.
+
+    Returns:
+        Tuple[int, int, int]: Thresholds before, for `leave_steady_state`.
+    """
+    previous_thresholds = gc.get_threshold()
+    if config.freeze:
+        gc.collect()
+        gc.freeze()
+    if config.thresholds is not None:
+        gc.set_threshold(*config.thresholds)
+    if logger is not None:
+        logger.info("GC steady state: frozen=%d thresholds=%s", gc.get_freeze_count(), gc.get_threshold())
+    return previous_thresholds
+
+
+def leave_steady_state(previous_thresholds: Tuple[int, int, int]) -> None:
+    gc.set_threshold(*previous_thresholds)
+    gc.unfreeze()
+
+
+class GcPauseMonitor:
+    """Time the collections of the garbage collector with `gc.callbacks`.
+
+    Collections run by IdleCollector are scheduled. The others were triggered by the thresholds at a random
+    allocation, possibly in the middle of a decision.
+    """
+
+    def __init__(self):
+        self.collections = 0
+        self.unscheduled_collections = 0
+        self.last_pause = 0.0
+        self.max_pause = 0.0
+        self.max_unscheduled_pause = 0.0
+        self.scheduled = False
+        self._start = 0.0
+        self._installed = False
+
+    def install(self) -> None:
+        if not self._installed:
+            gc.callbacks.append(self._callback)
+            self._installed = True
+
+    def uninstall(self) -> None:
+        if self._installed:
+            gc.callbacks.remove(self._callback)
+            self._installed = False
+
+    def _callback(self, phase: str, info: Dict) -> None:
+        if phase == "start":
+            self._start = time.perf_counter()
+            return
+
+        pause = time.perf_counter() - self._start
+        self.collections += 1
+        self.last_pause = pause
+        self.max_pause = max(self.max_pause, pause)
+        if not self.scheduled:
+            self.unscheduled_collections += 1
+            self.max_unscheduled_pause = max(self.max_unscheduled_pause, pause)
+
+
+class IdleCollector:
+    """Collect garbage in the idle window right after a decision, when the next one is a bar away.
+
+    Call `collect` after the decision is sent. It collects `config.idle_generation`, and all generations every
+    `config.full_collect_every` calls, so that the thresholds rarely trigger a collection on the hot path.
+    """
+
+    def __init__(
+        self,
+        config: GcConfig,
+        monitor: Optional[GcPauseMonitor] = None,
+        heartbeat: Optional[Heartbeat] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.config = config
+        self.monitor = monitor
+        self.heartbeat = heartbeat
+        self.logger = logger
+        self.calls = 0
+        self.last_pause = 0.0
+
+    def collect(self) -> int:
+        """Collect garbage.
+
+        Returns:
+            int: Number of unreachable objects found.
+        """
+        if self.config.idle_generation is None:
+            return 0
+
+        self.calls += 1
+        generation = self.config.idle_generation
+        if self.config.full_collect_every is not None and self.calls % self.config.full_collect_every == 0:
+            generation = 2
+
+        if self.monitor is not None:
+            self.monitor.scheduled = True
+        start = time.perf_counter()
+        try:
+            unreachable = gc.collect(generation)
+        finally:
+            self.last_pause = time.perf_counter() - start
+            if self.monitor is not None:
+                self.monitor.scheduled = False
+
+        if self.logger is not None:
+            self.logger.debug("Idle GC of generation %d: %d unreachable objects in %.2f ms", generation, unreachable, self.last_pause * 1000)
+        if self.heartbeat is not None:
+            self.heartbeat.set_metric(METRIC_GC_IDLE_PAUSE_MS, self.last_pause * 1000)
+            if self.monitor is not None:
+                self.heartbeat.set_metric(METRIC_GC_MAX_PAUSE_MS, self.monitor.max_unscheduled_pause * 1000)
+                self.heartbeat.set_metric(METRIC_GC_UNSCHEDULED_COLLECTIONS, self.monitor.unscheduled_collections)
+        return unreachable
+
+
+class AllocationStats(NamedTuple):
+    """Allocations per call of a function."""
+
+    # Collections triggered by the thresholds, per generation. Young collections are triggered by container
+    # objects (dicts, lists, ORM and pydantic objects, ...) which outlive the code that allocated them.
+    gc_collections: Tuple[float, float, float]
+    # Memory blocks still allocated after the call. Above 0 means the call grows something (a cache or a leak).
+    retained_blocks: float
+    # Largest peak of memory allocated during a call (bytes).
+    peak_bytes: float
+
+
+def measure_allocations(func: Callable[[], None], calls: int = 1, thresholds: Tuple[int, int, int] = (700, 10, 10)) -> AllocationStats:
+    """Measure allocations of `func`, e.g. a queue consumer which handles a batch of messages.
+
+    Run this apart from timing. `tracemalloc` slows down every allocation.
+
+    Args:
+        func (Callable[[], None]): Function to measure.
+        calls (int, optional): Number of calls. Defaults to 1.
+        thresholds (Tuple[int, int, int], optional): GC thresholds while measuring, so that the counts do not depend on the
+            settings of the process. Defaults to the default thresholds of CPython.
+
+    Returns:
+        AllocationStats: Allocations per call.
+    """
+    previous_thresholds = gc.get_threshold()
+    gc.collect()
+    gc.set_threshold(*thresholds)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        collections_before = [stats["collections"] for stats in gc.get_stats()]
+        blocks_before = sys.getallocatedblocks()
+        peak = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            func()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        blocks_after = sys.getallocatedblocks()
+        collections_after = [stats["collections"] for stats in gc.get_stats()]
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+        gc.set_threshold(*previous_thresholds)
+
+    return AllocationStats(
+        gc_collections=tuple((after - before) / calls for before, after in zip(collections_before, collections_after)),
+        retained_blocks=(blocks_after - blocks_before) / calls,
+        peak_bytes=float(peak),
+    )
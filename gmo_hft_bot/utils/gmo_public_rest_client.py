@@ -0,0 +1,87 @@
+import sys
+from decimal import Decimal
+from typing import Dict, List
+
+import aiohttp
+from dateutil import parser
+
+sys.path.append(".")
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+
+
+class GmoPublicRestClient:
+    """Client of GMO public REST API. Set `base_url` to a local server to mock it."""
+
+    def __init__(self, base_url: str = "https://api.coin.z.com/public", timeout: float = 5.0):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    async def get_symbol_specs(self) -> Dict[str, SymbolSpec]:
+        """Get tick size and size step of all symbols.
+
+        Returns:
+            Dict[str, SymbolSpec]: Specs by symbol.
+        """
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            async with session.get(self.base_url + "/v1/symbols") as response:
+                res = await response.json()
+
+        if res.get("status") != 0:
+            raise ValueError(f"Failed to get symbols: {res}")
+
+        return {
+            item["symbol"]: SymbolSpec(symbol=item["symbol"], tick_size=Decimal(item["tickSize"]), size_step=Decimal(item["sizeStep"])) for item in res["data"]
+        }
+
+    async def get_trades(self, symbol: str, page: int = 1, count: int = 100) -> List[Dict]:
+        """Get trades (newest first).
+
+        Args:
+            symbol (str): Name of symbol
+            page (int, optional): Page number. Defaults to 1.
+            count (int, optional): Trades per page (max 100). Defaults to 100.
+
+        Returns:
+            List[Dict]: Trades in the same format as the trades channel of public websocket.
+                e.g. [{"price": "750760", "side": "BUY", "size": "0.1", "timestamp": "2018-03-30T12:34:56.789Z", "symbol": "BTC_JPY"}]
+        """
+        params = {"symbol": symbol, "page": page, "count": count}
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            async with session.get(self.base_url + "/v1/trades", params=params) as response:
+                res = await response.json()
+
+        if res.get("status") != 0:
+            raise ValueError(f"Failed to get trades: {res}")
+
+        trades = res["data"].get("list", [])
+        for trade in trades:
+            trade["symbol"] = symbol
+
+        return trades
+
+    async def get_trades_since(self, symbol: str, since_timestamp: int, max_pages: int = 10, count: int = 100) -> List[Dict]:
+        """Get trades newer than `since_timestamp` (oldest first).
+
+        Args:
+            symbol (str): Name of symbol
+            since_timestamp (int): Unix timestamp (ms).
+            max_pages (int, optional): Max number of pages to request. Defaults to 10.
+            count (int, optional): Trades per page (max 100). Defaults to 100.
+
+        Returns:
+            List[Dict]: Trades
+        """
+        trades = []
+        for page in range(1, max_pages + 1):
+            page_trades = await self.get_trades(symbol=symbol, page=page, count=count)
+            is_reached = False
+            for trade in page_trades:
+                if parser.parse(trade["timestamp"]).timestamp() * 1000 <= since_timestamp:
+                    is_reached = True
+                    break
+                trades.append(trade)
+
+            if is_reached or len(page_trades) < count:
+                break
+
+        return trades[::-1]
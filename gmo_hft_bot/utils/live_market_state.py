@@ -0,0 +1,117 @@
+import sys
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, records
+from gmo_hft_bot.utils.bar_builder import MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.fixed_point import SymbolSpec, get_symbol_spec
+from gmo_hft_bot.utils.freshness import FreshnessConfig, gate_decision, incomplete_bars
+from gmo_hft_bot.utils.orderbook_kernels import BookArrays
+
+_EMPTY_BOOK = BookArrays(
+    bid_prices=np.empty(0, dtype=np.int64),
+    bid_sizes=np.empty(0, dtype=np.int64),
+    ask_prices=np.empty(0, dtype=np.int64),
+    ask_sizes=np.empty(0, dtype=np.int64),
+)
+
+
+class LiveMarketState:
+    """Newest board and bars of a symbol in memory, so that decisions do not read the database.
+
+    OrderbookQueueManager updates the board from the queued messages and the bars are those of the bar builder
+    which TickQueueManager feeds. The same messages are written to the database by the DbWriter, later.
+    """
+
+    def __init__(self, symbol: str, bar_builder: MultiTimeframeBarBuilder, spec: Optional[SymbolSpec] = None):
+        """
+        Args:
+            symbol (str): Name of symbol.
+            bar_builder (MultiTimeframeBarBuilder): Builder of the bars of the symbol.
+            spec (Optional[SymbolSpec], optional): Units of prices and sizes. Defaults to None (`get_symbol_spec(symbol)`).
+        """
+        self.symbol = symbol
+        self.bar_builder = bar_builder
+        self.spec = spec or get_symbol_spec(symbol)
+        self.book = _EMPTY_BOOK
+        # Unix timestamp (ms) of the board. None until the first board.
+        self.board_timestamp: Optional[int] = None
+
+    def update_board(self, board: Union[Dict, records.Board]) -> None:
+        """Replace the board with a converted board (see records.board_from_message) or an orderbooks message (the format of `crud.insert_board_items`)."""
+        if not isinstance(board, records.Board):
+            board = records.board_from_message(board, self.spec)
+        bids = np.array(board.bids, dtype=np.int64).reshape(-1, 2)
+        asks = np.array(board.asks, dtype=np.int64).reshape(-1, 2)
+        # From the best level: bids in descending and asks in ascending order of price.
+        bids = bids[np.argsort(-bids[:, 0], kind="stable")]
+        asks = asks[np.argsort(asks[:, 0], kind="stable")]
+        self.book = BookArrays(
+            bid_prices=np.ascontiguousarray(bids[:, 0]),
+            bid_sizes=np.ascontiguousarray(bids[:, 1]),
+            ask_prices=np.ascontiguousarray(asks[:, 0]),
+            ask_sizes=np.ascontiguousarray(asks[:, 1]),
+        )
+        self.board_timestamp = board.timestamp
+
+    def best_prices(self) -> Tuple[Optional[int], Optional[int]]:
+        """(best bid, best ask) in ticks. None for an empty side."""
+        book = self.book
+        best_bid = int(book.bid_prices[0]) if book.bid_prices.size > 0 else None
+        best_ask = int(book.ask_prices[0]) if book.ask_prices.size > 0 else None
+        return best_bid, best_ask
+
+    def ohlcv_df(self, time_span: int, bar_close_timestamp: Optional[int] = None, limit: int = crud.PREDICTION_BARS) -> pd.DataFrame:
+        """Newest `limit` closed bars of `time_span` opened before `bar_close_timestamp`, in the format of `crud.get_ohlcv_with_symbol`."""
+        if bar_close_timestamp is not None:
+            self.bar_builder.close_until(bar_close_timestamp)
+        bars = self.bar_builder.recent_bars(time_span, limit + 1)
+        if bar_close_timestamp is not None:
+            bars = [bar for bar in bars if bar.timestamp < bar_close_timestamp]
+        return pd.DataFrame(
+            [[bar.timestamp, bar.open, bar.high, bar.low, bar.close, bar.volume, bar.symbol] for bar in bars[-limit:]],
+            columns=["timestamp", "open", "high", "low", "close", "volume", "symbol"],
+        )
+
+    def get_prediction_info(
+        self,
+        time_span: int,
+        bar_close_timestamp: Optional[int] = None,
+        freshness_config: Optional[FreshnessConfig] = None,
+        last_tick_timestamp: Optional[int] = None,
+        now: Optional[float] = None,
+    ) -> records.Decision:
+        """Same as `crud.get_prediction_info`, from memory.
+
+        Args:
+            time_span (int): Time span of the bars (seconds).
+            bar_close_timestamp (Optional[int]): Unix timestamp (s) when the bar closed. Defaults to None (use the newest bars).
+            freshness_config (Optional[FreshnessConfig]): Skip or downsize the orders if the board, the ticks or the bars are
+                stale (see utils/freshness.py). Defaults to None (no check).
+            last_tick_timestamp (Optional[int]): Unix timestamp (ms) of the newest tick. Defaults to None (unknown).
+            now (Optional[float]): Unix time (s) of the decision. Defaults to None (time.time()).
+
+        Returns:
+            records.Decision: Prediction.
+        """
+        ohlcv_df = self.ohlcv_df(time_span, bar_close_timestamp)
+        features = crud.prediction_features(ohlcv_df, book=self.book)
+        prediction = crud.get_prediction(ohlcv_df)
+        best_bid, best_ask = self.best_prices()
+        decision = crud.build_prediction_info(prediction=prediction, best_bid_price=best_bid, best_ask_price=best_ask, spec=self.spec, features=features)
+        if freshness_config is None:
+            return decision
+
+        incomplete = incomplete_bars(
+            ohlcv_df["timestamp"].tolist(),
+            ohlcv_df["volume"].tolist(),
+            bars=crud.PREDICTION_BARS,
+            time_span=time_span,
+            bar_close_timestamp=bar_close_timestamp,
+        )
+        return gate_decision(
+            decision, freshness_config, board_timestamp=self.board_timestamp, last_tick_timestamp=last_tick_timestamp, incomplete=incomplete, now=now
+        )
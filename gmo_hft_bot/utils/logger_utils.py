@@ -1,12 +1,16 @@
 import sys
+import time
+import threading
+from queue import Empty, Full
 import logging
 import logging.handlers
 import multiprocessing
-from typing import Callable, Tuple
+import multiprocessing.util
+from multiprocessing.connection import Connection
+from typing import Callable, List, Optional, Tuple
 
 sys.path.append(".")
-from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
-
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
 
 # References: https://docs.python.org/ja/3/howto/logging-cookbook.html
 # Functions to enable logging in multiprocessing.
@@ -14,6 +18,98 @@ from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 
 LOGGER_FORMAT = "[%(asctime)s] [%(name)s] [%(levelname)s]: %(message)s (%(filename)s:%(lineno)d)"
 
+# Max number of batches waiting in the logging queue. Batches are dropped (and counted) when it is full.
+LOGGING_QUEUE_MAXSIZE = 1000
+
+
+class BatchQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for the hot loops.
+
+    Records are buffered in the worker and handed to the listener as one list per batch, so the
+    queue is touched once per `batch_size` records instead of once per record. A batch is flushed when
+    it is full, when `flush_interval` seconds have passed since the last flush, or when a record of
+    `flush_level` or higher arrives. The queue should be bounded: if it is full the batch is dropped
+    and counted in `dropped_records` instead of blocking the caller, and the number of dropped records
+    is reported with the next batch that gets through.
+
+    `flush_interval` is checked when a record arrives. Call `start_periodic_flush` so that the records of
+    the last burst are also flushed while no record arrives (`worker_configurer` does).
+    """
+
+    def __init__(self, queue: multiprocessing.Queue, batch_size: int = 100, flush_interval: float = 0.5, flush_level: int = logging.WARNING):
+        super().__init__(queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.buffer: List[logging.LogRecord] = []
+        self.dropped_records = 0
+        self._reported_dropped_records = 0
+        self._last_flush_time = time.monotonic()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._stop_flush_thread = threading.Event()
+
+    def start_periodic_flush(self) -> None:
+        """Flush the buffer from a daemon thread every `flush_interval` seconds until `close`."""
+        if self._flush_thread is not None:
+            return
+        self._flush_thread = threading.Thread(target=self._flush_periodically, name="BatchQueueHandlerFlush", daemon=True)
+        self._flush_thread.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_flush_thread.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush_time >= self.flush_interval:
+                self.flush()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.buffer.append(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+            return
+
+        if len(self.buffer) >= self.batch_size or record.levelno >= self.flush_level or time.monotonic() - self._last_flush_time >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if len(self.buffer) == 0:
+                return
+
+            batch = self.buffer
+            self.buffer = []
+            self._last_flush_time = time.monotonic()
+
+            unreported_dropped_records = self.dropped_records - self._reported_dropped_records
+            if unreported_dropped_records > 0:
+                batch.insert(
+                    0,
+                    logging.makeLogRecord(
+                        {
+                            "name": "BatchQueueHandler",
+                            "levelno": logging.WARNING,
+                            "levelname": logging.getLevelName(logging.WARNING),
+                            "msg": f"{unreported_dropped_records} log records were dropped because the logging queue was full.",
+                        }
+                    ),
+                )
+
+            try:
+                self.queue.put_nowait(batch)
+                self._reported_dropped_records = self.dropped_records
+            except Full:
+                # The drop notice is not counted, it is rebuilt for the next batch.
+                self.dropped_records += len(batch) - (1 if unreported_dropped_records > 0 else 0)
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self._stop_flush_thread.set()
+        if self._flush_thread is not None and self._flush_thread is not threading.current_thread():
+            self._flush_thread.join()
+        self.flush()
+        super().close()
+
 
 def listener_configurer():
     root = logging.getLogger()
@@ -26,31 +122,48 @@ def listener_configurer():
     root.addHandler(stream_handler)
 
 
-def listener_process(queue: multiprocessing.Queue, configurer: Callable, queue_and_trade_manager: QueueAndTradeManager):
+def listener_process(queue: multiprocessing.Queue, configurer: Callable, heartbeat_conn: Optional[Connection] = None, heartbeat_interval: float = 1.0):
     configurer()
+    heartbeat = Heartbeat(heartbeat_conn, name="logging", interval=heartbeat_interval) if heartbeat_conn is not None else None
+    last_heartbeat_time = 0.0
     while True:
         try:
-            record = queue.get()
-            if record is None:  # We send this as a sentinel to tell the listener to quit.
+            if heartbeat is not None:
+                if time.monotonic() - last_heartbeat_time >= heartbeat.interval:
+                    heartbeat.beat()
+                    # No commands for this process. Drain them so that the pipe does not fill up.
+                    heartbeat.handle_commands()
+                    last_heartbeat_time = time.monotonic()
+                try:
+                    records = queue.get(timeout=heartbeat.interval)
+                except Empty:
+                    continue
+            else:
+                records = queue.get()
+
+            if records is None:  # We send this as a sentinel to tell the listener to quit.
                 break
 
-            if "gmo_hft_bot.utils.custom_exceptions.ConnectionFailedError" in record.getMessage():
-                print("=" * 100)
-                print("Execption detected")
-                queue_and_trade_manager.update_subprocesses_alive_status(False)
+            # Workers configured with a plain QueueHandler send single records.
+            if isinstance(records, logging.LogRecord):
+                records = [records]
 
-            logger = logging.getLogger(record.name)
-            logger.handle(record)  # No level or filter logic applied - just do it!
+            for record in records:
+                logger = logging.getLogger(record.name)
+                logger.handle(record)  # No level or filter logic applied - just do it!
         except Exception:
-            import sys
             import traceback
 
             print("Whoops! Problem:", file=sys.stderr)
             traceback.print_exc(file=sys.stderr)
 
 
-def worker_configurer(queue: multiprocessing.Queue, level: Tuple[str, int]):
-    h = logging.handlers.QueueHandler(queue)  # Just the one handler needed
+def worker_configurer(queue: multiprocessing.Queue, level: Tuple[str, int], batch_size: int = 100, flush_interval: float = 0.5):
+    h = BatchQueueHandler(queue, batch_size=batch_size, flush_interval=flush_interval)  # Just the one handler needed
+    h.start_periodic_flush()
+    # Flush the buffered records when the process exits. Child processes of multiprocessing skip atexit,
+    # but run the finalizers of multiprocessing.util.
+    multiprocessing.util.Finalize(h, h.close, exitpriority=10)
     root = logging.getLogger()
     root.addHandler(h)
     # send all messages, for demo; no other level or filter logic applied.
@@ -0,0 +1,340 @@
+"""Fan-out of the public feed of the websocket process to local subscriber processes over a Unix domain socket.
+
+GMO rate-limits subscriptions, so one websocket connection serves every consumer of the host: the queue and trade
+process through QueueAndTradeManager as before, and any number of subscribers (other strategies, the recorder,
+monitors) through MarketDataService.
+
+A subscriber connects, sends its subscription as one JSON line ({"name": ..., "channels": [...]}) and then receives
+messages of MESSAGE_HEADER (sequence, receive time in ns since epoch, channel, frame length) + the frame of GMO
+(`trades` or `orderbooks` JSON, the format of `QueueAndTradeManager.add_*_queue`).
+The sequence counts the messages of each subscriber from 1. The service never waits for a slow subscriber: a message
+which does not fit in its socket buffer is dropped and its sequence is skipped, so that the subscriber sees the gap.
+"""
+
+import sys
+import json
+import time
+import struct
+import asyncio
+import logging
+from typing import Dict, NamedTuple, Optional, Sequence, Set, Union
+
+sys.path.append(".")
+from gmo_hft_bot.utils.feed_lag import FEED_ORDERBOOKS, FEED_TRADES
+from gmo_hft_bot.utils.feed_recorder import FeedRecorder
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
+from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
+
+# Channels of the messages. Same names as the feeds of utils/feed_lag.py.
+CHANNELS = (FEED_TRADES, FEED_ORDERBOOKS)
+_CHANNEL_IDS = {channel: channel_id for channel_id, channel in enumerate(CHANNELS)}
+
+# Sequence, receive time (ns since epoch), channel id (index of CHANNELS), frame length.
+MESSAGE_HEADER = struct.Struct("<QqBI")
+
+# Heartbeat metrics of MarketDataService.
+METRIC_MARKET_DATA_SUBSCRIBERS = "market_data_subscribers"
+METRIC_MARKET_DATA_DROPPED = "market_data_dropped"
+
+
+class _Subscription:
+    __slots__ = ("name", "channels", "writer", "sequence", "sent", "dropped")
+
+    def __init__(self, name: str, channels: Sequence[str], writer: asyncio.StreamWriter):
+        self.name = name
+        self.channels = frozenset(channels)
+        self.writer = writer
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+
+
+class MarketDataService:
+    """Unix domain socket server which fans out the frames published by the websocket connections."""
+
+    def __init__(
+        self,
+        socket_path: str,
+        max_buffer_bytes: int = 4 * 1024 * 1024,
+        heartbeat: Optional[Heartbeat] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """
+        Args:
+            socket_path (str): Path of the Unix domain socket. A stale socket file is replaced.
+            max_buffer_bytes (int, optional): Messages are dropped for a subscriber while this much is not sent to it yet.
+                Defaults to 4 MiB.
+            heartbeat (Optional[Heartbeat], optional): Heartbeat which publishes the subscribers and drops. Defaults to None.
+            logger (Optional[logging.Logger], optional): Logger of the subscribers. Defaults to None.
+        """
+        self.socket_path = socket_path
+        self.max_buffer_bytes = max_buffer_bytes
+        self.heartbeat = heartbeat
+        self.logger = logger
+        self.subscriptions: Dict[int, _Subscription] = {}
+        self.published = 0
+        self.dropped = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        if self.logger is not None:
+            self.logger.info("Market data service on %s", self.socket_path)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for subscription in list(self.subscriptions.values()):
+            subscription.writer.close()
+        # Until the connections are closed.
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def serve(self) -> None:
+        """Serve until cancelled (with the websocket coroutines)."""
+        await self.start()
+        try:
+            await asyncio.Future()
+        finally:
+            await self.stop()
+
+    def _set_metrics(self) -> None:
+        if self.heartbeat is not None:
+            self.heartbeat.set_metric(METRIC_MARKET_DATA_SUBSCRIBERS, len(self.subscriptions))
+            self.heartbeat.set_metric(METRIC_MARKET_DATA_DROPPED, self.dropped)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = json.loads(await reader.readline())
+            channels = [channel for channel in request.get("channels", CHANNELS) if channel in _CHANNEL_IDS]
+            subscription = _Subscription(name=str(request.get("name", "")), channels=channels, writer=writer)
+        except (ValueError, AttributeError):
+            writer.close()
+            return
+
+        key = id(subscription)
+        self.subscriptions[key] = subscription
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        self._set_metrics()
+        if self.logger is not None:
+            self.logger.info("Market data subscriber %s: %s", subscription.name, sorted(subscription.channels))
+        try:
+            # Subscribers send nothing else. EOF when they disconnect.
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.subscriptions.pop(key, None)
+            self._handlers.discard(handler)
+            writer.close()
+            self._set_metrics()
+            if self.logger is not None:
+                self.logger.info("Market data subscriber %s left: %d sent, %d dropped", subscription.name, subscription.sent, subscription.dropped)
+
+    def publish(self, channel: str, frame: Union[str, bytes], recv_time_ns: Optional[int] = None) -> int:
+        """Send a frame to the subscribers of `channel`. It never waits.
+
+        Args:
+            channel (str): One of CHANNELS.
+            frame (Union[str, bytes]): Frame of GMO websocket.
+            recv_time_ns (Optional[int], optional): Receive time (ns since epoch). Defaults to now.
+
+        Returns:
+            int: Number of subscribers which the frame is sent to.
+        """
+        if len(self.subscriptions) == 0:
+            return 0
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        if recv_time_ns is None:
+            recv_time_ns = time.time_ns()
+        channel_id = _CHANNEL_IDS[channel]
+        self.published += 1
+
+        sent = 0
+        for subscription in self.subscriptions.values():
+            if channel not in subscription.channels:
+                continue
+            subscription.sequence += 1
+            transport = subscription.writer.transport
+            if transport.is_closing() or transport.get_write_buffer_size() > self.max_buffer_bytes:
+                # The subscriber sees the skipped sequence.
+                subscription.dropped += 1
+                self.dropped += 1
+                continue
+            subscription.writer.write(MESSAGE_HEADER.pack(subscription.sequence, recv_time_ns, channel_id, len(frame)) + frame)
+            subscription.sent += 1
+            sent += 1
+        return sent
+
+
+class MarketDataMessage(NamedTuple):
+    # Sequence of the message for the subscriber.
+    sequence: int
+    # Receive time of the frame by the websocket process (ns since epoch).
+    recv_time_ns: int
+    # One of CHANNELS.
+    channel: str
+    # Frame of GMO websocket.
+    frame: bytes
+    # Messages missed right before this one (dropped for a slow subscriber). 0 if there is no gap.
+    missed: int
+
+    def data(self) -> Dict:
+        """Parsed frame, in the format of `QueueAndTradeManager.add_*_queue`."""
+        return json.loads(self.frame)
+
+
+class MarketDataSubscriber:
+    """Subscriber of MarketDataService, with gap detection.
+
+    Example:
+        async with MarketDataSubscriber(socket_path, channels=[FEED_TRADES], name="monitor") as subscriber:
+            async for message in subscriber:
+                tick = records.tick_from_message(message.data(), spec)
+    """
+
+    def __init__(self, socket_path: str, channels: Sequence[str] = CHANNELS, name: str = "", logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            socket_path (str): Path of the Unix domain socket of the service.
+            channels (Sequence[str], optional): Channels to receive. Defaults to CHANNELS.
+            name (str, optional): Name in the logs of the service. Defaults to "".
+            logger (Optional[logging.Logger], optional): Logger of the gaps. Defaults to None.
+        """
+        self.socket_path = socket_path
+        self.channels = list(channels)
+        self.name = name
+        self.logger = logger
+        self.last_sequence = 0
+        self.received = 0
+        self.gaps = 0
+        self.missed = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self) -> None:
+        """Connect and subscribe.
+
+        Raises:
+            FileNotFoundError, ConnectionRefusedError: If the service is not running.
+        """
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        self._writer.write(json.dumps({"name": self.name, "channels": self.channels}).encode("utf-8") + b"\n")
+        await self._writer.drain()
+        self.last_sequence = 0
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._writer = None
+
+    async def __aenter__(self) -> "MarketDataSubscriber":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def recv(self) -> MarketDataMessage:
+        """Next message.
+
+        Raises:
+            asyncio.IncompleteReadError: If the service has stopped.
+        """
+        header = await self._reader.readexactly(MESSAGE_HEADER.size)
+        sequence, recv_time_ns, channel_id, length = MESSAGE_HEADER.unpack(header)
+        frame = await self._reader.readexactly(length)
+
+        missed = sequence - self.last_sequence - 1
+        if missed > 0:
+            self.gaps += 1
+            self.missed += missed
+            if self.logger is not None:
+                self.logger.warning("Market data gap: %d messages missed before %d (%d in total)", missed, sequence, self.missed)
+        self.last_sequence = sequence
+        self.received += 1
+        return MarketDataMessage(sequence=sequence, recv_time_ns=recv_time_ns, channel=CHANNELS[channel_id], frame=frame, missed=max(missed, 0))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> MarketDataMessage:
+        try:
+            return await self.recv()
+        except asyncio.IncompleteReadError:
+            raise StopAsyncIteration
+
+
+async def relay_to_queues(subscriber: MarketDataSubscriber, queue_and_trade_manager: QueueAndTradeManager) -> int:
+    """Put the messages of a connected subscriber to the queues of `queue_and_trade_manager`, as the websocket connections
+    do, so that another strategy process runs `run_manage_queue_and_trading` on the feed of the service.
+
+    Returns:
+        int: Number of relayed messages, when the service stops.
+    """
+    relayed = 0
+    async for message in subscriber:
+        if message.channel == FEED_TRADES:
+            await queue_and_trade_manager.add_ticks_queue_async(message.data())
+        else:
+            await queue_and_trade_manager.add_orderbook_queue_async(message.data())
+        relayed += 1
+    return relayed
+
+
+async def record_market_data(socket_path: str, path: str, duration: float, logger: logging.Logger) -> int:
+    """Record the frames of MarketDataService to a feed file (see utils/feed_recorder.py), with the receive times of the
+    websocket process. Unlike `record_public_feed`, this does not add a subscription to GMO.
+
+    Args:
+        socket_path (str): Path of the Unix domain socket of the service.
+        path (str): File path of feed. Frames are appended if it exists.
+        duration (float): Recording time (seconds).
+        logger (logging.Logger): logger
+
+    Returns:
+        int: Number of recorded frames.
+    """
+    with FeedRecorder(path) as recorder:
+        async with MarketDataSubscriber(socket_path, name="recorder", logger=logger) as subscriber:
+            end_time = time.monotonic() + duration
+            last_flush_time = time.monotonic()
+            while time.monotonic() < end_time:
+                try:
+                    message = await asyncio.wait_for(subscriber.recv(), timeout=end_time - time.monotonic())
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    break
+                recorder.write(message.frame, recv_time_ns=message.recv_time_ns)
+
+                if time.monotonic() - last_flush_time > 1.0:
+                    recorder.flush()
+                    last_flush_time = time.monotonic()
+                    logger.info("Recorded %d frames (%d missed)", recorder.record_count, subscriber.missed)
+
+        return recorder.record_count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from gmo_hft_bot.utils.logger_utils import LOGGER_FORMAT
+
+    arg_parser = argparse.ArgumentParser(description="Record the frames of the market data service of a running bot.")
+    arg_parser.add_argument("path", help="File path of feed.")
+    arg_parser.add_argument("--socket", default="/tmp/gmo_hft_bot_BTC_JPY.sock", help="Unix domain socket of the service.")
+    arg_parser.add_argument("--duration", type=float, default=600.0, help="Recording time (seconds).")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOGGER_FORMAT)
+    logger = logging.getLogger("MarketDataRecorderLogger")
+    count = asyncio.run(record_market_data(socket_path=args.socket, path=args.path, duration=args.duration, logger=logger))
+    logger.info("Recorded %d frames to %s", count, args.path)
@@ -0,0 +1,362 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import traceback
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, records, schemas
+from gmo_hft_bot.utils.gmo_public_rest_client import GmoPublicRestClient
+from gmo_hft_bot.utils.bar_builder import DEFAULT_TIMEFRAMES, MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.fixed_point import get_symbol_spec
+from gmo_hft_bot.utils.db_writer import DbWriter
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+
+# Columns of `MarketStateSnapshot.ohlcv`
+OHLCV_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+
+class MarketStateSnapshot(NamedTuple):
+    """In-memory market state of the queue/trade process.
+
+    The features of `crud.get_prediction` are derived from the bars, so bars and the last book are all we need to keep.
+    """
+
+    symbol: str
+    time_span: int
+    # Unix timestamp (s) when the snapshot is taken.
+    saved_at: float
+    # shape (n_bars, 6). See OHLCV_COLUMNS.
+    ohlcv: np.ndarray
+    # Unix timestamp (ms) of the last board.
+    board_timestamp: int
+    # shape (n_levels, 2). Columns are price (ticks) and size (lots), ascending order of price.
+    bids: np.ndarray
+    asks: np.ndarray
+
+
+def take_market_state_snapshot(db: Session, symbol: str, time_span: int, max_bars: int = 100) -> MarketStateSnapshot:
+    """Take snapshot of bars and the last board from database.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        symbol (str): Name of symbol
+        time_span (int): Time span of bars (seconds).
+        max_bars (int, optional): Number of newest bars to keep. Defaults to 100.
+
+    Returns:
+        MarketStateSnapshot: snapshot
+    """
+    ohlcv_items = crud.get_ohlcv_with_symbol(db=db, symbol=symbol, limit=max_bars, ascending=False, timeframe=schemas.timeframe_label(time_span))
+    ohlcv = np.array([[getattr(item, column) for column in OHLCV_COLUMNS] for item in reversed(ohlcv_items)], dtype=np.float64).reshape(-1, len(OHLCV_COLUMNS))
+
+    buy_board_items, sell_board_items = crud.get_current_board(db=db, symbol=symbol)
+    bids = np.array([[item.price, item.size] for item in buy_board_items], dtype=np.int64).reshape(-1, 2)
+    asks = np.array([[item.price, item.size] for item in sell_board_items], dtype=np.int64).reshape(-1, 2)
+    board_timestamp = buy_board_items[0].timestamp if len(buy_board_items) > 0 else 0
+
+    return MarketStateSnapshot(
+        symbol=symbol,
+        time_span=time_span,
+        saved_at=time.time(),
+        ohlcv=ohlcv,
+        board_timestamp=board_timestamp,
+        bids=bids,
+        asks=asks,
+    )
+
+
+def save_market_state_snapshot(path: str, snapshot: MarketStateSnapshot) -> None:
+    """Save snapshot as npz file. The file is replaced atomically so that a crash never leaves a broken snapshot.
+
+    Args:
+        path (str): File path (should end with `.npz`)
+        snapshot (MarketStateSnapshot): snapshot
+    """
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        symbol=np.array(snapshot.symbol),
+        time_span=np.array(snapshot.time_span),
+        saved_at=np.array(snapshot.saved_at),
+        ohlcv=snapshot.ohlcv,
+        board_timestamp=np.array(snapshot.board_timestamp),
+        bids=snapshot.bids,
+        asks=snapshot.asks,
+    )
+    os.replace(tmp_path, path)
+
+
+def load_market_state_snapshot(path: str) -> Optional[MarketStateSnapshot]:
+    """Load snapshot saved by `save_market_state_snapshot`.
+
+    Args:
+        path (str): File path
+
+    Returns:
+        Optional[MarketStateSnapshot]: snapshot. None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        symbol, bids, asks = str(data["symbol"]), data["bids"], data["asks"]
+        if bids.dtype.kind == "f":
+            # Snapshot of older versions in prices and sizes.
+            spec = get_symbol_spec(symbol)
+            bids = np.column_stack([spec.ticks_array(bids[:, 0]), spec.lots_array(bids[:, 1])])
+            asks = np.column_stack([spec.ticks_array(asks[:, 0]), spec.lots_array(asks[:, 1])])
+
+        return MarketStateSnapshot(
+            symbol=symbol,
+            time_span=int(data["time_span"]),
+            saved_at=float(data["saved_at"]),
+            ohlcv=data["ohlcv"],
+            board_timestamp=int(data["board_timestamp"]),
+            bids=bids,
+            asks=asks,
+        )
+
+
+def restore_market_state(db: Session, snapshot: MarketStateSnapshot, max_board_counts: int, max_ohlcv_rows: int) -> None:
+    """Insert bars and the last board of snapshot into database.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        snapshot (MarketStateSnapshot): snapshot
+        max_board_counts (int): Max board counts (group by timestamp)
+        max_ohlcv_rows (int): Number of max rows of ohlcv table.
+    """
+    timeframe = schemas.timeframe_label(snapshot.time_span)
+    ohlcv_items = [
+        records.Bar(
+            timestamp=int(row[0]),
+            open=float(row[1]),
+            high=float(row[2]),
+            low=float(row[3]),
+            close=float(row[4]),
+            volume=float(row[5]),
+            symbol=snapshot.symbol,
+            timeframe=timeframe,
+        )
+        for row in snapshot.ohlcv
+    ]
+    if len(ohlcv_items) > 0:
+        crud.insert_ohlcv_items(db=db, insert_items=ohlcv_items, max_rows=max_ohlcv_rows)
+
+    if snapshot.board_timestamp > 0:
+        spec = get_symbol_spec(snapshot.symbol)
+        # Use the same format as the orderbooks channel so that crud.insert_board_items can be used.
+        board_item = {
+            "asks": [{"price": spec.format_price(price), "size": spec.format_size(size)} for price, size in snapshot.asks],
+            "bids": [{"price": spec.format_price(price), "size": spec.format_size(size)} for price, size in snapshot.bids],
+            "symbol": snapshot.symbol,
+            "timestamp": datetime.fromtimestamp(snapshot.board_timestamp / 1000, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        }
+        crud.insert_board_items(db=db, insert_items=board_item, max_board_counts=max_board_counts)
+
+
+async def backfill_ohlcv(
+    SessionLocal: sqlalchemy.orm.Session,
+    symbol: str,
+    time_span: int,
+    since_timestamp: int,
+    max_tick_rows: int,
+    max_ohlcv_rows: int,
+    rest_client: GmoPublicRestClient,
+    max_pages: int = 10,
+    timeframes: Sequence[int] = DEFAULT_TIMEFRAMES,
+) -> int:
+    """Fill the gap of bars since `since_timestamp` with trades of the public REST API.
+
+    The trades are fetched before a session is opened, and go through a MultiTimeframeBarBuilder, so that the bars of all
+    timeframes served by the live bar builder are backfilled, not only those of `time_span`. The ticks and the bars are
+    written in one batch each.
+
+    Args:
+        SessionLocal (sqlalchemy.orm.Session): Session factory of sqlalchemy.
+        symbol (str): Name of symbol
+        time_span (int): Time span of bars (seconds).
+        since_timestamp (int): Unix timestamp (s) of the open time of the last stored bar of `time_span`.
+        max_tick_rows (int): Number of max rows of tick table.
+        max_ohlcv_rows (int): Number of max rows of each timeframe of ohlcv table.
+        rest_client (GmoPublicRestClient): Client of public REST API.
+        max_pages (int, optional): Max number of pages to request. Defaults to 10.
+        timeframes (Sequence[int], optional): Time spans of the bars to backfill (seconds). `time_span` is always included.
+            Defaults to DEFAULT_TIMEFRAMES.
+
+    Returns:
+        int: Number of backfilled trades.
+    """
+    spans = sorted({*timeframes, time_span})
+    # The bars which contain `since_timestamp` are rebuilt, so start at the open time of the bar of the longest timeframe.
+    start_timestamp = since_timestamp // spans[-1] * spans[-1]
+    min_unix_timestamp = start_timestamp * 1000 - 1
+    trades = await rest_client.get_trades_since(symbol=symbol, since_timestamp=min_unix_timestamp, max_pages=max_pages)
+    if len(trades) == 0:
+        return 0
+
+    spec = get_symbol_spec(symbol)
+    ticks = [records.tick_from_message(trade, spec) for trade in trades]
+    bar_builder = MultiTimeframeBarBuilder(symbol=symbol, timeframes=spans, spec=spec)
+    for tick in ticks:
+        bar_builder.add_tick(tick.timestamp, tick.price, tick.size)
+
+    with SessionLocal() as db:
+        # Keep all backfilled ticks.
+        crud.insert_tick_items(db=db, insert_items=ticks, max_rows=max(max_tick_rows, len(ticks)))
+        crud.upsert_ohlcv_items(db=db, items=bar_builder.drain_updates(), max_rows=max_ohlcv_rows)
+
+    return len(trades)
+
+
+async def warm_start(
+    snapshot_path: str,
+    symbol: str,
+    time_span: int,
+    max_orderbook_table_rows: int,
+    max_tick_table_rows: int,
+    max_ohlcv_table_rows: int,
+    logger: logging.Logger,
+    SessionLocal: sqlalchemy.orm.Session,
+    rest_client: Optional[GmoPublicRestClient] = None,
+    timeframes: Sequence[int] = DEFAULT_TIMEFRAMES,
+) -> bool:
+    """Restore market state from snapshot and backfill the gap since it was taken, in the bars of `timeframes` (see
+    `backfill_ohlcv`).
+
+    Returns:
+        bool: True if market state is restored.
+    """
+    try:
+        snapshot = load_market_state_snapshot(snapshot_path)
+    except Exception:
+        logger.warning("Failed to load market state snapshot %s\n%s", snapshot_path, traceback.format_exc())
+        return False
+
+    if snapshot is None or snapshot.symbol != symbol or snapshot.time_span != time_span:
+        return False
+
+    with SessionLocal() as db:
+        stored_ohlcv = crud.get_ohlcv_with_symbol(db=db, symbol=symbol, limit=1, ascending=False, timeframe=schemas.timeframe_label(time_span))
+        if len(stored_ohlcv) > 0:
+            # Database was not cleared (e.g. the process was killed). Only fill the gap.
+            since_timestamp = stored_ohlcv[0].timestamp
+        else:
+            restore_market_state(db=db, snapshot=snapshot, max_board_counts=max_orderbook_table_rows, max_ohlcv_rows=max_ohlcv_table_rows)
+            logger.info("Restored %d bars from market state snapshot (saved at %f)", len(snapshot.ohlcv), snapshot.saved_at)
+            since_timestamp = int(snapshot.ohlcv[-1, 0]) if len(snapshot.ohlcv) > 0 else None
+
+    if since_timestamp is not None:
+        rest_client = rest_client or GmoPublicRestClient()
+        try:
+            count = await backfill_ohlcv(
+                SessionLocal=SessionLocal,
+                symbol=symbol,
+                time_span=time_span,
+                since_timestamp=since_timestamp,
+                max_tick_rows=max_tick_table_rows,
+                max_ohlcv_rows=max_ohlcv_table_rows,
+                rest_client=rest_client,
+                timeframes=timeframes,
+            )
+            logger.info("Backfilled %d trades", count)
+        except Exception:
+            # Start with the restored state. The live feed fills bars from now on.
+            logger.warning("Failed to backfill trades\n%s", traceback.format_exc())
+
+    return True
+
+
+def seed_live_market_state(db: Session, market_state: LiveMarketState, time_span: int, max_bars: int = 100) -> int:
+    """Load the bars of `time_span` and the last board of the database (e.g. restored by `warm_start`) into `market_state`,
+    whose decisions do not read the database.
+
+    Args:
+        db (Session): Session of sqlalchemy
+        market_state (LiveMarketState): Market state of the trader.
+        time_span (int): Time span of bars (seconds).
+        max_bars (int, optional): Number of newest bars to load. Defaults to 100.
+
+    Returns:
+        int: Number of loaded bars.
+    """
+    ohlcv_items = crud.get_ohlcv_with_symbol(db=db, symbol=market_state.symbol, limit=max_bars, ascending=False, timeframe=schemas.timeframe_label(time_span))
+    bars = [
+        records.Bar(
+            timestamp=item.timestamp,
+            open=item.open,
+            high=item.high,
+            low=item.low,
+            close=item.close,
+            volume=item.volume,
+            symbol=item.symbol,
+            timeframe=item.timeframe,
+        )
+        for item in ohlcv_items
+    ]
+    loaded = market_state.bar_builder.seed_history(bars)
+
+    buy_board_items, sell_board_items = crud.get_current_board(db=db, symbol=market_state.symbol)
+    if market_state.board_timestamp is None and len(buy_board_items) + len(sell_board_items) > 0:
+        market_state.update_board(
+            records.Board(
+                timestamp=(buy_board_items or sell_board_items)[0].timestamp,
+                symbol=market_state.symbol,
+                bids=tuple(records.BookLevel(item.price, item.size) for item in buy_board_items),
+                asks=tuple(records.BookLevel(item.price, item.size) for item in sell_board_items),
+            )
+        )
+    return loaded
+
+
+def checkpoint_market_state(db: Session, snapshot_path: str, symbol: str, time_span: int, max_bars: int = 100) -> None:
+    """Take and save a snapshot. Job of DbWriter, which runs it after the queued writes."""
+    save_market_state_snapshot(snapshot_path, take_market_state_snapshot(db=db, symbol=symbol, time_span=time_span, max_bars=max_bars))
+
+
+class MarketStateCheckpointer:
+    RUNNING = True
+
+    async def run(
+        self,
+        snapshot_path: str,
+        symbol: str,
+        time_span: int,
+        logger: logging.Logger,
+        SessionLocal: sqlalchemy.orm.Session,
+        checkpoint_interval: float = 10.0,
+        max_bars: int = 100,
+        db_writer: Optional[DbWriter] = None,
+    ):
+        """Save market state snapshot every `checkpoint_interval` seconds.
+
+        Args:
+            snapshot_path (str): File path of snapshot.
+            symbol (str): Name of symbol
+            time_span (int): Time span of bars (seconds).
+            logger (logging.Logger): logger
+            SessionLocal (sqlalchemy.orm.Session): Session of sqlalchemy
+            checkpoint_interval (float, optional): Interval of checkpoints (seconds). Defaults to 10.0.
+            max_bars (int, optional): Number of newest bars to keep. Defaults to 100.
+            db_writer (Optional[DbWriter], optional): Take the snapshots in its thread. Defaults to None (in this coroutine).
+        """
+        while self.RUNNING:
+            await asyncio.sleep(checkpoint_interval)
+            try:
+                kwargs = {"snapshot_path": snapshot_path, "symbol": symbol, "time_span": time_span, "max_bars": max_bars}
+                if db_writer is None:
+                    with SessionLocal() as db:
+                        checkpoint_market_state(db=db, **kwargs)
+                else:
+                    db_writer.submit(checkpoint_market_state, **kwargs)
+            except Exception:
+                # A failed checkpoint should not stop trading.
+                logger.warning("Failed to save market state snapshot\n%s", traceback.format_exc())
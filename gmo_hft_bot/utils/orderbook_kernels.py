@@ -0,0 +1,148 @@
+from typing import List, NamedTuple
+
+import numba
+import numpy as np
+from sqlalchemy.engine.row import Row
+
+# Kernels take the price and size arrays of one side ordered from the best level (bids descending, asks ascending).
+# Arrays of `board_arrays` are int64 prices in ticks and sizes in lots (see utils/fixed_point.py), and results are in
+# the same units (e.g. `weighted_mid` in ticks). Kernels also take float64 arrays.
+# They are numba.njit functions, so that they can be called from the live process and from other compiled functions
+# (e.g. backtest.backtest_trade.backtest) alike. Compiled code is cached in __pycache__ so that only the first run compiles.
+
+
+class BookArrays(NamedTuple):
+    bid_prices: np.ndarray
+    bid_sizes: np.ndarray
+    ask_prices: np.ndarray
+    ask_sizes: np.ndarray
+
+
+def board_arrays(buy_board_items: List[Row], sell_board_items: List[Row]) -> BookArrays:
+    """Arrays (int64 ticks and lots) of the kernels from the return of `crud.get_current_board` (ascending order of price).
+
+    Args:
+        buy_board_items (List[Row]): Bids.
+        sell_board_items (List[Row]): Asks.
+
+    Returns:
+        BookArrays: Arrays ordered from the best level.
+    """
+    bids = np.array([(item.price, item.size) for item in reversed(buy_board_items)], dtype=np.int64).reshape(-1, 2)
+    asks = np.array([(item.price, item.size) for item in sell_board_items], dtype=np.int64).reshape(-1, 2)
+    return BookArrays(
+        bid_prices=np.ascontiguousarray(bids[:, 0]),
+        bid_sizes=np.ascontiguousarray(bids[:, 1]),
+        ask_prices=np.ascontiguousarray(asks[:, 0]),
+        ask_sizes=np.ascontiguousarray(asks[:, 1]),
+    )
+
+
+@numba.njit(cache=True)
+def cumulative_depth(sizes: np.ndarray) -> np.ndarray:
+    """Cumulative size from the best level."""
+    depth = np.empty_like(sizes)
+    total = 0
+    for i in range(sizes.size):
+        total += sizes[i]
+        depth[i] = total
+    return depth
+
+
+@numba.njit(cache=True)
+def depth_imbalance(bid_sizes: np.ndarray, ask_sizes: np.ndarray, levels: int) -> float:
+    """(bid depth - ask depth) / (bid depth + ask depth) of the best `levels` levels, in [-1, 1]. 0.0 if the book is empty."""
+    bid_depth = 0.0
+    for i in range(min(levels, bid_sizes.size)):
+        bid_depth += bid_sizes[i]
+    ask_depth = 0.0
+    for i in range(min(levels, ask_sizes.size)):
+        ask_depth += ask_sizes[i]
+    total = bid_depth + ask_depth
+    if total <= 0.0:
+        return 0.0
+    return (bid_depth - ask_depth) / total
+
+
+@numba.njit(cache=True)
+def weighted_mid(bid_prices: np.ndarray, bid_sizes: np.ndarray, ask_prices: np.ndarray, ask_sizes: np.ndarray) -> float:
+    """Mid price weighted by the opposite best size (micro price). nan if a side is empty."""
+    if bid_prices.size == 0 or ask_prices.size == 0:
+        return np.nan
+    total = float(bid_sizes[0] + ask_sizes[0])
+    if total <= 0.0:
+        return (bid_prices[0] + ask_prices[0]) / 2.0
+    # float, so that the products of int64 ticks and lots do not overflow.
+    return (float(bid_prices[0]) * ask_sizes[0] + float(ask_prices[0]) * bid_sizes[0]) / total
+
+
+@numba.njit(cache=True)
+def vwap_to_size(prices: np.ndarray, sizes: np.ndarray, target_size: float) -> float:
+    """Average price to fill `target_size` by taking the levels from the best. nan if the book is not deep enough."""
+    remaining = float(target_size)
+    notional = 0.0
+    for i in range(prices.size):
+        fill = min(remaining, float(sizes[i]))
+        notional += fill * prices[i]
+        remaining -= fill
+        if remaining <= 0.0:
+            return notional / target_size
+    return np.nan
+
+
+@numba.njit(cache=True)
+def book_slope(prices: np.ndarray, sizes: np.ndarray, levels: int) -> float:
+    """Least squares slope of cumulative depth against the distance from the best price over the best `levels` levels.
+
+    Larger slope means that more size is quoted near the best price. nan with less than 2 levels.
+    """
+    n = min(levels, prices.size)
+    if n < 2:
+        return np.nan
+    best_price = prices[0]
+    sum_x = 0.0
+    sum_y = 0.0
+    depth = 0.0
+    for i in range(n):
+        depth += sizes[i]
+        sum_x += abs(prices[i] - best_price)
+        sum_y += depth
+    mean_x = sum_x / n
+    mean_y = sum_y / n
+    covariance = 0.0
+    variance = 0.0
+    depth = 0.0
+    for i in range(n):
+        depth += sizes[i]
+        dx = abs(prices[i] - best_price) - mean_x
+        covariance += dx * (depth - mean_y)
+        variance += dx * dx
+    if variance == 0.0:
+        return np.nan
+    return covariance / variance
+
+
+# Features of the board which are journaled with each decision after the bar features (see crud.prediction_features).
+BOOK_FEATURE_NAMES = ("depth_imbalance", "weighted_mid")
+# Levels of each side in `depth_imbalance` of the features.
+BOOK_FEATURE_LEVELS = 5
+
+
+def book_features(book: BookArrays, levels: int = BOOK_FEATURE_LEVELS) -> List[float]:
+    """BOOK_FEATURE_NAMES of a board: depth imbalance of the best `levels` levels and weighted mid (ticks, nan if a side is empty)."""
+    return [
+        float(depth_imbalance(book.bid_sizes, book.ask_sizes, levels)),
+        float(weighted_mid(book.bid_prices, book.bid_sizes, book.ask_prices, book.ask_sizes)),
+    ]
+
+
+def warmup_kernels() -> None:
+    """Compile (or load the cache of) all kernels, so that the first call in the trade loop is not slow."""
+    for dtype in (np.int64, np.float64):
+        prices = np.array([2, 3], dtype=dtype)
+        sizes = np.array([1, 1], dtype=dtype)
+        cumulative_depth(sizes)
+        depth_imbalance(sizes, sizes, 1)
+        weighted_mid(prices, sizes, prices, sizes)
+        vwap_to_size(prices, sizes, 1.0)
+        book_slope(prices, sizes, 2)
@@ -0,0 +1,288 @@
+import sys
+import time
+import heapq
+import json
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+
+sys.path.append(".")
+from gmo_hft_bot.utils.custom_exceptions import RequestSupersededError
+from gmo_hft_bot.utils.process_supervisor import Heartbeat
+
+# Priority classes of private requests. Lower is sent first.
+# Cancels first: a resting order at a stale price costs more than a late new order.
+PRIORITY_CANCEL = 0
+PRIORITY_ORDER = 1
+# Account and order status queries.
+PRIORITY_QUERY = 2
+
+# Heartbeat metrics of PrivateApiScheduler.
+METRIC_API_QUEUED_MS = "api_queued_ms"
+METRIC_API_MAX_QUEUED_MS = "api_max_queued_ms"
+METRIC_API_THROTTLED = "api_throttled"
+METRIC_API_REJECTED = "api_rejected"
+METRIC_API_SUPERSEDED = "api_superseded"
+
+# Message code of GMO for too many requests (the response of a throttled request).
+GMO_TOO_MANY_REQUESTS = "ERR-5003"
+
+
+class RateLimitConfig(NamedTuple):
+    """Token bucket of the private API. Picklable, so that it can be passed to multiprocessing targets.
+
+    Set `rate` to the limit of the account (GMO limits the requests per second by the trading volume tier), or a bit
+    below it: a throttled request costs far more than a few milliseconds in the queue.
+    """
+
+    # Requests per second.
+    rate: float = 6.0
+    # Requests which can be sent at once after an idle period.
+    burst: int = 6
+    # Timeout of a request (seconds).
+    timeout: float = 5.0
+
+
+class TokenBucket:
+    """Token bucket. A token is added every 1 / `rate` seconds, up to `capacity` tokens."""
+
+    def __init__(self, rate: float, capacity: int, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Seconds until a token is available. 0 if one is available now."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        """Take a token if one is available."""
+        if self.delay(now) > 0.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class PrivateRequest:
+    """Queued private request. `future` is resolved with the response (parsed JSON)."""
+
+    __slots__ = ("method", "endpoint", "params", "body", "priority", "coalesce_key", "sequence", "queued_at", "future", "superseded")
+
+    def __init__(
+        self,
+        method: str,
+        endpoint: str,
+        params: Optional[Dict],
+        body: Optional[Dict],
+        priority: int,
+        coalesce_key: Optional[str],
+        sequence: int,
+        future: asyncio.Future,
+    ):
+        self.method = method
+        self.endpoint = endpoint
+        self.params = params
+        self.body = body
+        self.priority = priority
+        self.coalesce_key = coalesce_key
+        # Order of arrival within the priority class.
+        self.sequence = sequence
+        self.queued_at = time.monotonic()
+        self.future = future
+        self.superseded = False
+
+
+def is_throttled(status: int, response: Any) -> bool:
+    """Whether a response is the rejection of a throttled request (HTTP 429 or GMO_TOO_MANY_REQUESTS)."""
+    if status == 429:
+        return True
+    if isinstance(response, dict):
+        return any(message.get("message_code") == GMO_TOO_MANY_REQUESTS for message in response.get("messages", []))
+    return False
+
+
+class PrivateApiScheduler:
+    """Send private REST requests through a token bucket, by priority.
+
+    `request` queues a request and waits for its response. `run` sends the queued requests: cancels (PRIORITY_CANCEL)
+    before new orders (PRIORITY_ORDER) before queries, and in the order of arrival within a class. A request queued with
+    the `coalesce_key` of a queued request (e.g. the replace of the buy order) supersedes it. The superseded request is
+    not sent and its caller gets RequestSupersededError.
+
+    Time spent in the queue and the waits for a token (throttled on the client side) are published as heartbeat metrics,
+    with the requests rejected by the server as too many.
+    """
+
+    RUNNING = True
+
+    def __init__(
+        self,
+        base_url: str = "https://api.coin.z.com/private",
+        sign: Optional[Callable[[str, str, str], Dict]] = None,
+        config: RateLimitConfig = RateLimitConfig(),
+        heartbeat: Optional[Heartbeat] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """
+        Args:
+            base_url (str, optional): Base url of the private API. Set it to a local server to mock it.
+                Defaults to "https://api.coin.z.com/private".
+            sign (Optional[Callable[[str, str, str], Dict]], optional): Headers of (method, endpoint, body), e.g. API-SIGN,
+                computed right before sending so that the timestamp is not stale. Defaults to None (no headers).
+            config (RateLimitConfig, optional): Token bucket. Defaults to RateLimitConfig().
+            heartbeat (Optional[Heartbeat], optional): Heartbeat which publishes the metrics. Defaults to None.
+            logger (Optional[logging.Logger], optional): Logger of the rejected requests. Defaults to None.
+        """
+        self.base_url = base_url
+        self.sign = sign
+        self.config = config
+        self.heartbeat = heartbeat
+        self.logger = logger
+        self.bucket = TokenBucket(rate=config.rate, capacity=config.burst)
+        self._queue: List[Tuple[int, int, PrivateRequest]] = []
+        self._coalesced: Dict[str, PrivateRequest] = {}
+        self._sequence = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._in_flight: set = set()
+        self.sent = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.superseded = 0
+        self.last_queued = 0.0
+        self.max_queued = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def submit(
+        self,
+        method: str,
+        endpoint: str,
+        params: Optional[Dict] = None,
+        body: Optional[Dict] = None,
+        priority: int = PRIORITY_ORDER,
+        coalesce_key: Optional[str] = None,
+    ) -> asyncio.Future:
+        """Queue a request.
+
+        Args:
+            method (str): HTTP method.
+            endpoint (str): Endpoint, e.g. "/v1/order".
+            params (Optional[Dict], optional): Query parameters. Defaults to None.
+            body (Optional[Dict], optional): JSON body. Defaults to None.
+            priority (int, optional): One of PRIORITY_*. Defaults to PRIORITY_ORDER.
+            coalesce_key (Optional[str], optional): A queued request with the same key is superseded. Defaults to None.
+
+        Returns:
+            asyncio.Future: Response (parsed JSON) of the request.
+        """
+        request = PrivateRequest(method, endpoint, params, body, priority, coalesce_key, self._sequence, asyncio.get_running_loop().create_future())
+        self._sequence += 1
+        if coalesce_key is not None:
+            previous = self._coalesced.get(coalesce_key)
+            if previous is not None and not previous.future.done():
+                # Left in the heap, and skipped when it is popped.
+                previous.superseded = True
+                previous.future.set_exception(RequestSupersededError(f"{previous.method} {previous.endpoint} is superseded ({coalesce_key})"))
+                self.superseded += 1
+                self._set_metric(METRIC_API_SUPERSEDED, self.superseded)
+            self._coalesced[coalesce_key] = request
+
+        heapq.heappush(self._queue, (priority, request.sequence, request))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return request.future
+
+    async def request(self, method: str, endpoint: str, **kwargs) -> Any:
+        """Queue a request and wait for its response. See `submit` for the arguments.
+
+        Raises:
+            RequestSupersededError: If a request with the same `coalesce_key` is queued before this one is sent.
+        """
+        return await self.submit(method, endpoint, **kwargs)
+
+    def _pop(self) -> Optional[PrivateRequest]:
+        while len(self._queue) > 0:
+            _, _, request = heapq.heappop(self._queue)
+            if request.coalesce_key is not None and self._coalesced.get(request.coalesce_key) is request:
+                del self._coalesced[request.coalesce_key]
+            if not request.superseded and not request.future.done():
+                return request
+        return None
+
+    def _set_metric(self, name: str, value: float) -> None:
+        if self.heartbeat is not None:
+            self.heartbeat.set_metric(name, value)
+
+    async def _send(self, session: aiohttp.ClientSession, request: PrivateRequest) -> None:
+        body = "" if request.body is None else json.dumps(request.body)
+        headers = {} if self.sign is None else self.sign(request.method, request.endpoint, body)
+        try:
+            async with session.request(
+                request.method,
+                self.base_url + request.endpoint,
+                params=request.params,
+                data=body if request.body is not None else None,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout),
+            ) as response:
+                status = response.status
+                result = await response.json(content_type=None)
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+            return
+
+        if is_throttled(status, result):
+            self.rejected += 1
+            self._set_metric(METRIC_API_REJECTED, self.rejected)
+            if self.logger is not None:
+                self.logger.warning("Private API throttled %s %s: %s", request.method, request.endpoint, result)
+        if not request.future.done():
+            request.future.set_result(result)
+
+    async def run(self, session: aiohttp.ClientSession):
+        """Send the queued requests with `session`. Requests are sent concurrently, as fast as the token bucket allows."""
+        self._wakeup = asyncio.Event()
+        try:
+            while self.RUNNING:
+                request = self._pop()
+                if request is None:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                delay = self.bucket.delay()
+                if delay > 0.0:
+                    self.throttled += 1
+                    self._set_metric(METRIC_API_THROTTLED, self.throttled)
+                    # Back to the queue, since a request of a higher priority can come meanwhile.
+                    heapq.heappush(self._queue, (request.priority, request.sequence, request))
+                    if request.coalesce_key is not None:
+                        self._coalesced.setdefault(request.coalesce_key, request)
+                    await asyncio.sleep(delay)
+                    continue
+
+                self.bucket.try_acquire()
+                self.last_queued = time.monotonic() - request.queued_at
+                self.max_queued = max(self.max_queued, self.last_queued)
+                self._set_metric(METRIC_API_QUEUED_MS, self.last_queued * 1000)
+                self._set_metric(METRIC_API_MAX_QUEUED_MS, self.max_queued * 1000)
+                self.sent += 1
+                task = asyncio.create_task(self._send(session, request))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+        finally:
+            self._wakeup = None
+            for task in list(self._in_flight):
+                task.cancel()
@@ -0,0 +1,413 @@
+import gc
+import os
+import sys
+import time
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+HEARTBEAT_ALIVE = "alive"
+HEARTBEAT_FAILED = "failed"
+
+# Control messages sent by ProcessSupervisor over the health channel.
+COMMAND_TOGGLE_PROFILER = "toggle_profiler"
+
+# Start methods of ProcessSupervisor. None for the default of the platform (fork on Linux).
+START_METHODS = (None, "fork", "forkserver", "spawn")
+
+
+class ProcessLaunchConfig(NamedTuple):
+    """Settings applied to a supervised process before its target runs. Picklable for the spawn and forkserver start methods."""
+
+    # CPUs the process may run on, e.g. (2,) to pin it to one core. None to inherit. Linux only.
+    cpu_affinity: Optional[Tuple[int, ...]] = None
+    # Nice value (-20 to 19, lower runs first). Values below the current one need CAP_SYS_NICE. None to inherit.
+    nice: Optional[int] = None
+    # Collect and freeze the objects created before the target runs (imports, objects inherited with fork),
+    # so that later collections do not scan them and fork does not copy their pages by touching the GC headers.
+    gc_freeze: bool = False
+
+
+class ProcessUsage(NamedTuple):
+    """Resource usage of a supervised process, read from /proc by the supervisor."""
+
+    pid: int
+    # User and system CPU time since the process started (seconds).
+    cpu_seconds: float
+    # CPU usage since the previous sample (100.0 is one core).
+    cpu_percent: float
+    rss_bytes: int
+    nice: int
+    # CPU the process ran on last. Changes between samples show core migration.
+    last_cpu: int
+
+
+def parse_cpu_list(text: Optional[str]) -> Optional[Tuple[int, ...]]:
+    """Parse a CPU list in the format of taskset and cpusets, e.g. "0,2-3" -> (0, 2, 3). None or empty text -> None."""
+    if text is None or text.strip() == "":
+        return None
+
+    cpus = set()
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return tuple(sorted(cpus))
+
+
+def apply_launch_config(config: ProcessLaunchConfig) -> None:
+    """Apply `config` to the current process. Settings which are not permitted or not supported are logged and skipped."""
+    logger = logging.getLogger(__name__)
+    if config.cpu_affinity is not None:
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, config.cpu_affinity)
+            except OSError as e:
+                logger.warning("Failed to set CPU affinity %s: %s", config.cpu_affinity, e)
+        else:
+            logger.warning("CPU affinity is not supported on %s", sys.platform)
+
+    if config.nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, config.nice)
+        except (OSError, AttributeError) as e:
+            logger.warning("Failed to set nice %d: %s", config.nice, e)
+
+    if config.gc_freeze:
+        gc.collect()
+        gc.freeze()
+
+
+def _launch(target: Callable, launch_config: Optional[ProcessLaunchConfig], /, **kwargs: Any) -> None:
+    if launch_config is not None:
+        apply_launch_config(launch_config)
+    target(**kwargs)
+
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def read_process_usage(pid: int, previous: Optional[ProcessUsage] = None, interval: Optional[float] = None) -> Optional[ProcessUsage]:
+    """Read CPU time and RSS of `pid` from /proc/<pid>/stat.
+
+    Args:
+        pid (int): Process id.
+        previous (Optional[ProcessUsage], optional): Previous sample of the process, to compute `cpu_percent`. Defaults to None.
+        interval (Optional[float], optional): Seconds since `previous`. Defaults to None.
+
+    Returns:
+        Optional[ProcessUsage]: None if /proc is not available (not Linux) or the process has exited.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read().decode()
+    except OSError:
+        return None
+
+    # The command name in parentheses can contain spaces. Fields after it start from the 3rd (state).
+    fields = stat.rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    cpu_percent = 0.0
+    if previous is not None and previous.pid == pid and interval:
+        cpu_percent = max(cpu_seconds - previous.cpu_seconds, 0.0) / interval * 100
+    return ProcessUsage(
+        pid=pid, cpu_seconds=cpu_seconds, cpu_percent=cpu_percent, rss_bytes=int(fields[21]) * _PAGE_SIZE, nice=int(fields[16]), last_cpu=int(fields[36])
+    )
+
+
+class Heartbeat:
+    """Child side of the health channel of ProcessSupervisor.
+
+    Sends structured heartbeats over the pipe given by the supervisor, e.g.
+        {"name": "queue_and_trade", "status": "alive", "pid": 1234, "timestamp": 1648000000.0}
+    and runs the handler registered with `add_command_handler` for control messages from the supervisor, e.g.
+        {"command": "toggle_profiler"}
+    Metrics set with `set_metric` (e.g. loop lag of utils/event_loop.LoopLagMonitor) are sent with each heartbeat as
+        {"name": ..., "status": "alive", ..., "metrics": {"loop_lag_ms": 0.4}}
+    """
+
+    RUNNING = True
+
+    def __init__(self, conn: Connection, name: str, interval: float = 1.0):
+        self.conn = conn
+        self.name = name
+        self.interval = interval
+        self.command_handlers: Dict[str, Callable[[], None]] = {}
+        self.metrics: Dict[str, float] = {}
+
+    def _send(self, status: str, **info: Any) -> None:
+        try:
+            self.conn.send({"name": self.name, "status": status, "pid": os.getpid(), "timestamp": time.time(), **info})
+        except (BrokenPipeError, OSError):
+            # The supervisor has gone away. Nothing to report to.
+            pass
+
+    def set_metric(self, name: str, value: float) -> None:
+        """Send `value` as `name` with the next heartbeats."""
+        self.metrics[name] = value
+
+    def beat(self) -> None:
+        if len(self.metrics) > 0:
+            self._send(HEARTBEAT_ALIVE, metrics=dict(self.metrics))
+        else:
+            self._send(HEARTBEAT_ALIVE)
+
+    def fail(self, reason: str) -> None:
+        self._send(HEARTBEAT_FAILED, reason=reason)
+
+    def add_command_handler(self, command: str, handler: Callable[[], None]) -> None:
+        self.command_handlers[command] = handler
+
+    def handle_commands(self) -> None:
+        """Run handlers of the control messages waiting in the pipe."""
+        try:
+            while self.conn.poll():
+                message = self.conn.recv()
+                handler = self.command_handlers.get(message.get("command"))
+                if handler is not None:
+                    handler()
+        except (EOFError, OSError):
+            pass
+
+    async def run(self):
+        """Send a heartbeat every `interval` seconds. Heartbeats stop if the event loop is blocked."""
+        while self.RUNNING:
+            self.beat()
+            self.handle_commands()
+            await asyncio.sleep(self.interval)
+
+
+class _SupervisedProcess:
+    def __init__(self, name: str, target: Callable, kwargs: Dict, health_flag: Optional[Any], launch_config: Optional[ProcessLaunchConfig] = None):
+        self.name = name
+        self.target = target
+        self.kwargs = kwargs
+        self.health_flag = health_flag
+        self.launch_config = launch_config
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn: Optional[Connection] = None
+        self.started_at = 0.0
+        self.last_heartbeat_at = 0.0
+        self.is_failed = False
+        self.restart_count = 0
+        # Metrics of the last heartbeat.
+        self.metrics: Dict[str, float] = {}
+        self.usage: Optional[ProcessUsage] = None
+
+
+class ProcessSupervisor:
+    """Own the bot processes and restart only the one which failed.
+
+    Each target is called as `target(**kwargs, heartbeat_conn=conn)` and is expected to send heartbeats
+    with `Heartbeat`. A process is restarted when it exits, reports `failed`, or stops sending heartbeats
+    for `heartbeat_timeout` seconds. If a `health_flag` (e.g. `multiprocessing.RawValue(ctypes.c_bool)`) is
+    given for a process, it is cleared while the process is down and set again on its first heartbeat, so
+    other processes can check the health by reading shared memory instead of asking a manager process.
+
+    Processes are started with `start_method` (e.g. "forkserver" or "spawn", which do not copy the state of the
+    supervisor). Queues and locks passed to the targets should be created with `context` then. CPU affinity, nice
+    and GC freezing are set per process with `ProcessLaunchConfig`. CPU and RSS of each process are sampled every
+    `usage_interval` seconds (see `usage`).
+    """
+
+    RUNNING = True
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        heartbeat_timeout: float = 10.0,
+        poll_interval: float = 0.5,
+        min_restart_interval: float = 1.0,
+        start_method: Optional[str] = None,
+        usage_interval: Optional[float] = 10.0,
+    ):
+        if start_method not in START_METHODS:
+            raise ValueError(f"Invalid start method {start_method}. It should be in {START_METHODS}")
+
+        self.logger = logger
+        self.heartbeat_timeout = heartbeat_timeout
+        self.poll_interval = poll_interval
+        self.min_restart_interval = min_restart_interval
+        self.context = multiprocessing.get_context(start_method)
+        self.usage_interval = usage_interval
+        self.last_usage_at = 0.0
+        self.processes: Dict[str, _SupervisedProcess] = {}
+
+    def add_process(
+        self,
+        name: str,
+        target: Callable,
+        kwargs: Optional[Dict] = None,
+        health_flag: Optional[Any] = None,
+        launch_config: Optional[ProcessLaunchConfig] = None,
+    ) -> None:
+        """Register a process. Processes are started in the order they are added.
+
+        Args:
+            name (str): Name of process.
+            target (Callable): Process target. It should accept `heartbeat_conn` keyword argument.
+            kwargs (Optional[Dict], optional): Keyword arguments of target. Defaults to None.
+            health_flag (Optional[Any], optional): Shared boolean (has `value` attribute) which tells if the process is healthy. Defaults to None.
+            launch_config (Optional[ProcessLaunchConfig], optional): CPU affinity, nice and GC settings of the process. Defaults to None (inherit).
+        """
+        if name in self.processes:
+            raise ValueError(f"Process {name} is already registered.")
+
+        self.processes[name] = _SupervisedProcess(name=name, target=target, kwargs=kwargs or {}, health_flag=health_flag, launch_config=launch_config)
+
+    def send_command(self, name: str, command: str) -> None:
+        """Send a control message to a process. It is handled with its next heartbeat.
+
+        Args:
+            name (str): Name of process.
+            command (str): Command, e.g. COMMAND_TOGGLE_PROFILER.
+        """
+        supervised = self.processes[name]
+        if supervised.conn is None:
+            return
+        try:
+            supervised.conn.send({"command": command})
+        except (BrokenPipeError, OSError):
+            # The process is being restarted.
+            pass
+
+    def broadcast_command(self, command: str) -> None:
+        for name in self.processes:
+            self.send_command(name, command)
+
+    def restart_counts(self) -> Dict[str, int]:
+        return {name: supervised.restart_count for name, supervised in self.processes.items()}
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Metrics of the last heartbeat of each process (see Heartbeat.set_metric)."""
+        return {name: dict(supervised.metrics) for name, supervised in self.processes.items()}
+
+    def usage(self) -> Dict[str, Optional[ProcessUsage]]:
+        """CPU and RSS of each process at the last sample. None before the first sample or where /proc is not available."""
+        return {name: supervised.usage for name, supervised in self.processes.items()}
+
+    def sample_usage(self) -> None:
+        now = time.monotonic()
+        interval = now - self.last_usage_at if self.last_usage_at > 0 else None
+        self.last_usage_at = now
+        for supervised in self.processes.values():
+            if supervised.process is None or supervised.process.pid is None:
+                continue
+            supervised.usage = read_process_usage(supervised.process.pid, previous=supervised.usage, interval=interval)
+            if supervised.usage is not None:
+                self.logger.info(
+                    "%s process cpu=%.1f%% rss=%.1fMB nice=%d cpu_id=%d",
+                    supervised.name,
+                    supervised.usage.cpu_percent,
+                    supervised.usage.rss_bytes / 2**20,
+                    supervised.usage.nice,
+                    supervised.usage.last_cpu,
+                )
+
+    def _start_process(self, supervised: _SupervisedProcess) -> None:
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_launch,
+            args=(supervised.target, supervised.launch_config),
+            kwargs={**supervised.kwargs, "heartbeat_conn": child_conn},
+            name=supervised.name,
+        )
+        process.start()
+        # Close our copy of the child end so that recv() raises EOFError when the child exits.
+        child_conn.close()
+
+        supervised.process = process
+        supervised.conn = parent_conn
+        supervised.started_at = time.monotonic()
+        supervised.last_heartbeat_at = supervised.started_at
+        supervised.is_failed = False
+        supervised.usage = None
+        self.logger.info("Started %s process (pid=%d)", supervised.name, process.pid)
+
+    def _stop_process(self, supervised: _SupervisedProcess) -> None:
+        if supervised.health_flag is not None:
+            supervised.health_flag.value = False
+
+        if supervised.process is not None:
+            if supervised.process.is_alive():
+                supervised.process.terminate()
+            supervised.process.join(timeout=5.0)
+
+        if supervised.conn is not None:
+            supervised.conn.close()
+            supervised.conn = None
+
+    def start(self) -> None:
+        for supervised in self.processes.values():
+            self._start_process(supervised)
+
+    def _handle_heartbeat(self, supervised: _SupervisedProcess) -> None:
+        try:
+            message = supervised.conn.recv()
+        except (EOFError, OSError):
+            # The child has exited. It is restarted by _check_processes.
+            supervised.conn.close()
+            supervised.conn = None
+            return
+
+        supervised.last_heartbeat_at = time.monotonic()
+        if "metrics" in message:
+            supervised.metrics = message["metrics"]
+        if message.get("status") == HEARTBEAT_FAILED:
+            self.logger.error("%s process reported a failure: %s", supervised.name, message.get("reason"))
+            supervised.is_failed = True
+        elif supervised.health_flag is not None and supervised.health_flag.value is False:
+            supervised.health_flag.value = True
+            self.logger.info("%s process is healthy", supervised.name)
+
+    def _check_processes(self) -> None:
+        now = time.monotonic()
+        for supervised in self.processes.values():
+            if supervised.process is None:
+                continue
+
+            reason = None
+            if supervised.is_failed:
+                reason = "reported a failure"
+            elif not supervised.process.is_alive():
+                reason = f"exited with code {supervised.process.exitcode}"
+            elif supervised.conn is None:
+                reason = "closed the health channel"
+            elif now - supervised.last_heartbeat_at > self.heartbeat_timeout:
+                reason = f"sent no heartbeat for {now - supervised.last_heartbeat_at:.1f} seconds"
+
+            if reason is None:
+                continue
+
+            if supervised.health_flag is not None:
+                supervised.health_flag.value = False
+
+            # Avoid restarting in a tight loop, e.g. while the exchange refuses connections.
+            if now - supervised.started_at < self.min_restart_interval:
+                continue
+
+            self.logger.warning("Restart %s process. It %s.", supervised.name, reason)
+            self._stop_process(supervised)
+            supervised.restart_count += 1
+            self._start_process(supervised)
+
+    def run(self) -> None:
+        """Start all processes and supervise them until `stop` is called."""
+        self.start()
+        try:
+            while self.RUNNING:
+                conns = {supervised.conn: supervised for supervised in self.processes.values() if supervised.conn is not None and not supervised.is_failed}
+                for conn in wait(list(conns.keys()), timeout=self.poll_interval):
+                    self._handle_heartbeat(conns[conn])
+
+                self._check_processes()
+                if self.usage_interval is not None and time.monotonic() - self.last_usage_at >= self.usage_interval:
+                    self.sample_usage()
+        finally:
+            for supervised in self.processes.values():
+                self._stop_process(supervised)
+
+    def stop(self) -> None:
+        self.RUNNING = False
@@ -1,24 +1,76 @@
 from typing import Dict, Tuple, Optional
+import sys
+import asyncio
+import ctypes
+import queue
 import time
 from datetime import datetime
 import hmac
 import hashlib
 import multiprocessing as mp
+import multiprocessing.context
+
+sys.path.append(".")
+from gmo_hft_bot.utils.db_writer import BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_POLICIES
+
+# Backoff of the retries of a full queue with BACKPRESSURE_BLOCK in the event loop (seconds).
+QUEUE_FULL_MIN_DELAY = 0.001
+QUEUE_FULL_MAX_DELAY = 0.05
 
 
 class QueueAndTradeManager:
-    def __init__(self, api_key: str, api_secret: str) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        api_secret: str,
+        orderbook_queue_maxsize: int = 100,
+        ticks_queue_maxsize: int = 100000,
+        orderbook_backpressure: str = BACKPRESSURE_DROP_OLDEST,
+        ticks_backpressure: str = BACKPRESSURE_BLOCK,
+        context: Optional[multiprocessing.context.BaseContext] = None,
+    ) -> None:
+        """
+        Args:
+            api_key (str): API key of the exchange.
+            api_secret (str): API secret of the exchange.
+            orderbook_queue_maxsize (int, optional): Max boards in the queue. 0 for unbounded. Defaults to 100.
+            ticks_queue_maxsize (int, optional): Max ticks in the queue. 0 for unbounded. Defaults to 100000.
+            orderbook_backpressure (str, optional): Policy when the board queue is full (one of BACKPRESSURE_POLICIES of
+                utils/db_writer.py). Defaults to BACKPRESSURE_DROP_OLDEST, since a board supersedes the older ones.
+            ticks_backpressure (str, optional): Policy when the tick queue is full. Defaults to BACKPRESSURE_BLOCK: ticks are
+                never dropped, since bars are built from them. The websocket waits (without blocking its event loop, see
+                `add_ticks_queue_async`) and the consumer alerts.
+            context (Optional[multiprocessing.context.BaseContext], optional): Context of the processes which share this
+                manager (e.g. `ProcessSupervisor.context`). The queues and the shared values are created with it.
+                Defaults to None (the default context).
+
+        Raises:
+            ValueError: If a backpressure policy is unknown.
+        """
         self.enable_trade = False
         if api_key is None or api_secret is None:
             raise ValueError("api_key or api_secret is None. Check your .env file.")
+        for backpressure in (orderbook_backpressure, ticks_backpressure):
+            if backpressure not in BACKPRESSURE_POLICIES:
+                raise ValueError(f"Invalid backpressure {backpressure}. It should be in {BACKPRESSURE_POLICIES}")
 
         self.api_key = api_key
         self.api_secret = api_secret
         self.http_request_private_baseurl = "https://api.coin.z.com/private"
-        self.orderbook_queue = mp.Manager().Queue()
-        self.ticks_queue = mp.Manager().Queue()
-
-        self.subprocesses_info = mp.Manager().dict({"is_subprocesses_alive": True})
+        context = context or mp.get_context()
+        # One manager process serves both queues. The proxies keep it alive, and it is not pickled with this object.
+        manager = context.Manager()
+        self.orderbook_queue = manager.Queue(orderbook_queue_maxsize)
+        self.ticks_queue = manager.Queue(ticks_queue_maxsize)
+        self.orderbook_backpressure = orderbook_backpressure
+        self.ticks_backpressure = ticks_backpressure
+        # Times the queues were full: dropped items, or waits of the websocket for BACKPRESSURE_BLOCK. Written by the
+        # websocket process only and read by the consumers, like `subprocesses_alive`.
+        self.orderbook_queue_overflows = context.RawValue(ctypes.c_long, 0)
+        self.ticks_queue_overflows = context.RawValue(ctypes.c_long, 0)
+
+        # Shared-memory flag written by ProcessSupervisor. Reading it costs no IPC, so the feed loops check it per message.
+        self.subprocesses_alive = context.RawValue(ctypes.c_bool, True)
 
     def __del__(self):
         import time
@@ -26,16 +78,17 @@ class QueueAndTradeManager:
         # Sometime, Broken pipe error raises becase main process finishes faster than Queue.close().
         time.sleep(0.01)
 
-    def is_subprocesses_alive(self):
-        return self.subprocesses_info["is_subprocesses_alive"]
+    def is_subprocesses_alive(self) -> bool:
+        return self.subprocesses_alive.value
 
     def update_subprocesses_alive_status(self, status: bool) -> None:
-        self.subprocesses_info["is_subprocesses_alive"] = status
+        self.subprocesses_alive.value = status
 
-    def http_headers(self, method: str, endpint: str):
+    def http_headers(self, method: str, endpint: str, body: str = ""):
         timestamp = "{0}000".format(int(time.mktime(datetime.now().timetuple())))
 
-        text = timestamp + method + endpint
+        # The JSON body of a POST is signed too.
+        text = timestamp + method + endpint + body
         sign = hmac.new(bytes(self.api_secret.encode("ascii")), bytes(text.encode("ascii")), hashlib.sha256).hexdigest()
 
         headers = {"API-KEY": self.api_key, "API-TIMESTAMP": timestamp, "API-SIGN": sign}
@@ -80,9 +133,80 @@ class QueueAndTradeManager:
     def _disable_trade(self):
         self.enable_trade = False
 
-    def add_orderbook_queue(self, item: Dict):
-        # self.orderbook_queue.put_nowait(item)
-        self.orderbook_queue.put(item)
+    @staticmethod
+    def _put(bounded_queue, item: Dict, backpressure: str, overflows) -> bool:
+        """Put `item` to `bounded_queue` with the `backpressure` policy. BACKPRESSURE_BLOCK blocks the caller, so event
+        loops use `_put_async`.
+
+        Returns:
+            bool: False if the queue was full.
+        """
+        try:
+            bounded_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        overflows.value += 1
+        if backpressure == BACKPRESSURE_BLOCK:
+            bounded_queue.put(item)
+        elif backpressure == BACKPRESSURE_DROP_OLDEST:
+            while True:
+                try:
+                    bounded_queue.get_nowait()
+                except queue.Empty:
+                    # The consumer has taken the items meanwhile.
+                    pass
+                try:
+                    bounded_queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    pass
+        # Otherwise (BACKPRESSURE_DROP_NEWEST) `item` is dropped.
+        return False
+
+    @classmethod
+    async def _put_async(cls, bounded_queue, item: Dict, backpressure: str, overflows) -> bool:
+        """`_put` which does not block the event loop: a full queue with BACKPRESSURE_BLOCK is retried with a backoff
+        from QUEUE_FULL_MIN_DELAY to QUEUE_FULL_MAX_DELAY, so other coroutines (pings of the websocket) keep running.
+
+        Returns:
+            bool: False if the queue was full.
+        """
+        if backpressure != BACKPRESSURE_BLOCK:
+            # The other policies never wait.
+            return cls._put(bounded_queue, item, backpressure, overflows)
+        try:
+            bounded_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        overflows.value += 1
+        delay = QUEUE_FULL_MIN_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                bounded_queue.put_nowait(item)
+                return False
+            except queue.Full:
+                delay = min(delay * 2, QUEUE_FULL_MAX_DELAY)
+
+    def add_orderbook_queue(self, item: Dict) -> bool:
+        """Queue a board.
+
+        Returns:
+            bool: False if the queue was full (see `orderbook_backpressure`).
+        """
+        return self._put(self.orderbook_queue, item, self.orderbook_backpressure, self.orderbook_queue_overflows)
+
+    async def add_orderbook_queue_async(self, item: Dict) -> bool:
+        """Queue a board from an event loop, which keeps running while the queue is full.
+
+        Returns:
+            bool: False if the queue was full (see `orderbook_backpressure`).
+        """
+        return await self._put_async(self.orderbook_queue, item, self.orderbook_backpressure, self.orderbook_queue_overflows)
 
     def get_orderbook_queue_size(self):
         return self.orderbook_queue.qsize()
@@ -91,9 +215,21 @@ class QueueAndTradeManager:
         # return self.orderbook_queue.get_nowait()
         return self.orderbook_queue.get(block=True, timeout=0.05)
 
-    def add_ticks_queue(self, item: Dict):
-        # self.ticks_queue.put_nowait(item)
-        self.ticks_queue.put(item)
+    def add_ticks_queue(self, item: Dict) -> bool:
+        """Queue a tick.
+
+        Returns:
+            bool: False if the queue was full (see `ticks_backpressure`).
+        """
+        return self._put(self.ticks_queue, item, self.ticks_backpressure, self.ticks_queue_overflows)
+
+    async def add_ticks_queue_async(self, item: Dict) -> bool:
+        """Queue a tick from an event loop, which keeps running while the queue is full.
+
+        Returns:
+            bool: False if the queue was full (see `ticks_backpressure`).
+        """
+        return await self._put_async(self.ticks_queue, item, self.ticks_backpressure, self.ticks_queue_overflows)
 
     def get_ticks_queue_item(self):
         # return self.ticks_queue.get_nowait()
@@ -101,3 +237,9 @@ class QueueAndTradeManager:
 
     def get_ticks_queue_size(self):
         return self.ticks_queue.qsize()
+
+    def get_orderbook_queue_overflows(self) -> int:
+        return self.orderbook_queue_overflows.value
+
+    def get_ticks_queue_overflows(self) -> int:
+        return self.ticks_queue_overflows.value
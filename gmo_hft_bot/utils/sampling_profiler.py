@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, Iterable, List, Optional, Tuple
+
+sys.path.append(".")
+from gmo_hft_bot.utils.process_supervisor import COMMAND_TOGGLE_PROFILER, Heartbeat
+
+# Tag of samples taken while the event loop waits for IO.
+IDLE_TAG = "idle"
+# Tag of samples which are not inside a tagged coroutine.
+UNTAGGED = "other"
+
+
+class SamplingProfiler:
+    """Opt-in wall-clock sampling profiler of the main thread, which runs the event loop of the bot processes.
+
+    While running, a real-time interval timer (SIGALRM) fires every `interval` seconds and its handler, which
+    Python runs in the main thread, records the current stack. Nothing is traced, so the cost is one stack walk
+    per sample. Time blocked in C calls (sqlite, select) is attributed to the caller when the call returns.
+    Samples are tagged with the coroutine they belong to, which is found by the code object of `run` of
+    `tag_classes` (e.g. `TickQueueManager`), or `idle` while the event loop waits for IO. On stop, samples are
+    written in the collapsed-stack format (`tag;frame;frame count`) which flamegraph.pl and speedscope read, to
+    `{output_dir}/{name}-{pid}-{start time}.collapsed`.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        name: str,
+        tag_classes: Iterable[type] = (),
+        interval: float = 0.01,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """
+        Args:
+            output_dir (str): Directory of output files.
+            name (str): Name of process. Used in the file name.
+            tag_classes (Iterable[type], optional): Classes whose `run` tags samples. Defaults to ().
+            interval (float, optional): Sampling interval (seconds). Defaults to 0.01.
+            logger (Optional[logging.Logger], optional): logger. Defaults to None.
+        """
+        self.output_dir = output_dir
+        self.name = name
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.tag_codes: Dict[CodeType, str] = {cls.run.__code__: cls.__name__ for cls in tag_classes}
+        self.samples: Counter = Counter()
+        self.output_path: Optional[str] = None
+        self._is_running = False
+        self._writer: Optional[threading.Thread] = None
+
+    def is_running(self) -> bool:
+        return self._is_running
+
+    def start(self) -> None:
+        """Start sampling. Call from the main thread (signal handlers only run there)."""
+        if self._is_running:
+            return
+        self.samples = Counter()
+        self.output_path = os.path.join(self.output_dir, f"{self.name}-{os.getpid()}-{time.strftime('%Y%m%d%H%M%S')}.collapsed")
+        signal.signal(signal.SIGALRM, self._sample)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+        self._is_running = True
+        self.logger.info("Started sampling profiler of %s process", self.name)
+
+    def stop(self) -> None:
+        """Stop sampling. Samples are written by a background thread so that the event loop is not blocked."""
+        if not self._is_running:
+            return
+        signal.setitimer(signal.ITIMER_REAL, 0, 0)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        self._is_running = False
+        self._writer = threading.Thread(target=self.write, args=(self.output_path, self.samples), name=f"{self.name}-profiler-writer")
+        self._writer.start()
+
+    def toggle(self) -> None:
+        if self._is_running:
+            self.stop()
+        else:
+            self.start()
+
+    def join(self) -> None:
+        """Wait for the output of the last run."""
+        if self._writer is not None:
+            self._writer.join()
+
+    def _frame_label(self, code: CodeType) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _collapse(self, frame: Optional[FrameType]) -> Tuple[str, ...]:
+        labels: List[str] = []
+        tag = None
+        leaf_code = frame.f_code if frame is not None else None
+        while frame is not None:
+            code = frame.f_code
+            labels.append(self._frame_label(code))
+            if tag is None:
+                tag = self.tag_codes.get(code)
+            frame = frame.f_back
+
+        if tag is None:
+            # The loop is in select() when there is nothing to do.
+            tag = IDLE_TAG if leaf_code is not None and leaf_code.co_name in ("select", "poll") else UNTAGGED
+
+        labels.append(tag)
+        return tuple(reversed(labels))
+
+    def _sample(self, signum: int, frame: Optional[FrameType]) -> None:
+        self.samples[self._collapse(frame)] += 1
+
+    def write(self, path: str, samples: Counter) -> None:
+        """Write samples in the collapsed-stack format.
+
+        Args:
+            path (str): Output file path.
+            samples (Counter): Number of samples per stack.
+        """
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{';'.join(stack)} {count}\n")
+            self.logger.info("Wrote %d profiler samples of %s process to %s", sum(samples.values()), self.name, path)
+        except OSError:
+            self.logger.exception("Failed to write profiler samples")
+
+
+def install_profiler_signal_handler(profiler: SamplingProfiler, signum: int = signal.SIGUSR2) -> None:
+    """Toggle `profiler` when the process receives `signum` (e.g. `kill -USR2 <pid>`).
+
+    Args:
+        profiler (SamplingProfiler): Profiler.
+        signum (int, optional): Signal number. Defaults to signal.SIGUSR2.
+    """
+    signal.signal(signum, lambda *_: profiler.toggle())
+
+
+def attach_profiler(
+    output_dir: Optional[str],
+    name: str,
+    tag_classes: Iterable[type],
+    logger: logging.Logger,
+    heartbeat: Optional[Heartbeat] = None,
+) -> Optional[SamplingProfiler]:
+    """Make a process profilable at runtime. The profiler is toggled by SIGUSR2 and by COMMAND_TOGGLE_PROFILER
+    from ProcessSupervisor, and costs nothing until then.
+
+    Args:
+        output_dir (Optional[str]): Directory of output files. If None, profiling is disabled.
+        name (str): Name of process.
+        tag_classes (Iterable[type]): Classes whose `run` tags samples.
+        logger (logging.Logger): logger
+        heartbeat (Optional[Heartbeat], optional): Heartbeat of the process. Defaults to None.
+
+    Returns:
+        Optional[SamplingProfiler]: Profiler. None if disabled.
+    """
+    if output_dir is None:
+        return None
+
+    profiler = SamplingProfiler(output_dir=output_dir, name=name, tag_classes=tag_classes, logger=logger)
+    install_profiler_signal_handler(profiler)
+    if heartbeat is not None:
+        heartbeat.add_command_handler(COMMAND_TOGGLE_PROFILER, profiler.toggle)
+    return profiler
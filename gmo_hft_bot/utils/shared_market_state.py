@@ -0,0 +1,404 @@
+"""Market state of the queue and trade process in shared memory, for the other processes of the host.
+
+The queue consumers publish the top levels of the board, the last trade and the latest bars of the trading timeframe
+to one shared memory segment per symbol (`/dev/shm/gmo_hft_bot_<symbol>`). A risk monitor, a dashboard or another
+strategy reads them with SharedMarketStateReader instead of polling the database.
+
+The segment is a seqlock: the writer makes the sequence odd, writes, and makes it even again. A reader copies the
+segment and keeps the copy if the sequence was the same even number before and after, or retries. Readers take no
+lock and never block the writer. They make no syscall unless a write is in progress, when they yield the core and back
+off until it ends. There must be one writer per symbol (the consumers run on one event loop). Stores of the writer
+are seen in program order on x86-64 (TSO), which this relies on.
+"""
+
+import sys
+import time
+from decimal import Decimal
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+sys.path.append(".")
+from gmo_hft_bot.db import records
+from gmo_hft_bot.utils.custom_exceptions import SharedStateReadError
+from gmo_hft_bot.utils.fixed_point import SymbolSpec, get_symbol_spec
+from gmo_hft_bot.utils.orderbook_kernels import BookArrays
+
+SHARED_MARKET_STATE_MAGIC = 0x474D4F31
+SHARED_MARKET_STATE_VERSION = 1
+
+# Side of the last trade.
+TRADE_SIDE_NONE = 0
+TRADE_SIDE_BUY = 1
+TRADE_SIDE_SELL = -1
+
+# Time a reader waits for a write in progress, which takes microseconds, before it gives up (seconds).
+READ_TIMEOUT = 0.05
+# Backoff of the sleeps between the retries of a reader (seconds). The first retry only yields the core.
+READ_MIN_BACKOFF = 0.00001
+READ_MAX_BACKOFF = 0.001
+
+# Written once when the segment is created.
+_HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "<u4"),
+        ("version", "<u4"),
+        ("levels", "<u4"),
+        ("bars", "<u4"),
+        ("tick_size", "<f8"),
+        ("size_step", "<f8"),
+        ("symbol", "S32"),
+        ("timeframe", "S16"),
+    ]
+)
+# Before Python 3.13, every segment is registered to the resource tracker, which unlinks it when the process exits.
+_HAS_TRACK_ARGUMENT = sys.version_info >= (3, 13)
+
+# Bytes of the sequence. The header starts after it and the body after the header.
+_SEQUENCE_SIZE = 8
+_HEADER_SLICE = slice(_SEQUENCE_SIZE, _SEQUENCE_SIZE + _HEADER_DTYPE.itemsize)
+_BODY_OFFSET = _HEADER_SLICE.stop
+
+BAR_DTYPE = np.dtype([("timestamp", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"), ("volume", "<f8")])
+
+
+def _body_dtype(levels: int, bars: int) -> np.dtype:
+    return np.dtype(
+        [
+            # Board: ticks and lots from the best level.
+            ("board_timestamp", "<i8"),
+            ("bid_count", "<i8"),
+            ("ask_count", "<i8"),
+            ("bid_prices", "<i8", (levels,)),
+            ("bid_sizes", "<i8", (levels,)),
+            ("ask_prices", "<i8", (levels,)),
+            ("ask_sizes", "<i8", (levels,)),
+            # Last trade: ticks and lots.
+            ("trade_timestamp", "<i8"),
+            ("trade_price", "<i8"),
+            ("trade_size", "<i8"),
+            ("trade_side", "<i8"),
+            # Ring of the latest bars. `bar_head` is the index of the newest bar.
+            ("bar_count", "<i8"),
+            ("bar_head", "<i8"),
+            ("bars", BAR_DTYPE, (bars,)),
+        ]
+    )
+
+
+def shared_market_state_name(symbol: str) -> str:
+    """Name of the shared memory segment of `symbol`."""
+    return f"gmo_hft_bot_{symbol}"
+
+
+def _open(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Open a segment, without letting the resource tracker unlink it when this process exits."""
+    if _HAS_TRACK_ARGUMENT:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def _unlink(segment: shared_memory.SharedMemory) -> None:
+    if not _HAS_TRACK_ARGUMENT:
+        # `unlink` unregisters the segment from the resource tracker again.
+        resource_tracker.register(segment._name, "shared_memory")
+    segment.close()
+    segment.unlink()
+
+
+def unlink_shared_market_state(symbol: str) -> bool:
+    """Remove the segment of `symbol` (at shutdown of the bot). Readers attached to it keep the last state.
+
+    Returns:
+        bool: False if there is no segment.
+    """
+    try:
+        segment = _open(shared_market_state_name(symbol))
+    except FileNotFoundError:
+        return False
+    _unlink(segment)
+    return True
+
+
+class SharedMarketStateConfig(NamedTuple):
+    """Size of the shared market state. Picklable, so that it can be passed to multiprocessing targets."""
+
+    # Levels of each side of the board.
+    levels: int = 10
+    # Latest bars of the trading timeframe.
+    bars: int = 100
+
+
+class SharedMarketStateWriter:
+    """Publish the market state of `symbol` to shared memory.
+
+    The segment outlives the writer, so that readers keep reading it across restarts of the queue and trade process.
+    Remove it with `unlink_shared_market_state` at shutdown.
+    """
+
+    def __init__(self, symbol: str, timeframe: str, config: SharedMarketStateConfig = SharedMarketStateConfig(), spec: Optional[SymbolSpec] = None):
+        """
+        Args:
+            symbol (str): Name of symbol.
+            timeframe (str): Timeframe of the published bars (e.g. "5s").
+            config (SharedMarketStateConfig, optional): Size of the segment. Defaults to SharedMarketStateConfig().
+            spec (Optional[SymbolSpec], optional): Units of prices and sizes, for the readers. Defaults to None (`get_symbol_spec(symbol)`).
+        """
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.config = config
+        spec = spec or get_symbol_spec(symbol)
+
+        header = np.zeros((), dtype=_HEADER_DTYPE)
+        header["magic"] = SHARED_MARKET_STATE_MAGIC
+        header["version"] = SHARED_MARKET_STATE_VERSION
+        header["levels"] = config.levels
+        header["bars"] = config.bars
+        header["tick_size"] = float(spec.tick_size)
+        header["size_step"] = float(spec.size_step)
+        header["symbol"] = symbol.encode("ascii")
+        header["timeframe"] = timeframe.encode("ascii")
+        body_dtype = _body_dtype(config.levels, config.bars)
+        size = _BODY_OFFSET + body_dtype.itemsize
+
+        name = shared_market_state_name(symbol)
+        try:
+            segment = _open(name)
+            # Reuse the segment of the previous run if it has the same layout, so that the readers keep it.
+            if segment.size < size or bytes(segment.buf[_HEADER_SLICE]) != header.tobytes():
+                _unlink(segment)
+                segment = None
+        except FileNotFoundError:
+            segment = None
+        if segment is None:
+            segment = _open(name, create=True, size=size)
+            segment.buf[_HEADER_SLICE] = header.tobytes()
+        self._segment = segment
+
+        self._sequence = np.ndarray((1,), dtype="<u8", buffer=segment.buf, offset=0)
+        self._body = np.ndarray((), dtype=body_dtype, buffer=segment.buf, offset=_BODY_OFFSET)
+        if self._sequence[0] % 2 == 1:
+            # The previous writer stopped in the middle of a write.
+            self._sequence[0] += 1
+        self.writes = 0
+
+    @property
+    def sequence(self) -> int:
+        return int(self._sequence[0])
+
+    def _begin(self) -> None:
+        self._sequence[0] += 1
+
+    def _end(self) -> None:
+        self._sequence[0] += 1
+        self.writes += 1
+
+    def publish_book(self, book: BookArrays, timestamp: int) -> None:
+        """Publish the top levels of a board.
+
+        Args:
+            book (BookArrays): Board ordered from the best level (e.g. `LiveMarketState.book`).
+            timestamp (int): Unix timestamp (ms) of the board.
+        """
+        levels = self.config.levels
+        bid_count = min(book.bid_prices.size, levels)
+        ask_count = min(book.ask_prices.size, levels)
+        body = self._body
+        self._begin()
+        body["board_timestamp"] = timestamp
+        body["bid_count"] = bid_count
+        body["ask_count"] = ask_count
+        body["bid_prices"][:bid_count] = book.bid_prices[:bid_count]
+        body["bid_sizes"][:bid_count] = book.bid_sizes[:bid_count]
+        body["ask_prices"][:ask_count] = book.ask_prices[:ask_count]
+        body["ask_sizes"][:ask_count] = book.ask_sizes[:ask_count]
+        self._end()
+
+    def publish_trade(self, tick: records.Tick) -> None:
+        """Publish the last trade."""
+        body = self._body
+        self._begin()
+        body["trade_timestamp"] = tick.timestamp
+        body["trade_price"] = tick.price
+        body["trade_size"] = tick.size
+        body["trade_side"] = TRADE_SIDE_BUY if tick.side == "BUY" else TRADE_SIDE_SELL
+        self._end()
+
+    def publish_bars(self, bars: Sequence[records.Bar]) -> int:
+        """Publish new and updated bars (e.g. the return of `MultiTimeframeBarBuilder.drain_updates`).
+
+        Bars of other timeframes and bars older than the newest published bar are ignored. A bar at the time of the newest
+        bar replaces it, since the open bar is updated until it closes.
+
+        Returns:
+            int: Number of published bars.
+        """
+        bars = [bar for bar in bars if bar.timeframe == self.timeframe]
+        if len(bars) == 0:
+            return 0
+        body = self._body
+        ring = body["bars"]
+        capacity = self.config.bars
+        published = 0
+        self._begin()
+        try:
+            for bar in bars:
+                head = int(body["bar_head"])
+                count = int(body["bar_count"])
+                if count > 0:
+                    newest_timestamp = int(ring[head]["timestamp"])
+                    if bar.timestamp < newest_timestamp:
+                        continue
+                    if bar.timestamp > newest_timestamp:
+                        head = (head + 1) % capacity
+                        count = min(count + 1, capacity)
+                else:
+                    head, count = 0, 1
+                ring[head] = (bar.timestamp, bar.open, bar.high, bar.low, bar.close, bar.volume)
+                body["bar_head"] = head
+                body["bar_count"] = count
+                published += 1
+        finally:
+            self._end()
+        return published
+
+    def close(self) -> None:
+        """Detach from the segment. The segment is kept."""
+        del self._sequence, self._body
+        self._segment.close()
+
+
+class SharedMarketSnapshot(NamedTuple):
+    """Consistent copy of the shared market state."""
+
+    symbol: str
+    timeframe: str
+    # Sequence of the copy. It grows by 2 per write, so that a reader can tell whether anything has changed.
+    sequence: int
+    # Units of the prices and sizes of `book` and `last_trade`.
+    spec: SymbolSpec
+    # Unix timestamp (ms) of the board. 0 until the first board.
+    board_timestamp: int
+    # Top levels in ticks and lots, from the best level (the arrays of utils/orderbook_kernels.py).
+    book: BookArrays
+    # None until the first trade.
+    last_trade: Optional[records.Tick]
+    # Latest bars of `timeframe` (BAR_DTYPE, prices and sizes), oldest first.
+    bars: np.ndarray
+
+    def best_prices(self) -> Tuple[Optional[float], Optional[float]]:
+        """(best bid, best ask) prices. None for an empty side."""
+        best_bid = self.spec.to_price(self.book.bid_prices[0]) if self.book.bid_prices.size > 0 else None
+        best_ask = self.spec.to_price(self.book.ask_prices[0]) if self.book.ask_prices.size > 0 else None
+        return best_bid, best_ask
+
+
+class SharedMarketStateReader:
+    """Read the market state of `symbol` published by SharedMarketStateWriter, from any process of the host.
+
+    Example:
+        with SharedMarketStateReader("BTC_JPY") as reader:
+            snapshot = reader.read()
+            best_bid, best_ask = snapshot.best_prices()
+    """
+
+    def __init__(self, symbol: str):
+        """
+        Args:
+            symbol (str): Name of symbol.
+
+        Raises:
+            FileNotFoundError: If no writer has published the symbol.
+            SharedStateReadError: If the segment has another layout version.
+        """
+        self._segment = _open(shared_market_state_name(symbol))
+        header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=self._segment.buf, offset=_SEQUENCE_SIZE).copy()[()]
+        if header["magic"] != SHARED_MARKET_STATE_MAGIC or header["version"] != SHARED_MARKET_STATE_VERSION:
+            self._segment.close()
+            raise SharedStateReadError(f"Unknown shared market state of {symbol}: magic={header['magic']:#x} version={header['version']}")
+        self.symbol = header["symbol"].decode("ascii")
+        self.timeframe = header["timeframe"].decode("ascii")
+        self.spec = SymbolSpec(self.symbol, Decimal(str(header["tick_size"])), Decimal(str(header["size_step"])))
+        self._sequence = np.ndarray((1,), dtype="<u8", buffer=self._segment.buf, offset=0)
+        self._body = np.ndarray((), dtype=_body_dtype(int(header["levels"]), int(header["bars"])), buffer=self._segment.buf, offset=_BODY_OFFSET)
+        # Reads which found a write in progress.
+        self.retries = 0
+
+    def __enter__(self) -> "SharedMarketStateReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def sequence(self) -> int:
+        """Current sequence. Cheap to poll for changes before `read`."""
+        return int(self._sequence[0])
+
+    def read_raw(self, timeout: float = READ_TIMEOUT):
+        """Consistent copy of the body (a numpy structured scalar) and its sequence.
+
+        Args:
+            timeout (float, optional): Time to wait for a write in progress (seconds). Defaults to READ_TIMEOUT.
+
+        Raises:
+            SharedStateReadError: If a write is in progress for `timeout` seconds (the writer died in the middle of a write).
+        """
+        deadline = None
+        delay = 0.0
+        while True:
+            before = int(self._sequence[0])
+            if before % 2 == 0:
+                body = self._body.copy()
+                if int(self._sequence[0]) == before:
+                    return body, before
+            self.retries += 1
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + timeout
+            elif now >= deadline:
+                raise SharedStateReadError(f"Shared market state of {self.symbol} is being written for {timeout * 1000:.0f} ms")
+            # Let the writer finish, if it runs on the same core.
+            time.sleep(delay)
+            delay = min(max(delay * 2, READ_MIN_BACKOFF), READ_MAX_BACKOFF)
+
+    def read(self, timeout: float = READ_TIMEOUT) -> SharedMarketSnapshot:
+        """Consistent snapshot of the market state. See `read_raw`."""
+        body, sequence = self.read_raw(timeout)
+        bid_count = int(body["bid_count"])
+        ask_count = int(body["ask_count"])
+        last_trade = None
+        if body["trade_timestamp"] > 0:
+            last_trade = records.Tick(
+                timestamp=int(body["trade_timestamp"]),
+                price=int(body["trade_price"]),
+                size=int(body["trade_size"]),
+                side="BUY" if body["trade_side"] == TRADE_SIDE_BUY else "SELL",
+                symbol=self.symbol,
+            )
+        capacity = body["bars"].shape[0]
+        count = int(body["bar_count"])
+        # Oldest first.
+        indices = (int(body["bar_head"]) - np.arange(count - 1, -1, -1)) % capacity
+        return SharedMarketSnapshot(
+            symbol=self.symbol,
+            timeframe=self.timeframe,
+            sequence=sequence,
+            spec=self.spec,
+            board_timestamp=int(body["board_timestamp"]),
+            book=BookArrays(
+                bid_prices=body["bid_prices"][:bid_count],
+                bid_sizes=body["bid_sizes"][:bid_count],
+                ask_prices=body["ask_prices"][:ask_count],
+                ask_sizes=body["ask_sizes"][:ask_count],
+            ),
+            last_trade=last_trade,
+            bars=body["bars"][indices],
+        )
+
+    def close(self) -> None:
+        del self._sequence, self._body
+        self._segment.close()
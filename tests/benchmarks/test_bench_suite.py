@@ -0,0 +1,58 @@
+import sys
+import unittest
+
+sys.path.append(".")
+from benchmarks.bench_suite import BenchmarkCase, compare_with_baseline, run_case
+
+
+def dummy_report(results: dict) -> dict:
+    return {"meta": {}, "results": results}
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_compare_with_baseline(self):
+        baseline = dummy_report(
+            {"ok": {"us_per_item": 100.0}, "slow": {"us_per_item": 100.0}, "fast": {"us_per_item": 100.0}, "broken": {"us_per_item": 100.0}}
+        )
+        report = dummy_report(
+            {
+                "ok": {"us_per_item": 110.0},
+                "slow": {"us_per_item": 130.0},
+                "fast": {"us_per_item": 50.0},
+                "broken": {"error": "TypeError: dummy"},
+                "added": {"us_per_item": 10.0},
+            }
+        )
+        statuses = {comparison["name"]: comparison["status"] for comparison in compare_with_baseline(report, baseline, threshold=0.2)}
+        self.assertEqual(statuses, {"ok": "ok", "slow": "regression", "fast": "improvement", "broken": "error", "added": "new"})
+
+        with self.subTest("More young collections"):
+            baseline = dummy_report(
+                {"more": {"us_per_item": 100.0, "gc_collections_per_1k_items": 2.0}, "few": {"us_per_item": 100.0, "gc_collections_per_1k_items": 0.1}}
+            )
+            report = dummy_report(
+                {"more": {"us_per_item": 100.0, "gc_collections_per_1k_items": 4.0}, "few": {"us_per_item": 100.0, "gc_collections_per_1k_items": 0.5}}
+            )
+            statuses = {comparison["name"]: comparison["status"] for comparison in compare_with_baseline(report, baseline, threshold=0.2)}
+            self.assertEqual(statuses, {"more": "allocation_regression", "few": "ok"})
+
+    def test_run_case(self):
+        calls = []
+        result = run_case(BenchmarkCase("dummy", lambda: lambda: calls.append(1), number=10, items_per_call=2), repeat=3)
+        self.assertEqual(result["calls"], 30)
+        # Includes the warm up call and the calls measuring allocations.
+        self.assertEqual(len(calls), 41)
+        self.assertGreater(result["items_per_second"], 0)
+        self.assertGreaterEqual(result["retained_blocks_per_item"], 0.0)
+
+        with self.subTest("Record error instead of raising"):
+
+            def failing_setup():
+                raise ValueError("dummy")
+
+            result = run_case(BenchmarkCase("failing", failing_setup, number=1))
+            self.assertEqual(result["error"], "ValueError: dummy")
+
+
+if __name__ == "__main__":
+    unittest.main()
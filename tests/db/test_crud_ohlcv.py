@@ -3,6 +3,8 @@ import unittest
 import sys
 from dateutil import parser
 
+from sqlalchemy import event, text
+
 from tests.utils import response_schemas
 
 sys.path.append("./gmo-websocket/")
@@ -157,7 +159,7 @@ class TestCrudOHLCV(unittest.TestCase):
         timestamp = parser.parse(dummy_timestamp).timestamp() * 1000
         timestamp = (timestamp // (time_span * 1000)) * time_span
         insert_items = [
-            schemas.OHLCV(timestamp=timestamp, open=50.0, high=60.0, low=20.0, close=30.0, volume=15.0, symbol=self.dummy_symbol),
+            schemas.OHLCV(timestamp=timestamp, open=50.0, high=60.0, low=20.0, close=30.0, volume=15.0, symbol=self.dummy_symbol, timeframe="2s"),
         ]
         with SessionLocal() as db:
             crud.create_ohlcv_from_ticks(db=db, symbol=self.dummy_symbol, time_span=time_span)
@@ -169,12 +171,81 @@ class TestCrudOHLCV(unittest.TestCase):
         self.assertEqual(rows, 1)
         self.assertEqual(ohlc_row.timestamp, timestamp)
 
+    def test_timeframes_and_symbols_do_not_collide(self):
+        timestamp = 1648000000
+        items = [
+            schemas.OHLCVCreate(timestamp=timestamp, open=1.0, high=1.0, low=1.0, close=1.0, volume=1.0, symbol=symbol, timeframe=timeframe)
+            for symbol in [self.dummy_symbol, "Othercoin"]
+            for timeframe in ["1s", "5s"]
+        ]
+        with SessionLocal() as db:
+            crud.insert_ohlcv_items(db=db, insert_items=items, max_rows=1)
+
+            self.assertEqual(crud._count_ohlcv(db=db), 4)
+            self.assertEqual(crud._count_ohlcv(db=db, symbol=self.dummy_symbol, timeframe="5s"), 1)
+
+            with self.subTest("max_rows applies to each symbol and timeframe"):
+                newer_items = [items[0].copy(update={"timestamp": timestamp + i}) for i in [1, 2]]
+                crud.insert_ohlcv_items(db=db, insert_items=newer_items, max_rows=1)
+                res = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="1s")
+
+                self.assertEqual([item.timestamp for item in res], [timestamp + 1, timestamp + 2])
+                self.assertEqual(crud._count_ohlcv(db=db), 5)
+
+    def test_upsert_ohlcv_items(self):
+        timestamp = 1648000000
+        item = schemas.OHLCVCreate(timestamp=timestamp, open=1.0, high=1.0, low=1.0, close=1.0, volume=1.0, symbol=self.dummy_symbol, timeframe="5s")
+        with SessionLocal() as db:
+            crud.upsert_ohlcv_items(db=db, items=[item])
+            crud.upsert_ohlcv_items(db=db, items=[item.copy(update={"close": 2.0}), item.copy(update={"timestamp": timestamp + 5})])
+            res = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="5s")
+
+        self.assertEqual([(item.timestamp, item.close) for item in res], [(timestamp, 2.0), (timestamp + 5, 1.0)])
+
+    def test_upsert_ohlcv_items_in_one_statement(self):
+        timestamp = 1648000000
+        items = [
+            schemas.OHLCVCreate(timestamp=timestamp + i * 5, open=1.0, high=1.0, low=1.0, close=1.0, volume=1.0, symbol=self.dummy_symbol, timeframe="5s")
+            for i in range(10)
+        ]
+        statements = []
+
+        def count_statements(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with SessionLocal() as db:
+            crud.upsert_ohlcv_items(db=db, items=items[:5])
+            event.listen(database_engine, "before_cursor_execute", count_statements)
+            try:
+                changes = db.execute(text("select total_changes()")).scalar()
+                statements.clear()
+                # The open bar is updated, 4 stored bars are unchanged and 5 bars are new.
+                crud.upsert_ohlcv_items(db=db, items=[items[4].copy(update={"close": 2.0})] + items[:4] + items[5:], max_rows=8)
+                upsert_statements = list(statements)
+                new_changes = db.execute(text("select total_changes()")).scalar() - changes
+
+                statements.clear()
+                crud.upsert_ohlcv_items(db=db, items=[items[9].copy(update={"close": 3.0})], max_rows=8)
+                update_statements = list(statements)
+            finally:
+                event.remove(database_engine, "before_cursor_execute", count_statements)
+            res = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="5s")
+
+        # Newest bars of the series, the upsert and the trim.
+        self.assertEqual(len(upsert_statements), 3)
+        # 1 update, 5 inserts and 2 deleted bars.
+        self.assertEqual(new_changes, 8)
+        with self.subTest("No trim without a new bar"):
+            self.assertEqual(len(update_statements), 2)
+        self.assertEqual([item.timestamp for item in res], [timestamp + i * 5 for i in range(2, 10)])
+        self.assertEqual((res[2].close, res[-1].close), (2.0, 3.0))
+
     def test_update_ohlcv_items(self):
         time_span = 1
         timestamp = parser.parse(self.dummy_timestamps[0]).timestamp() * 1000
         timestamp = timestamp // (time_span * 1000)
 
-        update_items = [schemas.OHLCV(timestamp=timestamp, open=0.0, high=1.0, low=0.0, close=0.5, volume=2.0, symbol=self.dummy_symbol)]
+        update_items = [schemas.OHLCV(timestamp=timestamp, open=0.0, high=1.0, low=0.0, close=0.5, volume=2.0, symbol=self.dummy_symbol, timeframe="1s")]
         with SessionLocal() as db:
             crud.create_ohlcv_from_ticks(db=db, symbol=self.dummy_symbol, time_span=time_span)
 
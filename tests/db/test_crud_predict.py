@@ -0,0 +1,90 @@
+import sys
+import unittest
+
+import pandas as pd
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models, records, schemas
+from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils.freshness import FreshnessConfig
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+class TestCrudPredict(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        self.time_span = 5
+        models.Base.metadata.create_all(database_engine)
+        # 2018-03-30T12:35:00Z, aligned to 5 seconds. The decision is made 0.1 seconds after the bar closed.
+        self.bar_close = 1522413300
+        self.now = self.bar_close + 0.1
+        self.now_ms = int(self.now * 1000)
+        with SessionLocal() as db:
+            # Up candles, one bar missing.
+            bars = [
+                records.Bar(
+                    timestamp=self.bar_close - i * self.time_span,
+                    open=100.0,
+                    high=102.0,
+                    low=100.0,
+                    close=101.0,
+                    volume=1.0,
+                    symbol=self.dummy_symbol,
+                    timeframe="5s",
+                )
+                for i in [1, 2, 3, 5]
+            ]
+            crud.upsert_ohlcv_items(db=db, items=bars)
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    def _insert_board(self, timestamp: int):
+        board = records.Board(timestamp=timestamp, symbol=self.dummy_symbol, bids=(records.BookLevel(100, 10),), asks=(records.BookLevel(110, 10),))
+        with SessionLocal() as db:
+            crud.insert_board_items(db=db, insert_items=board)
+
+    def _prediction_info(self, **kwargs) -> records.Decision:
+        with SessionLocal() as db:
+            # Prefetched like Trader does.
+            items = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="5s")
+            prefetched_ohlcv_df = pd.DataFrame(
+                [[item.timestamp, item.open, item.high, item.low, item.close, item.volume, item.symbol] for item in items],
+                columns=["timestamp", "open", "high", "low", "close", "volume", "symbol"],
+            )
+            return crud.get_prediction_info(
+                db=db,
+                symbol=self.dummy_symbol,
+                prefetched_ohlcv_df=prefetched_ohlcv_df,
+                bar_close_timestamp=self.bar_close,
+                timeframe="5s",
+                now=self.now,
+                **kwargs,
+            )
+
+    def test_get_prediction_info_with_freshness(self):
+        self._insert_board(self.now_ms)
+        config = FreshnessConfig()
+        predict_info = self._prediction_info(freshness_config=config, last_tick_timestamp=self.now_ms)
+
+        # A missing bar downsizes the orders.
+        self.assertTrue(predict_info.is_buy_entry)
+        self.assertEqual(predict_info.freshness, schemas.FRESHNESS_PARTIAL_BARS)
+        self.assertEqual(predict_info.buy_size, self._prediction_info().buy_size * config.downsize_factor)
+        # Bar features of the 4 bars, then the depth imbalance and the weighted mid of the board.
+        self.assertEqual(len(predict_info.features), 4 * len(crud.PREDICTION_FEATURE_COLUMNS) + 2)
+        self.assertEqual(predict_info.features[-2:], [0.0, 105.0])
+
+        with self.subTest("Stale board"):
+            with SessionLocal() as db:
+                db.execute(models.Board.__table__.delete())
+                db.commit()
+            self._insert_board(self.now_ms - 60000)
+            predict_info = self._prediction_info(freshness_config=config, last_tick_timestamp=self.now_ms)
+            self.assertFalse(predict_info.is_buy_entry)
+            self.assertEqual(predict_info.freshness, schemas.FRESHNESS_STALE_BOOK | schemas.FRESHNESS_PARTIAL_BARS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import sys
+
+from tests.utils import response_schemas
+
+sys.path.append("./gmo-websocket/")
+from gmo_hft_bot.db import crud, models
+from gmo_hft_bot.db.database import initialize_database
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+class TestCrudRange(unittest.TestCase):
+    def __init__(self, methodName: str = ...) -> None:
+        super().__init__(methodName)
+        self.dummy_symbol = "Uncoin"
+        # 2018-03-30T12:34:56.000Z
+        self.start_timestamp = 1522413296000
+
+    def setUp(self) -> None:
+        models.Base.metadata.create_all(database_engine)
+        with SessionLocal() as db:
+            for i in range(5):
+                for symbol in [self.dummy_symbol, "Othercoin"]:
+                    crud.insert_tick_item(
+                        db=db,
+                        insert_item=response_schemas.TickResponseItem(
+                            channel="trades",
+                            price=str(100 + i),
+                            side="BUY",
+                            size="0.1",
+                            timestamp=f"2018-03-30T12:34:5{6 + i // 4}.{(i % 4) * 250:03d}Z",
+                            symbol=symbol,
+                        ).dict(),
+                    )
+            for i in range(3):
+                crud.insert_board_items(
+                    db=db,
+                    insert_items=response_schemas.BoardResponseItem(
+                        asks=[response_schemas.BidsAsks(price=str(110 + i), size="1"), response_schemas.BidsAsks(price=str(120 + i), size="2")],
+                        bids=[response_schemas.BidsAsks(price=str(90 + i), size="3")],
+                        symbol=self.dummy_symbol,
+                        timestamp=f"2018-03-30T12:34:5{6 + i}.000Z",
+                    ).dict(),
+                )
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    def test_get_ticks_in_range(self):
+        with SessionLocal() as db:
+            ticks = crud.get_ticks_in_range(
+                db=db, symbol=self.dummy_symbol, start_timestamp=self.start_timestamp + 250, end_timestamp=self.start_timestamp + 1000
+            )
+
+        self.assertEqual(ticks.dtype, crud.TICK_DTYPE)
+        self.assertEqual(ticks["timestamp"].tolist(), [self.start_timestamp + 250, self.start_timestamp + 500, self.start_timestamp + 750])
+        self.assertEqual(ticks["price"].tolist(), [101.0, 102.0, 103.0])
+
+        with self.subTest("Empty range"):
+            with SessionLocal() as db:
+                ticks = crud.get_ticks_in_range(db=db, symbol=self.dummy_symbol, start_timestamp=0, end_timestamp=1)
+            self.assertEqual(len(ticks), 0)
+
+        with self.subTest("As dataframe"):
+            with SessionLocal() as db:
+                df = crud.get_ticks_in_range(db=db, symbol=self.dummy_symbol, start_timestamp=0, end_timestamp=self.start_timestamp * 2, as_df=True)
+            self.assertEqual(list(df.columns), ["timestamp", "price", "size"])
+            self.assertEqual(len(df), 5)
+
+    def test_iter_ticks_in_range(self):
+        with SessionLocal() as db:
+            chunks = list(crud.iter_ticks_in_range(db=db, symbol=self.dummy_symbol, start_timestamp=0, end_timestamp=self.start_timestamp * 2, chunk_size=2))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(chunks[-1]["timestamp"][0], self.start_timestamp + 1000)
+
+    def test_get_boards_in_range(self):
+        with SessionLocal() as db:
+            boards = crud.get_boards_in_range(db=db, symbol=self.dummy_symbol, start_timestamp=self.start_timestamp + 1, end_timestamp=self.start_timestamp * 2)
+
+        self.assertEqual(boards.dtype, crud.BOARD_DTYPE)
+        self.assertEqual(boards["timestamp"].tolist(), [self.start_timestamp + 1000] * 3 + [self.start_timestamp + 2000] * 3)
+        self.assertEqual(boards["side"].tolist()[:3], ["BUY", "SELL", "SELL"])
+        self.assertEqual(boards["price"].tolist()[:3], [91.0, 111.0, 121.0])
+
+    def test_get_ticks_with_symbol(self):
+        with SessionLocal() as db:
+            crud.insert_tick_item(
+                db=db,
+                insert_item=response_schemas.TickResponseItem(
+                    channel="trades", price="1", side="SELL", size="0.1", timestamp="2018-03-30T12:35:00.000Z", symbol="Othercoin"
+                ).dict(),
+            )
+            newest_tick = crud.get_ticks(db=db, is_newer=True, limit=1, symbol=self.dummy_symbol)[0]
+
+        self.assertEqual(newest_tick.symbol, self.dummy_symbol)
+        self.assertEqual(newest_tick.timestamp, self.start_timestamp + 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
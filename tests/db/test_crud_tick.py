@@ -60,10 +60,11 @@ class TestCrudTick(unittest.TestCase):
             newer_tick_item = crud.get_ticks(db=db, is_newer=True, limit=1)
             older_tick_item = crud.get_ticks(db=db, is_newer=False, limit=1)
 
-        self.assertEqual(newer_tick_item[0].price, 200.0)
-        self.assertEqual(newer_tick_item[0].size, 0.2)
-        self.assertEqual(older_tick_item[0].price, 100.0)
-        self.assertEqual(older_tick_item[0].size, 0.1)
+        # Ticks of 1 and lots of 0.0001 (default spec).
+        self.assertEqual(newer_tick_item[0].price, 200)
+        self.assertEqual(newer_tick_item[0].size, 2000)
+        self.assertEqual(older_tick_item[0].price, 100)
+        self.assertEqual(older_tick_item[0].size, 1000)
 
     def test_delete_tick_items(self):
         # Create tick
@@ -132,3 +133,12 @@ class TestCrudTick(unittest.TestCase):
             rows = crud._count_ticks(db=db)
 
         self.assertEqual(rows, 1)
+
+        with self.subTest("Insert a batch in one commit"):
+            with SessionLocal() as db:
+                crud.insert_tick_items(db=db, insert_items=[item.dict() for item in insert_items], max_rows=2)
+                ticks = crud.get_ticks(db=db, is_newer=True, limit=10)
+
+            # The oldest tick is deleted.
+            self.assertEqual(len(ticks), 2)
+            self.assertEqual(sorted(tick.price for tick in ticks), [100, 200])
@@ -0,0 +1,186 @@
+import re
+import sys
+import unittest
+from typing import Callable, List, Optional
+
+from sqlalchemy import event, inspect
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models, schemas
+from gmo_hft_bot.db.database import initialize_database
+from tests.utils import response_schemas
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+# `SCAN <table>` without an index reads every row of the table.
+FULL_SCAN = re.compile(r"^SCAN (board|tick|ohlcv|predict)$")
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Assert `EXPLAIN QUERY PLAN` of the crud queries, so that a full scan does not slip back in."""
+
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        models.Base.metadata.create_all(database_engine)
+        with SessionLocal() as db:
+            for i in range(3):
+                crud.insert_tick_item(
+                    db=db,
+                    insert_item=response_schemas.TickResponseItem(
+                        channel="trades", price="100", side="BUY", size="0.1", timestamp=f"2018-03-30T12:34:5{6 + i}.000Z", symbol=self.dummy_symbol
+                    ).dict(),
+                )
+                crud.insert_board_items(
+                    db=db,
+                    insert_items=response_schemas.BoardResponseItem(
+                        asks=[response_schemas.BidsAsks(price="101", size="1")],
+                        bids=[response_schemas.BidsAsks(price="99", size="1")],
+                        symbol=self.dummy_symbol,
+                        timestamp=f"2018-03-30T12:34:5{6 + i}.000Z",
+                    ).dict(),
+                )
+            crud.insert_ohlcv_items(
+                db=db,
+                insert_items=[
+                    schemas.OHLCVCreate(timestamp=1522413296, open=1.0, high=1.0, low=1.0, close=1.0, volume=1.0, symbol=self.dummy_symbol, timeframe="5s")
+                ],
+            )
+            crud.insert_predict_items(
+                db=db,
+                insert_items=[
+                    {
+                        "symbol": self.dummy_symbol,
+                        "strategy_id": "dummy",
+                        "kind": schemas.PREDICT_KIND_DECISION,
+                        "side": schemas.PREDICT_SIDE_BUY,
+                        "price": 1.0,
+                        "size": 0.01,
+                        "predict_value": 1.0,
+                        "is_entry": True,
+                    }
+                ],
+            )
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    def _query_plans(self, func: Callable, **kwargs) -> List[str]:
+        """Call a crud function and return the query plan details of the queries it executes."""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().lower().startswith(("select", "update", "delete")):
+                statements.append((statement, parameters))
+
+        event.listen(database_engine, "before_cursor_execute", record)
+        try:
+            with SessionLocal() as db:
+                func(db=db, **kwargs)
+        finally:
+            event.remove(database_engine, "before_cursor_execute", record)
+
+        self.assertGreater(len(statements), 0)
+        connection = database_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            return [row[3] for statement, parameters in statements for row in cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()]
+        finally:
+            connection.close()
+
+    def assertIndexSeek(self, func: Callable, index_name: Optional[str] = None, **kwargs) -> None:
+        details = self._query_plans(func, **kwargs)
+        for detail in details:
+            self.assertIsNone(FULL_SCAN.match(detail), f"Full scan in {func.__name__}: {details}")
+        if index_name is not None:
+            self.assertTrue(any(detail.startswith("SEARCH") and index_name in detail for detail in details), f"{index_name} is not used: {details}")
+
+    def test_board_queries(self):
+        cases = [
+            (crud.get_current_board, "ix_board_symbol_side_timestamp", {"symbol": self.dummy_symbol}),
+            (crud.get_oldest_board, "ix_board_symbol_side_timestamp", {"symbol": self.dummy_symbol, "side": "BUY"}),
+            (crud.get_boards_in_range, "ix_board_symbol_timestamp", {"symbol": self.dummy_symbol, "start_timestamp": 0, "end_timestamp": 1}),
+            (crud.delete_board, "ix_board_timestamp", {"timestamp": 0}),
+            (crud.update_board_items, "sqlite_autoindex_board_1", {"update_items": [{"id": "0", "size": 1.0}]}),
+            (crud.delete_board_items, "sqlite_autoindex_board_1", {"delete_items": [{"id": "0"}]}),
+        ]
+        for func, index_name, kwargs in cases:
+            with self.subTest(func.__name__):
+                self.assertIndexSeek(func, index_name, **kwargs)
+
+        with self.subTest("Insert with trimming"):
+            self.assertIndexSeek(
+                crud.insert_board_items,
+                "ix_board_symbol_side_timestamp",
+                insert_items=response_schemas.BoardResponseItem(
+                    asks=[], bids=[response_schemas.BidsAsks(price="99", size="1")], symbol=self.dummy_symbol, timestamp="2018-03-30T12:35:00.000Z"
+                ).dict(),
+                max_board_counts=1,
+            )
+
+    def test_tick_queries(self):
+        cases = [
+            (crud.get_all_ticks, "ix_tick_symbol_timestamp", {"symbol": self.dummy_symbol}),
+            (crud.get_ticks, "ix_tick_symbol_timestamp", {"is_newer": True, "symbol": self.dummy_symbol}),
+            # Ordered index scan which stops at `limit` rows.
+            (crud.get_ticks, None, {"is_newer": False}),
+            (crud.get_ticks_in_range, "ix_tick_symbol_timestamp", {"symbol": self.dummy_symbol, "start_timestamp": 0, "end_timestamp": 1}),
+            (
+                crud.create_ohlcv_from_ticks,
+                "ix_tick_symbol_timestamp",
+                {"symbol": self.dummy_symbol, "time_span": 5, "min_unix_timestamp": 1522413296000 - 5000},
+            ),
+        ]
+        for func, index_name, kwargs in cases:
+            with self.subTest(func.__name__, **kwargs):
+                self.assertIndexSeek(func, index_name, **kwargs)
+
+        with self.subTest("Insert with trimming"):
+            self.assertIndexSeek(
+                crud.insert_tick_item,
+                "sqlite_autoindex_tick_1",
+                insert_item=response_schemas.TickResponseItem(
+                    channel="trades", price="100", side="BUY", size="0.1", timestamp="2018-03-30T12:35:00.000Z", symbol=self.dummy_symbol
+                ).dict(),
+                max_rows=1,
+            )
+
+    def test_ohlcv_queries(self):
+        item = schemas.OHLCVCreate(timestamp=1522413296, open=2.0, high=2.0, low=2.0, close=2.0, volume=1.0, symbol=self.dummy_symbol, timeframe="5s")
+        cases = [
+            (crud.get_ohlcv_with_symbol, {"symbol": self.dummy_symbol, "timeframe": "5s", "limit": 2, "ascending": False}),
+            (crud.get_ohlcv_with_symbol, {"symbol": self.dummy_symbol}),
+            (crud._check_if_ohclv_stored, {"timestamp": 1522413296, "symbol": self.dummy_symbol, "timeframe": "5s"}),
+            (crud.update_ohlcv_items, {"update_items": [item]}),
+            (crud.upsert_ohlcv_items, {"items": [item]}),
+            (crud.upsert_ohlcv_items, {"items": [item.copy(update={"timestamp": 1522413306})], "max_rows": 1}),
+            (crud.insert_ohlcv_items, {"insert_items": [item.copy(update={"timestamp": 1522413301})], "max_rows": 1}),
+            (crud.delete_ohlcv_items, {"delete_items": [item]}),
+        ]
+        for func, kwargs in cases:
+            with self.subTest(func.__name__, **{key: value for key, value in kwargs.items() if not isinstance(value, list)}):
+                self.assertIndexSeek(func, "sqlite_autoindex_ohlcv_1", **kwargs)
+
+        with self.subTest("Delete at a timestamp of all series"):
+            self.assertIndexSeek(crud.delete_ohlcv_items, "ix_ohlcv_timestamp", delete_items=[{"timestamp": 1522413296}])
+
+    def test_predict_queries(self):
+        self.assertIndexSeek(crud.get_predict_items, "ix_predict_symbol_timestamp", symbol=self.dummy_symbol)
+        self.assertIndexSeek(crud.get_predictions_in_range, "ix_predict_symbol_timestamp", symbol=self.dummy_symbol, start_timestamp=0, end_timestamp=1)
+
+    def test_indexes(self):
+        # Each index is a write on every insert. Indexes which no query uses are not allowed.
+        inspector = inspect(database_engine)
+        indexes = {table: sorted(tuple(index["column_names"]) for index in inspector.get_indexes(table)) for table in ["board", "tick", "ohlcv", "predict"]}
+        self.assertEqual(
+            indexes,
+            {
+                "board": [("symbol", "side", "timestamp"), ("symbol", "timestamp"), ("timestamp",)],
+                "tick": [("symbol", "timestamp"), ("timestamp",)],
+                "ohlcv": [("timestamp",)],
+                "predict": [("symbol", "timestamp")],
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models, records, schemas
+from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+from tests.utils import response_schemas
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+class TestRecords(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        self.spec = SymbolSpec(self.dummy_symbol, Decimal("0.1"), Decimal("0.01"))
+        models.Base.metadata.create_all(database_engine)
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    def test_tick_from_message(self):
+        message = response_schemas.TickResponseItem(
+            channel="trades", price="100.5", side="BUY", size="0.12", timestamp="2018-03-30T12:34:56.789Z", symbol=self.dummy_symbol
+        ).dict()
+        self.assertEqual(
+            records.tick_from_message(message, self.spec), records.Tick(timestamp=1522413296789, price=1005, size=12, side="BUY", symbol=self.dummy_symbol)
+        )
+
+    def test_board_from_message(self):
+        message = response_schemas.BoardResponseItem(
+            asks=[response_schemas.BidsAsks(price="100.2", size="0.5"), response_schemas.BidsAsks(price="100.5", size="1")],
+            bids=[response_schemas.BidsAsks(price="100.0", size="0.1")],
+            symbol=self.dummy_symbol,
+            timestamp="2018-03-30T12:34:56.000Z",
+        ).dict()
+        board = records.board_from_message(message, self.spec)
+        self.assertEqual(board.timestamp, 1522413296000)
+        self.assertEqual(board.bids, (records.BookLevel(1000, 10),))
+        self.assertEqual(board.asks, (records.BookLevel(1002, 50), records.BookLevel(1005, 100)))
+
+    def test_bars_and_schemas_are_stored_alike(self):
+        fields = dict(timestamp=1522413295, open=1.0, high=2.0, low=0.5, close=1.5, volume=3.0, symbol=self.dummy_symbol, timeframe="5s")
+        self.assertEqual(records.Bar._fields, tuple(schemas.OHLCVCreate.__fields__))
+        self.assertEqual(records.Decision._fields, tuple(schemas.PreidictInfo.__fields__))
+
+        with SessionLocal() as db:
+            crud.upsert_ohlcv_items(db=db, items=[records.Bar(**fields)])
+            crud.upsert_ohlcv_items(db=db, items=[schemas.OHLCVCreate(**{**fields, "close": 1.8, "timestamp": 1522413300})])
+            crud.upsert_ohlcv_items(db=db, items=[records.Bar(**{**fields, "close": 1.7})])
+            stored = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, ascending=True)
+
+        self.assertEqual([(item.timestamp, item.close) for item in stored], [(1522413295, 1.7), (1522413300, 1.8)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,20 @@
+import asyncio
+import multiprocessing
 import unittest
 import sys
+import threading
 import time
 
 sys.path.append("./gmo-websocket/")
+from gmo_hft_bot.utils.db_writer import BACKPRESSURE_DROP_NEWEST
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 
 
+def put_tick(manager: QueueAndTradeManager) -> None:
+    manager.add_ticks_queue({"i": "child"})
+    manager.update_subprocesses_alive_status(False)
+
+
 class TestQueueAndTradeManager(unittest.TestCase):
     def __init__(self, methodName: str = ...) -> None:
         super().__init__(methodName)
@@ -69,3 +78,82 @@ class TestQueueAndTradeManager(unittest.TestCase):
         item = manager.get_ticks_queue_item()
         self.assertEqual(item, self.dummy_item)
         self.assertEqual(manager.ticks_queue.qsize(), 0)
+
+    def test_bounded_orderbook_queue(self):
+        manager = QueueAndTradeManager(api_key="cscsd", api_secret="acsdca", orderbook_queue_maxsize=2)
+        results = [manager.add_orderbook_queue({"i": i}) for i in range(4)]
+
+        # The oldest boards are dropped.
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(manager.get_orderbook_queue_overflows(), 2)
+        self.assertEqual([manager.get_orderbook_queue_item() for _ in range(manager.get_orderbook_queue_size())], [{"i": 2}, {"i": 3}])
+
+        with self.subTest("Drop newest"):
+            manager = QueueAndTradeManager(api_key="cscsd", api_secret="acsdca", orderbook_queue_maxsize=1, orderbook_backpressure=BACKPRESSURE_DROP_NEWEST)
+            manager.add_orderbook_queue({"i": 0})
+            self.assertFalse(manager.add_orderbook_queue({"i": 1}))
+            self.assertEqual(manager.get_orderbook_queue_item(), {"i": 0})
+
+        with self.assertRaises(ValueError):
+            QueueAndTradeManager(api_key="cscsd", api_secret="acsdca", ticks_backpressure="unknown")
+
+    def test_bounded_ticks_queue(self):
+        manager = QueueAndTradeManager(api_key="cscsd", api_secret="acsdca", ticks_queue_maxsize=1)
+        self.assertTrue(manager.add_ticks_queue({"i": 0}))
+
+        items = []
+        consumer = threading.Timer(0.1, lambda: items.append(manager.get_ticks_queue_item()))
+        consumer.start()
+        # Waits for the consumer instead of dropping a tick.
+        self.assertFalse(manager.add_ticks_queue({"i": 1}))
+        consumer.join()
+
+        self.assertEqual(manager.get_ticks_queue_overflows(), 1)
+        self.assertEqual(items + [manager.get_ticks_queue_item()], [{"i": 0}, {"i": 1}])
+
+    def test_full_ticks_queue_does_not_block_loop(self):
+        manager = QueueAndTradeManager(api_key="cscsd", api_secret="acsdca", ticks_queue_maxsize=1)
+        self.assertTrue(manager.add_ticks_queue({"i": 0}))
+
+        items = []
+        consumer = threading.Timer(0.1, lambda: items.append(manager.get_ticks_queue_item()))
+
+        async def main():
+            heartbeats = 0
+
+            async def heartbeat():
+                nonlocal heartbeats
+                while True:
+                    heartbeats += 1
+                    await asyncio.sleep(0.01)
+
+            heartbeat_task = asyncio.create_task(heartbeat())
+            await asyncio.sleep(0.0)
+            consumer.start()
+            is_queued = await manager.add_ticks_queue_async({"i": 1})
+            heartbeat_task.cancel()
+            return is_queued, heartbeats
+
+        is_queued, heartbeats = asyncio.run(main())
+        consumer.join()
+
+        # The loop kept running while the tick waited for the consumer, and the tick was not dropped.
+        self.assertFalse(is_queued)
+        self.assertGreater(heartbeats, 5)
+        self.assertEqual(manager.get_ticks_queue_overflows(), 1)
+        self.assertEqual(items + [manager.get_ticks_queue_item()], [{"i": 0}, {"i": 1}])
+
+    def test_context(self):
+        context = multiprocessing.get_context("forkserver")
+        children = set(multiprocessing.active_children())
+        manager = QueueAndTradeManager(api_key="cscsd", api_secret="acsdca", context=context)
+        # One manager process for both queues.
+        self.assertEqual(len(set(multiprocessing.active_children()) - children), 1)
+
+        process = context.Process(target=put_tick, args=(manager,))
+        process.start()
+        process.join(30.0)
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(manager.get_ticks_queue_item(), {"i": "child"})
+        # Shared with the child.
+        self.assertFalse(manager.is_subprocesses_alive())
@@ -4,7 +4,7 @@ import unittest
 import sys
 import time
 import asyncio
-from unittest.mock import PropertyMock, patch
+from unittest.mock import MagicMock, PropertyMock, patch
 import json
 
 from tests.utils.dummy_gmo_websocket import dummy_gmo_websockt_server
@@ -14,6 +14,7 @@ from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 from gmo_hft_bot.utils.gmo_websocket_subscriber import GmoWebsocketSubscriber
 from gmo_hft_bot.threads.connect_tick_ws import ConnectTickWs
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
+from gmo_hft_bot.utils.feed_lag import FEED_TRADES
 
 
 class TestConnectTickWs(unittest.TestCase):
@@ -54,6 +55,28 @@ class TestConnectTickWs(unittest.TestCase):
 
         self.assertEqual(queue_and_trade_manager.get_ticks_queue_size(), 1)
 
+    def test_publish_to_market_data_service(self):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy_key", api_secret="dummy_secret")
+        market_data_service = MagicMock()
+        ConnectTickWs.RUNNING = PropertyMock(side_effect=[True, False])
+
+        connect_tick_ws = ConnectTickWs()
+        asyncio.run(
+            connect_tick_ws.run(
+                ws_url=self.dummy_websocket_url,
+                symbol=self.dummy_symbol,
+                logger=self.test_logger,
+                queue_and_trade_manager=queue_and_trade_manager,
+                market_data_service=market_data_service,
+            )
+        )
+
+        # The same frame as the queued message.
+        market_data_service.publish.assert_called_once()
+        channel, frame = market_data_service.publish.call_args.args
+        self.assertEqual(channel, FEED_TRADES)
+        self.assertEqual(json.loads(frame), queue_and_trade_manager.get_ticks_queue_item())
+
     @patch.object(GmoWebsocketSubscriber, "subscribe_trades_msg")
     def test_with_error_response(self, mocked_subscriber_method):
         mocked_subscriber_method.return_value = json.dumps({"channel": "errorTooManyRequest"})
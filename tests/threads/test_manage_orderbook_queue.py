@@ -8,8 +8,14 @@ sys.path.append(".")
 from gmo_hft_bot.threads.manage_orderbook_queue import OrderbookQueueManager
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
-from gmo_hft_bot.db import models
+from gmo_hft_bot.db import crud, models, records
 from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils.bar_builder import MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.db_writer import DbWriter
+from gmo_hft_bot.utils.feed_lag import FEED_ORDERBOOKS, FeedLagMonitor
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from gmo_hft_bot.utils.shared_market_state import SharedMarketStateReader, SharedMarketStateWriter, unlink_shared_market_state
+from tests.utils import response_schemas
 
 database_engine, SessionLocal = initialize_database(uri=None)
 
@@ -28,9 +34,15 @@ class TestOrderbookQueueManager(unittest.TestCase):
         OrderbookQueueManager.RUNNING = mock_running
 
         queue_count = 10
-        dummy_items = [{"dummy_key": "dummy_value"} for _ in range(queue_count)]
-        for item in dummy_items:
-            queue_and_trade_manager.add_orderbook_queue(item)
+        for _ in range(queue_count):
+            queue_and_trade_manager.add_orderbook_queue(
+                response_schemas.BoardResponseItem(
+                    asks=[response_schemas.BidsAsks(price="110", size="1")],
+                    bids=[response_schemas.BidsAsks(price="100", size="1")],
+                    symbol="Uncoin",
+                    timestamp="2018-03-30T12:34:56.000Z",
+                ).dict()
+            )
 
         orderbook_queue_manager = OrderbookQueueManager()
 
@@ -44,6 +56,44 @@ class TestOrderbookQueueManager(unittest.TestCase):
         )
 
         self.assertEqual(mocked_crud_func.call_count, 10)
+        # Converted once when taken from the queue.
+        _, kwargs = mocked_crud_func.call_args
+        self.assertEqual(
+            kwargs["insert_items"],
+            records.Board(timestamp=1522413296000, symbol="Uncoin", bids=(records.BookLevel(100, 10000),), asks=(records.BookLevel(110, 10000),)),
+        )
+
+    @patch("gmo_hft_bot.db.crud.insert_board_items")
+    def test_drop_invalid_messages(self, mocked_crud_func):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        OrderbookQueueManager.RUNNING = PropertyMock(side_effect=[True, False])
+
+        for bid_price in ["100.5", "100"]:
+            # The first board is off the price grid (1) of the symbol.
+            queue_and_trade_manager.add_orderbook_queue(
+                response_schemas.BoardResponseItem(
+                    asks=[response_schemas.BidsAsks(price="110", size="1")],
+                    bids=[response_schemas.BidsAsks(price=bid_price, size="1")],
+                    symbol="Uncoin",
+                    timestamp="2018-03-30T12:34:56.000Z",
+                ).dict()
+            )
+
+        orderbook_queue_manager = OrderbookQueueManager()
+        market_state = LiveMarketState(symbol="Uncoin", bar_builder=MultiTimeframeBarBuilder(symbol="Uncoin", timeframes=[5]))
+        asyncio.run(
+            orderbook_queue_manager.run(
+                max_orderbook_table_rows=10,
+                logger=logging.getLogger("testLogger"),
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+                market_state=market_state,
+            )
+        )
+
+        self.assertEqual(orderbook_queue_manager.invalid_messages, 1)
+        self.assertEqual(mocked_crud_func.call_count, 1)
+        self.assertEqual(market_state.best_prices(), (100, 110))
 
     @patch("gmo_hft_bot.db.crud.insert_board_items")
     def test_with_zero_item_in_queue(self, mock_crud_func):
@@ -79,3 +129,86 @@ class TestOrderbookQueueManager(unittest.TestCase):
                     SessionLocal=SessionLocal,
                 )
             )
+
+    def test_with_db_writer_and_market_state(self):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        OrderbookQueueManager.RUNNING = PropertyMock(side_effect=[True, False])
+        for i in range(3):
+            queue_and_trade_manager.add_orderbook_queue(
+                response_schemas.BoardResponseItem(
+                    asks=[response_schemas.BidsAsks(price=str(110 + i), size="1")],
+                    bids=[response_schemas.BidsAsks(price=str(100 + i), size="1")],
+                    symbol="Uncoin",
+                    timestamp=f"2018-03-30T12:34:5{6 + i}.000Z",
+                ).dict()
+            )
+        market_state = LiveMarketState(symbol="Uncoin", bar_builder=MultiTimeframeBarBuilder(symbol="Uncoin"))
+        db_writer = DbWriter(SessionLocal=SessionLocal)
+        db_writer.start()
+        shared_state = SharedMarketStateWriter(symbol="Uncoin", timeframe="1s")
+        self.addCleanup(unlink_shared_market_state, "Uncoin")
+        self.addCleanup(shared_state.close)
+
+        orderbook_queue_manager = OrderbookQueueManager()
+        try:
+            asyncio.run(
+                orderbook_queue_manager.run(
+                    max_orderbook_table_rows=10,
+                    logger=logging.getLogger("testLogger"),
+                    queue_and_trade_manager=queue_and_trade_manager,
+                    SessionLocal=SessionLocal,
+                    db_writer=db_writer,
+                    market_state=market_state,
+                    shared_state=shared_state,
+                )
+            )
+            # The newest board is in memory at once.
+            self.assertEqual(market_state.best_prices(), (102, 112))
+            # And in shared memory, once per batch.
+            self.assertEqual(shared_state.writes, 1)
+            with SharedMarketStateReader("Uncoin") as reader:
+                snapshot = reader.read()
+            self.assertEqual(snapshot.best_prices(), (102.0, 112.0))
+            self.assertEqual(snapshot.board_timestamp, market_state.board_timestamp)
+        finally:
+            db_writer.stop()
+
+        self.assertEqual(db_writer.stats().written, 3)
+        with SessionLocal() as db:
+            buy_board_items, sell_board_items = crud.get_current_board(db=db, symbol="Uncoin")
+        self.assertEqual((buy_board_items[-1].price, sell_board_items[0].price), (102, 112))
+
+    @patch("gmo_hft_bot.db.crud.insert_board_items")
+    def test_with_feed_monitor(self, mocked_crud_func):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy", orderbook_queue_maxsize=2)
+        OrderbookQueueManager.RUNNING = PropertyMock(side_effect=[True, False])
+
+        for second in range(56, 59):
+            queue_and_trade_manager.add_orderbook_queue(
+                response_schemas.BoardResponseItem(
+                    asks=[response_schemas.BidsAsks(price="110", size="1")],
+                    bids=[response_schemas.BidsAsks(price="100", size="1")],
+                    symbol="Uncoin",
+                    timestamp=f"2018-03-30T12:34:{second}.000Z",
+                ).dict()
+            )
+
+        logger = logging.getLogger("testLogger")
+        feed_monitor = FeedLagMonitor(max_lag=1.0, logger=logger)
+        with self.assertLogs(logger, level="WARNING") as logs:
+            asyncio.run(
+                OrderbookQueueManager().run(
+                    max_orderbook_table_rows=10,
+                    logger=logger,
+                    queue_and_trade_manager=queue_and_trade_manager,
+                    SessionLocal=SessionLocal,
+                    feed_monitor=feed_monitor,
+                )
+            )
+
+        # The oldest board is dropped, and boards of 2018 pause trading.
+        self.assertEqual(mocked_crud_func.call_count, 2)
+        self.assertEqual(mocked_crud_func.call_args[1]["insert_items"].timestamp, 1522413298000)
+        self.assertTrue(feed_monitor.trading_paused)
+        self.assertEqual(feed_monitor.overflows, {FEED_ORDERBOOKS: 1})
+        self.assertEqual(len(logs.output), 2)
@@ -8,8 +8,10 @@ sys.path.append(".")
 from gmo_hft_bot.threads.manage_tick_queue import TickQueueManager
 from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
 from gmo_hft_bot.utils.custom_exceptions import ConnectionFailedError
-from gmo_hft_bot.db import models
+from gmo_hft_bot.utils.bar_builder import BAR_TYPE_TICK, InformationBarBuilder, MultiTimeframeBarBuilder
+from gmo_hft_bot.db import crud, models, records
 from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils.shared_market_state import SharedMarketStateReader, SharedMarketStateWriter, unlink_shared_market_state
 
 database_engine, SessionLocal = initialize_database(uri=None)
 
@@ -33,9 +35,10 @@ class TestTickQueueManager(unittest.TestCase):
         TickQueueManager.RUNNING = mock_running
 
         queue_count = 10
-        dummy_items = [{"dummy_key": "dummy_value"} for _ in range(queue_count)]
-        for item in dummy_items:
-            queue_and_trade_manager.add_ticks_queue(item)
+        for _ in range(queue_count):
+            queue_and_trade_manager.add_ticks_queue(
+                {"channel": "trades", "price": "100", "side": "SELL", "size": "0.1", "timestamp": "2018-03-30T12:34:56.789Z", "symbol": self.dummy_symbol}
+            )
 
         orderbook_queue_manager = TickQueueManager()
 
@@ -53,6 +56,141 @@ class TestTickQueueManager(unittest.TestCase):
 
         self.assertEqual(mocked_insert_tick_func.call_count, 10)
         self.assertEqual(mocked_create_ohlcv_func.call_count, 1)
+        # Converted once when taken from the queue.
+        _, kwargs = mocked_insert_tick_func.call_args
+        self.assertEqual(kwargs["insert_item"], records.Tick(timestamp=1522413296789, price=100, size=1000, side="SELL", symbol=self.dummy_symbol))
+
+    @patch("gmo_hft_bot.db.crud.insert_tick_item")
+    @patch("gmo_hft_bot.db.crud.create_ohlcv_from_ticks")
+    def test_drop_invalid_messages(self, mocked_create_ohlcv_func, mocked_insert_tick_func):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        TickQueueManager.RUNNING = PropertyMock(side_effect=[True, False])
+
+        message = {"channel": "trades", "price": "100", "side": "SELL", "size": "0.1", "timestamp": "2018-03-30T12:34:56.789Z", "symbol": self.dummy_symbol}
+        # Off the size grid (0.0001) of the symbol, a broken price and a missing field.
+        for invalid_message in [{**message, "size": "0.00015"}, {**message, "price": "abc"}, {k: v for k, v in message.items() if k != "timestamp"}]:
+            queue_and_trade_manager.add_ticks_queue(invalid_message)
+        queue_and_trade_manager.add_ticks_queue(message)
+
+        tick_queue_manager = TickQueueManager()
+        # No ConnectionFailedError, so that the process does not restart.
+        asyncio.run(
+            tick_queue_manager.run(
+                symbol=self.dummy_symbol,
+                time_span=5,
+                max_tick_table_rows=10,
+                max_ohlcv_table_rows=10,
+                logger=logging.getLogger("testLogger"),
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+            )
+        )
+
+        self.assertEqual(tick_queue_manager.invalid_messages, 3)
+        self.assertEqual(mocked_insert_tick_func.call_count, 1)
+
+    @patch("gmo_hft_bot.db.crud.insert_tick_item")
+    @patch("gmo_hft_bot.db.crud.create_ohlcv_from_ticks")
+    def test_notify_bar_scheduler(self, mocked_create_ohlcv_func, mocked_insert_tick_func):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        TickQueueManager.RUNNING = PropertyMock(side_effect=[True, False])
+
+        for timestamp in ["2018-03-30T12:34:56.789Z", "2018-03-30T12:34:57.000Z"]:
+            queue_and_trade_manager.add_ticks_queue(
+                {"channel": "trades", "price": "100", "side": "BUY", "size": "0.1", "timestamp": timestamp, "symbol": self.dummy_symbol}
+            )
+
+        bar_scheduler = MagicMock()
+        tick_queue_manager = TickQueueManager()
+        asyncio.run(
+            tick_queue_manager.run(
+                symbol=self.dummy_symbol,
+                time_span=5,
+                max_tick_table_rows=10,
+                max_ohlcv_table_rows=10,
+                logger=logging.getLogger("testLogger"),
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+                bar_scheduler=bar_scheduler,
+            )
+        )
+
+        bar_scheduler.on_tick.assert_called_once_with(1522413297000)
+
+    @patch("gmo_hft_bot.db.crud.create_ohlcv_from_ticks")
+    def test_with_bar_builder(self, mocked_create_ohlcv_func):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        TickQueueManager.RUNNING = PropertyMock(side_effect=[True, False])
+
+        for timestamp, price in [("2018-03-30T12:34:56.789Z", "100"), ("2018-03-30T12:34:57.000Z", "110")]:
+            queue_and_trade_manager.add_ticks_queue(
+                {"channel": "trades", "price": price, "side": "BUY", "size": "0.1", "timestamp": timestamp, "symbol": self.dummy_symbol}
+            )
+
+        # Few flat bars until now, so that the 2018 bars are within max_ohlcv_table_rows.
+        bar_builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5, 60], max_fill_bars=2)
+        shared_state = SharedMarketStateWriter(symbol=self.dummy_symbol, timeframe="5s")
+        self.addCleanup(unlink_shared_market_state, self.dummy_symbol)
+        self.addCleanup(shared_state.close)
+        tick_queue_manager = TickQueueManager()
+        asyncio.run(
+            tick_queue_manager.run(
+                symbol=self.dummy_symbol,
+                time_span=5,
+                max_tick_table_rows=10,
+                max_ohlcv_table_rows=10,
+                logger=logging.getLogger("testLogger"),
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+                bar_builder=bar_builder,
+                shared_state=shared_state,
+            )
+        )
+
+        # Bars are built in memory instead of from the tick table.
+        self.assertEqual(mocked_create_ohlcv_func.call_count, 0)
+        with SessionLocal() as db:
+            bars_5s = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="5s")
+            bars_1m = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="1m")
+
+        self.assertEqual((bars_5s[0].timestamp, bars_5s[0].open, bars_5s[0].close), (1522413295, 100.0, 110.0))
+        self.assertEqual((bars_1m[0].timestamp, bars_1m[0].high, bars_1m[0].low), (1522413240, 110.0, 100.0))
+
+        with SharedMarketStateReader(self.dummy_symbol) as reader:
+            snapshot = reader.read()
+        self.assertEqual(snapshot.last_trade, records.Tick(timestamp=1522413297000, price=110, size=1000, side="BUY", symbol=self.dummy_symbol))
+        # Bars of the trading timeframe only, with the flat bars filled until now.
+        self.assertEqual(snapshot.bars[0]["timestamp"], 1522413295)
+        self.assertEqual((snapshot.bars[0]["open"], snapshot.bars[0]["close"]), (100.0, 110.0))
+
+    def test_with_information_bar_builders(self):
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        TickQueueManager.RUNNING = PropertyMock(side_effect=[True, False])
+
+        for timestamp, price in [("2018-03-30T12:34:56.789Z", "100"), ("2018-03-30T12:34:57.000Z", "110"), ("2018-03-30T12:34:57.500Z", "120")]:
+            queue_and_trade_manager.add_ticks_queue(
+                {"channel": "trades", "price": price, "side": "BUY", "size": "0.1", "timestamp": timestamp, "symbol": self.dummy_symbol}
+            )
+
+        tick_queue_manager = TickQueueManager()
+        with patch("gmo_hft_bot.db.crud.create_ohlcv_from_ticks"):
+            asyncio.run(
+                tick_queue_manager.run(
+                    symbol=self.dummy_symbol,
+                    time_span=5,
+                    max_tick_table_rows=10,
+                    max_ohlcv_table_rows=10,
+                    logger=logging.getLogger("testLogger"),
+                    queue_and_trade_manager=queue_and_trade_manager,
+                    SessionLocal=SessionLocal,
+                    information_bar_builders=[InformationBarBuilder(symbol=self.dummy_symbol, bar_type=BAR_TYPE_TICK, threshold=2)],
+                )
+            )
+
+        with SessionLocal() as db:
+            bars = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="tick2")
+
+        self.assertEqual([(bar.timestamp, bar.open, bar.close) for bar in bars], [(1522413296789, 100.0, 110.0), (1522413297500, 120.0, 120.0)])
 
     @patch("gmo_hft_bot.db.crud.insert_tick_item")
     @patch("gmo_hft_bot.db.crud.create_ohlcv_from_ticks")
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import sys
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock, patch, PropertyMock
+
+sys.path.append(".")
+from gmo_hft_bot.threads.trade import DUMMY_ORDER_ENDPOINT, Trader
+from gmo_hft_bot.utils.bar_scheduler import BarScheduler
+from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
+from gmo_hft_bot.db import crud, models, schemas
+from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils.bar_builder import MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.db_writer import DbWriter
+from gmo_hft_bot.utils.feed_lag import FEED_ORDERBOOKS, FeedLagMonitor
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from gmo_hft_bot.utils.private_api_scheduler import PrivateApiScheduler, RateLimitConfig
+from tests.utils import response_schemas
+from tests.utils.dummy_gmo_private_api import DummyGmoPrivateApi
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+class TestTrader(unittest.TestCase):
+    def __init__(self, methodName: str = ...) -> None:
+        super().__init__(methodName)
+        self.dummy_symbol = "Uncoin"
+
+    def setUp(self) -> None:
+        models.Base.metadata.create_all(database_engine)
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    @patch("gmo_hft_bot.db.crud.get_ohlcv_with_symbol")
+    @patch("gmo_hft_bot.db.crud.get_prediction_info")
+    def test_decide_at_bar_close(self, mocked_get_prediction_info, mocked_get_ohlcv_with_symbol):
+        decision_times = []
+
+        def get_prediction_info(**kwargs):
+            decision_times.append(time.time())
+            return schemas.PreidictInfo(
+                is_buy_entry=False,
+                is_sell_entry=False,
+                buy_price=100.0,
+                sell_price=110.0,
+                buy_size=0.0,
+                sell_size=0.0,
+                buy_predict_value=0.0,
+                sell_predict_value=0.0,
+            )
+
+        mocked_get_prediction_info.side_effect = get_prediction_info
+        mocked_get_ohlcv_with_symbol.return_value = "prefetched"
+
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        Trader.RUNNING = PropertyMock(side_effect=[True, False])
+        bar_scheduler = BarScheduler(time_span=1)
+        boundary = bar_scheduler.next_boundary()
+
+        trader = Trader()
+        asyncio.run(
+            trader.run(
+                symbol=self.dummy_symbol,
+                trade_time_span=1,
+                logger=logging.getLogger("testLogger"),
+                queue_and_trade_manager=queue_and_trade_manager,
+                SessionLocal=SessionLocal,
+                bar_scheduler=bar_scheduler,
+                execution_check_interval=0.1,
+            )
+        )
+
+        self.assertEqual(len(decision_times), 1)
+        self.assertGreaterEqual(decision_times[0], boundary)
+        self.assertLess(decision_times[0] - boundary, 0.05)
+
+        _, kwargs = mocked_get_prediction_info.call_args
+        self.assertEqual(kwargs["prefetched_ohlcv_df"], "prefetched")
+        self.assertEqual(kwargs["bar_close_timestamp"], int(boundary))
+        self.assertEqual(kwargs["timeframe"], "1s")
+
+        with SessionLocal() as db:
+            self.assertEqual(len(crud.get_predict_items(db=db, symbol=self.dummy_symbol)), 2)
+
+    @patch("gmo_hft_bot.db.crud.get_current_board")
+    @patch("gmo_hft_bot.db.crud.get_ohlcv_with_symbol")
+    def test_decide_from_market_state(self, mocked_get_ohlcv_with_symbol, mocked_get_current_board):
+        spec = SymbolSpec(self.dummy_symbol, Decimal("1"), Decimal("0.01"))
+        bar_builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1], spec=spec)
+        market_state = LiveMarketState(symbol=self.dummy_symbol, bar_builder=bar_builder, spec=spec)
+        market_state.update_board(
+            response_schemas.BoardResponseItem(
+                asks=[response_schemas.BidsAsks(price="110", size="1")],
+                bids=[response_schemas.BidsAsks(price="100", size="1")],
+                symbol=self.dummy_symbol,
+                timestamp="2018-03-30T12:34:56.000Z",
+            ).dict()
+        )
+        db_writer = DbWriter(SessionLocal=SessionLocal)
+        db_writer.start()
+        idle_collector = MagicMock()
+
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        Trader.RUNNING = PropertyMock(side_effect=[True, False])
+        trader = Trader()
+        try:
+            asyncio.run(
+                trader.run(
+                    symbol=self.dummy_symbol,
+                    trade_time_span=1,
+                    logger=logging.getLogger("testLogger"),
+                    queue_and_trade_manager=queue_and_trade_manager,
+                    SessionLocal=SessionLocal,
+                    bar_scheduler=BarScheduler(time_span=1),
+                    execution_check_interval=0.1,
+                    db_writer=db_writer,
+                    market_state=market_state,
+                    idle_collector=idle_collector,
+                )
+            )
+        finally:
+            db_writer.stop()
+
+        # Once after the decision.
+        idle_collector.collect.assert_called_once_with()
+
+        # The decision path does not read the database.
+        mocked_get_ohlcv_with_symbol.assert_not_called()
+        mocked_get_current_board.assert_not_called()
+        with SessionLocal() as db:
+            self.assertEqual(len(crud.get_predict_items(db=db, symbol=self.dummy_symbol)), 2)
+        self.assertEqual(db_writer.stats().written, 1)
+
+    @patch("aiohttp.ClientSession.request")
+    @patch("gmo_hft_bot.db.crud.get_ohlcv_with_symbol")
+    @patch("gmo_hft_bot.db.crud.get_prediction_info")
+    def test_skip_orders_while_feeds_lag(self, mocked_get_prediction_info, mocked_get_ohlcv_with_symbol, mocked_request):
+        mocked_get_prediction_info.return_value = schemas.PreidictInfo(
+            is_buy_entry=True,
+            is_sell_entry=True,
+            buy_price=100.0,
+            sell_price=110.0,
+            buy_size=0.01,
+            sell_size=0.01,
+            buy_predict_value=3.0,
+            sell_predict_value=3.0,
+        )
+        feed_monitor = FeedLagMonitor(max_lag=1.0)
+        feed_monitor.observe(FEED_ORDERBOOKS, timestamp=int((time.time() - 5.0) * 1000))
+        self.assertTrue(feed_monitor.trading_paused)
+
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        Trader.RUNNING = PropertyMock(side_effect=[True, False])
+        logger = logging.getLogger("testLogger")
+        with self.assertLogs(logger, level="WARNING") as logs:
+            asyncio.run(
+                Trader().run(
+                    symbol=self.dummy_symbol,
+                    trade_time_span=1,
+                    logger=logger,
+                    queue_and_trade_manager=queue_and_trade_manager,
+                    SessionLocal=SessionLocal,
+                    bar_scheduler=BarScheduler(time_span=1),
+                    execution_check_interval=0.1,
+                    feed_monitor=feed_monitor,
+                )
+            )
+
+        mocked_request.assert_not_called()
+        self.assertTrue(any("Skip orders" in output and "feed_lag" in output for output in logs.output), logs.output)
+        # The decision is journaled without entries, with the reason.
+        with SessionLocal() as db:
+            predict_items = crud.get_predict_items(db=db, symbol=self.dummy_symbol)
+        self.assertEqual([(item.is_entry, item.freshness) for item in predict_items], [(False, schemas.FRESHNESS_FEED_LAG)] * 2)
+
+    @patch("gmo_hft_bot.db.crud.get_ohlcv_with_symbol")
+    @patch("gmo_hft_bot.db.crud.get_prediction_info")
+    def test_orders_through_api_scheduler(self, mocked_get_prediction_info, mocked_get_ohlcv_with_symbol):
+        mocked_get_prediction_info.return_value = schemas.PreidictInfo(
+            is_buy_entry=True,
+            is_sell_entry=True,
+            buy_price=100.0,
+            sell_price=110.0,
+            buy_size=0.01,
+            sell_size=0.01,
+            buy_predict_value=3.0,
+            sell_predict_value=3.0,
+        )
+        # One token: the buy order of the first bar is sent, and its sell order waits until the next bar replaces it.
+        api_scheduler = PrivateApiScheduler(config=RateLimitConfig(rate=0.1, burst=1))
+        server = DummyGmoPrivateApi(limit=100)
+
+        async def main():
+            api_scheduler.base_url = await server.start()
+            try:
+                await Trader().run(
+                    symbol=self.dummy_symbol,
+                    trade_time_span=1,
+                    logger=logging.getLogger("testLogger"),
+                    queue_and_trade_manager=queue_and_trade_manager,
+                    SessionLocal=SessionLocal,
+                    bar_scheduler=BarScheduler(time_span=1),
+                    execution_check_interval=0.1,
+                    api_scheduler=api_scheduler,
+                )
+            finally:
+                await server.stop()
+
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+        Trader.RUNNING = PropertyMock(side_effect=[True, True, False])
+        asyncio.run(main())
+
+        self.assertEqual(server.accepted, [("GET", DUMMY_ORDER_ENDPOINT, "")])
+        self.assertEqual(api_scheduler.superseded, 1)
+        # A superseded order does not stop the trader.
+        with SessionLocal() as db:
+            self.assertEqual(len(crud.get_predict_items(db=db, symbol=self.dummy_symbol)), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import time
+import collections
+from typing import List, Tuple
+
+from aiohttp import web
+
+
+class DummyGmoPrivateApi:
+    """Local private API which rejects requests above `limit` per `window` seconds, like GMO.
+
+    A rejected request gets ERR-5003 in the body (status 200), or HTTP 429 if `use_http_status` is True.
+    """
+
+    def __init__(self, limit: int, window: float = 1.0, use_http_status: bool = False) -> None:
+        self.limit = limit
+        self.window = window
+        self.use_http_status = use_http_status
+        self.accepted_times = collections.deque()
+        # (method, path, query string) of the accepted requests, in the order of arrival.
+        self.accepted: List[Tuple[str, str, str]] = []
+        self.rejected = 0
+        self.runner = None
+        self.base_url = ""
+
+    async def handler(self, request: web.Request) -> web.Response:
+        now = time.monotonic()
+        while len(self.accepted_times) > 0 and now - self.accepted_times[0] >= self.window:
+            self.accepted_times.popleft()
+
+        if len(self.accepted_times) >= self.limit:
+            self.rejected += 1
+            body = {"status": 5, "messages": [{"message_code": "ERR-5003", "message_string": "Requests are too many."}], "responsetime": ""}
+            return web.json_response(body, status=429 if self.use_http_status else 200)
+
+        self.accepted_times.append(now)
+        self.accepted.append((request.method, request.path, request.query_string))
+        return web.json_response({"status": 0, "data": {}, "responsetime": ""})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
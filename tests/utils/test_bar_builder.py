@@ -0,0 +1,206 @@
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.append(".")
+from gmo_hft_bot.utils.bar_builder import (
+    BAR_TYPE_DOLLAR,
+    BAR_TYPE_TICK,
+    BAR_TYPE_TICK_IMBALANCE,
+    BAR_TYPE_VOLUME,
+    InformationBarBuilder,
+    MultiTimeframeBarBuilder,
+    information_bar_label,
+)
+from gmo_hft_bot.db import records
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+
+
+class TestMultiTimeframeBarBuilder(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        # 2022-03-23 01:46:40 UTC, aligned to 5 minutes.
+        self.start = 1648000000 - 1648000000 % 300
+        # Prices and sizes are the same as ticks and lots.
+        self.spec = SymbolSpec(self.dummy_symbol, Decimal("1"), Decimal("1"))
+
+    def _bars(self, items):
+        return {(item.timeframe, item.timestamp): item for item in items}
+
+    def test_invalid_timeframes(self):
+        with self.assertRaises(ValueError):
+            MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[2, 5])
+
+    def test_roll_up(self):
+        builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5], spec=self.spec)
+        ticks = [(0.1, 100, 1), (0.5, 120, 1), (1.2, 90, 2), (3.9, 110, 1)]
+        for offset, price, size in ticks:
+            builder.add_tick(int((self.start + offset) * 1000), price, size)
+        builder.close_until(self.start + 5)
+
+        bars = self._bars(builder.drain_updates())
+        bar_5s = bars[("5s", self.start)]
+        self.assertEqual((bar_5s.open, bar_5s.high, bar_5s.low, bar_5s.close, bar_5s.volume), (100.0, 120.0, 90.0, 110.0, 5.0))
+        self.assertEqual(bar_5s.symbol, self.dummy_symbol)
+
+        bar_1s = bars[("1s", self.start)]
+        self.assertEqual((bar_1s.open, bar_1s.high, bar_1s.low, bar_1s.close, bar_1s.volume), (100.0, 120.0, 100.0, 120.0, 2.0))
+
+        with self.subTest("Seconds without trades are flat bars at the last close"):
+            flat_bar = bars[("1s", self.start + 2)]
+            self.assertEqual((flat_bar.open, flat_bar.close, flat_bar.volume), (90.0, 90.0, 0.0))
+            self.assertEqual(sorted(timestamp for timeframe, timestamp in bars if timeframe == "1s"), [self.start + i for i in range(5)])
+
+        with self.subTest("Nothing changes until the next tick"):
+            self.assertEqual(builder.drain_updates(), [])
+
+    def test_open_bars(self):
+        builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5, 60], spec=self.spec)
+        builder.add_tick(int((self.start + 0.5) * 1000), 100, 1)
+        builder.add_tick(int((self.start + 1.5) * 1000), 105, 1)
+
+        bars = self._bars(builder.drain_updates())
+        # The open bars of higher timeframes include the open 1s bar.
+        self.assertEqual(bars[("5s", self.start)].close, 105.0)
+        self.assertEqual(bars[("1m", self.start)].volume, 2.0)
+        self.assertEqual(bars[("1s", self.start + 1)].open, 105.0)
+
+        builder.add_tick(int((self.start + 6.5) * 1000), 95, 1)
+        bars = self._bars(builder.drain_updates())
+        self.assertEqual(bars[("5s", self.start)].volume, 2.0)
+        self.assertEqual(bars[("5s", self.start + 5)].open, 95.0)
+        self.assertEqual((bars[("1m", self.start)].low, bars[("1m", self.start)].volume), (95.0, 3.0))
+
+    def test_late_tick(self):
+        builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5], spec=self.spec)
+        builder.add_tick(int((self.start + 2.5) * 1000), 100, 1)
+
+        self.assertFalse(builder.add_tick(int((self.start + 1.5) * 1000), 200, 1))
+        self.assertEqual(builder.late_ticks, 1)
+
+    def test_prices_and_sizes(self):
+        spec = SymbolSpec(self.dummy_symbol, Decimal("0.001"), Decimal("0.0001"))
+        builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1], spec=spec)
+        for size in [1, 2]:
+            builder.add_tick(int(self.start * 1000), 100, size)
+
+        bar = builder.drain_updates()[0]
+        # Converted once from the sums of ticks and lots (0.0001 + 0.0002 is not 0.0003 in float).
+        self.assertEqual((bar.close, bar.volume), (0.1, 0.0003))
+
+    def test_max_fill_bars(self):
+        builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5], max_fill_bars=3, spec=self.spec)
+        builder.add_tick(int(self.start * 1000), 100, 1)
+        builder.add_tick(int((self.start + 100) * 1000), 100, 1)
+
+        bars = self._bars(builder.drain_updates())
+        self.assertEqual(
+            sorted(timestamp for timeframe, timestamp in bars if timeframe == "1s"),
+            [self.start, self.start + 97, self.start + 98, self.start + 99, self.start + 100],
+        )
+
+    def test_recent_bars(self):
+        builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5], spec=self.spec, history=3)
+        builder.add_tick(int((self.start + 0.5) * 1000), 100, 1)
+        builder.add_tick(int((self.start + 3.5) * 1000), 110, 1)
+        self.assertEqual(builder.recent_bars(5, limit=2), [])
+
+        builder.close_until(self.start + 5)
+        # Oldest first, only closed bars, at most `history` bars.
+        self.assertEqual([bar.timestamp for bar in builder.recent_bars(1, limit=10)], [self.start + 2, self.start + 3, self.start + 4])
+        self.assertEqual([(bar.close, bar.volume) for bar in builder.recent_bars(1, limit=2)], [(110.0, 1.0), (110.0, 0.0)])
+        self.assertEqual([(bar.timestamp, bar.volume) for bar in builder.recent_bars(5, limit=2)], [(self.start, 2.0)])
+
+    def test_seed_history(self):
+        builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5], spec=self.spec)
+        restored = [
+            records.Bar(timestamp=self.start - span, open=100.0, high=101.0, low=99.0, close=100.0, volume=2.0, symbol=self.dummy_symbol, timeframe="5s")
+            for span in (10, 5)
+        ]
+        other = records.Bar(timestamp=self.start - 5, open=1.0, high=1.0, low=1.0, close=1.0, volume=1.0, symbol=self.dummy_symbol, timeframe="1m")
+        self.assertEqual(builder.seed_history([restored[1], restored[0], other]), 2)
+        self.assertEqual(builder.recent_bars(5, limit=10), restored)
+
+        # The first tick comes a bar after the restored bars. The gap gets a flat bar.
+        builder.add_tick(int((self.start + 5.5) * 1000), 110, 1)
+        builder.close_until(self.start + 10)
+        self.assertEqual(
+            [(bar.timestamp, bar.close, bar.volume) for bar in builder.recent_bars(5, limit=2)], [(self.start, 100.0, 0.0), (self.start + 5, 110.0, 1.0)]
+        )
+
+        with self.subTest("Bars not older than the bars from ticks are ignored"):
+            self.assertEqual(builder.seed_history([restored[1]._replace(timestamp=self.start)]), 0)
+
+
+class TestInformationBarBuilder(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        self.start = 1648000000000
+        # Sizes in lots of 0.1.
+        self.spec = SymbolSpec(self.dummy_symbol, Decimal("1"), Decimal("0.1"))
+
+    def test_label(self):
+        self.assertEqual(information_bar_label(BAR_TYPE_TICK, 100), "tick100")
+        self.assertEqual(information_bar_label(BAR_TYPE_VOLUME, 0.5), "volume0.5")
+        self.assertEqual(information_bar_label(BAR_TYPE_DOLLAR, 5000000.0), "dollar5000000")
+
+    def test_invalid_bar_type(self):
+        with self.assertRaises(ValueError):
+            InformationBarBuilder(symbol=self.dummy_symbol, bar_type="time", threshold=1)
+
+    def test_tick_bars(self):
+        builder = InformationBarBuilder(symbol=self.dummy_symbol, bar_type=BAR_TYPE_TICK, threshold=3, spec=self.spec)
+        prices = [100, 110, 90, 95, 96]
+        closed = [builder.add_tick(self.start, price, 10) for price in prices]
+
+        self.assertEqual(closed, [False, False, True, False, False])
+        items = builder.drain_updates()
+        self.assertEqual(
+            [(item.open, item.high, item.low, item.close, item.volume) for item in items], [(100.0, 110.0, 90.0, 90.0, 3.0), (95.0, 96.0, 95.0, 96.0, 2.0)]
+        )
+        self.assertEqual(items[0].timeframe, "tick3")
+
+        with self.subTest("Bars opened in the same ms have unique timestamps"):
+            self.assertEqual([item.timestamp for item in items], [self.start, self.start + 1])
+
+        with self.subTest("The open bar is updated under the same timestamp"):
+            builder.add_tick(self.start + 10, 97, 10)
+            items = builder.drain_updates()
+            self.assertEqual([(item.timestamp, item.close, item.volume) for item in items], [(self.start + 1, 97.0, 3.0)])
+            self.assertEqual(builder.drain_updates(), [])
+
+    def test_volume_and_dollar_bars(self):
+        volume_builder = InformationBarBuilder(symbol=self.dummy_symbol, bar_type=BAR_TYPE_VOLUME, threshold=1.0, spec=self.spec)
+        dollar_builder = InformationBarBuilder(symbol=self.dummy_symbol, bar_type=BAR_TYPE_DOLLAR, threshold=190.0, spec=self.spec)
+        # Sizes 0.5, 0.4, 0.5 and 3.0.
+        for i, (price, size) in enumerate([(100, 5), (100, 4), (200, 5), (100, 30)]):
+            volume_builder.add_tick(self.start + i, price, size)
+            dollar_builder.add_tick(self.start + i, price, size)
+
+        # A large trade is not split over bars.
+        self.assertEqual([item.volume for item in volume_builder.drain_updates()], [1.4, 3.0])
+        self.assertEqual([item.volume for item in dollar_builder.drain_updates()], [1.4, 3.0])
+
+    def test_tick_imbalance_bars(self):
+        builder = InformationBarBuilder(symbol=self.dummy_symbol, bar_type=BAR_TYPE_TICK_IMBALANCE, threshold=100, spec=self.spec)
+
+        with self.subTest("Balanced flow needs min_imbalance of the expected ticks"):
+            closed = [builder.add_tick(self.start + i, 100, 1, is_buy=i % 2 == 0) for i in range(40)]
+            self.assertEqual(sum(closed), 0)
+
+        with self.subTest("One-sided flow closes the bar"):
+            ticks = 1
+            while not builder.add_tick(self.start + 100 + ticks, 100, 1, is_buy=True):
+                ticks += 1
+            self.assertLessEqual(ticks, 11)
+            # The bar of 40 + `ticks` ticks was shorter than expected.
+            self.assertAlmostEqual(builder.expected_ticks, 100 + 0.1 * (40 + ticks - 100))
+
+        with self.subTest("Tick rule is used without the side"):
+            builder = InformationBarBuilder(symbol=self.dummy_symbol, bar_type=BAR_TYPE_TICK_IMBALANCE, threshold=2, min_imbalance=1.0, spec=self.spec)
+            closed = [builder.add_tick(self.start + i, price, 1) for i, price in enumerate([100, 101, 101])]
+            self.assertEqual(closed, [False, True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import time
+import unittest
+
+sys.path.append(".")
+from gmo_hft_bot.utils.bar_scheduler import CLOSE_ON_CLOCK, CLOSE_ON_TICKS, BarScheduler
+
+
+class TestBarScheduler(unittest.TestCase):
+    def test_next_boundary(self):
+        bar_scheduler = BarScheduler(time_span=5)
+        self.assertEqual(bar_scheduler.next_boundary(now=1648000001.2), 1648000005)
+        self.assertEqual(bar_scheduler.next_boundary(now=1648000005.0), 1648000010)
+
+        with self.assertRaises(ValueError):
+            BarScheduler(time_span=5, close_on="invalid")
+
+    def test_close_on_clock(self):
+        bar_scheduler = BarScheduler(time_span=1, close_on=CLOSE_ON_CLOCK)
+
+        async def wait():
+            boundary = bar_scheduler.next_boundary()
+            await bar_scheduler.wait_until_precompute(boundary)
+            precompute_time = time.time()
+            close_time = await bar_scheduler.wait_for_close(boundary)
+            return boundary, precompute_time, close_time
+
+        boundary, precompute_time, close_time = asyncio.run(wait())
+        self.assertGreaterEqual(precompute_time, boundary - bar_scheduler.precompute_lead)
+        self.assertLess(precompute_time, boundary)
+        self.assertGreaterEqual(close_time, boundary)
+        self.assertLess(close_time - boundary, 0.05)
+
+    def test_wait_until_precompute_with_timeout(self):
+        bar_scheduler = BarScheduler(time_span=60)
+
+        async def wait():
+            boundary = time.time() + 10.0
+            start_time = time.time()
+            precompute_reached = await bar_scheduler.wait_until_precompute(boundary, timeout=0.05)
+            return precompute_reached, time.time() - start_time, await bar_scheduler.wait_until_precompute(time.time(), timeout=0.05)
+
+        precompute_reached, elapsed, past_precompute_reached = asyncio.run(wait())
+        self.assertFalse(precompute_reached)
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 1.0)
+        self.assertTrue(past_precompute_reached)
+
+    def test_close_on_ticks(self):
+        bar_scheduler = BarScheduler(time_span=1, close_on=CLOSE_ON_TICKS, tick_grace=0.5)
+
+        async def wait_with_tick(tick_delay: float):
+            boundary = bar_scheduler.next_boundary()
+
+            async def store_tick():
+                await bar_scheduler.sleep_until(boundary + tick_delay)
+                # A tick of the current bar does not close it.
+                bar_scheduler.on_tick(int((boundary - 0.1) * 1000))
+                bar_scheduler.on_tick(int((boundary + tick_delay) * 1000))
+
+            close_time, _ = await asyncio.gather(bar_scheduler.wait_for_close(boundary), store_tick())
+            return boundary, close_time
+
+        boundary, close_time = asyncio.run(wait_with_tick(0.1))
+        self.assertGreaterEqual(close_time, boundary + 0.1)
+        self.assertLess(close_time, boundary + 0.2)
+
+        with self.subTest("Close after tick_grace if no tick comes"):
+
+            async def wait_without_tick():
+                boundary = bar_scheduler.next_boundary()
+                return boundary, await bar_scheduler.wait_for_close(boundary)
+
+            boundary, close_time = asyncio.run(wait_without_tick())
+            self.assertGreaterEqual(close_time, boundary + 0.5)
+            self.assertLess(close_time, boundary + 0.6)
+
+
+if __name__ == "__main__":
+    unittest.main()
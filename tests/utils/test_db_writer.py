@@ -0,0 +1,153 @@
+import logging
+import sys
+import threading
+import unittest
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models, schemas
+from gmo_hft_bot.db.database import SerializedSessionLocal, initialize_database
+from gmo_hft_bot.utils.db_writer import BACKPRESSURE_DROP_NEWEST, BACKPRESSURE_DROP_OLDEST, DbWriter, DirectWriter
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+def _predict_item(value: float) -> dict:
+    return {
+        "symbol": "Uncoin",
+        "strategy_id": "dummy",
+        "kind": schemas.PREDICT_KIND_DECISION,
+        "side": schemas.PREDICT_SIDE_BUY,
+        "price": 1.0,
+        "size": 0.01,
+        "predict_value": value,
+        "is_entry": False,
+    }
+
+
+class TestDbWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        models.Base.metadata.create_all(database_engine)
+        self.logger = logging.getLogger("testLogger")
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    def _predict_values(self):
+        with SessionLocal() as db:
+            return [item.predict_value for item in crud.get_predict_items(db=db, symbol="Uncoin")]
+
+    def test_write_in_order(self):
+        writer = DbWriter(SessionLocal=SessionLocal, logger=self.logger)
+        writer.start()
+        try:
+            for i in range(20):
+                self.assertTrue(writer.submit(crud.insert_predict_items, insert_items=[_predict_item(i)]))
+            self.assertTrue(writer.flush(timeout=5.0))
+        finally:
+            writer.stop()
+
+        self.assertEqual(sorted(self._predict_values()), list(range(20)))
+        stats = writer.stats()
+        self.assertEqual((stats.submitted, stats.written, stats.dropped, stats.failed, stats.queue_size), (20, 20, 0, 0, 0))
+        self.assertGreater(stats.flushes, 0)
+        self.assertGreaterEqual(stats.max_flush_seconds, stats.last_flush_seconds)
+
+    def _blocked_writer(self, backpressure: str):
+        """Writer whose thread is blocked by the first job until the returned event is set."""
+        release = threading.Event()
+        started = threading.Event()
+
+        def block(db):
+            started.set()
+            release.wait(5.0)
+
+        writer = DbWriter(SessionLocal=SessionLocal, maxsize=2, backpressure=backpressure, logger=self.logger)
+        writer.start()
+        writer.submit(block)
+        started.wait(5.0)
+        return writer, release
+
+    def test_drop_oldest(self):
+        writer, release = self._blocked_writer(BACKPRESSURE_DROP_OLDEST)
+        for i in range(4):
+            self.assertTrue(writer.submit(crud.insert_predict_items, insert_items=[_predict_item(i)]))
+        release.set()
+        writer.stop()
+
+        self.assertEqual(sorted(self._predict_values()), [2, 3])
+        self.assertEqual(writer.stats().dropped, 2)
+        self.assertEqual(writer.stats().max_queue_size, 2)
+
+    def test_drop_newest(self):
+        writer, release = self._blocked_writer(BACKPRESSURE_DROP_NEWEST)
+        results = [writer.submit(crud.insert_predict_items, insert_items=[_predict_item(i)]) for i in range(4)]
+        release.set()
+        writer.stop()
+
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(sorted(self._predict_values()), [0, 1])
+        self.assertEqual(writer.stats().dropped, 2)
+
+    def test_serialized_sessions(self):
+        serialized_session_local = SerializedSessionLocal(SessionLocal)
+        board_writer = DbWriter(SessionLocal=serialized_session_local, maxsize=2, backpressure=BACKPRESSURE_DROP_OLDEST, logger=self.logger)
+        # Never drops.
+        tick_writer = DbWriter(SessionLocal=serialized_session_local, maxsize=0, logger=self.logger)
+        board_writer.start()
+        tick_writer.start()
+
+        release = threading.Event()
+        started = threading.Event()
+
+        def block(db):
+            started.set()
+            release.wait(5.0)
+
+        board_writer.submit(block)
+        started.wait(5.0)
+        for i in range(100):
+            self.assertTrue(tick_writer.submit(crud.insert_predict_items, insert_items=[_predict_item(i)]))
+        # The writers write one batch at a time.
+        self.assertFalse(tick_writer.flush(timeout=0.1))
+        self.assertEqual(tick_writer.stats().written, 0)
+        # So does this thread (the event loop), which would otherwise commit in the middle of the batch.
+        self.assertFalse(serialized_session_local.lock.acquire(timeout=0.1))
+        release.set()
+        with serialized_session_local() as db:
+            with serialized_session_local() as nested_db:
+                self.assertIsNotNone(nested_db)
+            crud.insert_predict_items(db=db, insert_items=[_predict_item(100)])
+        tick_writer.stop()
+        board_writer.stop()
+
+        self.assertEqual(sorted(self._predict_values()), list(range(101)))
+        self.assertEqual(tick_writer.stats().dropped, 0)
+
+    def test_failed_job(self):
+        def fail(db):
+            raise RuntimeError("dummy failure")
+
+        writer = DbWriter(SessionLocal=SessionLocal, logger=self.logger)
+        writer.start()
+        with self.assertLogs(self.logger, level="ERROR"):
+            writer.submit(fail)
+            writer.submit(crud.insert_predict_items, insert_items=[_predict_item(1)])
+            writer.flush()
+        writer.stop()
+
+        self.assertEqual(self._predict_values(), [1])
+        self.assertEqual((writer.stats().written, writer.stats().failed), (1, 1))
+
+    def test_invalid_backpressure(self):
+        with self.assertRaises(ValueError):
+            DbWriter(SessionLocal=SessionLocal, backpressure="unknown")
+
+    def test_direct_writer(self):
+        writer = DirectWriter(SessionLocal)
+        self.assertTrue(writer.submit(crud.insert_predict_items, insert_items=[_predict_item(1)]))
+        self.assertTrue(writer.flush())
+        self.assertEqual(self._predict_values(), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models, schemas
+from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils.db_writer import DirectWriter
+from gmo_hft_bot.utils.decision_journal import DecisionJournal, decode_book_features, decode_features
+from backtest.utils.utils import get_predict_df
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+class TestDecisionJournal(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        models.Base.metadata.create_all(database_engine)
+        self.predict_info = schemas.PreidictInfo(
+            is_buy_entry=True,
+            is_sell_entry=False,
+            buy_price=101.0,
+            sell_price=109.0,
+            buy_size=0.01,
+            sell_size=0.01,
+            buy_predict_value=3.0,
+            sell_predict_value=3.0,
+            features=[1.0, 2.0, 3.0],
+            freshness=schemas.FRESHNESS_AGING_BOOK,
+        )
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    def test_batches(self):
+        writer = MagicMock()
+        journal = DecisionJournal(symbol=self.dummy_symbol, writer=writer, max_buffer=4)
+        journal.record(kind=schemas.PREDICT_KIND_TRACK_BEST, side=schemas.PREDICT_SIDE_BUY, price=102.0, size=0.0)
+        journal.record_decision(self.predict_info, bar_timestamp=1522413300)
+        self.assertEqual(len(journal), 3)
+        writer.submit.assert_not_called()
+
+        journal.flush()
+        self.assertEqual(len(journal), 0)
+        self.assertEqual(writer.submit.call_count, 1)
+        _, kwargs = writer.submit.call_args
+        self.assertEqual([row["kind"] for row in kwargs["insert_items"]], [schemas.PREDICT_KIND_TRACK_BEST] + [schemas.PREDICT_KIND_DECISION] * 2)
+
+        with self.subTest("Flush when the buffer is full"):
+            for _ in range(2):
+                journal.record_decision(self.predict_info)
+            self.assertEqual((len(journal), writer.submit.call_count), (0, 2))
+
+        with self.subTest("Nothing to flush"):
+            journal.flush()
+            self.assertEqual(writer.submit.call_count, 2)
+
+    def test_read_in_bulk(self):
+        journal = DecisionJournal(symbol=self.dummy_symbol, writer=DirectWriter(SessionLocal), strategy_id="dummy")
+        journal.record(kind=schemas.PREDICT_KIND_TRACK_BEST, side=schemas.PREDICT_SIDE_SELL, price=108.0, size=0.0, timestamp=1522413299000)
+        journal.record_decision(self.predict_info, bar_timestamp=1522413300)
+        journal.flush()
+
+        with SessionLocal() as db:
+            predictions = crud.get_predictions_in_range(db=db, symbol=self.dummy_symbol, start_timestamp=0, end_timestamp=2**62)
+
+        self.assertEqual(predictions.dtype, crud.PREDICT_DTYPE)
+        self.assertEqual(predictions["kind"].tolist(), [schemas.PREDICT_KIND_TRACK_BEST, schemas.PREDICT_KIND_DECISION, schemas.PREDICT_KIND_DECISION])
+        self.assertEqual(predictions["side"].tolist(), [schemas.PREDICT_SIDE_SELL, schemas.PREDICT_SIDE_BUY, schemas.PREDICT_SIDE_SELL])
+        self.assertEqual(predictions["bar_timestamp"].tolist(), [0, 1522413300, 1522413300])
+        self.assertEqual(predictions["freshness"].tolist(), [schemas.FRESHNESS_OK, schemas.FRESHNESS_AGING_BOOK, schemas.FRESHNESS_AGING_BOOK])
+        self.assertIsNone(predictions["features"][0])
+        np.testing.assert_array_equal(decode_features(predictions["features"][1]), [1.0, 2.0, 3.0])
+
+        buy_df, sell_df = get_predict_df(predictions)
+        self.assertEqual(len(buy_df), 1)
+        self.assertEqual(len(sell_df), 1)
+        self.assertEqual((buy_df["price"].iloc[0], bool(buy_df["is_entry"].iloc[0])), (101.0, True))
+        self.assertEqual(bool(sell_df["is_entry"].iloc[0]), False)
+        np.testing.assert_array_equal(decode_features(buy_df["features"].iloc[0]), [1.0, 2.0, 3.0])
+        self.assertEqual(len(get_predict_df(predictions, strategy_id="other")[0]), 0)
+        # Decoded only from the features which end with the board features.
+        self.assertTrue(np.isnan(buy_df["depth_imbalance"].iloc[0]))
+
+        with self.subTest("Board features of the live kernels"):
+            features = [100.0, 101.0, 100.0, 101.0, 1.0, 0.5, 1000.5]
+            journal.record_decision(self.predict_info.copy(update={"features": features}), bar_timestamp=1522413305)
+            journal.flush()
+            with SessionLocal() as db:
+                predictions = crud.get_predictions_in_range(db=db, symbol=self.dummy_symbol, start_timestamp=0, end_timestamp=2**62)
+            np.testing.assert_array_equal(decode_book_features(predictions["features"][-1]), [0.5, 1000.5])
+            buy_df, _ = get_predict_df(predictions)
+            self.assertEqual((buy_df["depth_imbalance"].iloc[-1], buy_df["weighted_mid"].iloc[-1]), (0.5, 1000.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
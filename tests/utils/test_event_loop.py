@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.append(".")
+from gmo_hft_bot.utils import event_loop
+from gmo_hft_bot.utils.event_loop import (
+    LOOP_ASYNCIO,
+    LOOP_AUTO,
+    METRIC_LOOP_LAG_MS,
+    METRIC_MAX_LOOP_LAG_MS,
+    LoopConfig,
+    LoopLagMonitor,
+    configure_loop,
+    new_event_loop,
+    run_with_loop,
+)
+
+
+async def blocking_worker(seconds: float):
+    await asyncio.sleep(0.0)
+    # Blocks the loop, like a synchronous database call.
+    time.sleep(seconds)
+    await asyncio.sleep(0.0)
+
+
+class TestEventLoop(unittest.TestCase):
+    def setUp(self) -> None:
+        self.logger = logging.getLogger("testLogger")
+
+    def test_new_event_loop(self):
+        loop = new_event_loop(LOOP_ASYNCIO)
+        try:
+            self.assertFalse(event_loop.is_uvloop(loop))
+        finally:
+            loop.close()
+
+        with self.subTest("Fallback if uvloop is not installed"):
+            loop = new_event_loop(LOOP_AUTO)
+            loop.close()
+
+        with self.assertRaises(ValueError):
+            new_event_loop("unknown")
+
+    def test_run_with_loop(self):
+        async def main():
+            thread_name = await asyncio.get_running_loop().run_in_executor(None, lambda: threading.current_thread().name)
+            return thread_name
+
+        thread_name = run_with_loop(main(), logger=self.logger, config=LoopConfig(loop=LOOP_ASYNCIO, executor_workers=1, lag_interval=None))
+        self.assertTrue(thread_name.startswith("loop-executor"))
+
+        with self.subTest("asyncio.run without config"):
+            self.assertEqual(run_with_loop(asyncio.sleep(0.0, result=1), logger=self.logger), 1)
+
+    def test_slow_callback(self):
+        original_run = asyncio.Handle._run
+        config = LoopConfig(loop=LOOP_ASYNCIO, slow_callback_duration=0.05, lag_interval=None)
+        with self.assertLogs(self.logger, level="WARNING") as logs:
+            run_with_loop(blocking_worker(0.1), logger=self.logger, config=config)
+
+        self.assertTrue(any("blocking_worker" in output for output in logs.output), logs.output)
+        # Removed with the loop.
+        self.assertIs(asyncio.Handle._run, original_run)
+
+    def test_uvloop_without_debug(self):
+        # Stands in for a uvloop loop, which is not installed in every environment.
+        uvloop_like_loop = type("Loop", (asyncio.SelectorEventLoop,), {"__module__": "uvloop"})()
+        try:
+            self.assertIsNone(configure_loop(uvloop_like_loop, LoopConfig(slow_callback_duration=0.05), logger=self.logger))
+            self.assertFalse(uvloop_like_loop.get_debug())
+
+            with self.subTest("Debug mode is opt-in"):
+                self.assertIsNone(configure_loop(uvloop_like_loop, LoopConfig(slow_callback_duration=0.05, debug=True), logger=self.logger))
+                self.assertTrue(uvloop_like_loop.get_debug())
+                self.assertEqual(uvloop_like_loop.slow_callback_duration, 0.05)
+        finally:
+            uvloop_like_loop.close()
+
+    def test_loop_lag(self):
+        heartbeat = MagicMock()
+        monitor = LoopLagMonitor(interval=0.05, warning_threshold=0.05)
+
+        async def main():
+            task = asyncio.create_task(monitor.run(logger=self.logger, heartbeat=heartbeat))
+            await asyncio.sleep(0.01)
+            await blocking_worker(0.1)
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        with self.assertLogs(self.logger, level="WARNING"):
+            asyncio.run(main())
+
+        self.assertGreater(monitor.max_lag, 0.04)
+        metrics = {call.args[0]: call.args[1] for call in heartbeat.set_metric.call_args_list}
+        self.assertEqual(set(metrics), {METRIC_LOOP_LAG_MS, METRIC_MAX_LOOP_LAG_MS})
+        self.assertGreater(metrics[METRIC_MAX_LOOP_LAG_MS], 40.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
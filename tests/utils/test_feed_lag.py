@@ -0,0 +1,66 @@
+import logging
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.append(".")
+from gmo_hft_bot.utils.feed_lag import FEED_ORDERBOOKS, FEED_TRADES, METRIC_TRADING_PAUSED, FeedLagMonitor
+
+
+class TestFeedLagMonitor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.logger = logging.getLogger("testLogger")
+        self.now = 1648000000.0
+
+    def test_pause_and_resume(self):
+        heartbeat = MagicMock()
+        monitor = FeedLagMonitor(max_lag=1.0, heartbeat=heartbeat, logger=self.logger)
+        self.assertAlmostEqual(monitor.observe(FEED_TRADES, timestamp=1647999999800, now=self.now), 0.2)
+        self.assertFalse(monitor.trading_paused)
+
+        with self.assertLogs(self.logger, level="WARNING"):
+            monitor.observe(FEED_ORDERBOOKS, timestamp=1647999998000, now=self.now)
+        self.assertTrue(monitor.trading_paused)
+        heartbeat.set_metric.assert_any_call("orderbooks_lag_ms", 2000.0)
+        heartbeat.set_metric.assert_called_with(METRIC_TRADING_PAUSED, 1.0)
+
+        with self.subTest("Paused until the lag of all feeds is at resume_lag"):
+            monitor.observe(FEED_ORDERBOOKS, timestamp=1647999999200, now=self.now)
+            self.assertTrue(monitor.trading_paused)
+            monitor.observe(FEED_ORDERBOOKS, timestamp=1647999999600, now=self.now)
+            self.assertFalse(monitor.trading_paused)
+
+        self.assertEqual(monitor.pauses, 1)
+        self.assertAlmostEqual(monitor.max_lags[FEED_ORDERBOOKS], 2.0)
+
+    def test_sparse_feed(self):
+        monitor = FeedLagMonitor(max_lag=1.0, logger=self.logger)
+        # The last trade of a quiet market.
+        with self.assertLogs(self.logger, level="WARNING"):
+            monitor.observe(FEED_TRADES, timestamp=1647999998000, now=self.now)
+        self.assertTrue(monitor.trading_paused)
+
+        monitor.observe(FEED_ORDERBOOKS, timestamp=1647999999900, now=self.now + 0.5)
+        self.assertTrue(monitor.trading_paused)
+        # No trade for `lag_expiry` (max_lag) seconds: the trades queue is empty, and fresh boards resume trading.
+        with self.assertLogs(self.logger, level="WARNING"):
+            monitor.observe(FEED_ORDERBOOKS, timestamp=1648000001000, now=self.now + 1.1)
+        self.assertFalse(monitor.trading_paused)
+
+        with self.subTest("A lagging trade pauses again"):
+            monitor.observe(FEED_TRADES, timestamp=1647999999000, now=self.now + 1.2)
+            self.assertTrue(monitor.trading_paused)
+            self.assertEqual(monitor.pauses, 2)
+
+    def test_report_overflows(self):
+        heartbeat = MagicMock()
+        monitor = FeedLagMonitor(heartbeat=heartbeat, logger=self.logger)
+        with self.assertLogs(self.logger, level="WARNING") as logs:
+            monitor.report_overflows(FEED_TRADES, 3)
+            monitor.report_overflows(FEED_TRADES, 3)
+        self.assertEqual(len(logs.output), 1)
+        heartbeat.set_metric.assert_called_once_with("trades_queue_overflows", 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
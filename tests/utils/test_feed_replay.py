@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import PropertyMock
+
+sys.path.append(".")
+from gmo_hft_bot.threads.connect_tick_ws import ConnectTickWs
+from gmo_hft_bot.utils.feed_recorder import FeedRecorder, read_feed_records
+from gmo_hft_bot.utils.feed_replay_server import FeedReplayServer, feed_replay_server_process
+from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
+
+
+def dummy_trade(second: int) -> str:
+    return json.dumps(
+        {"channel": "trades", "price": "750760", "side": "BUY", "size": "0.1", "timestamp": f"2018-03-30T12:34:{second:02d}.000Z", "symbol": "Uncoin"}
+    )
+
+
+def dummy_orderbook() -> str:
+    return json.dumps(
+        {
+            "channel": "orderbooks",
+            "asks": [{"price": "455659", "size": "0.1"}],
+            "bids": [{"price": "455655", "size": "0.3"}],
+            "symbol": "Uncoin",
+            "timestamp": "2018-03-30T12:34:56.789Z",
+        }
+    )
+
+
+class TestFeedRecorder(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.feed_path = os.path.join(self.tmp_dir.name, "feed.bin")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_write_and_read(self):
+        with FeedRecorder(self.feed_path) as recorder:
+            recorder.write(dummy_trade(0), recv_time_ns=1)
+            recorder.write(dummy_orderbook().encode("utf-8"), recv_time_ns=2)
+
+        with self.subTest("Append to existing feed"):
+            with FeedRecorder(self.feed_path) as recorder:
+                recorder.write(dummy_trade(1), recv_time_ns=3)
+
+        records = list(read_feed_records(self.feed_path))
+        self.assertEqual([recv_time_ns for recv_time_ns, _ in records], [1, 2, 3])
+        self.assertEqual(records[1][1], dummy_orderbook().encode("utf-8"))
+
+        with self.subTest("Read up to the last complete record"):
+            with open(self.feed_path, "r+b") as f:
+                f.truncate(os.path.getsize(self.feed_path) - 1)
+            self.assertEqual(len(list(read_feed_records(self.feed_path))), 2)
+
+        with self.subTest("Raise ValueError if not a feed file"):
+            invalid_path = os.path.join(self.tmp_dir.name, "invalid.bin")
+            with open(invalid_path, "wb") as f:
+                f.write(b"invalid")
+            with self.assertRaises(ValueError):
+                list(read_feed_records(invalid_path))
+
+
+class TestFeedReplayServer(unittest.TestCase):
+    def __init__(self, methodName: str = ...) -> None:
+        super().__init__(methodName)
+        self.test_logger = logging.getLogger("testLogger")
+        self.replay_websocket_url = "ws://localhost:8002/"
+        self.dummy_symbol = "Uncoin"
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.feed_path = os.path.join(self.tmp_dir.name, "feed.bin")
+        with FeedRecorder(self.feed_path) as recorder:
+            recorder.write(dummy_trade(0), recv_time_ns=0)
+            recorder.write(dummy_orderbook(), recv_time_ns=10_000_000)
+            recorder.write(dummy_trade(1), recv_time_ns=20_000_000)
+            recorder.write(dummy_trade(2), recv_time_ns=30_000_000)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_load_frames(self):
+        server = FeedReplayServer(self.feed_path)
+        self.assertEqual(server.frame_count("trades"), 3)
+        self.assertEqual(server.frame_count("orderbooks"), 1)
+        self.assertAlmostEqual(server.duration, 0.03)
+
+    def test_replay_to_connect_tick_ws(self):
+        process = multiprocessing.Process(target=feed_replay_server_process, kwargs={"path": self.feed_path, "port": 8002, "speed": 10.0})
+        process.start()
+        # Wait to open websocket server.
+        time.sleep(0.5)
+
+        try:
+            queue_and_trade_manager = QueueAndTradeManager(api_key="dummy_key", api_secret="dummy_secret")
+            ConnectTickWs.RUNNING = PropertyMock(side_effect=[True, True, True, False])
+            connect_tick_ws = ConnectTickWs()
+            start_time = time.time()
+            asyncio.run(
+                connect_tick_ws.run(
+                    ws_url=self.replay_websocket_url,
+                    symbol=self.dummy_symbol,
+                    logger=self.test_logger,
+                    queue_and_trade_manager=queue_and_trade_manager,
+                )
+            )
+        finally:
+            process.terminate()
+
+        self.assertEqual(queue_and_trade_manager.get_ticks_queue_size(), 3)
+        with self.subTest("Timestamps are rewritten to the send time"):
+            tick = queue_and_trade_manager.get_ticks_queue_item()
+            self.assertTrue(tick["timestamp"].startswith(time.strftime("%Y-%m-%dT", time.gmtime(start_time))))
+            self.assertEqual(tick["price"], "750760")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import sys
+import unittest
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.append(".")
+from gmo_hft_bot.utils import fixed_point
+from gmo_hft_bot.utils.fixed_point import SymbolSpec, get_symbol_spec, register_symbol_spec
+
+
+class TestFixedPoint(unittest.TestCase):
+    def setUp(self) -> None:
+        self.spec = SymbolSpec("Uncoin", Decimal("0.001"), Decimal("0.1"))
+
+    def test_to_ticks_and_lots(self):
+        self.assertEqual(self.spec.to_ticks("455.659"), 455659)
+        self.assertEqual(self.spec.to_ticks("1"), 1000)
+        self.assertEqual(self.spec.to_lots("0.3"), 3)
+
+        with self.subTest("Not a multiple of the unit"):
+            with self.assertRaises(ValueError):
+                self.spec.to_ticks("455.6591")
+            with self.assertRaises(ValueError):
+                self.spec.to_lots("0.25")
+
+    def test_to_price_and_size(self):
+        # Exact, unlike 3 * 0.1 in float.
+        self.assertEqual(self.spec.to_size(3), 0.3)
+        self.assertEqual(self.spec.to_price(455659), 455.659)
+        self.assertEqual(self.spec.format_price(455659), "455.659")
+        self.assertEqual(self.spec.format_size(self.spec.to_lots("0.3")), "0.3")
+
+    def test_arrays(self):
+        ticks = self.spec.ticks_array(np.array([0.1, 0.3, 455.659]))
+        self.assertEqual(ticks.dtype, np.int64)
+        np.testing.assert_array_equal(ticks, [100, 300, 455659])
+        np.testing.assert_array_almost_equal(self.spec.prices_array(ticks), [0.1, 0.3, 455.659])
+        np.testing.assert_array_equal(self.spec.lots_array(np.array([0.1 + 0.2])), [3])
+
+    def test_registry(self):
+        self.assertEqual(get_symbol_spec("Othercoin"), SymbolSpec("Othercoin", fixed_point.DEFAULT_TICK_SIZE, fixed_point.DEFAULT_SIZE_STEP))
+
+        register_symbol_spec(self.spec)
+        try:
+            self.assertEqual(get_symbol_spec("Uncoin"), self.spec)
+        finally:
+            fixed_point._SYMBOL_SPECS.pop("Uncoin")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import sys
+import unittest
+
+sys.path.append(".")
+from gmo_hft_bot.db import records, schemas
+from gmo_hft_bot.utils.freshness import (
+    FreshnessConfig,
+    InputAges,
+    check_freshness,
+    describe_freshness,
+    gate_decision,
+    incomplete_bars,
+    skip_orders,
+)
+
+
+class TestFreshness(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1648000000.0
+        self.config = FreshnessConfig(max_book_age=2.0, downsize_book_age=0.5, max_tick_age=60.0, max_incomplete_bars=2, downsize_incomplete_bars=0)
+        self.decision = records.Decision(
+            is_buy_entry=True,
+            is_sell_entry=False,
+            buy_price=100.0,
+            sell_price=110.0,
+            buy_size=0.02,
+            sell_size=0.02,
+            buy_predict_value=3.0,
+            sell_predict_value=3.0,
+        )
+
+    def test_incomplete_bars(self):
+        bar_close = 1648000000
+        timestamps = [bar_close - 25, bar_close - 20, bar_close - 10, bar_close - 5]
+        self.assertEqual(incomplete_bars(timestamps, [1.0, 1.0, 1.0, 1.0], bars=5, time_span=5, bar_close_timestamp=bar_close), 1)
+        with self.subTest("Flat bars filled after a gap"):
+            self.assertEqual(incomplete_bars(timestamps, [1.0, 0.0, 0.0, 1.0], bars=5, time_span=5, bar_close_timestamp=bar_close), 3)
+        with self.subTest("After the newest bar"):
+            self.assertEqual(incomplete_bars(timestamps[-2:], [1.0, 1.0], bars=2, time_span=5), 0)
+        with self.subTest("Information bars"):
+            self.assertEqual(incomplete_bars([1, 2, 3], [1.0, 0.0, 1.0], bars=5), 3)
+            self.assertEqual(incomplete_bars([], [], bars=5, time_span=5), 5)
+
+    def test_check_freshness(self):
+        self.assertEqual(check_freshness(InputAges(book_age=0.1, tick_age=1.0, incomplete_bars=0), self.config), schemas.FRESHNESS_OK)
+        self.assertEqual(
+            check_freshness(InputAges(book_age=1.0, tick_age=1.0, incomplete_bars=1), self.config),
+            schemas.FRESHNESS_AGING_BOOK | schemas.FRESHNESS_PARTIAL_BARS,
+        )
+        self.assertEqual(
+            check_freshness(InputAges(book_age=None, tick_age=None, incomplete_bars=3), self.config),
+            schemas.FRESHNESS_STALE_BOOK | schemas.FRESHNESS_STALE_TICKS | schemas.FRESHNESS_INCOMPLETE_BARS,
+        )
+        with self.subTest("Tick age not checked"):
+            config = self.config._replace(max_tick_age=None)
+            self.assertEqual(check_freshness(InputAges(book_age=0.1, tick_age=None, incomplete_bars=0), config), schemas.FRESHNESS_OK)
+
+    def test_gate_decision(self):
+        fresh = gate_decision(self.decision, self.config, board_timestamp=1647999999900, last_tick_timestamp=1647999999000, incomplete=0, now=self.now)
+        self.assertEqual(fresh, self.decision)
+
+        downsized = gate_decision(self.decision, self.config, board_timestamp=1647999999000, last_tick_timestamp=1647999999000, incomplete=0, now=self.now)
+        self.assertEqual((downsized.is_buy_entry, downsized.buy_size, downsized.sell_size), (True, 0.01, 0.01))
+        self.assertEqual(downsized.freshness, schemas.FRESHNESS_AGING_BOOK)
+
+        skipped = gate_decision(self.decision, self.config, board_timestamp=1647999990000, last_tick_timestamp=0, incomplete=0, now=self.now)
+        self.assertEqual((skipped.is_buy_entry, skipped.is_sell_entry, skipped.buy_size), (False, False, 0.02))
+        self.assertEqual(describe_freshness(skipped.freshness), ["stale_book", "stale_ticks"])
+
+    def test_skip_orders(self):
+        predict_info = schemas.PreidictInfo(**self.decision._asdict())
+        skipped = skip_orders(predict_info, schemas.FRESHNESS_FEED_LAG)
+        self.assertIsInstance(skipped, records.Decision)
+        self.assertEqual((skipped.is_buy_entry, skipped.freshness), (False, schemas.FRESHNESS_FEED_LAG))
+
+    def test_timeframe_span(self):
+        for time_span in [1, 5, 60, 300, 3600]:
+            self.assertEqual(schemas.timeframe_span(schemas.timeframe_label(time_span)), time_span)
+        self.assertIsNone(schemas.timeframe_span("volume"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import gc
+import logging
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.append(".")
+from gmo_hft_bot.utils.gc_control import (
+    METRIC_GC_IDLE_PAUSE_MS,
+    METRIC_GC_MAX_PAUSE_MS,
+    METRIC_GC_UNSCHEDULED_COLLECTIONS,
+    GcConfig,
+    GcPauseMonitor,
+    IdleCollector,
+    enter_steady_state,
+    leave_steady_state,
+    measure_allocations,
+)
+
+
+class Node:
+    def __init__(self):
+        self.next = self
+
+
+class TestGcControl(unittest.TestCase):
+    def setUp(self) -> None:
+        self.thresholds = gc.get_threshold()
+
+    def tearDown(self) -> None:
+        gc.set_threshold(*self.thresholds)
+        gc.unfreeze()
+
+    def test_steady_state(self):
+        previous_thresholds = enter_steady_state(GcConfig(thresholds=(10000, 20, 30)), logger=logging.getLogger("testLogger"))
+        self.assertEqual(previous_thresholds, self.thresholds)
+        self.assertEqual(gc.get_threshold(), (10000, 20, 30))
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+        leave_steady_state(previous_thresholds)
+        self.assertEqual(gc.get_threshold(), self.thresholds)
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+    def test_idle_collector(self):
+        monitor = GcPauseMonitor()
+        heartbeat = MagicMock()
+        collector = IdleCollector(GcConfig(idle_generation=0, full_collect_every=3), monitor=monitor, heartbeat=heartbeat)
+        monitor.install()
+        try:
+            generations = []
+            gc.callbacks.append(lambda phase, info: generations.append(info["generation"]) if phase == "start" else None)
+            try:
+                for _ in range(3):
+                    collector.collect()
+            finally:
+                gc.callbacks.pop()
+
+            with self.subTest("Collections outside the idle window are unscheduled"):
+                gc.collect(0)
+        finally:
+            monitor.uninstall()
+
+        self.assertEqual(generations, [0, 0, 2])
+        self.assertEqual((monitor.collections, monitor.unscheduled_collections), (4, 1))
+        metrics = {call.args[0] for call in heartbeat.set_metric.call_args_list}
+        self.assertEqual(metrics, {METRIC_GC_IDLE_PAUSE_MS, METRIC_GC_MAX_PAUSE_MS, METRIC_GC_UNSCHEDULED_COLLECTIONS})
+
+        with self.subTest("Disabled"):
+            self.assertEqual(IdleCollector(GcConfig(idle_generation=None)).collect(), 0)
+
+    def test_measure_allocations(self):
+        kept = []
+
+        def allocate_cycles():
+            for _ in range(1000):
+                Node()
+
+        def retain():
+            kept.append(bytearray(1000))
+
+        cycles = measure_allocations(allocate_cycles, calls=3)
+        self.assertGreater(cycles.gc_collections[0], 0.5)
+        self.assertEqual(gc.get_threshold(), self.thresholds)
+
+        retained = measure_allocations(retain, calls=10)
+        self.assertEqual(retained.gc_collections, (0.0, 0.0, 0.0))
+        self.assertGreaterEqual(retained.retained_blocks, 1.0)
+        self.assertGreater(retained.peak_bytes, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import asyncio
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.append(".")
+from gmo_hft_bot.utils.gmo_public_rest_client import GmoPublicRestClient
+
+
+def dummy_trade(second: int) -> dict:
+    return {"price": "100", "side": "BUY", "size": "0.1", "timestamp": f"2018-03-30T12:34:{second:02d}.000Z", "symbol": "BTC_JPY"}
+
+
+class TestGmoPublicRestClient(unittest.TestCase):
+    @patch.object(GmoPublicRestClient, "get_trades")
+    def test_get_trades_since(self, mocked_get_trades):
+        # Newest first, two trades per page.
+        pages = {1: [dummy_trade(50), dummy_trade(40)], 2: [dummy_trade(30), dummy_trade(20)], 3: [dummy_trade(10), dummy_trade(0)]}
+
+        async def get_trades(symbol, page, count):
+            return pages[page]
+
+        mocked_get_trades.side_effect = get_trades
+
+        client = GmoPublicRestClient()
+        since_timestamp = 1522413265000  # 2018-03-30T12:34:25.000Z
+        trades = asyncio.run(client.get_trades_since(symbol="BTC_JPY", since_timestamp=since_timestamp, count=2))
+
+        self.assertEqual([trade["timestamp"] for trade in trades], [dummy_trade(30)["timestamp"], dummy_trade(40)["timestamp"], dummy_trade(50)["timestamp"]])
+        self.assertEqual(mocked_get_trades.call_count, 2)
+
+        with self.subTest("Stop at max_pages"):
+            mocked_get_trades.reset_mock()
+            trades = asyncio.run(client.get_trades_since(symbol="BTC_JPY", since_timestamp=0, count=2, max_pages=2))
+            self.assertEqual(len(trades), 4)
+            self.assertEqual(mocked_get_trades.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
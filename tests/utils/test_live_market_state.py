@@ -0,0 +1,89 @@
+import sys
+import unittest
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, schemas
+from gmo_hft_bot.utils.bar_builder import MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+from gmo_hft_bot.utils.freshness import FreshnessConfig
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from tests.utils import response_schemas
+
+
+class TestLiveMarketState(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        # 2018-03-30T12:34:55Z, aligned to 5 seconds.
+        self.start = 1522413295
+        self.spec = SymbolSpec(self.dummy_symbol, Decimal("0.1"), Decimal("0.01"))
+        self.bar_builder = MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[5], spec=self.spec)
+        self.market_state = LiveMarketState(symbol=self.dummy_symbol, bar_builder=self.bar_builder, spec=self.spec)
+
+    def _board(self, bids, asks) -> dict:
+        return response_schemas.BoardResponseItem(
+            asks=[response_schemas.BidsAsks(price=price, size=size) for price, size in asks],
+            bids=[response_schemas.BidsAsks(price=price, size=size) for price, size in bids],
+            symbol=self.dummy_symbol,
+            timestamp="2018-03-30T12:34:56.000Z",
+        ).dict()
+
+    def test_update_board(self):
+        self.assertEqual(self.market_state.best_prices(), (None, None))
+
+        self.market_state.update_board(self._board(bids=[("99.9", "0.2"), ("100.0", "0.1")], asks=[("100.5", "1"), ("100.2", "0.5")]))
+
+        book = self.market_state.book
+        self.assertEqual(book.bid_prices.dtype, np.int64)
+        np.testing.assert_array_equal(book.bid_prices, [1000, 999])
+        np.testing.assert_array_equal(book.bid_sizes, [10, 20])
+        np.testing.assert_array_equal(book.ask_prices, [1002, 1005])
+        self.assertEqual(self.market_state.best_prices(), (1000, 1002))
+        self.assertEqual(self.market_state.board_timestamp, 1522413296000)
+
+    def test_get_prediction_info(self):
+        self.market_state.update_board(self._board(bids=[("100.0", "0.1")], asks=[("100.2", "0.5")]))
+        # Up candles in the first two bars.
+        for offset, price in [(0, 1000), (4, 1010), (5, 1010), (9, 1020), (10, 1020)]:
+            self.bar_builder.add_tick((self.start + offset) * 1000, price, 1)
+
+        predict_info = self.market_state.get_prediction_info(time_span=5, bar_close_timestamp=self.start + 10)
+        ohlcv_df = self.market_state.ohlcv_df(time_span=5, bar_close_timestamp=self.start + 10)
+        self.assertEqual(ohlcv_df["timestamp"].tolist(), [self.start, self.start + 5])
+
+        features = crud.prediction_features(ohlcv_df, book=self.market_state.book)
+        expected = crud.build_prediction_info(
+            prediction=crud.get_prediction(ohlcv_df), best_bid_price=1000, best_ask_price=1002, spec=self.spec, features=features
+        )
+        self.assertEqual(predict_info, expected)
+        # open, high, low, close and volume of the two bars.
+        self.assertEqual(features[:10], [100.0, 101.0, 100.0, 101.0, 0.02, 101.0, 102.0, 101.0, 102.0, 0.02])
+        # Depth imbalance and weighted mid (ticks) of the board: 10 lots of bids against 50 lots of asks.
+        np.testing.assert_allclose(features[10:], [-40 / 60, (1000 * 50 + 1002 * 10) / 60])
+        self.assertTrue(predict_info.is_buy_entry)
+        self.assertEqual((predict_info.buy_price, predict_info.sell_price), (100.1, 100.1))
+
+        with self.subTest("No entry without a board"):
+            market_state = LiveMarketState(symbol=self.dummy_symbol, bar_builder=self.bar_builder, spec=self.spec)
+            self.assertFalse(market_state.get_prediction_info(time_span=5, bar_close_timestamp=self.start + 10).is_buy_entry)
+
+    def test_freshness(self):
+        self.market_state.update_board(self._board(bids=[("100.0", "0.1")], asks=[("100.2", "0.5")]))
+        for offset, price in [(0, 1000), (4, 1010), (5, 1010), (9, 1020), (10, 1020)]:
+            self.bar_builder.add_tick((self.start + offset) * 1000, price, 1)
+
+        predict_info = self.market_state.get_prediction_info(
+            time_span=5, bar_close_timestamp=self.start + 10, freshness_config=FreshnessConfig(), last_tick_timestamp=(self.start + 10) * 1000
+        )
+        # The board and the tick of 2018 are old, and 3 of the 5 bars are missing.
+        self.assertEqual(predict_info.freshness, schemas.FRESHNESS_STALE_BOOK | schemas.FRESHNESS_STALE_TICKS | schemas.FRESHNESS_INCOMPLETE_BARS)
+        self.assertEqual((predict_info.is_buy_entry, predict_info.is_sell_entry), (False, False))
+
+        with self.subTest("No check without config"):
+            self.assertEqual(self.market_state.get_prediction_info(time_span=5, bar_close_timestamp=self.start + 10).freshness, schemas.FRESHNESS_OK)
+
+
+if __name__ == "__main__":
+    unittest.main()
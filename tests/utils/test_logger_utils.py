@@ -0,0 +1,126 @@
+import logging
+import queue
+import sys
+import threading
+import unittest
+
+sys.path.append(".")
+from gmo_hft_bot.utils.logger_utils import BatchQueueHandler, listener_process
+
+
+class CollectHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+class TestBatchQueueHandler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.logger = logging.getLogger("TestBatchQueueHandlerLogger")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self) -> None:
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+    def test_records_are_sent_in_batches(self):
+        logging_queue = queue.Queue()
+        handler = BatchQueueHandler(logging_queue, batch_size=3, flush_interval=60.0)
+        self.logger.addHandler(handler)
+
+        for i in range(7):
+            self.logger.debug("message %d", i)
+
+        self.assertEqual(logging_queue.qsize(), 2)
+        batch = logging_queue.get_nowait()
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch[0].getMessage(), "message 0")
+
+        handler.flush()
+        self.assertEqual(len(logging_queue.get_nowait()), 3)
+        self.assertEqual(len(logging_queue.get_nowait()), 1)
+
+    def test_warning_is_flushed_immediately(self):
+        logging_queue = queue.Queue()
+        handler = BatchQueueHandler(logging_queue, batch_size=100, flush_interval=60.0)
+        self.logger.addHandler(handler)
+
+        self.logger.debug("debug")
+        self.assertEqual(logging_queue.qsize(), 0)
+
+        self.logger.warning("warning")
+        batch = logging_queue.get_nowait()
+        self.assertEqual([record.getMessage() for record in batch], ["debug", "warning"])
+
+    def test_batches_are_dropped_when_queue_is_full(self):
+        logging_queue = queue.Queue(maxsize=1)
+        handler = BatchQueueHandler(logging_queue, batch_size=2, flush_interval=60.0)
+        self.logger.addHandler(handler)
+
+        for i in range(6):
+            self.logger.debug("message %d", i)
+
+        self.assertEqual(logging_queue.qsize(), 1)
+        self.assertEqual(handler.dropped_records, 4)
+
+        with self.subTest("Dropped records are reported with the next batch"):
+            logging_queue.get_nowait()
+            self.logger.debug("message 6")
+            self.logger.debug("message 7")
+
+            batch = logging_queue.get_nowait()
+            self.assertEqual(len(batch), 3)
+            self.assertEqual(batch[0].levelno, logging.WARNING)
+            self.assertIn("4 log records were dropped", batch[0].getMessage())
+
+    def test_periodic_flush(self):
+        logging_queue = queue.Queue()
+        handler = BatchQueueHandler(logging_queue, batch_size=100, flush_interval=0.05)
+        handler.start_periodic_flush()
+        self.logger.addHandler(handler)
+
+        # The last record of a burst, no record arrives after it.
+        self.logger.debug("last")
+        batch = logging_queue.get(timeout=1.0)
+        self.assertEqual([record.getMessage() for record in batch], ["last"])
+
+        with self.subTest("Close flushes the buffer"):
+            handler.flush_interval = 60.0
+            self.logger.debug("before close")
+            handler.close()
+            self.assertFalse(handler._flush_thread.is_alive())
+            self.assertEqual([record.getMessage() for record in logging_queue.get_nowait()], ["before close"])
+
+
+class TestListenerProcess(unittest.TestCase):
+    def test_handle_batches_and_single_records(self):
+        collect_handler = CollectHandler()
+        logger = logging.getLogger("TestListenerProcessLogger")
+        logger.propagate = False
+        logger.addHandler(collect_handler)
+
+        logging_queue = queue.Queue()
+        logging_queue.put(
+            [
+                logging.makeLogRecord({"name": logger.name, "levelno": logging.INFO, "msg": "first"}),
+                logging.makeLogRecord({"name": logger.name, "levelno": logging.INFO, "msg": "second"}),
+            ]
+        )
+        logging_queue.put(logging.makeLogRecord({"name": logger.name, "levelno": logging.INFO, "msg": "third"}))
+        logging_queue.put(None)
+
+        listener = threading.Thread(target=listener_process, args=(logging_queue, lambda: None))
+        listener.start()
+        listener.join(timeout=1.0)
+
+        self.assertFalse(listener.is_alive())
+        self.assertEqual([record.getMessage() for record in collect_handler.records], ["first", "second", "third"])
+        logger.removeHandler(collect_handler)
+
+
+if __name__ == "__main__":
+    unittest.main()
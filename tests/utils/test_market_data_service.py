@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.append(".")
+from gmo_hft_bot.utils.feed_lag import FEED_ORDERBOOKS, FEED_TRADES
+from gmo_hft_bot.utils.feed_recorder import read_feed_records
+from gmo_hft_bot.utils.market_data_service import (
+    METRIC_MARKET_DATA_SUBSCRIBERS,
+    MarketDataService,
+    MarketDataSubscriber,
+    record_market_data,
+    relay_to_queues,
+)
+from gmo_hft_bot.utils.queue_and_trade_manager import QueueAndTradeManager
+
+
+def dummy_trade(second: int) -> str:
+    return json.dumps(
+        {"channel": "trades", "price": "750760", "side": "BUY", "size": "0.1", "timestamp": f"2018-03-30T12:34:{second:02d}.000Z", "symbol": "Uncoin"}
+    )
+
+
+def dummy_orderbook() -> str:
+    return json.dumps(
+        {
+            "channel": "orderbooks",
+            "asks": [{"price": "455659", "size": "0.1"}],
+            "bids": [{"price": "455655", "size": "0.3"}],
+            "symbol": "Uncoin",
+            "timestamp": "2018-03-30T12:34:56.789Z",
+        }
+    )
+
+
+async def wait_for_subscribers(service: MarketDataService, count: int) -> None:
+    while len(service.subscriptions) < count:
+        await asyncio.sleep(0.01)
+
+
+class TestMarketDataService(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp_dir.name, "market_data.sock")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_fan_out(self):
+        heartbeat = MagicMock()
+
+        async def run():
+            service = MarketDataService(self.socket_path, heartbeat=heartbeat)
+            await service.start()
+            # Nobody to send to.
+            self.assertEqual(service.publish(FEED_TRADES, dummy_trade(0)), 0)
+            try:
+                async with MarketDataSubscriber(self.socket_path, name="strategy") as strategy, MarketDataSubscriber(
+                    self.socket_path, channels=[FEED_TRADES], name="recorder"
+                ) as recorder:
+                    await wait_for_subscribers(service, 2)
+                    self.assertEqual(service.publish(FEED_TRADES, dummy_trade(1), recv_time_ns=1), 2)
+                    self.assertEqual(service.publish(FEED_ORDERBOOKS, dummy_orderbook(), recv_time_ns=2), 1)
+                    self.assertEqual(service.publish(FEED_TRADES, dummy_trade(2), recv_time_ns=3), 2)
+                    strategy_messages = [await strategy.recv() for _ in range(3)]
+                    recorder_messages = [await recorder.recv() for _ in range(2)]
+                # The subscriptions end with the connections.
+                while len(service.subscriptions) > 0:
+                    await asyncio.sleep(0.01)
+            finally:
+                await service.stop()
+            return strategy_messages, recorder_messages
+
+        strategy_messages, recorder_messages = asyncio.run(run())
+
+        # Sequences of each subscriber, without gaps.
+        self.assertEqual(
+            [(message.sequence, message.channel, message.missed) for message in strategy_messages],
+            [(1, FEED_TRADES, 0), (2, FEED_ORDERBOOKS, 0), (3, FEED_TRADES, 0)],
+        )
+        self.assertEqual([(message.sequence, message.recv_time_ns) for message in recorder_messages], [(1, 1), (2, 3)])
+        self.assertEqual(strategy_messages[1].data(), json.loads(dummy_orderbook()))
+        self.assertEqual(recorder_messages[1].frame, dummy_trade(2).encode("utf-8"))
+        subscribers = [call.args[1] for call in heartbeat.set_metric.call_args_list if call.args[0] == METRIC_MARKET_DATA_SUBSCRIBERS]
+        self.assertEqual(subscribers, [1, 2, 1, 0])
+
+    def test_gap_of_slow_subscriber(self):
+        large_frame = json.dumps({"channel": "orderbooks", "asks": [{"price": "1", "size": "1"}] * 50000, "bids": [], "symbol": "Uncoin"})
+
+        async def run():
+            # Drop while anything is not sent yet.
+            service = MarketDataService(self.socket_path, max_buffer_bytes=0)
+            await service.start()
+            try:
+                async with MarketDataSubscriber(self.socket_path) as subscriber:
+                    await wait_for_subscribers(service, 1)
+                    # The subscriber does not read while they are published.
+                    for _ in range(3):
+                        service.publish(FEED_ORDERBOOKS, large_frame)
+                    first = await subscriber.recv()
+                    while next(iter(service.subscriptions.values())).writer.transport.get_write_buffer_size() > 0:
+                        await asyncio.sleep(0.01)
+                    service.publish(FEED_TRADES, dummy_trade(0))
+                    second = await subscriber.recv()
+            finally:
+                await service.stop()
+            return service, subscriber, first, second
+
+        service, subscriber, first, second = asyncio.run(run())
+
+        self.assertEqual((first.sequence, first.missed), (1, 0))
+        self.assertEqual((second.sequence, second.missed, second.channel), (4, 2, FEED_TRADES))
+        self.assertEqual((subscriber.gaps, subscriber.missed, subscriber.received), (1, 2, 2))
+        self.assertEqual(service.dropped, 2)
+
+    def test_record_and_relay(self):
+        feed_path = os.path.join(self.tmp_dir.name, "feed.bin")
+        queue_and_trade_manager = QueueAndTradeManager(api_key="dummy", api_secret="dummy")
+
+        async def run():
+            service = MarketDataService(self.socket_path)
+            await service.start()
+            subscriber = MarketDataSubscriber(self.socket_path, name="strategy")
+            await subscriber.connect()
+            recording = asyncio.create_task(record_market_data(self.socket_path, feed_path, duration=10.0, logger=MagicMock()))
+            relaying = asyncio.create_task(relay_to_queues(subscriber, queue_and_trade_manager))
+            await wait_for_subscribers(service, 2)
+            service.publish(FEED_TRADES, dummy_trade(0), recv_time_ns=1)
+            service.publish(FEED_ORDERBOOKS, dummy_orderbook(), recv_time_ns=2)
+            await asyncio.sleep(0.1)
+            # Both end when the service stops.
+            await service.stop()
+            results = await recording, await relaying
+            await subscriber.close()
+            return results
+
+        recorded, relayed = asyncio.run(run())
+
+        self.assertEqual((recorded, relayed), (2, 2))
+        self.assertEqual(list(read_feed_records(feed_path)), [(1, dummy_trade(0).encode("utf-8")), (2, dummy_orderbook().encode("utf-8"))])
+        self.assertEqual(queue_and_trade_manager.get_ticks_queue_item(), json.loads(dummy_trade(0)))
+        self.assertEqual(queue_and_trade_manager.get_orderbook_queue_item(), json.loads(dummy_orderbook()))
+
+
+if __name__ == "__main__":
+    unittest.main()
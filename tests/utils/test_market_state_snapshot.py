@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+
+import numpy as np
+
+from tests.utils import response_schemas
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models, schemas
+from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils.bar_builder import MultiTimeframeBarBuilder
+from gmo_hft_bot.utils.freshness import FreshnessConfig
+from gmo_hft_bot.utils.live_market_state import LiveMarketState
+from gmo_hft_bot.utils.market_state_snapshot import (
+    backfill_ohlcv,
+    load_market_state_snapshot,
+    restore_market_state,
+    save_market_state_snapshot,
+    seed_live_market_state,
+    take_market_state_snapshot,
+    warm_start,
+)
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+def to_isoformat(unix_timestamp: float) -> str:
+    return datetime.fromtimestamp(unix_timestamp, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class DummyRestClient:
+    def __init__(self, trades) -> None:
+        self.trades = trades
+        self.since_timestamps = []
+
+    async def get_trades_since(self, symbol: str, since_timestamp: int, max_pages: int = 10):
+        self.since_timestamps.append(since_timestamp)
+        return self.trades
+
+
+class TestMarketStateSnapshot(unittest.TestCase):
+    def __init__(self, methodName: str = ...) -> None:
+        super().__init__(methodName)
+        self.dummy_symbol = "Uncoin"
+        self.time_span = 5
+
+    def setUp(self) -> None:
+        models.Base.metadata.create_all(database_engine)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.tmp_dir.name, "market_state.npz")
+
+        # Five bars ending with the previous bar.
+        self.last_bar_timestamp = int(time.time() // self.time_span - 1) * self.time_span
+        ohlcv_items = [
+            schemas.OHLCVCreate(
+                timestamp=self.last_bar_timestamp - i * self.time_span,
+                open=100,
+                high=110,
+                low=90,
+                close=105,
+                volume=1.0,
+                symbol=self.dummy_symbol,
+                timeframe="5s",
+            )
+            for i in range(5)
+        ]
+        with SessionLocal() as db:
+            crud.insert_ohlcv_items(db=db, insert_items=ohlcv_items, max_rows=100)
+            crud.insert_board_items(
+                db=db,
+                insert_items=response_schemas.BoardResponseItem(
+                    asks=[response_schemas.BidsAsks(price="300", size="10"), response_schemas.BidsAsks(price="310", size="1")],
+                    bids=[response_schemas.BidsAsks(price="100", size="3")],
+                    symbol=self.dummy_symbol,
+                    timestamp="2018-03-30T12:34:56.789Z",
+                ).dict(),
+            )
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self):
+        with SessionLocal() as db:
+            snapshot = take_market_state_snapshot(db=db, symbol=self.dummy_symbol, time_span=self.time_span)
+        save_market_state_snapshot(self.snapshot_path, snapshot)
+
+        loaded = load_market_state_snapshot(self.snapshot_path)
+        self.assertEqual(loaded.symbol, self.dummy_symbol)
+        self.assertEqual(loaded.time_span, self.time_span)
+        self.assertEqual(loaded.ohlcv.shape, (5, 6))
+        self.assertEqual(loaded.ohlcv[-1, 0], self.last_bar_timestamp)
+        # Ticks of 1 and lots of 0.0001 (default spec).
+        np.testing.assert_array_equal(loaded.asks, [[300, 100000], [310, 10000]])
+        np.testing.assert_array_equal(loaded.bids, [[100, 30000]])
+        self.assertEqual(loaded.board_timestamp, 1522413296789)
+
+        with self.subTest("Snapshot in prices and sizes of older versions"):
+            save_market_state_snapshot(self.snapshot_path, snapshot._replace(bids=np.array([[100.0, 3.0]]), asks=np.array([[300.0, 0.1]])))
+            loaded = load_market_state_snapshot(self.snapshot_path)
+            np.testing.assert_array_equal(loaded.bids, [[100, 30000]])
+            np.testing.assert_array_equal(loaded.asks, [[300, 1000]])
+
+        with self.subTest("Return None if snapshot does not exist"):
+            self.assertIsNone(load_market_state_snapshot(os.path.join(self.tmp_dir.name, "not_exist.npz")))
+
+    def test_restore_market_state(self):
+        with SessionLocal() as db:
+            snapshot = take_market_state_snapshot(db=db, symbol=self.dummy_symbol, time_span=self.time_span)
+
+        models.Base.metadata.drop_all(database_engine)
+        models.Base.metadata.create_all(database_engine)
+
+        with SessionLocal() as db:
+            restore_market_state(db=db, snapshot=snapshot, max_board_counts=100, max_ohlcv_rows=100)
+            ohlcv = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol)
+            buy_board_items, sell_board_items = crud.get_current_board(db=db, symbol=self.dummy_symbol)
+
+        self.assertEqual(len(ohlcv), 5)
+        self.assertEqual(ohlcv[-1].timestamp, self.last_bar_timestamp)
+        self.assertEqual([(item.price, item.size) for item in sell_board_items], [(300, 100000), (310, 10000)])
+        self.assertEqual(buy_board_items[0].timestamp, 1522413296789)
+
+    def test_backfill_ohlcv(self):
+        trades = [
+            response_schemas.TickResponseItem(
+                channel="trades",
+                price="120",
+                side="BUY",
+                size="0.5",
+                timestamp=to_isoformat(self.last_bar_timestamp + self.time_span + 1),
+                symbol=self.dummy_symbol,
+            ).dict()
+        ]
+        trades.append({**trades[0], "price": "130", "timestamp": to_isoformat(self.last_bar_timestamp + self.time_span + 2)})
+        rest_client = DummyRestClient(trades)
+        count = asyncio.run(
+            backfill_ohlcv(
+                SessionLocal=SessionLocal,
+                symbol=self.dummy_symbol,
+                time_span=self.time_span,
+                since_timestamp=self.last_bar_timestamp,
+                max_tick_rows=10,
+                max_ohlcv_rows=100,
+                rest_client=rest_client,
+                timeframes=[1, 60],
+            )
+        )
+        with SessionLocal() as db:
+            ohlcv = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, limit=1, ascending=False, timeframe="5s")
+            minute_ohlcv = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="1m")
+            second_ohlcv = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, timeframe="1s")
+            ticks = crud.get_ticks(db=db, is_newer=True, limit=10)
+
+        self.assertEqual(count, 2)
+        # From the open time of the 1 minute bar which contains the last stored bar.
+        self.assertEqual(rest_client.since_timestamps, [self.last_bar_timestamp // 60 * 60 * 1000 - 1])
+        self.assertEqual(ohlcv[0].timestamp, self.last_bar_timestamp + self.time_span)
+        self.assertEqual((ohlcv[0].open, ohlcv[0].close), (120.0, 130.0))
+        # Every timeframe of the live bar builder is backfilled.
+        self.assertEqual([(bar.timestamp, bar.close) for bar in minute_ohlcv], [((self.last_bar_timestamp + self.time_span) // 60 * 60, 130.0)])
+        self.assertEqual([bar.close for bar in second_ohlcv], [120.0, 130.0])
+        self.assertEqual(len(ticks), 2)
+
+    def test_warm_start(self):
+        with SessionLocal() as db:
+            save_market_state_snapshot(self.snapshot_path, take_market_state_snapshot(db=db, symbol=self.dummy_symbol, time_span=self.time_span))
+
+        models.Base.metadata.drop_all(database_engine)
+        models.Base.metadata.create_all(database_engine)
+
+        rest_client = DummyRestClient([])
+        is_restored = asyncio.run(
+            warm_start(
+                snapshot_path=self.snapshot_path,
+                symbol=self.dummy_symbol,
+                time_span=self.time_span,
+                max_orderbook_table_rows=100,
+                max_tick_table_rows=100,
+                max_ohlcv_table_rows=100,
+                logger=logging.getLogger("testLogger"),
+                SessionLocal=SessionLocal,
+                rest_client=rest_client,
+            )
+        )
+
+        self.assertTrue(is_restored)
+        with SessionLocal() as db:
+            ohlcv = crud.get_ohlcv_with_symbol(db=db, symbol=self.dummy_symbol, limit=5, ascending=False)
+        self.assertEqual(len(ohlcv), 5)
+        self.assertEqual(len(rest_client.since_timestamps), 1)
+
+        with self.subTest("A decision right after the warm start has the restored bars and board"):
+            market_state = LiveMarketState(symbol=self.dummy_symbol, bar_builder=MultiTimeframeBarBuilder(symbol=self.dummy_symbol, timeframes=[1, 5]))
+            with SessionLocal() as db:
+                self.assertEqual(seed_live_market_state(db=db, market_state=market_state, time_span=self.time_span), 5)
+            self.assertEqual(market_state.best_prices(), (100, 300))
+
+            bar_close_timestamp = self.last_bar_timestamp + self.time_span
+            predict_info = market_state.get_prediction_info(
+                time_span=self.time_span,
+                bar_close_timestamp=bar_close_timestamp,
+                freshness_config=FreshnessConfig(),
+                last_tick_timestamp=bar_close_timestamp * 1000,
+                now=bar_close_timestamp,
+            )
+            self.assertEqual(len(market_state.ohlcv_df(time_span=self.time_span, bar_close_timestamp=bar_close_timestamp)), crud.PREDICTION_BARS)
+            # Only the board of the fixture (2018) is stale.
+            self.assertEqual(predict_info.freshness, schemas.FRESHNESS_STALE_BOOK)
+
+        with self.subTest("Do not restore snapshot of other symbol"):
+            is_restored = asyncio.run(
+                warm_start(
+                    snapshot_path=self.snapshot_path,
+                    symbol="OtherCoin",
+                    time_span=self.time_span,
+                    max_orderbook_table_rows=100,
+                    max_tick_table_rows=100,
+                    max_ohlcv_table_rows=100,
+                    logger=logging.getLogger("testLogger"),
+                    SessionLocal=SessionLocal,
+                    rest_client=rest_client,
+                )
+            )
+            self.assertFalse(is_restored)
+
+
+if __name__ == "__main__":
+    unittest.main()
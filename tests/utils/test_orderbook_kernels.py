@@ -0,0 +1,96 @@
+import sys
+import unittest
+
+import numba
+import numpy as np
+
+sys.path.append(".")
+from gmo_hft_bot.db import crud, models
+from gmo_hft_bot.db.database import initialize_database
+from gmo_hft_bot.utils import orderbook_kernels
+from tests.utils import response_schemas
+
+database_engine, SessionLocal = initialize_database(uri=None)
+
+
+class TestOrderbookKernels(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dummy_symbol = "Uncoin"
+        self.book = orderbook_kernels.BookArrays(
+            bid_prices=np.array([99.0, 98.0, 97.0]),
+            bid_sizes=np.array([1.0, 2.0, 3.0]),
+            ask_prices=np.array([101.0, 102.0, 104.0]),
+            ask_sizes=np.array([3.0, 1.0, 1.0]),
+        )
+
+    def tearDown(self) -> None:
+        models.Base.metadata.drop_all(database_engine)
+
+    def test_board_arrays(self):
+        models.Base.metadata.create_all(database_engine)
+        with SessionLocal() as db:
+            crud.insert_board_items(
+                db=db,
+                insert_items=response_schemas.BoardResponseItem(
+                    asks=[response_schemas.BidsAsks(price="101", size="3"), response_schemas.BidsAsks(price="102", size="1")],
+                    bids=[response_schemas.BidsAsks(price="99", size="1"), response_schemas.BidsAsks(price="98", size="2")],
+                    symbol=self.dummy_symbol,
+                    timestamp="2018-03-30T12:34:56.789Z",
+                ).dict(),
+            )
+            book = orderbook_kernels.board_arrays(*crud.get_current_board(db=db, symbol=self.dummy_symbol))
+
+        # Ticks of 1 and lots of 0.0001 (default spec).
+        self.assertEqual(book.bid_prices.dtype, np.int64)
+        np.testing.assert_array_equal(book.bid_prices, [99, 98])
+        np.testing.assert_array_equal(book.bid_sizes, [10000, 20000])
+        np.testing.assert_array_equal(book.ask_prices, [101, 102])
+        np.testing.assert_array_equal(book.ask_sizes, [30000, 10000])
+
+        with self.subTest("Kernels of int64 arrays"):
+            self.assertAlmostEqual(orderbook_kernels.weighted_mid(*book), (99 * 3 + 101 * 1) / 4)
+            np.testing.assert_array_equal(orderbook_kernels.cumulative_depth(book.bid_sizes), [10000, 30000])
+            self.assertAlmostEqual(orderbook_kernels.vwap_to_size(book.ask_prices, book.ask_sizes, 40000), (3 * 101 + 102) / 4)
+
+        with self.subTest("Empty board"):
+            book = orderbook_kernels.board_arrays([], [])
+            self.assertEqual(book.bid_prices.size, 0)
+            self.assertTrue(np.isnan(orderbook_kernels.weighted_mid(*book)))
+
+    def test_cumulative_depth(self):
+        np.testing.assert_array_equal(orderbook_kernels.cumulative_depth(self.book.bid_sizes), [1.0, 3.0, 6.0])
+
+    def test_depth_imbalance(self):
+        self.assertAlmostEqual(orderbook_kernels.depth_imbalance(self.book.bid_sizes, self.book.ask_sizes, 1), (1.0 - 3.0) / 4.0)
+        self.assertAlmostEqual(orderbook_kernels.depth_imbalance(self.book.bid_sizes, self.book.ask_sizes, 10), (6.0 - 5.0) / 11.0)
+        self.assertEqual(orderbook_kernels.depth_imbalance(np.zeros(0), np.zeros(0), 5), 0.0)
+
+    def test_weighted_mid(self):
+        # Larger ask size pushes the price toward the bid.
+        self.assertAlmostEqual(orderbook_kernels.weighted_mid(*self.book), (99.0 * 3.0 + 101.0 * 1.0) / 4.0)
+
+    def test_vwap_to_size(self):
+        self.assertAlmostEqual(orderbook_kernels.vwap_to_size(self.book.ask_prices, self.book.ask_sizes, 2.0), 101.0)
+        self.assertAlmostEqual(orderbook_kernels.vwap_to_size(self.book.ask_prices, self.book.ask_sizes, 4.5), (3.0 * 101.0 + 102.0 + 0.5 * 104.0) / 4.5)
+        self.assertTrue(np.isnan(orderbook_kernels.vwap_to_size(self.book.ask_prices, self.book.ask_sizes, 10.0)))
+
+    def test_book_slope(self):
+        # Cumulative depth 1, 3, 6 at the distance 0, 1, 2.
+        self.assertAlmostEqual(orderbook_kernels.book_slope(self.book.bid_prices, self.book.bid_sizes, 3), 2.5)
+        self.assertTrue(np.isnan(orderbook_kernels.book_slope(self.book.bid_prices, self.book.bid_sizes, 1)))
+
+    def test_call_from_compiled_function(self):
+        # e.g. a backtest over recorded books (one row per snapshot).
+        @numba.njit
+        def imbalance_series(bid_sizes, ask_sizes, levels):
+            result = np.empty(bid_sizes.shape[0])
+            for i in range(bid_sizes.shape[0]):
+                result[i] = orderbook_kernels.depth_imbalance(bid_sizes[i], ask_sizes[i], levels)
+            return result
+
+        series = imbalance_series(np.array([[1.0, 1.0], [3.0, 0.0]]), np.array([[1.0, 1.0], [1.0, 0.0]]), 2)
+        np.testing.assert_array_almost_equal(series, [0.0, 0.5])
+
+
+if __name__ == "__main__":
+    unittest.main()
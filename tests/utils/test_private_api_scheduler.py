@@ -0,0 +1,130 @@
+import asyncio
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+import aiohttp
+
+sys.path.append(".")
+from gmo_hft_bot.utils.custom_exceptions import RequestSupersededError
+from gmo_hft_bot.utils.private_api_scheduler import (
+    METRIC_API_QUEUED_MS,
+    METRIC_API_REJECTED,
+    PRIORITY_CANCEL,
+    PRIORITY_ORDER,
+    PRIORITY_QUERY,
+    PrivateApiScheduler,
+    RateLimitConfig,
+    TokenBucket,
+    is_throttled,
+)
+from tests.utils.dummy_gmo_private_api import DummyGmoPrivateApi
+
+
+async def run_scheduler(server: DummyGmoPrivateApi, scheduler: PrivateApiScheduler, submit):
+    """Start `server` and `scheduler`, and return the results of the futures returned by `submit(scheduler)`."""
+    scheduler.base_url = await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            futures = submit(scheduler)
+            task = asyncio.create_task(scheduler.run(session))
+            try:
+                return await asyncio.gather(*futures, return_exceptions=True)
+            finally:
+                task.cancel()
+    finally:
+        await server.stop()
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_delay(self):
+        bucket = TokenBucket(rate=10.0, capacity=2, now=0.0)
+        self.assertTrue(bucket.try_acquire(now=0.0))
+        self.assertTrue(bucket.try_acquire(now=0.0))
+        self.assertFalse(bucket.try_acquire(now=0.0))
+        self.assertAlmostEqual(bucket.delay(now=0.05), 0.05)
+
+        self.assertTrue(bucket.try_acquire(now=0.1))
+        with self.subTest("Up to the capacity after an idle period"):
+            self.assertEqual(bucket.delay(now=10.0), 0.0)
+            self.assertEqual(bucket.tokens, 2)
+
+
+class TestPrivateApiScheduler(unittest.TestCase):
+    def test_is_throttled(self):
+        self.assertTrue(is_throttled(429, None))
+        self.assertTrue(is_throttled(200, {"status": 5, "messages": [{"message_code": "ERR-5003", "message_string": ""}]}))
+        self.assertFalse(is_throttled(200, {"status": 0, "data": {}}))
+
+    def test_stay_under_the_limit(self):
+        def submit(scheduler):
+            return [scheduler.submit("GET", "/v1/account/margin", params={"n": i}) for i in range(30)]
+
+        with self.subTest("Without the limit, the server rejects requests"):
+            server = DummyGmoPrivateApi(limit=12, window=1.0)
+            scheduler = PrivateApiScheduler(config=RateLimitConfig(rate=1e6, burst=1000))
+            results = asyncio.run(run_scheduler(server, scheduler, submit))
+            self.assertGreater(server.rejected, 0)
+            self.assertEqual(scheduler.rejected, server.rejected)
+            self.assertEqual(sum(is_throttled(200, result) for result in results), server.rejected)
+
+        server = DummyGmoPrivateApi(limit=12, window=0.1, use_http_status=True)
+        heartbeat = MagicMock()
+        # At most 3 + 0.1 * 20 = 5 requests are sent in any 0.1 seconds: less than half of the limit, so that late or
+        # bunched arrivals on a loaded machine are not rejected either.
+        scheduler = PrivateApiScheduler(config=RateLimitConfig(rate=20.0, burst=3), heartbeat=heartbeat)
+        results = asyncio.run(run_scheduler(server, scheduler, submit))
+
+        self.assertEqual(server.rejected, 0)
+        self.assertEqual(len(server.accepted), 30)
+        self.assertEqual([result["status"] for result in results], [0] * 30)
+        self.assertEqual((scheduler.sent, scheduler.rejected), (30, 0))
+        # Requests after the burst waited for tokens.
+        self.assertGreater(scheduler.throttled, 0)
+        self.assertGreater(scheduler.max_queued, 0.4)
+        metrics = {call.args[0] for call in heartbeat.set_metric.call_args_list}
+        self.assertIn(METRIC_API_QUEUED_MS, metrics)
+        self.assertNotIn(METRIC_API_REJECTED, metrics)
+
+    def test_cancels_first(self):
+        def submit(scheduler):
+            return [
+                scheduler.submit("GET", "/v1/account/margin", priority=PRIORITY_QUERY),
+                scheduler.submit("POST", "/v1/order", body={"n": 0}, priority=PRIORITY_ORDER),
+                scheduler.submit("POST", "/v1/order", body={"n": 1}, priority=PRIORITY_ORDER),
+                scheduler.submit("POST", "/v1/cancelOrder", body={"n": 2}, priority=PRIORITY_CANCEL),
+                scheduler.submit("POST", "/v1/cancelOrder", body={"n": 3}, priority=PRIORITY_CANCEL),
+            ]
+
+        server = DummyGmoPrivateApi(limit=100)
+        # One request at a time, so that they arrive in the order they are sent.
+        scheduler = PrivateApiScheduler(config=RateLimitConfig(rate=50.0, burst=1))
+        asyncio.run(run_scheduler(server, scheduler, submit))
+
+        self.assertEqual(
+            [path for _, path, _ in server.accepted],
+            ["/v1/cancelOrder", "/v1/cancelOrder", "/v1/order", "/v1/order", "/v1/account/margin"],
+        )
+
+    def test_coalesce_replaces(self):
+        def submit(scheduler):
+            return [
+                *[scheduler.submit("POST", "/v1/changeOrder", params={"n": i}, coalesce_key="order:BUY") for i in range(3)],
+                scheduler.submit("POST", "/v1/changeOrder", params={"n": 3}, coalesce_key="order:SELL"),
+            ]
+
+        server = DummyGmoPrivateApi(limit=100)
+        scheduler = PrivateApiScheduler(config=RateLimitConfig(rate=50.0, burst=1))
+        results = asyncio.run(run_scheduler(server, scheduler, submit))
+
+        self.assertIsInstance(results[0], RequestSupersededError)
+        self.assertIsInstance(results[1], RequestSupersededError)
+        self.assertEqual(results[2]["status"], 0)
+        self.assertEqual(results[3]["status"], 0)
+        # Only the newest replace of each side is sent.
+        self.assertEqual([query for _, _, query in server.accepted], ["n=2", "n=3"])
+        self.assertEqual((scheduler.sent, scheduler.superseded), (2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
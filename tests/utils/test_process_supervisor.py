@@ -0,0 +1,193 @@
+import ctypes
+import gc
+import logging
+import os
+import multiprocessing
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(".")
+from gmo_hft_bot.utils.process_supervisor import Heartbeat, ProcessLaunchConfig, ProcessSupervisor, parse_cpu_list, read_process_usage
+
+
+def beating_target(start_count, heartbeat_conn):
+    with start_count.get_lock():
+        start_count.value += 1
+
+    heartbeat = Heartbeat(heartbeat_conn, name="beating", interval=0.05)
+    while True:
+        heartbeat.beat()
+        time.sleep(heartbeat.interval)
+
+
+def failing_once_target(start_count, heartbeat_conn):
+    with start_count.get_lock():
+        start_count.value += 1
+        is_first_run = start_count.value == 1
+
+    heartbeat = Heartbeat(heartbeat_conn, name="failing_once", interval=0.05)
+    if is_first_run:
+        heartbeat.fail("dummy failure")
+        sys.exit(1)
+
+    while True:
+        heartbeat.beat()
+        time.sleep(heartbeat.interval)
+
+
+def silent_target(start_count, heartbeat_conn):
+    with start_count.get_lock():
+        start_count.value += 1
+
+    time.sleep(60.0)
+
+
+def commanded_target(command_count, heartbeat_conn):
+    def handler():
+        with command_count.get_lock():
+            command_count.value += 1
+
+    heartbeat = Heartbeat(heartbeat_conn, name="commanded", interval=0.05)
+    heartbeat.add_command_handler("dummy_command", handler)
+    while True:
+        heartbeat.beat()
+        heartbeat.handle_commands()
+        time.sleep(heartbeat.interval)
+
+
+def metered_target(heartbeat_conn):
+    heartbeat = Heartbeat(heartbeat_conn, name="metered", interval=0.05)
+    heartbeat.set_metric("dummy_metric", 1.5)
+    while True:
+        heartbeat.beat()
+        time.sleep(heartbeat.interval)
+
+
+def launched_target(heartbeat_conn):
+    heartbeat = Heartbeat(heartbeat_conn, name="launched", interval=0.05)
+    heartbeat.set_metric("cpu_count", len(os.sched_getaffinity(0)))
+    heartbeat.set_metric("nice", os.getpriority(os.PRIO_PROCESS, 0))
+    heartbeat.set_metric("gc_freeze_count", gc.get_freeze_count())
+    while True:
+        heartbeat.beat()
+        time.sleep(heartbeat.interval)
+
+
+class TestProcessSupervisor(unittest.TestCase):
+    def run_supervisor(self, supervisor: ProcessSupervisor, seconds: float) -> None:
+        timer = threading.Timer(seconds, supervisor.stop)
+        timer.start()
+        supervisor.run()
+        timer.join()
+
+    def test_restart_only_failed_process(self):
+        beating_start_count = multiprocessing.Value("i", 0)
+        failing_start_count = multiprocessing.Value("i", 0)
+        health_flag = multiprocessing.RawValue(ctypes.c_bool, True)
+
+        supervisor = ProcessSupervisor(logger=logging.getLogger("testLogger"), poll_interval=0.05, min_restart_interval=0.1)
+        supervisor.add_process("beating", target=beating_target, kwargs={"start_count": beating_start_count})
+        supervisor.add_process("failing_once", target=failing_once_target, kwargs={"start_count": failing_start_count}, health_flag=health_flag)
+        self.run_supervisor(supervisor, 1.5)
+
+        self.assertEqual(beating_start_count.value, 1)
+        self.assertEqual(failing_start_count.value, 2)
+        self.assertEqual(supervisor.restart_counts(), {"beating": 0, "failing_once": 1})
+
+        with self.subTest("Processes are stopped with the supervisor"):
+            for supervised in supervisor.processes.values():
+                self.assertFalse(supervised.process.is_alive())
+
+    def test_restart_when_heartbeat_stops(self):
+        start_count = multiprocessing.Value("i", 0)
+        supervisor = ProcessSupervisor(logger=logging.getLogger("testLogger"), heartbeat_timeout=0.3, poll_interval=0.05, min_restart_interval=0.1)
+        supervisor.add_process("silent", target=silent_target, kwargs={"start_count": start_count})
+        self.run_supervisor(supervisor, 1.0)
+
+        self.assertGreaterEqual(start_count.value, 2)
+
+    def test_health_flag_is_set_by_heartbeat(self):
+        start_count = multiprocessing.Value("i", 0)
+        health_flag = multiprocessing.RawValue(ctypes.c_bool, False)
+
+        supervisor = ProcessSupervisor(logger=logging.getLogger("testLogger"), poll_interval=0.05)
+        supervisor.add_process("beating", target=beating_target, kwargs={"start_count": start_count}, health_flag=health_flag)
+
+        observed = []
+        observer = threading.Timer(0.5, lambda: observed.append(health_flag.value))
+        observer.start()
+        self.run_supervisor(supervisor, 0.8)
+
+        self.assertEqual(observed, [True])
+        with self.subTest("Health flag is cleared when the supervisor stops the process"):
+            self.assertFalse(health_flag.value)
+
+    def test_send_command(self):
+        command_count = multiprocessing.Value("i", 0)
+        supervisor = ProcessSupervisor(logger=logging.getLogger("testLogger"), poll_interval=0.05)
+        supervisor.add_process("commanded", target=commanded_target, kwargs={"command_count": command_count})
+
+        sender = threading.Timer(0.3, lambda: supervisor.broadcast_command("dummy_command"))
+        sender.start()
+        self.run_supervisor(supervisor, 0.8)
+
+        self.assertEqual(command_count.value, 1)
+
+    def test_metrics(self):
+        supervisor = ProcessSupervisor(logger=logging.getLogger("testLogger"), poll_interval=0.05)
+        supervisor.add_process("metered", target=metered_target)
+        supervisor.add_process("beating", target=beating_target, kwargs={"start_count": multiprocessing.Value("i", 0)})
+        self.run_supervisor(supervisor, 0.5)
+
+        self.assertEqual(supervisor.metrics(), {"metered": {"dummy_metric": 1.5}, "beating": {}})
+
+    @unittest.skipUnless(hasattr(os, "sched_setaffinity"), "Needs Linux")
+    def test_launch_config(self):
+        cpu = min(os.sched_getaffinity(0))
+        nice = min(os.getpriority(os.PRIO_PROCESS, 0) + 5, 19)
+        supervisor = ProcessSupervisor(logger=logging.getLogger("testLogger"), poll_interval=0.05, start_method="spawn", usage_interval=0.2)
+        supervisor.add_process("launched", target=launched_target, launch_config=ProcessLaunchConfig(cpu_affinity=(cpu,), nice=nice, gc_freeze=True))
+        self.run_supervisor(supervisor, 2.0)
+
+        metrics = supervisor.metrics()["launched"]
+        self.assertEqual((metrics["cpu_count"], metrics["nice"]), (1, nice))
+        self.assertGreater(metrics["gc_freeze_count"], 0)
+
+        usage = supervisor.usage()["launched"]
+        self.assertEqual((usage.nice, usage.last_cpu), (nice, cpu))
+        self.assertGreater(usage.rss_bytes, 0)
+        self.assertGreater(usage.cpu_seconds, 0.0)
+
+    def test_invalid_start_method(self):
+        with self.assertRaises(ValueError):
+            ProcessSupervisor(logger=logging.getLogger("testLogger"), start_method="unknown")
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list("0,2-3"), (0, 2, 3))
+        self.assertEqual(parse_cpu_list(" 1 "), (1,))
+        self.assertIsNone(parse_cpu_list(""))
+        self.assertIsNone(parse_cpu_list(None))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/stat"), "Needs /proc")
+    def test_read_process_usage(self):
+        previous = read_process_usage(os.getpid())
+        start = time.monotonic()
+        while time.monotonic() - start < 0.2:
+            pass
+        usage = read_process_usage(os.getpid(), previous=previous, interval=time.monotonic() - start)
+
+        self.assertEqual(usage.pid, os.getpid())
+        self.assertGreater(usage.cpu_percent, 10.0)
+        self.assertGreater(usage.rss_bytes, 0)
+
+    def test_add_same_process_twice(self):
+        supervisor = ProcessSupervisor(logger=logging.getLogger("testLogger"))
+        supervisor.add_process("beating", target=beating_target)
+        with self.assertRaises(ValueError):
+            supervisor.add_process("beating", target=beating_target)
+
+
+if __name__ == "__main__":
+    unittest.main()
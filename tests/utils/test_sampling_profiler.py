@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(".")
+from gmo_hft_bot.utils.sampling_profiler import SamplingProfiler
+
+
+class DummyWorker:
+    async def run(self, seconds: float):
+        end_time = time.monotonic() + seconds
+        while time.monotonic() < end_time:
+            sum(range(100000))
+            await asyncio.sleep(0.0)
+
+
+class DummyIdleWorker:
+    async def run(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_collapsed_stacks_tagged_by_coroutine(self):
+        profiler = SamplingProfiler(output_dir=self.tmp_dir.name, name="dummy", tag_classes=[DummyWorker, DummyIdleWorker], interval=0.001)
+
+        async def main():
+            await asyncio.gather(DummyWorker().run(0.3), DummyIdleWorker().run(0.3))
+
+        profiler.toggle()
+        asyncio.run(main())
+        profiler.toggle()
+        profiler.join()
+
+        self.assertTrue(os.path.basename(profiler.output_path).startswith(f"dummy-{os.getpid()}-"))
+        with open(profiler.output_path) as f:
+            lines = f.read().splitlines()
+
+        tags = {line.split(";")[0] for line in lines}
+        self.assertIn("DummyWorker", tags)
+        self.assertIn("idle", tags)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            if stack.startswith("DummyWorker;"):
+                self.assertIn("run (test_sampling_profiler.py:", stack)
+
+        with self.subTest("Restart with new samples"):
+            first_output_path = profiler.output_path
+            time.sleep(1.0)
+            profiler.toggle()
+            self.assertTrue(profiler.is_running())
+            profiler.stop()
+            profiler.join()
+            self.assertFalse(profiler.is_running())
+            self.assertNotEqual(profiler.output_path, first_output_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.append(".")
+from gmo_hft_bot.db import records
+from gmo_hft_bot.utils.custom_exceptions import SharedStateReadError
+from gmo_hft_bot.utils.fixed_point import SymbolSpec
+from gmo_hft_bot.utils.orderbook_kernels import BookArrays
+from gmo_hft_bot.utils.shared_market_state import (
+    SharedMarketStateConfig,
+    SharedMarketStateReader,
+    SharedMarketStateWriter,
+    unlink_shared_market_state,
+)
+
+
+def book(bid_prices, ask_prices) -> BookArrays:
+    return BookArrays(
+        bid_prices=np.array(bid_prices, dtype=np.int64),
+        bid_sizes=np.ones(len(bid_prices), dtype=np.int64),
+        ask_prices=np.array(ask_prices, dtype=np.int64),
+        ask_sizes=np.ones(len(ask_prices), dtype=np.int64),
+    )
+
+
+def bar(timestamp: int, close: float, timeframe: str = "5s") -> records.Bar:
+    return records.Bar(timestamp=timestamp, open=close, high=close, low=close, close=close, volume=1.0, symbol="Uncoin", timeframe=timeframe)
+
+
+def read_books(symbol: str, reads: int, results: multiprocessing.Queue) -> None:
+    """Count snapshots whose levels are not all from one board (torn reads)."""
+    torn = 0
+    with SharedMarketStateReader(symbol) as reader:
+        for _ in range(reads):
+            snapshot = reader.read()
+            levels = np.concatenate([snapshot.book.bid_prices, snapshot.book.ask_prices])
+            if np.any(levels != snapshot.board_timestamp):
+                torn += 1
+        results.put((torn, reader.retries))
+
+
+class TestSharedMarketState(unittest.TestCase):
+    def setUp(self) -> None:
+        self.symbol = f"Uncoin{os.getpid()}"
+        self.spec = SymbolSpec(self.symbol, Decimal("0.001"), Decimal("0.0001"))
+
+    def tearDown(self) -> None:
+        unlink_shared_market_state(self.symbol)
+
+    def test_publish_and_read(self):
+        writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", config=SharedMarketStateConfig(levels=3, bars=4), spec=self.spec)
+        with SharedMarketStateReader(self.symbol) as reader:
+            snapshot = reader.read()
+            self.assertEqual((snapshot.board_timestamp, snapshot.last_trade, len(snapshot.bars)), (0, None, 0))
+            self.assertEqual(snapshot.best_prices(), (None, None))
+
+            writer.publish_book(book([105, 104, 103, 102], [106]), timestamp=1000)
+            writer.publish_trade(records.Tick(timestamp=1001, price=105, size=2, side="SELL", symbol=self.symbol))
+            snapshot = reader.read()
+
+        self.assertEqual((snapshot.symbol, snapshot.timeframe, snapshot.spec), (self.symbol, "5s", self.spec))
+        self.assertEqual(snapshot.sequence, 4)
+        self.assertEqual(snapshot.board_timestamp, 1000)
+        # Top `levels` levels.
+        self.assertEqual(snapshot.book.bid_prices.tolist(), [105, 104, 103])
+        self.assertEqual(snapshot.book.ask_prices.tolist(), [106])
+        self.assertEqual(snapshot.best_prices(), (0.105, 0.106))
+        self.assertEqual(snapshot.last_trade, records.Tick(timestamp=1001, price=105, size=2, side="SELL", symbol=self.symbol))
+        writer.close()
+
+    def test_bars(self):
+        writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", config=SharedMarketStateConfig(levels=3, bars=4), spec=self.spec)
+        with SharedMarketStateReader(self.symbol) as reader:
+            self.assertEqual(writer.publish_bars([bar(0, 1.0), bar(0, 9.0, timeframe="1m"), bar(5, 2.0)]), 2)
+            with self.subTest("The open bar is replaced"):
+                writer.publish_bars([bar(5, 3.0)])
+                bars = reader.read().bars
+                self.assertEqual(bars["timestamp"].tolist(), [0, 5])
+                self.assertEqual(bars["close"].tolist(), [1.0, 3.0])
+
+            with self.subTest("The oldest bars are overwritten"):
+                self.assertEqual(writer.publish_bars([bar(timestamp, float(timestamp)) for timestamp in range(10, 35, 5)]), 5)
+                # Older than the newest bar.
+                self.assertEqual(writer.publish_bars([bar(5, 0.0)]), 0)
+                bars = reader.read().bars
+                self.assertEqual(bars["timestamp"].tolist(), [15, 20, 25, 30])
+                self.assertEqual(bars["close"].tolist(), [15.0, 20.0, 25.0, 30.0])
+        writer.close()
+
+    def test_reuse_segment_after_restart(self):
+        config = SharedMarketStateConfig(levels=3, bars=4)
+        writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", config=config, spec=self.spec)
+        writer.publish_book(book([100], [101]), timestamp=1000)
+        writer.close()
+
+        with SharedMarketStateReader(self.symbol) as reader:
+            # The state is kept while the writer restarts, and the reader sees the writes of the new writer.
+            self.assertEqual(reader.read().board_timestamp, 1000)
+            writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", config=config, spec=self.spec)
+            writer.publish_book(book([102], [103]), timestamp=2000)
+            snapshot = reader.read()
+            self.assertEqual((snapshot.sequence, snapshot.board_timestamp), (4, 2000))
+            writer.close()
+
+        with self.subTest("Another layout replaces the segment"):
+            writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", config=SharedMarketStateConfig(levels=5, bars=4), spec=self.spec)
+            with SharedMarketStateReader(self.symbol) as reader:
+                self.assertEqual(reader.read().board_timestamp, 0)
+            writer.close()
+
+    def test_write_in_progress(self):
+        writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", spec=self.spec)
+        with SharedMarketStateReader(self.symbol) as reader:
+            # A writer which died in the middle of a write.
+            writer._begin()
+            start_time = time.monotonic()
+            with self.assertRaises(SharedStateReadError):
+                reader.read(timeout=0.02)
+            elapsed = time.monotonic() - start_time
+            self.assertGreaterEqual(elapsed, 0.02)
+            self.assertLess(elapsed, 0.5)
+            # Backs off instead of spinning.
+            self.assertGreater(reader.retries, 1)
+            self.assertLess(reader.retries, 1000)
+        writer.close()
+
+        # The next writer finishes the write.
+        writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", spec=self.spec)
+        with SharedMarketStateReader(self.symbol) as reader:
+            self.assertEqual(reader.read().sequence, writer.sequence)
+        writer.close()
+
+    def test_no_segment(self):
+        with self.assertRaises(FileNotFoundError):
+            SharedMarketStateReader(self.symbol)
+        self.assertFalse(unlink_shared_market_state(self.symbol))
+
+    def test_consistent_reads_from_another_process(self):
+        writer = SharedMarketStateWriter(symbol=self.symbol, timeframe="5s", config=SharedMarketStateConfig(levels=50, bars=4), spec=self.spec)
+        writer.publish_book(book([1] * 50, [1] * 50), timestamp=1)
+        results = multiprocessing.Queue()
+        reader_process = multiprocessing.Process(target=read_books, args=(self.symbol, 20000, results))
+        reader_process.start()
+
+        # Every level of a board is its timestamp, so that a snapshot mixing two boards is found.
+        timestamp = 1
+        while reader_process.is_alive():
+            timestamp += 1
+            writer.publish_book(book([timestamp] * 50, [timestamp] * 50), timestamp=timestamp)
+            if not results.empty():
+                break
+        torn, retries = results.get(timeout=30)
+        reader_process.join()
+        writer.close()
+
+        self.assertEqual(torn, 0)
+        self.assertGreater(timestamp, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()